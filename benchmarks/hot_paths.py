@@ -0,0 +1,310 @@
+"""Benchmark suite of the client hot paths, run against an in-process FIWARE emulator and MQTT broker.
+
+Each benchmark reports its throughput (ops/s), the p50 and p99 latency of a single operation and the peak memory
+allocated during an operation, measured on a separate run with tracemalloc. For the benchmarks which reach
+the emulator, the allocations of the in-process servers are included.
+
+The results can be stored as a JSON baseline, and later runs compared against it to catch regressions:
+a benchmark regresses when its throughput drops, or its allocations grow, beyond the given tolerances.
+
+Usage: python benchmarks/hot_paths.py [--quick] [--only NAME ...] [--save-baseline FILE] [--compare FILE]
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fiotclient.context import FiwareContextClient  # noqa: E402
+from fiotclient.emulator import FiwareEmulator, MqttBrokerEmulator  # noqa: E402
+from fiotclient.gateway import ObservationGateway  # noqa: E402
+from fiotclient.iot import FiwareIotClient  # noqa: E402
+from request_overhead import _CannedTransport, _build_entities  # noqa: E402
+
+BENCHMARKS = {}
+
+DEVICE_SCHEMA = json.dumps({'devices': [{
+    'device_id': '[DEVICE_ID]',
+    'entity_name': '[ENTITY_ID]',
+    'entity_type': 'thing',
+    'transport': 'MQTT',
+    'attributes': [{'object_id': 't', 'name': 'temperature', 'type': 'Number'},
+                   {'object_id': 'h', 'name': 'humidity', 'type': 'Number'},
+                   {'object_id': 's', 'name': 'state', 'type': 'Text'}],
+    'commands': [{'name': 'switch', 'type': 'command', 'value': '[DEVICE_ID]@switch|%s'}],
+    'static_attributes': [{'name': 'device_id', 'type': 'string', 'value': '[DEVICE_ID]'}]
+}]})
+
+MEASUREMENTS = [{'t': 21.5 + index, 'h': 40 + index, 's': 'ON', 'battery': 0.97} for index in range(10)]
+
+
+def benchmark(name, ops):
+    """Register a benchmark, given by a function which prepares the environment and returns the operation
+
+    :param name: The name of the benchmark
+    :param ops: The number of operations measured
+    """
+    def register(setup):
+        BENCHMARKS[name] = (setup, ops)
+        return setup
+    return register
+
+
+class _Environment(object):
+
+    def __init__(self):
+        """In-process FIWARE emulator and MQTT broker shared by the benchmarks"""
+        self.emulator = FiwareEmulator(history_size=10).start()
+        self.broker = MqttBrokerEmulator(fiware_emulator=self.emulator).start()
+        self.config = self.emulator.config_dict({'fiwareService': 'bench', 'fiwareServicePath': '/',
+                                                 'iota': {'apiKey': 'bench-key'}})
+        self.clients = []
+
+    def client(self, client_class, **kwargs):
+        client = client_class.from_config_dict(self.config, **kwargs)
+        self.clients.append(client)
+        return client
+
+    def close(self):
+        for client in self.clients:
+            client.close()
+        self.broker.stop()
+        self.emulator.stop()
+
+
+@benchmark('ul_payload', ops=20000)
+def _ul_payload(environment):
+    return lambda index: FiwareIotClient._create_ul_payload_from_measurements(MEASUREMENTS)
+
+
+@benchmark('register_device_render', ops=5000)
+def _register_device_render(environment):
+    iot_client = environment.client(FiwareIotClient, transport=_CannedTransport(''))
+    return lambda index: iot_client.register_device(DEVICE_SCHEMA, f'LED_{index}', f'TEST_LED_{index}',
+                                                    endpoint='10.0.0.1:8080')
+
+
+@benchmark('send_request_overhead', ops=5000)
+def _send_request_overhead(environment):
+    entities = _build_entities(10)
+    context_client = environment.client(FiwareContextClient, transport=_CannedTransport(json.dumps(entities)))
+    payload = {'actionType': 'append', 'entities': entities}
+    url = f'{context_client.cb_url}/v2/op/update'
+    additional_headers = {'Content-Type': 'application/json'}
+    return lambda index: context_client._send_request(url, 'POST', payload=payload,
+                                                      additional_headers=additional_headers)['response']
+
+
+@benchmark('send_observation_http', ops=2000)
+def _send_observation_http(environment):
+    iot_client = environment.client(FiwareIotClient)
+    iot_client.register_devices([(f'HTTP_{index}', f'HTTP_SENSOR_{index}') for index in range(10)], DEVICE_SCHEMA)
+    return lambda index: iot_client.send_observation(f'HTTP_{index % 10}', MEASUREMENTS[index % 10], protocol='HTTP')
+
+
+@benchmark('send_observation_mqtt', ops=10000)
+def _send_observation_mqtt(environment):
+    iot_client = environment.client(FiwareIotClient)
+    iot_client.register_devices([(f'MQTT_{index}', f'MQTT_SENSOR_{index}') for index in range(10)], DEVICE_SCHEMA)
+
+    def operation(index):
+        iot_client.send_observation(f'MQTT_{index % 10}', MEASUREMENTS[index % 10], protocol='MQTT')
+
+    operation.finish = lambda: iot_client.mqtt_publisher.flush(30)
+    return operation
+
+
+@benchmark('gateway_ingest', ops=20000)
+def _gateway_ingest(environment):
+    iot_client = environment.client(FiwareIotClient)
+    iot_client.register_devices([(f'GATEWAY_{index}', f'GATEWAY_SENSOR_{index}') for index in range(10)],
+                                DEVICE_SCHEMA)
+    gateway = environment.client(ObservationGateway, workers=2)
+
+    def operation(index):
+        gateway.send(f'GATEWAY_{index % 10}', MEASUREMENTS[index % 10])
+
+    operation.finish = lambda: gateway.flush(30)
+    return operation
+
+
+@benchmark('get_entities_paging', ops=30)
+def _get_entities_paging(environment):
+    context_client = environment.client(FiwareContextClient)
+    context_client.upsert_entities(_build_entities(1000))
+    return lambda index: sum(1 for _ in context_client.iter_entities(entity_type='Room', page_size=100))
+
+
+@benchmark('bulk_upsert', ops=30)
+def _bulk_upsert(environment):
+    context_client = environment.client(FiwareContextClient)
+    entities = _build_entities(1000)
+    return lambda index: context_client.upsert_entities(entities, max_entities=100, max_concurrency=4)
+
+
+def _percentile(sorted_values, q):
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+def measure(operation, ops):
+    """Measure the throughput and the latency of an operation
+
+    :param operation: The function executing the operation, called with the index of the operation
+    :param ops: The number of operations executed
+    :return: A dict with the 'ops_per_sec', 'p50_us' and 'p99_us' of the operation
+    """
+    for index in range(max(1, ops // 10)):
+        operation(index)
+
+    latencies = []
+    perf_counter_ns = time.perf_counter_ns
+    started_at = time.perf_counter()
+    for index in range(ops):
+        operation_started_at = perf_counter_ns()
+        operation(index)
+        latencies.append(perf_counter_ns() - operation_started_at)
+
+    finish = getattr(operation, 'finish', None)
+    if finish is not None:
+        finish()
+    elapsed = time.perf_counter() - started_at
+
+    latencies.sort()
+    return {
+        'ops_per_sec': round(ops / elapsed, 1),
+        'p50_us': round(_percentile(latencies, 0.50) / 1000, 1),
+        'p99_us': round(_percentile(latencies, 0.99) / 1000, 1)
+    }
+
+
+def measure_allocations(operation, ops):
+    """Measure the mean peak memory allocated during an operation
+
+    :param operation: The function executing the operation, called with the index of the operation
+    :param ops: The number of operations executed
+    :return: The mean peak allocation in KiB
+    """
+    reset_peak = getattr(tracemalloc, 'reset_peak', None)
+    tracemalloc.start()
+    try:
+        total = 0
+        for index in range(ops):
+            if reset_peak is not None:
+                reset_peak()
+            else:
+                # Before Python 3.9 the peak can't be reset, so the tracing is started again for each operation
+                tracemalloc.stop()
+                tracemalloc.start()
+            current, _ = tracemalloc.get_traced_memory()
+            operation(index)
+            total += tracemalloc.get_traced_memory()[1] - current
+
+        finish = getattr(operation, 'finish', None)
+        if finish is not None:
+            finish()
+    finally:
+        tracemalloc.stop()
+
+    return round(total / ops / 1024, 2)
+
+
+def run(names, scale=1.0):
+    """Run the benchmarks
+
+    :param names: The names of the benchmarks to be run
+    :param scale: The factor applied to the number of operations of each benchmark
+    :return: A dict of benchmark names to their results
+    """
+    environment = _Environment()
+    results = {}
+    try:
+        for name in names:
+            setup, ops = BENCHMARKS[name]
+            ops = max(3, int(ops * scale))
+            operation = setup(environment)
+
+            result = measure(operation, ops)
+            result['peak_alloc_kib'] = measure_allocations(operation, max(3, ops // 10))
+            results[name] = result
+
+            print(f"  {name:<24} {result['ops_per_sec']:>12,.1f} ops/s  p50 {result['p50_us']:>10,.1f} us  "
+                  f"p99 {result['p99_us']:>10,.1f} us  alloc {result['peak_alloc_kib']:>9,.2f} KiB")
+    finally:
+        environment.close()
+    return results
+
+
+def compare(results, baseline, tolerance, alloc_tolerance):
+    """Compare the results with a baseline
+
+    :param results: A dict of benchmark names to their results
+    :param baseline: A dict of benchmark names to their results on the baseline
+    :param tolerance: The maximum relative drop of throughput
+    :param alloc_tolerance: The maximum relative growth of the allocations
+    :return: A list with the description of each regression
+    """
+    regressions = []
+    for name, result in results.items():
+        reference = baseline.get(name)
+        if reference is None:
+            continue
+
+        if result['ops_per_sec'] < reference['ops_per_sec'] * (1 - tolerance):
+            regressions.append(f"{name}: {result['ops_per_sec']:,.1f} ops/s, "
+                               f"baseline {reference['ops_per_sec']:,.1f} ops/s")
+        if result['peak_alloc_kib'] > reference['peak_alloc_kib'] * (1 + alloc_tolerance) + 1:
+            regressions.append(f"{name}: {result['peak_alloc_kib']:,.2f} KiB allocated, "
+                               f"baseline {reference['peak_alloc_kib']:,.2f} KiB")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--only', nargs='+', choices=sorted(BENCHMARKS), help='benchmarks to be run')
+    parser.add_argument('--quick', action='store_true', help='run a tenth of the operations of each benchmark')
+    parser.add_argument('--save-baseline', metavar='FILE', help='store the results as the baseline on FILE')
+    parser.add_argument('--compare', metavar='FILE', help='compare the results with the baseline on FILE')
+    parser.add_argument('--tolerance', type=float, default=0.3,
+                        help='maximum relative throughput drop before failing (default: 0.3)')
+    parser.add_argument('--alloc-tolerance', type=float, default=0.2,
+                        help='maximum relative allocations growth before failing (default: 0.2)')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+
+    names = args.only or list(BENCHMARKS)
+    print(f"Client hot paths (Python {platform.python_version()}, {platform.machine()}):")
+    results = run(names, scale=0.1 if args.quick else 1.0)
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as baseline_file:
+            json.dump({'python': platform.python_version(), 'machine': platform.machine(), 'results': results},
+                      baseline_file, indent=2, sort_keys=True)
+            baseline_file.write('\n')
+        print(f"Baseline stored on {args.save_baseline}")
+
+    if args.compare:
+        if not os.path.exists(args.compare):
+            print(f"No baseline found on {args.compare}, run 'make bench-baseline' to create it")
+            return 0
+
+        with open(args.compare) as baseline_file:
+            baseline = json.load(baseline_file)['results']
+        regressions = compare(results, baseline, args.tolerance, args.alloc_tolerance)
+        if regressions:
+            print("Regressions against the baseline:")
+            for regression in regressions:
+                print(f"  {regression}")
+            return 1
+        print(f"No regressions against the baseline on {args.compare}")
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,103 @@
+"""Micro-benchmark of the client-side cost of a request: payload serialization, logging and response decoding.
+
+The requests are answered by an in-process transport, so the network is left out of the measurements.
+
+Usage: python benchmarks/request_overhead.py [--calls N] [--entities N]
+"""
+import argparse
+import io
+import json
+import logging
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fiotclient.context import FiwareContextClient  # noqa: E402
+
+
+class _CannedResponse(object):
+
+    def __init__(self, status_code, text):
+        self.status_code = status_code
+        self.headers = {'Content-Type': 'application/json'}
+        self.text = text
+        self.content = text.encode('utf-8')
+
+
+class _CannedTransport(object):
+
+    def __init__(self, response_text):
+        """Transport answering every request with the same response, without any network access"""
+        self.response = _CannedResponse(200, response_text)
+
+    def request(self, method, url, params=None, data=None, headers=None, timeout=30, stream=False):
+        return self.response
+
+    def close(self):
+        pass
+
+
+SCENARIOS = [
+    ('pretty json, INFO logging', {'http': {'compactJson': False}}, logging.INFO),
+    ('compact json, INFO logging', {}, logging.INFO),
+    ('compact json, INFO logging, bodies truncated to 256', {'logging': {'bodyMaxLength': 256}}, logging.INFO),
+    ('compact json, INFO logging, 1% of bodies sampled', {'logging': {'bodySampleRate': 0.01}}, logging.INFO),
+    ('compact json, WARNING logging', {}, logging.WARNING),
+]
+
+
+def _build_entities(count):
+    return [{'id': f'ROOM_{index:06d}', 'type': 'Room',
+             'temperature': {'type': 'Number', 'value': 21.5 + index % 10},
+             'pressure': {'type': 'Integer', 'value': 720 + index % 50},
+             'location': {'type': 'Text', 'value': f'Building {index % 7}, floor {index % 12}'}}
+            for index in range(count)]
+
+
+def run(calls, entities_count):
+    entities = _build_entities(entities_count)
+    response_text = json.dumps(entities[:10])
+
+    log_stream = io.StringIO()
+    logging.basicConfig(stream=log_stream, force=True)
+
+    results = []
+    for name, config_options, level in SCENARIOS:
+        config = dict({'contextBroker': {'host': 'localhost', 'port': 1026}}, **config_options)
+        context_client = FiwareContextClient.from_config_dict(config, transport=_CannedTransport(response_text))
+        payload = {'actionType': 'append', 'entities': entities}
+
+        logging.root.setLevel(level)
+
+        def call():
+            context_client._send_request(f'{context_client.cb_url}/v2/op/update', 'POST', payload=payload,
+                                         additional_headers={'Content-Type': 'application/json'})
+
+        call()
+        elapsed = min(timeit.repeat(call, number=calls, repeat=3))
+        results.append((name, elapsed / calls * 1e6))
+
+        log_stream.seek(0)
+        log_stream.truncate()
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--calls', type=int, default=200, help='number of requests of each measurement')
+    parser.add_argument('--entities', type=int, default=100, help='number of entities on each request payload')
+    args = parser.parse_args()
+
+    results = run(args.calls, args.entities)
+
+    baseline = results[0][1]
+    print(f"Per-call overhead of a batch request with {args.entities} entities:")
+    for name, microseconds in results:
+        print(f"  {name:<55} {microseconds:10.1f} us  ({baseline / microseconds:5.1f}x)")
+
+
+if __name__ == '__main__':
+    main()
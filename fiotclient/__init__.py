@@ -1,13 +1,52 @@
-import json
+import contextlib
+import functools
 import logging
+import random
+import time
 
 import requests
 
+from fiotclient import tenant as tenant_context
 from fiotclient import utils
+from fiotclient.auth import DEFAULT_TOKENS_URL, KeystoneAuthenticator, TokenManager
+from fiotclient.cache import TTLCache
+from fiotclient.codec import JsonCodec, default_codec
+from fiotclient.concurrency import ConcurrencyLimiterRegistry
 from fiotclient.config import FiwareConfig
+from fiotclient.exceptions import FiwareRequestError
+from fiotclient.metrics import MetricsCollector, RequestMetrics
+from fiotclient.ratelimit import RateLimiter
+from fiotclient.resilience import CircuitBreakerRegistry, RetryPolicy
+from fiotclient.response import Response
+from fiotclient.singleflight import SingleFlight
+from fiotclient.streaming import JsonArrayStream
+from fiotclient.tenant import Tenant
+from fiotclient.transport import HttpTransport
+
+
+def _format_body(body, max_length=None):
+    if isinstance(body, bytes):
+        body = body.decode('utf-8', errors='replace')
+    if max_length is not None and len(body) > max_length:
+        return f"{body[:max_length]}... ({len(body)} characters)"
+    return body
+
+
+def _freeze_dict(dict_value):
+    """Auxiliary function to turn a dict of request parameters or headers into a hashable value
+
+    :param dict_value: The dict, or None
+    :return: A tuple with the sorted items of the dict
+    """
+    if not dict_value:
+        return ()
+    return tuple(sorted((str(key), str(value)) for key, value in dict_value.items()))
 
 
 def _log_request_url(method: str, url: str, params: dict, headers: dict):
+    if not logging.root.isEnabledFor(logging.INFO):
+        return
+
     params_str = '&'.join(map(lambda key: f'{key}={params[key]}', params.keys())) if params else ''
     if params_str:
         logging.info(f"{method} {url}?{params_str} {headers}")
@@ -15,162 +54,687 @@ def _log_request_url(method: str, url: str, params: dict, headers: dict):
         logging.info(f"{method} {url} {headers}")
 
 
-def _log_request(method, url, params, headers, str_payload):
+def _log_request(method, url, params, headers, str_payload, log_body=True, max_body_length=None):
+    if not logging.root.isEnabledFor(logging.INFO):
+        return
+
     _log_request_url(method, url, params, headers)
-    if str_payload != '':
-        logging.info(f"Request payload: {str_payload}")
+    if log_body and str_payload:
+        logging.info(f"Request payload: {_format_body(str_payload, max_body_length)}")
+
 
+def _log_response(status_code, response, headers, log_body=True, max_body_length=None):
+    if not logging.root.isEnabledFor(logging.INFO):
+        return
+
+    if log_body:
+        logging.info(f"Response {status_code} {_format_body(response, max_body_length)} {headers}")
+    else:
+        logging.info(f"Response {status_code} {headers}")
 
-def _log_response(status_code, response, headers):
-    logging.info(f"Response {status_code} {response} {headers}")
+
+def _connection_error_message(error):
+    """Auxiliary method to describe a request which got no response
+
+    :param error: The connection or timeout error raised by the transport
+    :return: The description of the error
+    """
+    if isinstance(error, requests.exceptions.Timeout):
+        return f"Request timed out: {error}"
+    return error.strerror
 
 
 class BaseClient(object):
 
-    def __init__(self, fiware_config: FiwareConfig):
+    transport_class = HttpTransport
+
+    def __init__(self, fiware_config: FiwareConfig, transport: HttpTransport = None, cache: TTLCache = None,
+                 metrics: MetricsCollector = None, codec: JsonCodec = None, retry_policy: RetryPolicy = None,
+                 circuit_breakers: CircuitBreakerRegistry = None, concurrency: ConcurrencyLimiterRegistry = None,
+                 rate_limiter: RateLimiter = None, single_flight: SingleFlight = None,
+                 token_manager: TokenManager = None):
         """Default client for making requests to FIWARE APIs
 
         :param fiware_config: The FiwareConfig object from which load the default configuration
+        :param transport: The pooled HttpTransport used to execute the requests.
+                          It can be shared among clients targeting the same hosts. If no transport is provided,
+                          a new one is created from the configuration and closed along with the client
+        :param cache: The TTLCache used to keep the results of entity and device lookups.
+                      Cached results are shared, so they must not be modified.
+                      If no cache is provided, every lookup is sent to the platform
+        :param metrics: The MetricsCollector which receives the measurements of every call made by the client
+                        (e.g. an InMemoryMetrics). It can be shared among clients.
+                        If no collector is provided, nothing is measured
+        :param codec: The JsonCodec used to serialize request payloads and decode response bodies.
+                      If no codec is provided, orjson is used when installed and the standard library otherwise
+        :param retry_policy: The RetryPolicy deciding which failed requests are sent again and when.
+                             If no policy is provided, every request is sent only once
+        :param circuit_breakers: The CircuitBreakerRegistry used to fail fast the calls to components which are down.
+                                 It can be shared among clients. If no registry is provided, calls are always sent
+        :param concurrency: The ConcurrencyLimiterRegistry adapting the number of simultaneous requests to each
+                            component to its capacity. It should be shared among the clients calling the same
+                            components. If no registry is provided, the number of requests is not limited
+        :param rate_limiter: The RateLimiter making requests wait to respect the quotas per component and per service.
+                             It can be shared among clients. If no limiter is provided, the rate is not limited
+        :param single_flight: The SingleFlight used to coalesce identical GET requests made at the same time,
+                              which then share the same response. Shared responses must not be modified.
+                              If no single-flight layer is provided, every request is sent
+        :param token_manager: The TokenManager keeping the authentication token valid. It can be shared among clients.
+                              If no manager is provided, the token of the configuration is used,
+                              until authenticate is called
         """
         # TODO Check and notify mandatory parameters on input config file
         self.fiware_config = fiware_config
 
-        self.token = self.fiware_config.token
-        self.expires_at = None
+        self._token = self.fiware_config.token
+        self.token_manager = token_manager
+
+        self._tenants = {}
+        self._default_tenant = self._get_tenant(self.fiware_config.service, self.fiware_config.service_path)
+
+        self._owns_transport = transport is None
+        self.transport = transport or self.transport_class.from_config(self.fiware_config)
+
+        self.cache = cache
+        self.codec = codec or default_codec()
+
+        self.metrics = metrics
+        self._components = []
+
+        self.retry_policy = retry_policy
+        self.circuit_breakers = circuit_breakers
+        self.concurrency = concurrency
+        self.rate_limiter = rate_limiter
+        self.single_flight = single_flight
 
     @classmethod
-    def from_config_file(cls, config_file_path):
+    def from_config_file(cls, config_file_path, **kwargs):
         """Default client for making requests to FIWARE APIs
 
         :param config_file_path: The file in which load the default configuration
+        :param kwargs: Additional options to be passed to the client constructor
         """
         fiware_config = utils.read_config_file(config_file_path)
-        return cls(fiware_config)
+        return cls(fiware_config, **kwargs)
 
     @classmethod
-    def from_config_json(cls, config_json: str):
+    def from_config_json(cls, config_json: str, **kwargs):
         """Default client for making requests to FIWARE APIs
 
         :param config_json: The json string from which to load the default configuration
+        :param kwargs: Additional options to be passed to the client constructor
         """
         fiware_config = utils.parse_config_json(config_json)
-        return cls(fiware_config)
+        return cls(fiware_config, **kwargs)
 
     @classmethod
-    def from_config_dict(cls, config_dict: dict):
+    def from_config_dict(cls, config_dict: dict, **kwargs):
         """Default client for making requests to FIWARE APIs
 
         :param config_dict: The config dict from which to load the default configuration
+        :param kwargs: Additional options to be passed to the client constructor
         """
         fiware_config = utils.parse_config_dict(config_dict)
-        return cls(fiware_config)
+        return cls(fiware_config, **kwargs)
 
-    def _send_request(self, url, method, payload=None, additional_headers=None, params=None, timeout=30):
-        """Auxiliary method to configure and execute a request to FIWARE APIs
+    def close(self):
+        """Releases the resources held by the client.
+        The transport is only closed if it was created by the client itself, not when it was shared
+
+        :return: None
+        """
+        if self._owns_transport:
+            self.transport.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @property
+    def token(self):
+        """The authentication token sent on the requests"""
+        if self.token_manager is not None:
+            return self.token_manager.token
+        return self._token
+
+    @token.setter
+    def token(self, token):
+        self._token = token
+
+    @property
+    def expires_at(self):
+        """The expiration of the authentication token as seconds since the epoch, or None if it is unknown"""
+        if self.token_manager is not None:
+            return self.token_manager.expires_at
+        return None
+
+    def _ensure_token(self):
+        """Auxiliary method to get a valid authentication token before sending a request,
+        waiting for it to be refreshed if needed
+
+        :return: The token
+        """
+        if self.token_manager is None:
+            return self._token
+        return self.token_manager.get_token()
+
+    def _prepare_request(self, payload=None, additional_headers=None):
+        """Auxiliary method to build the headers and the serialized body of a request to FIWARE APIs
 
-        :param url: The url to be called on the request
         :param payload: The payload to be sent on the request
-        :param method: The method to be used on the request
         :param additional_headers: Additional http headers to be used in the request
-        :param timeout: The request's timeout
-        :return: The response from the request execution
+        :return: A tuple with the headers and the payload (str or bytes) to be sent
         """
-        default_headers = {
-            'X-Auth-Token': self.fiware_config.token,
-            'Fiware-Service': self.fiware_config.service,
-            'Fiware-ServicePath': self.fiware_config.service_path
-        }
+        default_headers = self._tenant().default_headers(self.token)
 
-        additional_headers = additional_headers or {}
-
-        headers = utils.merge_dicts(default_headers, additional_headers)
+        if additional_headers:
+            headers = {**default_headers, **additional_headers}
+        else:
+            headers = dict(default_headers)
 
         if payload:
-            if not isinstance(payload, str):
-                str_payload = json.dumps(payload, indent=4)
+            if not isinstance(payload, (str, bytes)):
+                str_payload = self.codec.dumps(payload, compact=self.fiware_config.http_compact_json)
             else:
                 str_payload = payload
         else:
             str_payload = ''
 
-        _log_request(method, url, params, headers, str_payload)
+        return headers, str_payload
+
+    def _build_response(self, status_code, headers, content):
+        """Auxiliary method to build the result of a request to FIWARE APIs
+
+        :param status_code: The status code of the response
+        :param headers: The http headers of the response
+        :param content: The raw body of the response
+        :return: A Response with the status code, the headers and the body of the response, decoded on first access
+        """
+        return Response(status_code, headers, content, self.codec)
+
+    def _log_bodies(self):
+        """Auxiliary method to decide if the bodies of a request and its response are logged,
+        sampling them at the configured rate
+
+        :return: True if the bodies must be logged
+        """
+        if not logging.root.isEnabledFor(logging.INFO):
+            return False
+
+        sample_rate = self.fiware_config.log_body_sample_rate
+        return sample_rate >= 1 or random.random() < sample_rate
 
+    def _register_component(self, component, base_url):
+        """Auxiliary method to associate the base url of a FIWARE component with the name used on the metrics
+
+        :param component: The name of the component (e.g. 'orion')
+        :param base_url: The base url of the component, on format http://HOST:PORT
+        :return: None
+        """
+        self._components.append((base_url, component))
+
+    def _component_for(self, url):
+        """Auxiliary method to find the FIWARE component to which an url belongs
+
+        :param url: The url called on a request
+        :return: The name of the component or 'unknown' if the url doesn't belong to any registered component
+        """
+        for base_url, component in self._components:
+            if url.startswith(base_url) and url[len(base_url):len(base_url) + 1] in ('', '/', '?'):
+                return component
+        return 'unknown'
+
+    def _record_request(self, operation, url, method, status_code, str_payload, bytes_received, started_at, sent_at,
+                        received_at):
+        """Auxiliary method to send the measurements of a request to the metrics collector
+
+        :param operation: The client operation which made the request
+        :param url: The url called on the request
+        :param method: The method used on the request
+        :param status_code: The status code of the response
+        :param str_payload: The body sent on the request
+        :param bytes_received: The size in bytes of the body of the response
+        :param started_at: The performance counter value when the request started to be built
+        :param sent_at: The performance counter value when the request was sent
+        :param received_at: The performance counter value when the response was received
+        :return: None
+        """
+        bytes_sent = len(str_payload) if isinstance(str_payload, bytes) else len(str_payload.encode('utf-8'))
+        self._record_metrics(RequestMetrics(operation or 'request', self._component_for(url), method, status_code,
+                                            bytes_sent=bytes_sent,
+                                            bytes_received=bytes_received,
+                                            serialize_time=sent_at - started_at,
+                                            network_time=received_at - sent_at,
+                                            parse_time=time.perf_counter() - received_at))
+
+    def _record_metrics(self, request_metrics):
+        """Auxiliary method to send measurements to the metrics collector, so that a failing collector
+        never breaks the calls of the client
+
+        :param request_metrics: The RequestMetrics of a call
+        :return: None
+        """
         try:
-            if method == 'GET':
-                r = requests.get(url, params=params, data=str_payload, headers=headers, timeout=timeout)
-            elif method == 'POST':
-                r = requests.post(url, params=params, data=str_payload, headers=headers, timeout=timeout)
-            elif method == 'PUT':
-                r = requests.put(url, params=params, data=str_payload, headers=headers, timeout=timeout)
-            elif method == 'DELETE':
-                r = requests.delete(url, params=params, data=str_payload, headers=headers, timeout=timeout)
-            else:
-                logging.error(f"Unsupported method '{str(method)}'")
-                return {'error': "Unsupported method. Select one of 'GET', 'POST', 'PUT' and 'DELETE'"}
+            self.metrics.record(request_metrics)
+        except Exception as e:
+            logging.error(f"Failed to record metrics: {e}")
+
+    def _circuit_breaker_for(self, url):
+        """Auxiliary method to get the circuit breaker of the component targeted by a url
+
+        :param url: The url to be called
+        :return: The CircuitBreaker of the component, or None if the client has no circuit breakers
+        """
+        if self.circuit_breakers is None:
+            return None
+        return self.circuit_breakers.get(self._component_for(url))
+
+    def _limiter_for(self, url):
+        """Auxiliary method to get the concurrency limiter of the component targeted by a url
 
-            status_code = r.status_code
-            headers = r.headers
-            response_str = r.text
+        :param url: The url to be called
+        :return: The AdaptiveLimiter of the component, or None if the client has no concurrency limiters
+        """
+        if self.concurrency is None:
+            return None
+        return self.concurrency.get(self._component_for(url))
+
+    def _rate_limit_key(self, url, additional_headers=None):
+        """Auxiliary method to identify the rate limits applying to a request
+
+        :param url: The url to be called
+        :param additional_headers: Additional http headers of the request, which may select another service
+        :return: A (component, service, service path) tuple
+        """
+        headers = additional_headers or {}
+        tenant = self._tenant()
+        return (self._component_for(url),
+                headers.get('Fiware-Service', tenant.service),
+                headers.get('Fiware-ServicePath', tenant.service_path))
+
+    def _circuit_open_response(self, url):
+        """Auxiliary method to build the response of a call rejected because its component is down
+
+        :param url: The url of the rejected call
+        :return: A response with status code 0, as for connection errors
+        """
+        message = f"Circuit open for component '{self._component_for(url)}', request not sent"
+        logging.error(f"Response Error: {message}")
+        return {
+            'status_code': 0,
+            'response': message
+        }
+
+    def _retry_delay(self, method, response, attempt, idempotent):
+        """Auxiliary method to decide if a request is sent again after a response
+
+        :param method: The method of the request
+        :param response: The response of the last attempt
+        :param attempt: The number of the last attempt, starting at 1
+        :param idempotent: If the request can be safely repeated. If None, it is deduced from the method
+        :return: The delay in seconds before the next attempt, or None if the request must not be retried
+        """
+        policy = self.retry_policy
+        if policy is None or attempt >= policy.max_attempts or 'status_code' not in response:
+            return None
+        if not policy.is_retryable(method, response['status_code'], idempotent):
+            return None
+
+        headers = response.get('headers') or {}
+        delay = policy.delay(attempt, headers.get('Retry-After'))
+        logging.warning(f"Request {method} failed with status code {response['status_code']}. "
+                        f"Retrying in {delay:.2f}s (attempt {attempt + 1} of {policy.max_attempts})")
+        return delay
+
+    def _single_flight_key(self, url, params=None, additional_headers=None):
+        """Auxiliary method to build the key identifying identical GET requests
+
+        :param url: The url to be called on the request
+        :param params: The query parameters of the request
+        :param additional_headers: Additional http headers of the request
+        :return: A hashable key with the url, the parameters and the headers of the request
+        """
+        tenant = self._tenant()
+        return (url, _freeze_dict(params), tenant.service, tenant.service_path, self.token,
+                _freeze_dict(additional_headers))
+
+    def _send_request(self, url, method, payload=None, additional_headers=None, params=None, timeout=30,
+                      operation=None, idempotent=None):
+        """Auxiliary method to configure and execute a request to FIWARE APIs.
+        GET requests identical to one already in flight share its response, if the client has a single-flight layer
+
+        :param url: The url to be called on the request
+        :param payload: The payload to be sent on the request
+        :param method: The method to be used on the request
+        :param additional_headers: Additional http headers to be used in the request
+        :param timeout: The request's timeout
+        :param operation: The name of the client operation making the request, reported to the metrics collector
+        :param idempotent: If the request can be safely repeated. If None, it is deduced from the method
+        :return: The response from the request execution
+        """
+        if self.single_flight is None or method != 'GET':
+            return self._execute_request(url, method, payload, additional_headers, params, timeout, operation,
+                                         idempotent)
+
+        return self.single_flight.do(self._single_flight_key(url, params, additional_headers),
+                                     functools.partial(self._execute_request, url, method, payload, additional_headers,
+                                                       params, timeout, operation, idempotent))
+
+    def _execute_request(self, url, method, payload=None, additional_headers=None, params=None, timeout=30,
+                         operation=None, idempotent=None):
+        """Auxiliary method to configure and execute a request to FIWARE APIs,
+        retrying it according to the retry policy and failing fast if the circuit of its component is open.
+        A request rejected with 401 is sent again once with a renewed token, if the client has a token manager.
+        Each attempt waits for its turn on the rate limiter and for a free slot of the concurrency limiter
+        of its component
 
+        :param url: The url to be called on the request
+        :param payload: The payload to be sent on the request
+        :param method: The method to be used on the request
+        :param additional_headers: Additional http headers to be used in the request
+        :param timeout: The request's timeout
+        :param operation: The name of the client operation making the request, reported to the metrics collector
+        :param idempotent: If the request can be safely repeated. If None, it is deduced from the method
+        :return: The response from the request execution
+        """
+        breaker = self._circuit_breaker_for(url)
+        limiter = self._limiter_for(url)
+        attempt = 0
+        token_renewed = False
+        while True:
+            attempt += 1
             try:
-                response = json.loads(response_str)
-            except json.decoder.JSONDecodeError as e:
-                logging.error(f"Error: {e}")
-                response = {}
+                token = self._ensure_token()
+            except Exception as e:
+                logging.error(f"Authentication Error: {e}")
+                return {'error': f"Authentication failed: {e}"}
+
+            if breaker is not None and not breaker.allow():
+                return self._circuit_open_response(url)
+
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire(*self._rate_limit_key(url, additional_headers))
+            if limiter is not None:
+                limiter.acquire()
+            started_at = time.perf_counter()
+            status_code = 0
+            try:
+                response = self._send_once(url, method, payload, additional_headers, params, timeout, operation)
+                status_code = response.get('status_code')
+            finally:
+                if limiter is not None:
+                    limiter.release(time.perf_counter() - started_at, status_code)
+                # The outcome is always recorded, so that a failed trial call never keeps its half-open slot
+                if breaker is not None:
+                    if status_code is None:
+                        breaker.release()
+                    else:
+                        breaker.record(status_code)
+
+            if status_code == 401 and self.token_manager is not None and not token_renewed:
+                # The token expired or was revoked, so it is renewed and the request sent again once
+                token_renewed = True
+                attempt -= 1
+                self.token_manager.invalidate(token)
+                continue
+
+            delay = self._retry_delay(method, response, attempt, idempotent)
+            if delay is None:
+                return response
+            time.sleep(delay)
+
+    def _send_once(self, url, method, payload=None, additional_headers=None, params=None, timeout=30,
+                   operation=None):
+        """Auxiliary method to configure and execute a single attempt of a request to FIWARE APIs
 
-            _log_response(status_code, response_str, headers)
+        :param url: The url to be called on the request
+        :param payload: The payload to be sent on the request
+        :param method: The method to be used on the request
+        :param additional_headers: Additional http headers to be used in the request
+        :param timeout: The request's timeout
+        :param operation: The name of the client operation making the request, reported to the metrics collector
+        :return: The response from the request execution
+        """
+        started_at = time.perf_counter()
+        headers, str_payload = self._prepare_request(payload, additional_headers)
 
-            return {
-                'status_code': status_code,
-                'headers': headers,
-                'response': response
-            }
+        if method not in ('GET', 'POST', 'PUT', 'DELETE'):
+            logging.error(f"Unsupported method '{str(method)}'")
+            return {'error': "Unsupported method. Select one of 'GET', 'POST', 'PUT' and 'DELETE'"}
+
+        log_body = self._log_bodies()
+        max_body_length = self.fiware_config.log_body_max_length
+        _log_request(method, url, params, headers, str_payload, log_body, max_body_length)
+
+        sent_at = time.perf_counter()
+        try:
+            r = self.transport.request(method, url, params=params, data=str_payload, headers=headers,
+                                       timeout=timeout)
+            received_at = time.perf_counter()
+
+            response = self._build_response(r.status_code, r.headers, r.content)
+            _log_response(r.status_code, r.content, r.headers, log_body, max_body_length)
 
-        except (ConnectionRefusedError, requests.exceptions.ConnectionError) as e:
-            logging.error(f"Response Error: {e.strerror}")
+            if self.metrics is not None:
+                self._record_request(operation, url, method, r.status_code, str_payload, len(r.content), started_at,
+                                     sent_at, received_at)
+
+            return response
+
+        except (ConnectionRefusedError, requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            # A timed out request is handled as a connection error, so that it is retried and counted by the breaker
+            message = _connection_error_message(e)
+            logging.error(f"Response Error: {message}")
+
+            if self.metrics is not None:
+                self._record_request(operation, url, method, 0, str_payload, 0, started_at, sent_at,
+                                     time.perf_counter())
 
             return {
                 'status_code': 0,
-                'response': e.strerror
+                'response': message
             }
 
-    def authenticate(self, username, password, timeout=30):
+    def _stream_request(self, url, path=(), params=None, additional_headers=None, timeout=30, chunk_size=65536,
+                        operation=None):
+        """Auxiliary method to execute a GET request to FIWARE APIs, decoding the items of an array of the response
+        as they are received, so that only the item being read is kept in memory
+
+        :param url: The url to be called on the request
+        :param path: The keys and indexes leading to the array in the response. An empty path selects a top-level array
+        :param params: The query parameters to be sent on the request
+        :param additional_headers: Additional http headers to be used in the request
+        :param timeout: The timeout for the connection and for each read from it
+        :param chunk_size: The number of bytes read from the connection at a time
+        :param operation: The name of the client operation making the request, reported to the metrics collector
+        :return: A generator of the decoded items
+        :raises FiwareRequestError: If the request fails or its response is not successful
+        """
+        breaker = self._circuit_breaker_for(url)
+        if breaker is not None and not breaker.allow():
+            response = self._circuit_open_response(url)
+            raise FiwareRequestError(f"Request to {url} failed: {response['response']}", response)
+
+        try:
+            self._ensure_token()
+        except Exception as e:
+            logging.error(f"Authentication Error: {e}")
+            if breaker is not None:
+                breaker.release()
+            raise FiwareRequestError(f"Request to {url} failed: {e}", {'error': f"Authentication failed: {e}"})
+
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire(*self._rate_limit_key(url, additional_headers))
+
+        started_at = time.perf_counter()
+        headers, _ = self._prepare_request(additional_headers=additional_headers)
+        _log_request('GET', url, params, headers, '')
+
+        sent_at = time.perf_counter()
+        try:
+            r = self.transport.request('GET', url, params=params, headers=headers, timeout=timeout, stream=True)
+        except (ConnectionRefusedError, requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            message = _connection_error_message(e)
+            logging.error(f"Response Error: {message}")
+            if breaker is not None:
+                breaker.record(0)
+            if self.metrics is not None:
+                self._record_request(operation, url, 'GET', 0, '', 0, started_at, sent_at, time.perf_counter())
+            raise FiwareRequestError(f"Request to {url} failed: {e}", {'status_code': 0, 'response': message})
+
+        received_at = time.perf_counter()
+        bytes_received = 0
+        if breaker is not None:
+            breaker.record(r.status_code)
+        try:
+            if r.status_code != 200:
+                response = self._build_response(r.status_code, r.headers, r.content)
+                bytes_received = len(r.content)
+                _log_response(r.status_code, r.content, r.headers, self._log_bodies(),
+                              self.fiware_config.log_body_max_length)
+                raise FiwareRequestError(f"Request to {url} failed: {response['response']}", response)
+
+            _log_response(r.status_code, '', r.headers, log_body=False)
+
+            stream = JsonArrayStream(path)
+            for chunk in r.iter_content(chunk_size):
+                bytes_received += len(chunk)
+                yield from stream.feed(chunk)
+            yield from stream.close()
+        finally:
+            r.close()
+            if self.metrics is not None:
+                self._record_request(operation, url, 'GET', r.status_code, '', bytes_received, started_at, sent_at,
+                                     received_at)
+
+    def _cache_key(self, *resource_key):
+        """Auxiliary method to build the cache key of a resource in the currently selected service
+
+        :param resource_key: The values identifying the resource (e.g. its kind, type and id)
+        :return: The cache key
+        """
+        tenant = self._tenant()
+        return (tenant.service, tenant.service_path) + resource_key
+
+    def _cached_request(self, resource_key, url, method, **kwargs):
+        """Auxiliary method to execute a lookup request through the cache, if the client has one.
+        Only successful responses are cached
+
+        :param resource_key: The values identifying the requested resource (e.g. its kind, type and id)
+        :param url: The url to be called on the request
+        :param method: The method to be used on the request
+        :param kwargs: Additional arguments of the request
+        :return: The cached response or the response from the request execution
+        """
+        if self.cache is None:
+            return self._send_request(url, method, **kwargs)
+
+        cache_key = self._cache_key(*resource_key)
+        response = self.cache.get(cache_key)
+        if response is None:
+            response = self._send_request(url, method, **kwargs)
+            if response.get('status_code') == 200:
+                self.cache.set(cache_key, response)
+
+        return response
+
+    def _invalidating_request(self, resource_keys, url, method, **kwargs):
+        """Auxiliary method to execute a request which modifies resources, removing them from the cache
+
+        :param resource_keys: A list with the values identifying each modified resource
+        :param url: The url to be called on the request
+        :param method: The method to be used on the request
+        :param kwargs: Additional arguments of the request
+        :return: The response from the request execution
+        """
+        response = self._send_request(url, method, **kwargs)
+        self._invalidate_cache(resource_keys)
+        return response
+
+    def _invalidate_cache(self, resource_keys):
+        """Auxiliary method to remove resources of the currently selected service from the cache
+
+        :param resource_keys: A list with the values identifying each resource
+        :return: None
+        """
+        if self.cache is not None:
+            for resource_key in resource_keys:
+                self.cache.invalidate(self._cache_key(*resource_key))
+
+    def authenticate(self, username, password, timeout=30, tokens_url=DEFAULT_TOKENS_URL):
         """Generates an authentication token based on user credentials using FIWARE Lab OAuth2.0 Authentication system
            If you didn't have a user, go and register first at http://cloud.fiware.org
+           The token is then kept valid by a TokenManager, which refreshes it ahead of its expiration
 
         :param username: the user's username from Fiware authentication account
         :param password: the user's password from Fiware authentication account
         :param timeout: the authentication request timeout
+        :param tokens_url: the url of the tokens API of the authentication system
         :return: the generated token and expiration
         """
-        tokens_url = "http://cloud.lab.fi-ware.org:4730/v2.0/tokens"
-
-        payload = {
-            "auth": {
-                "passwordCredentials": {
-                    "username": str(username),
-                    "password": str(password)
-                }
-            }
-        }
-
-        headers = {'Content-Type': 'application/json'}
-        url = tokens_url
+        authenticator = KeystoneAuthenticator(username, password, tokens_url=tokens_url, timeout=timeout,
+                                              transport=self.transport)
+        self.token_manager = TokenManager(authenticator)
+        token = self.token_manager.get_token()
 
-        resp = requests.post(url, data=json.dumps(payload), headers=headers, timeout=timeout)
-
-        self.token = resp.json()["access"]["token"]["id"]
-        self.expires_at = resp.json()["access"]["token"]["expires"]
-
-        logging.debug(f"FIWARE OAuth2.0 Token: {self.token}")
+        logging.debug(f"FIWARE OAuth2.0 Token: {token}")
         logging.debug(f"Token expiration: {self.expires_at}")
 
+        return token, self.expires_at
+
     def set_service(self, service, service_path):
-        """Specify the service context to use on operations
+        """Specify the service context to use on operations by default.
+        The configuration of the client is not modified, so it can be shared with other clients
 
         :param service: The name of the service to be used
         :param service_path: The service path of the service to be used
         :return: None
         """
-        self.fiware_config.service = service
-        self.fiware_config.service_path = service_path
+        self._default_tenant = self._get_tenant(service, service_path)
+
+    @contextlib.contextmanager
+    def tenant(self, service, service_path):
+        """Select the service context of the operations made by the client within a with block.
+        The selection only applies to the current thread or asyncio task (and to the tasks and batch
+        requests started from it), so a single client and its connections can serve several tenants at once
+
+        :param service: The name of the service to be used
+        :param service_path: The service path of the service to be used
+        :return: A context manager yielding the client
+        """
+        reset_token = tenant_context.set_override(self, self._get_tenant(service, service_path))
+        try:
+            yield self
+        finally:
+            tenant_context.reset_override(reset_token)
+
+    @property
+    def service(self):
+        """The service used by the operations of the client in the current context"""
+        return self._tenant().service
+
+    @property
+    def service_path(self):
+        """The service path used by the operations of the client in the current context"""
+        return self._tenant().service_path
+
+    def _get_tenant(self, service, service_path):
+        """Auxiliary method to get the Tenant of a service context, whose default headers are built only once
+
+        :param service: The name of the service
+        :param service_path: The service path of the service
+        :return: The Tenant
+        """
+        tenant = self._tenants.get((service, service_path))
+        if tenant is None:
+            tenant = self._tenants.setdefault((service, service_path), Tenant(service, service_path))
+        return tenant
+
+    def _tenant(self):
+        """Auxiliary method to get the tenant of the operations made in the current thread or asyncio task
+
+        :return: The Tenant selected with the tenant() context manager, or the default one of the client
+        """
+        return tenant_context.get_override(self) or self._default_tenant
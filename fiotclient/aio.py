@@ -0,0 +1,868 @@
+import asyncio
+import functools
+import logging
+import time
+from collections import deque
+
+import aiohttp
+
+from . import _log_request, _log_response, ul, utils
+from .auth import DEFAULT_TOKENS_URL, KeystoneAuthenticator, TokenManager
+from .config import FiwareConfig
+from .context import BATCH_ACTION_TYPES, FiwareContextClient
+from .exceptions import FiwareRequestError, MqttPublishError
+from .iot import FiwareIotClient
+from .streaming import JsonArrayStream
+from .template import as_template
+
+
+async def bounded_gather(function, items, max_concurrency):
+    """Run a coroutine function over each item, keeping at most max_concurrency calls in flight
+
+    :param function: The coroutine function to be applied to each item
+    :param items: The iterable of items. It is consumed lazily, as calls complete
+    :param max_concurrency: The maximum number of concurrent calls
+    :return: A list of the results, in the same order as the items
+    """
+    results = []
+    pending = deque()
+    for item in items:
+        if len(pending) >= max_concurrency:
+            results.append(await pending.popleft())
+        pending.append(asyncio.ensure_future(function(item)))
+
+    while pending:
+        results.append(await pending.popleft())
+
+    return results
+
+
+async def aiter_pages(fetch_page, page_size, prefetch=True, max_concurrency=1):
+    """Iterate over the items of a paginated resource, fetching the pages on demand without blocking the event loop
+
+    :param fetch_page: A coroutine function receiving an offset and a limit and returning a tuple with the list
+                       of items of the page and the total number of items (or None if the total is unknown)
+    :param page_size: The number of items requested on each page
+    :param prefetch: If the next page should be fetched while the items of the current one are consumed
+    :param max_concurrency: The maximum number of pages fetched at the same time once the total is known
+    :return: An asynchronous generator of the items
+    """
+    pending = deque()
+    try:
+        items, total = await fetch_page(0, page_size)
+
+        if total is not None and max_concurrency > 1:
+            for item in items:
+                yield item
+            for offset in range(page_size, total, page_size):
+                if len(pending) >= max_concurrency:
+                    page_items, _ = await pending.popleft()
+                    for item in page_items:
+                        yield item
+                pending.append(asyncio.ensure_future(fetch_page(offset, page_size)))
+            while pending:
+                page_items, _ = await pending.popleft()
+                for item in page_items:
+                    yield item
+            return
+
+        offset = 0
+        while True:
+            next_offset = offset + page_size
+            has_more = bool(items) and (len(items) == page_size if total is None else next_offset < total)
+
+            if has_more and prefetch:
+                pending.append(asyncio.ensure_future(fetch_page(next_offset, page_size)))
+
+            for item in items:
+                yield item
+
+            if not has_more:
+                return
+
+            items, page_total = await (pending.popleft() if pending else fetch_page(next_offset, page_size))
+            total = page_total if page_total is not None else total
+            offset = next_offset
+    finally:
+        for page in pending:
+            page.cancel()
+
+
+def _connection_error_message(error):
+    """Auxiliary method to describe a request which got no response
+
+    :param error: The connection or timeout error raised by the transport
+    :return: The description of the error
+    """
+    if isinstance(error, asyncio.TimeoutError):
+        return f"Request timed out: {error}" if str(error) else "Request timed out"
+    return str(error)
+
+
+class BufferedResponse(object):
+
+    def __init__(self, status_code, headers, content, encoding='utf-8'):
+        """Response of a request executed by the AsyncHttpTransport, with its body already read
+
+        :param status_code: The status code of the response
+        :param headers: The http headers of the response
+        :param content: The raw body of the response
+        :param encoding: The charset used to decode the body
+        """
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+        self.encoding = encoding
+
+    @property
+    def text(self):
+        return self.content.decode(self.encoding, errors='replace')
+
+
+class StreamedResponse(object):
+
+    def __init__(self, response):
+        """Response of a request executed by the AsyncHttpTransport, whose body is read on demand.
+        It must be closed to release its connection
+
+        :param response: The aiohttp response
+        """
+        self._response = response
+        self.status_code = response.status
+        self.headers = response.headers
+
+    async def read(self):
+        """Read the whole body of the response
+
+        :return: The raw body of the response
+        """
+        return await self._response.read()
+
+    def iter_content(self, chunk_size):
+        """Iterate over the body of the response as it is received
+
+        :param chunk_size: The maximum number of bytes of each chunk
+        :return: An asynchronous iterator of bytes chunks
+        """
+        return self._response.content.iter_chunked(chunk_size)
+
+    def close(self):
+        self._response.release()
+
+
+class AsyncHttpTransport(object):
+
+    def __init__(self, pool_connections=10, pool_maxsize=10, keep_alive=True, idle_timeout=None):
+        """Non-blocking pooled HTTP transport used by the asyncio clients
+
+        A single transport can be shared by several asyncio clients running on the same event loop.
+
+        :param pool_connections: The number of hosts for which connections are pooled
+        :param pool_maxsize: The maximum number of simultaneous connections to each host
+        :param keep_alive: If connections should be kept open between requests
+        :param idle_timeout: Time in seconds after which idle connections are closed.
+                             If no value is provided, the aiohttp default is used
+        """
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.keep_alive = keep_alive
+        self.idle_timeout = idle_timeout
+
+        self._session = None
+        self._closed = False
+
+    @classmethod
+    def from_config(cls, fiware_config: FiwareConfig):
+        """Creates a transport with the pool settings of the given configuration
+
+        :param fiware_config: The FiwareConfig object from which to load the pool settings
+        """
+        return cls(pool_connections=fiware_config.http_pool_connections,
+                   pool_maxsize=fiware_config.http_pool_maxsize,
+                   keep_alive=fiware_config.http_keep_alive,
+                   idle_timeout=fiware_config.http_idle_timeout)
+
+    def _get_session(self):
+        """Auxiliary method to get the pooled session, creating it on the running event loop on first use
+
+        :return: The aiohttp session used to execute the requests
+        """
+        if self._closed:
+            raise RuntimeError("Transport is closed")
+
+        if self._session is None:
+            connector_options = {}
+            if not self.keep_alive:
+                connector_options['force_close'] = True
+            elif self.idle_timeout is not None:
+                connector_options['keepalive_timeout'] = self.idle_timeout
+
+            connector = aiohttp.TCPConnector(limit=self.pool_connections * self.pool_maxsize,
+                                             limit_per_host=self.pool_maxsize, **connector_options)
+            self._session = aiohttp.ClientSession(connector=connector)
+
+        return self._session
+
+    async def request(self, method, url, params=None, data=None, headers=None, timeout=30, stream=False):
+        """Executes a request using a pooled connection
+
+        :param method: The method to be used on the request
+        :param url: The url to be called on the request
+        :param params: The query parameters to be sent on the request
+        :param data: The body to be sent on the request
+        :param headers: The http headers to be used in the request
+        :param timeout: The request's timeout. When streaming, the timeout of the connection and of each read
+        :param stream: If the response body should be read lazily
+        :return: The BufferedResponse of the request execution, or a StreamedResponse when streaming
+        """
+        session = self._get_session()
+        if stream:
+            r = await session.request(method, url, params=params, data=data, headers=headers,
+                                      timeout=aiohttp.ClientTimeout(sock_connect=timeout, sock_read=timeout))
+            return StreamedResponse(r)
+
+        async with session.request(method, url, params=params, data=data, headers=headers,
+                                   timeout=aiohttp.ClientTimeout(total=timeout)) as r:
+            content = await r.read()
+            return BufferedResponse(r.status, r.headers, content, r.charset or 'utf-8')
+
+    async def close(self):
+        """Closes all the pooled connections. The transport can't be used after being closed
+
+        :return: None
+        """
+        self._closed = True
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    @property
+    def closed(self):
+        return self._closed
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+
+class AsyncClientMixin(object):
+    """Turns a client into its asyncio counterpart, executing the requests on an AsyncHttpTransport.
+    Every request method of the resulting client is a coroutine
+    """
+
+    transport_class = AsyncHttpTransport
+
+    async def _ensure_token_async(self):
+        """Auxiliary method to get a valid authentication token before sending a request,
+        waiting without blocking the event loop for it to be refreshed if needed
+
+        :return: The token
+        """
+        if self.token_manager is None:
+            return self._token
+        return await self.token_manager.get_token_async()
+
+    async def _send_request(self, url, method, payload=None, additional_headers=None, params=None, timeout=30,
+                            operation=None, idempotent=None):
+        """Auxiliary method to configure and execute a request to FIWARE APIs without blocking the event loop.
+        GET requests identical to one already in flight share its response, if the client has a single-flight layer
+
+        :param url: The url to be called on the request
+        :param payload: The payload to be sent on the request
+        :param method: The method to be used on the request
+        :param additional_headers: Additional http headers to be used in the request
+        :param timeout: The request's timeout
+        :param operation: The name of the client operation making the request, reported to the metrics collector
+        :param idempotent: If the request can be safely repeated. If None, it is deduced from the method
+        :return: The response from the request execution
+        """
+        if self.single_flight is None or method != 'GET':
+            return await self._execute_request(url, method, payload, additional_headers, params, timeout, operation,
+                                               idempotent)
+
+        return await self.single_flight.do_async(
+            self._single_flight_key(url, params, additional_headers),
+            functools.partial(self._execute_request, url, method, payload, additional_headers, params, timeout,
+                              operation, idempotent))
+
+    async def _execute_request(self, url, method, payload=None, additional_headers=None, params=None, timeout=30,
+                               operation=None, idempotent=None):
+        """Auxiliary method to configure and execute a request to FIWARE APIs without blocking the event loop,
+        retrying it according to the retry policy and failing fast if the circuit of its component is open.
+        A request rejected with 401 is sent again once with a renewed token, if the client has a token manager.
+        Each attempt waits for its turn on the rate limiter and for a free slot of the concurrency limiter
+        of its component
+
+        :param url: The url to be called on the request
+        :param payload: The payload to be sent on the request
+        :param method: The method to be used on the request
+        :param additional_headers: Additional http headers to be used in the request
+        :param timeout: The request's timeout
+        :param operation: The name of the client operation making the request, reported to the metrics collector
+        :param idempotent: If the request can be safely repeated. If None, it is deduced from the method
+        :return: The response from the request execution
+        """
+        breaker = self._circuit_breaker_for(url)
+        limiter = self._limiter_for(url)
+        attempt = 0
+        token_renewed = False
+        while True:
+            attempt += 1
+            try:
+                token = await self._ensure_token_async()
+            except Exception as e:
+                logging.error(f"Authentication Error: {e}")
+                return {'error': f"Authentication failed: {e}"}
+
+            if breaker is not None and not breaker.allow():
+                return self._circuit_open_response(url)
+
+            if self.rate_limiter is not None:
+                await self.rate_limiter.acquire_async(*self._rate_limit_key(url, additional_headers))
+            if limiter is not None:
+                await limiter.acquire_async()
+            started_at = time.perf_counter()
+            status_code = 0
+            try:
+                response = await self._send_once(url, method, payload, additional_headers, params, timeout, operation)
+                status_code = response.get('status_code')
+            finally:
+                if limiter is not None:
+                    limiter.release(time.perf_counter() - started_at, status_code)
+                # The outcome is always recorded, so that a failed trial call never keeps its half-open slot
+                if breaker is not None:
+                    if status_code is None:
+                        breaker.release()
+                    else:
+                        breaker.record(status_code)
+
+            if status_code == 401 and self.token_manager is not None and not token_renewed:
+                # The token expired or was revoked, so it is renewed and the request sent again once
+                token_renewed = True
+                attempt -= 1
+                self.token_manager.invalidate(token)
+                continue
+
+            delay = self._retry_delay(method, response, attempt, idempotent)
+            if delay is None:
+                return response
+            await asyncio.sleep(delay)
+
+    async def _send_once(self, url, method, payload=None, additional_headers=None, params=None, timeout=30,
+                         operation=None):
+        """Auxiliary method to configure and execute a single attempt of a request to FIWARE APIs
+        without blocking the event loop
+
+        :param url: The url to be called on the request
+        :param payload: The payload to be sent on the request
+        :param method: The method to be used on the request
+        :param additional_headers: Additional http headers to be used in the request
+        :param timeout: The request's timeout
+        :param operation: The name of the client operation making the request, reported to the metrics collector
+        :return: The response from the request execution
+        """
+        started_at = time.perf_counter()
+        headers, str_payload = self._prepare_request(payload, additional_headers)
+
+        if method not in ('GET', 'POST', 'PUT', 'DELETE'):
+            logging.error(f"Unsupported method '{str(method)}'")
+            return {'error': "Unsupported method. Select one of 'GET', 'POST', 'PUT' and 'DELETE'"}
+
+        log_body = self._log_bodies()
+        max_body_length = self.fiware_config.log_body_max_length
+        _log_request(method, url, params, headers, str_payload, log_body, max_body_length)
+
+        sent_at = time.perf_counter()
+        try:
+            r = await self.transport.request(method, url, params=params, data=str_payload, headers=headers,
+                                             timeout=timeout)
+            received_at = time.perf_counter()
+
+            response = self._build_response(r.status_code, r.headers, r.content)
+            _log_response(r.status_code, r.content, r.headers, log_body, max_body_length)
+
+            if self.metrics is not None:
+                self._record_request(operation, url, method, r.status_code, str_payload, len(r.content), started_at,
+                                     sent_at, received_at)
+
+            return response
+
+        except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+            # A timed out request is handled as a connection error, so that it is retried and counted by the breaker
+            message = _connection_error_message(e)
+            logging.error(f"Response Error: {message}")
+
+            if self.metrics is not None:
+                self._record_request(operation, url, method, 0, str_payload, 0, started_at, sent_at,
+                                     time.perf_counter())
+
+            return {
+                'status_code': 0,
+                'response': message
+            }
+
+    async def _stream_request(self, url, path=(), params=None, additional_headers=None, timeout=30, chunk_size=65536,
+                              operation=None):
+        """Auxiliary method to execute a GET request to FIWARE APIs without blocking the event loop, decoding
+        the items of an array of the response as they are received
+
+        :param url: The url to be called on the request
+        :param path: The keys and indexes leading to the array in the response. An empty path selects a top-level array
+        :param params: The query parameters to be sent on the request
+        :param additional_headers: Additional http headers to be used in the request
+        :param timeout: The timeout for the connection and for each read from it
+        :param chunk_size: The number of bytes read from the connection at a time
+        :param operation: The name of the client operation making the request, reported to the metrics collector
+        :return: An asynchronous generator of the decoded items
+        :raises FiwareRequestError: If the request fails or its response is not successful
+        """
+        breaker = self._circuit_breaker_for(url)
+        if breaker is not None and not breaker.allow():
+            response = self._circuit_open_response(url)
+            raise FiwareRequestError(f"Request to {url} failed: {response['response']}", response)
+
+        try:
+            await self._ensure_token_async()
+        except Exception as e:
+            logging.error(f"Authentication Error: {e}")
+            if breaker is not None:
+                breaker.release()
+            raise FiwareRequestError(f"Request to {url} failed: {e}", {'error': f"Authentication failed: {e}"})
+
+        if self.rate_limiter is not None:
+            await self.rate_limiter.acquire_async(*self._rate_limit_key(url, additional_headers))
+
+        started_at = time.perf_counter()
+        headers, _ = self._prepare_request(additional_headers=additional_headers)
+        _log_request('GET', url, params, headers, '')
+
+        sent_at = time.perf_counter()
+        try:
+            r = await self.transport.request('GET', url, params=params, headers=headers, timeout=timeout, stream=True)
+        except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+            message = _connection_error_message(e)
+            logging.error(f"Response Error: {message}")
+            if breaker is not None:
+                breaker.record(0)
+            if self.metrics is not None:
+                self._record_request(operation, url, 'GET', 0, '', 0, started_at, sent_at, time.perf_counter())
+            raise FiwareRequestError(f"Request to {url} failed: {message}", {'status_code': 0, 'response': message})
+
+        received_at = time.perf_counter()
+        bytes_received = 0
+        if breaker is not None:
+            breaker.record(r.status_code)
+        try:
+            if r.status_code != 200:
+                content = await r.read()
+                bytes_received = len(content)
+                response = self._build_response(r.status_code, r.headers, content)
+                _log_response(r.status_code, content, r.headers, self._log_bodies(),
+                              self.fiware_config.log_body_max_length)
+                raise FiwareRequestError(f"Request to {url} failed: {response['response']}", response)
+
+            _log_response(r.status_code, '', r.headers, log_body=False)
+
+            stream = JsonArrayStream(path)
+            async for chunk in r.iter_content(chunk_size):
+                bytes_received += len(chunk)
+                for item in stream.feed(chunk):
+                    yield item
+            for item in stream.close():
+                yield item
+        finally:
+            r.close()
+            if self.metrics is not None:
+                self._record_request(operation, url, 'GET', r.status_code, '', bytes_received, started_at, sent_at,
+                                     received_at)
+
+    async def _cached_request(self, resource_key, url, method, **kwargs):
+        """Auxiliary method to execute a lookup request through the cache, if the client has one.
+        Only successful responses are cached
+
+        :param resource_key: The values identifying the requested resource (e.g. its kind, type and id)
+        :param url: The url to be called on the request
+        :param method: The method to be used on the request
+        :param kwargs: Additional arguments of the request
+        :return: The cached response or the response from the request execution
+        """
+        if self.cache is None:
+            return await self._send_request(url, method, **kwargs)
+
+        cache_key = self._cache_key(*resource_key)
+        response = self.cache.get(cache_key)
+        if response is None:
+            response = await self._send_request(url, method, **kwargs)
+            if response.get('status_code') == 200:
+                self.cache.set(cache_key, response)
+
+        return response
+
+    async def _invalidating_request(self, resource_keys, url, method, **kwargs):
+        """Auxiliary method to execute a request which modifies resources, removing them from the cache
+
+        :param resource_keys: A list with the values identifying each modified resource
+        :param url: The url to be called on the request
+        :param method: The method to be used on the request
+        :param kwargs: Additional arguments of the request
+        :return: The response from the request execution
+        """
+        response = await self._send_request(url, method, **kwargs)
+        self._invalidate_cache(resource_keys)
+        return response
+
+    async def authenticate(self, username, password, timeout=30, tokens_url=DEFAULT_TOKENS_URL):
+        """Generates an authentication token based on user credentials using FIWARE Lab OAuth2.0 Authentication system
+           If you didn't have a user, go and register first at http://cloud.fiware.org
+           The token is then kept valid by a TokenManager, which refreshes it ahead of its expiration
+
+        :param username: the user's username from Fiware authentication account
+        :param password: the user's password from Fiware authentication account
+        :param timeout: the authentication request timeout
+        :param tokens_url: the url of the tokens API of the authentication system
+        :return: the generated token and expiration
+        """
+        authenticator = KeystoneAuthenticator(username, password, tokens_url=tokens_url, timeout=timeout)
+        self.token_manager = TokenManager(authenticator)
+        token = await self.token_manager.get_token_async()
+
+        logging.debug(f"FIWARE OAuth2.0 Token: {token}")
+        logging.debug(f"Token expiration: {self.expires_at}")
+
+        return token, self.expires_at
+
+    async def close(self):
+        """Releases the resources held by the client.
+        The transport is only closed if it was created by the client itself, not when it was shared
+
+        :return: None
+        """
+        if self._owns_transport:
+            await self.transport.close()
+
+    def __enter__(self):
+        raise TypeError(f"Use 'async with' with {type(self).__name__}")
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+
+class AsyncFiwareContextClient(AsyncClientMixin, FiwareContextClient):
+
+    def __init__(self, fiware_config: FiwareConfig, **kwargs):
+        """Asyncio client for doing context management operations on FIWARE platform.
+        Offers the same methods as FiwareContextClient as coroutines
+
+        :param fiware_config: The FiwareConfig object from which to load the default configuration
+        :param kwargs: Additional options to be passed to BaseClient (e.g. a shared AsyncHttpTransport)
+        """
+        super(AsyncFiwareContextClient, self).__init__(fiware_config, **kwargs)
+
+    async def subscribe_attribute_change_with_rule(self, attribute, attribute_type, condition, action='post',
+                                                   notification_url=None):
+        """Register a new rule to be evaluated on attribute values change and a action to be taken when rule evaluated to true
+
+        :param attribute: The attribute to be monitored
+        :param attribute_type: The type of the attribute to be monitored
+        :param condition: The condition to be evaluated on changes on attribute's value
+        :param action: The action type to be taken when condition is evaluated true.
+                       Currently accepted values to this parameter are 'email' and 'post'
+        :param notification_url: The endpoint to which POST notifications will be sent
+        :return: The information of the created rule
+        """
+        result = super(AsyncFiwareContextClient, self).subscribe_attribute_change_with_rule(
+            attribute, attribute_type, condition, action=action, notification_url=notification_url)
+
+        if isinstance(result, dict):
+            return result
+        return await result
+
+    def iter_entities(self, entity_type=None, id_pattern=None, q=None, options=None, page_size=1000, prefetch=True,
+                      max_concurrency=1):
+        """Iterate over all the entities matching the given filters, requesting them page by page
+
+        :param entity_type: The type of the entities to be listed
+        :param id_pattern: A regular expression the ids of the entities must match
+        :param q: A query expression the entities must match
+        :param options: Additional options of the query (e.g. 'keyValues')
+        :param page_size: The number of entities requested on each page (Orion accepts up to 1000)
+        :param prefetch: If the next page should be requested while the current one is consumed
+        :param max_concurrency: The maximum number of pages requested at the same time.
+                                If greater than one, the pages are requested in parallel once the total is known
+        :return: An asynchronous generator of the entities
+        """
+        fetch_page = functools.partial(self._get_entities_page, entity_type=entity_type, id_pattern=id_pattern, q=q,
+                                       options=options)
+        return aiter_pages(fetch_page, page_size, prefetch=prefetch, max_concurrency=max_concurrency)
+
+    async def _get_entities_page(self, offset, limit, entity_type=None, id_pattern=None, q=None, options=None):
+        """Auxiliary method to request a page of entities along with the total number of entities
+
+        :param offset: The number of entities to skip
+        :param limit: The maximum number of entities on the page
+        :return: A tuple with the list of entities of the page and the total number of entities
+        """
+        options = f'{options},count' if options else 'count'
+        response = await self.get_entities(entity_type=entity_type, id_pattern=id_pattern, q=q, limit=limit,
+                                           offset=offset, options=options)
+        return self._parse_entities_page(response)
+
+    async def batch_update(self, entities, action_type, max_entities=1000, max_bytes=1000000, max_concurrency=4):
+        """Applies an NGSI v2 batch operation (POST /v2/op/update) over several entities.
+        The entities are split into requests limited by number of entities and payload size,
+        which are sent concurrently
+
+        :param entities: An iterable of dicts representing the entities of the operation
+        :param action_type: The action type of the operation.
+                            Accepted values are 'append', 'appendStrict', 'update', 'replace' and 'delete'
+        :param max_entities: The maximum number of entities sent on each request
+        :param max_bytes: The maximum size in bytes of the entities sent on each request
+        :param max_concurrency: The maximum number of requests executed at the same time
+        :return: A list with the response of each request, along with the entities sent on it,
+                 so that the failed chunks can be retried
+        """
+        if action_type not in BATCH_ACTION_TYPES:
+            error_msg = f"Unknown batch action type '{action_type}'"
+            logging.error(error_msg)
+            return {'error': error_msg}
+
+        batches = self._split_entity_batches(entities, action_type, max_entities, max_bytes)
+        # Repeating an 'appendStrict' fails for the entities created by the first attempt
+        send_batch = functools.partial(self._send_entity_batch, idempotent=action_type != 'appendStrict')
+        return await bounded_gather(send_batch, batches, max_concurrency)
+
+    async def _send_entity_batch(self, batch, idempotent=None):
+        """Auxiliary method to send a single request of a batch operation
+
+        :param batch: A (entities, payload string) tuple
+        :param idempotent: If the request can be safely repeated by the retry policy
+        :return: The response of the request, along with the entities sent on it
+        """
+        entities, payload = batch
+
+        url = f"{self.cb_url}/v2/op/update"
+        additional_headers = {'Content-Type': 'application/json'}
+
+        response = await self._send_request(url, 'POST', payload=payload, additional_headers=additional_headers,
+                                            operation='batch_update', idempotent=idempotent)
+        response['entities'] = entities
+
+        self._invalidate_cache(self._entities_cache_keys(entities))
+
+        return response
+
+
+class AsyncFiwareIotClient(AsyncClientMixin, FiwareIotClient):
+
+    def __init__(self, fiware_config: FiwareConfig, **kwargs):
+        """Asyncio client for doing IoT management operations on FIWARE platform.
+        Offers the same methods as FiwareIotClient as coroutines
+
+        :param fiware_config: The FiwareConfig object from which to load the default configuration
+        :param kwargs: Additional options to be passed to BaseClient (e.g. a shared AsyncHttpTransport)
+        """
+        super(AsyncFiwareIotClient, self).__init__(fiware_config, **kwargs)
+
+    async def create_service(self, service, service_path, api_key=None):
+        """Creates a new service with the given information
+
+        :param service: The name of the service to be created
+        :param service_path: The service path of the service to be created
+        :param api_key: A specific api key to use to create the service.
+                        If no api key is provided, a random one will be generated.
+        :return: The information of the created service
+        """
+        response = None
+        if api_key:
+            response = await self._create_service(service, service_path, api_key)
+            response['api_key'] = api_key
+        else:
+            retries = 0
+            while retries < 5:
+                generated_api_key = self.generate_api_key()
+                response = await self._create_service(service, service_path, generated_api_key)
+                if response and response['status_code'] == 201:
+                    response['api_key'] = generated_api_key
+                    break
+                retries += 1
+
+        return response
+
+    async def close(self):
+        """Releases the resources held by the client.
+        The transport and the MQTT publisher are only closed if they were created by the client itself
+
+        :return: None
+        """
+        if self._owns_mqtt_publisher and self._mqtt_publisher is not None:
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(None, self._mqtt_publisher.close)
+
+        await super(AsyncFiwareIotClient, self).close()
+
+    async def _publish(self, topic, payload, timeout):
+        """Auxiliary method to publish a message without blocking the event loop
+
+        :param topic: The topic in which the message will be published
+        :param payload: The payload of the message
+        :param timeout: The maximum time in seconds to wait for the connection and for a free in-flight slot
+        :return: The paho MQTTMessageInfo of the publication
+        """
+        publisher = self.mqtt_publisher
+        try:
+            return publisher.publish(topic, payload, timeout=0)
+        except TimeoutError:
+            # Waiting for the connection or for a free in-flight slot blocks, so it is done on the default executor
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(None, functools.partial(publisher.publish, topic, payload,
+                                                                      timeout=timeout))
+
+    async def send_observation_payload(self, device_id, payload, protocol='MQTT', timeout=10):
+        """Sends an already encoded UL payload with one or more measurement groups from a device
+        to the FIWARE platform
+
+        :param device_id: The id of the device in which the measurements were obtained
+        :param payload: The UL payload string, with measurement groups separated by '#'
+        :param protocol: The transport protocol to be used to send measurements.
+                         Currently accepted values are 'MQTT' and 'HTTP'.
+                         If no value is provided the default value (MQTT) will be used
+        :param timeout: The timeout for the observation send request.
+                        Over MQTT, the maximum time to wait for the broker connection and for a free in-flight slot
+        :return: The summary of the sent measurements
+        """
+        if protocol == 'MQTT':
+            logging.debug("Transport protocol: MQTT")
+            topic = f"/{self.api_key}/{device_id}/attrs"
+
+            logging.info("Publishing to %s on topic %s", self.mqtt_broker_url, topic)
+            logging.debug("Payload: %s", payload)
+
+            started_at = time.perf_counter()
+            try:
+                await self._publish(topic, payload, timeout)
+            except (TimeoutError, MqttPublishError) as e:
+                logging.error(f"Error: {e}")
+                return {'error': str(e)}
+
+            if self.metrics is not None:
+                self._record_publish('send_observation', payload, started_at)
+
+            return {'result': 'OK'}
+
+        elif protocol == 'HTTP':
+            logging.debug("Transport protocol: UL-HTTP")
+
+            params = {
+                'k': self.api_key,
+                'i': device_id
+            }
+
+            url = f"{self.iota_protocol_url}/iot/d"
+            additional_headers = {'Content-Type': 'text/plain'}
+
+            response = await self._send_request(url, 'POST', params=params, payload=payload,
+                                                additional_headers=additional_headers, timeout=timeout,
+                                                operation='send_observation')
+            return self._summarize_observation(device_id, response)
+
+        else:
+            logging.error(f"Unknown transport protocol '{protocol}'")
+            error_msg = "Unknown transport protocol. Accepted values are 'MQTT' and 'HTTP'"
+            return {'error': error_msg}
+
+    def iter_devices(self, page_size=100, prefetch=True, max_concurrency=1):
+        """Iterate over all the devices registered in the currently selected service, requesting them page by page
+
+        :param page_size: The number of devices requested on each page
+        :param prefetch: If the next page should be requested while the current one is consumed
+        :param max_concurrency: The maximum number of pages requested at the same time.
+                                If greater than one, the pages are requested in parallel once the total is known
+        :return: An asynchronous generator of the devices
+        """
+        return aiter_pages(self._get_devices_page, page_size, prefetch=prefetch, max_concurrency=max_concurrency)
+
+    async def _get_devices_page(self, offset, limit):
+        """Auxiliary method to request a page of devices along with the total number of devices
+
+        :param offset: The number of devices to skip
+        :param limit: The maximum number of devices on the page
+        :return: A tuple with the list of devices of the page and the total number of devices
+        """
+        response = await self.list_devices(limit=limit, offset=offset)
+        return self._parse_devices_page(response)
+
+    async def send_observation_columns(self, device_id, columns, rows=None, protocol='MQTT', float_format=None,
+                                       max_bytes=4096, max_groups=None, timeout=10):
+        """Sends columnar measurements from a device to the FIWARE platform, where each row is a measurement group.
+        The rows are encoded in bulk and sent as multi-group UL payloads limited in size
+
+        :param device_id: The id of the device in which the measurements were obtained
+        :param columns: A dict of attribute names to NumPy arrays or sequences with the values of each attribute
+        :param rows: The number of rows to be sent. If no value is provided, the length of the columns is used
+        :param protocol: The transport protocol to be used to send measurements.
+                         Currently accepted values are 'MQTT' and 'HTTP'.
+                         If no value is provided the default value (MQTT) will be used
+        :param float_format: The %-style format applied to float values (e.g. '%.2f').
+                             If no value is provided, the shortest representation of each float is used
+        :param max_bytes: The maximum size in bytes of each payload
+        :param max_groups: The maximum number of measurement groups on each payload
+        :param timeout: The timeout for each observation send request
+        :return: A list with the summary of each sent payload
+        :raises ValueError: If an attribute name or a value contains a UL separator ('|' or '#')
+        """
+        payloads = ul.encode_columns(columns, rows=rows, float_format=float_format, max_bytes=max_bytes,
+                                     max_groups=max_groups)
+
+        return [await self.send_observation_payload(device_id, payload, protocol=protocol, timeout=timeout)
+                for payload in payloads]
+
+    async def register_devices(self, devices, device_schema, protocol='IoTA-UL', max_devices=100, max_concurrency=4,
+                               isolate_failures=True):
+        """Register several devices sharing the same structure in the currently selected service.
+        The schema is parsed only once and the devices are sent in batches on the 'devices' array of each request
+
+        :param devices: An iterable of (device_id, entity_id) or (device_id, entity_id, endpoint) tuples,
+                        where endpoint is on format IP:PORT
+        :param device_schema: JSON string representing device schema, or its SchemaTemplate
+        :param protocol: The protocol to be used on the devices.
+                         If no value is provided the default protocol (IoTA-UL) will be used
+        :param max_devices: The maximum number of devices sent on each request
+        :param max_concurrency: The maximum number of requests executed at the same time
+        :param isolate_failures: If the devices of a failed request should be registered one by one,
+                                 so that only the devices which actually failed are reported
+        :return: A dict with the list of the registered device ids and a dict of the failed device ids
+                 to the response of their registration request
+        """
+        device_template = as_template(device_schema)
+
+        rendered_devices = (self._render_device(device_template, *device) for device in devices)
+        batches = utils.split_batches(rendered_devices, max_devices)
+
+        register_batch = functools.partial(self._register_device_batch, protocol=protocol,
+                                           isolate_failures=isolate_failures)
+        results = await bounded_gather(register_batch, batches, max_concurrency)
+
+        return self._summarize_device_registration(results)
+
+    async def _register_device_batch(self, batch, protocol, isolate_failures):
+        """Auxiliary method to register a batch of rendered devices in a single request
+
+        :param batch: The list of device dicts to be registered
+        :param protocol: The protocol to be used on the devices
+        :param isolate_failures: If the devices should be registered one by one when the batch request fails
+        :return: A list of (device_id, response) tuples
+        """
+        response = await self._post_devices(batch, protocol)
+
+        if len(batch) > 1 and isolate_failures and not 200 <= response.get('status_code', 0) < 300:
+            return [(device['device_id'], await self._post_devices([device], protocol)) for device in batch]
+
+        return [(device['device_id'], response) for device in batch]
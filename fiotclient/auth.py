@@ -0,0 +1,226 @@
+import asyncio
+import calendar
+import json
+import logging
+import threading
+import time
+
+import requests
+
+DEFAULT_TOKENS_URL = "http://cloud.lab.fi-ware.org:4730/v2.0/tokens"
+
+
+def _parse_expiration(expires):
+    """Auxiliary function to convert the expiration date of a token into a timestamp
+
+    :param expires: The expiration date in ISO 8601 format, in UTC (e.g. '2024-01-01T12:00:00Z')
+    :return: The expiration as seconds since the epoch, or None if the date is missing or not recognized
+    """
+    if not expires:
+        return None
+
+    value = expires.replace('Z', '').split('+')[0]
+    for date_format in ('%Y-%m-%dT%H:%M:%S.%f', '%Y-%m-%dT%H:%M:%S'):
+        try:
+            return calendar.timegm(time.strptime(value, date_format))
+        except ValueError:
+            continue
+
+    logging.error(f"Unrecognized token expiration '{expires}'")
+    return None
+
+
+class KeystoneAuthenticator(object):
+
+    def __init__(self, username, password, tokens_url=DEFAULT_TOKENS_URL, timeout=30, transport=None):
+        """Generates authentication tokens based on user credentials using FIWARE Lab OAuth2.0 Authentication system
+
+        :param username: the user's username from Fiware authentication account
+        :param password: the user's password from Fiware authentication account
+        :param tokens_url: the url of the tokens API of the authentication system
+        :param timeout: the authentication request timeout
+        :param transport: the HttpTransport used to send the authentication requests.
+                          If no transport is provided, each request is sent on a new connection
+        """
+        self.username = username
+        self.password = password
+        self.tokens_url = tokens_url
+        self.timeout = timeout
+        self.transport = transport
+
+    def __call__(self):
+        """Request a new token
+
+        :return: A tuple with the token and its expiration as seconds since the epoch (or None if it doesn't expire)
+        :raises requests.exceptions.RequestException: If the request fails or the credentials are rejected
+        """
+        payload = {
+            "auth": {
+                "passwordCredentials": {
+                    "username": str(self.username),
+                    "password": str(self.password)
+                }
+            }
+        }
+
+        headers = {'Content-Type': 'application/json'}
+        data = json.dumps(payload)
+
+        if self.transport is not None:
+            resp = self.transport.request('POST', self.tokens_url, data=data, headers=headers, timeout=self.timeout)
+        else:
+            resp = requests.post(self.tokens_url, data=data, headers=headers, timeout=self.timeout)
+        resp.raise_for_status()
+
+        token = resp.json()["access"]["token"]
+        return token["id"], _parse_expiration(token.get("expires"))
+
+
+class TokenManager(object):
+
+    def __init__(self, fetch_token, refresh_margin=60.0, retry_interval=5.0):
+        """Keeps a valid authentication token, shared among threads, asyncio tasks and clients
+
+        The token is refreshed in the background when it is close to expiry, so that requests never wait for it.
+        When the token is missing, expired or rejected, the first caller refreshes it while the others wait
+        for that single refresh.
+
+        :param fetch_token: A callable requesting a new token, which returns a tuple with the token and its
+                            expiration as seconds since the epoch (or None if it doesn't expire)
+                            (e.g. a KeystoneAuthenticator)
+        :param refresh_margin: The time in seconds before expiry from which the token is refreshed in the background
+        :param retry_interval: The time in seconds before a failed background refresh is tried again
+        """
+        self.fetch_token = fetch_token
+        self.refresh_margin = refresh_margin
+        self.retry_interval = retry_interval
+
+        self._lock = threading.Lock()
+        self._refreshed = threading.Condition(self._lock)
+        self._token = None
+        self._expires_at = None
+        self._refreshing = False
+        self._generation = 0
+        self._error = None
+        self._retry_at = 0.0
+
+    @property
+    def token(self):
+        """The current token, without checking its expiration"""
+        return self._token
+
+    @property
+    def expires_at(self):
+        """The expiration of the current token as seconds since the epoch, or None if it doesn't expire"""
+        return self._expires_at
+
+    def get_token(self):
+        """Get a valid token, blocking the calling thread if it must be refreshed first
+
+        :return: The token
+        :raises Exception: The error of the refresh, if it failed
+        """
+        with self._lock:
+            while True:
+                token = self._valid_token()
+                if token is not None:
+                    return token
+
+                if not self._refreshing:
+                    self._refreshing = True
+                    break
+
+                # Another caller is refreshing the token
+                generation = self._generation
+                self._refreshed.wait_for(lambda: self._generation != generation)
+                if self._error is not None:
+                    raise self._error
+
+        return self._refresh()
+
+    async def get_token_async(self):
+        """Get a valid token, waiting without blocking the event loop if it must be refreshed first
+
+        :return: The token
+        :raises Exception: The error of the refresh, if it failed
+        """
+        with self._lock:
+            token = self._valid_token()
+        if token is not None:
+            return token
+        return await asyncio.get_running_loop().run_in_executor(None, self.get_token)
+
+    def invalidate(self, token):
+        """Discard a token rejected by the platform, so that the next request refreshes it.
+        Nothing is done if the token was already replaced, so that simultaneous rejections cause a single refresh
+
+        :param token: The rejected token
+        :return: None
+        """
+        with self._lock:
+            if self._token == token:
+                self._expires_at = 0.0
+
+    def _valid_token(self):
+        """Auxiliary method to get the current token if it is still valid, starting a background refresh
+        if it is close to expiry. Must be called holding the manager lock
+
+        :return: The token, or None if it is missing or expired
+        """
+        if self._token is None:
+            return None
+        if self._expires_at is None:
+            return self._token
+
+        now = time.time()
+        if now >= self._expires_at:
+            return None
+
+        if now >= self._expires_at - self.refresh_margin and not self._refreshing and now >= self._retry_at:
+            self._refreshing = True
+            threading.Thread(target=self._refresh_in_background, name='TokenRefresh', daemon=True).start()
+        return self._token
+
+    def _refresh(self):
+        """Auxiliary method to request a new token, waking up the callers waiting for it
+
+        :return: The new token
+        :raises Exception: The error of the request, if it failed
+        """
+        try:
+            token, expires_at = self.fetch_token()
+        except Exception as e:
+            with self._lock:
+                self._finish_refresh(error=e)
+            raise
+
+        with self._lock:
+            self._token = token
+            self._expires_at = expires_at
+            self._finish_refresh()
+
+        logging.debug(f"Token refreshed, expiration: {expires_at}")
+        return token
+
+    def _refresh_in_background(self):
+        """Auxiliary method to refresh the token ahead of expiry, keeping the current one if it fails
+
+        :return: None
+        """
+        try:
+            self._refresh()
+        except Exception as e:
+            logging.error(f"Background token refresh failed: {e}")
+            with self._lock:
+                self._retry_at = time.time() + self.retry_interval
+
+    def _finish_refresh(self, error=None):
+        """Auxiliary method to mark the end of a refresh. Must be called holding the manager lock
+
+        :param error: The error of the refresh, if it failed
+        :return: None
+        """
+        self._refreshing = False
+        self._error = error
+        self._generation += 1
+        self._refreshed.notify_all()
@@ -0,0 +1,207 @@
+import logging
+import threading
+import time
+
+from . import ul
+from .iot import FiwareIotClient
+
+
+class _DeviceBuffer(object):
+
+    def __init__(self):
+        """Measurement groups accumulated for a single device"""
+        self.groups = []
+        self.size = 0
+        self.first_added_at = None
+        self.send_lock = threading.Lock()
+
+
+class ObservationBuffer(object):
+
+    def __init__(self, iot_client: FiwareIotClient, protocol='MQTT', max_groups=10, max_bytes=4096, max_linger=1.0,
+                 timeout=10, on_error=None):
+        """Accumulates the measurement groups of each device and sends them as multi-group UL payloads,
+        reducing the number of messages sent to the broker or to the IoT Agent
+
+        The groups of a device are sent when any of the limits is reached. It is safe to add observations
+        from several threads. The remaining groups are sent when the buffer is closed.
+
+        :param iot_client: The FiwareIotClient used to send the observations
+        :param protocol: The transport protocol to be used to send measurements.
+                         Currently accepted values are 'MQTT' and 'HTTP'
+        :param max_groups: The maximum number of measurement groups sent on each payload
+        :param max_bytes: The maximum size in bytes of each payload.
+                          A single group bigger than this limit is sent alone
+        :param max_linger: The maximum time in seconds a group waits in the buffer before being sent.
+                           If None, groups are only sent when the other limits are reached or on flush
+        :param timeout: The timeout for each observation send request
+        :param on_error: A function called with the device id, the payload and the result of each failed send.
+                         If no function is provided, failures are logged
+        """
+        self.iot_client = iot_client
+        self.protocol = protocol
+        self.max_groups = max_groups
+        self.max_bytes = max_bytes
+        self.max_linger = max_linger
+        self.timeout = timeout
+        self.on_error = on_error
+
+        self.sent_payloads = 0
+        self.sent_groups = 0
+
+        self._buffers = {}
+        self._lock = threading.Lock()
+        self._linger_condition = threading.Condition(self._lock)
+        self._closed = False
+
+        self._linger_thread = None
+        if max_linger is not None:
+            self._linger_thread = threading.Thread(target=self._linger_loop, name='ObservationBuffer', daemon=True)
+            self._linger_thread.start()
+
+    def add(self, device_id, measurements):
+        """Adds a measurement group or a list of measurement groups from a device to the buffer
+
+        :param device_id: The id of the device in which the measurements were obtained
+        :param measurements: A measurement group (a dict where keys are device attributes and values are measurements
+                             for each attribute) or a list of measurement groups obtained in the device
+        :return: None
+        :raises ValueError: If an attribute name or a value contains a UL separator ('|' or '#')
+        """
+        if not isinstance(measurements, list):
+            measurements = [measurements]
+
+        for measurement_group in measurements:
+            group = ul.encode_group(measurement_group)
+            group_size = len(group.encode('utf-8'))
+
+            with self._lock:
+                if self._closed:
+                    raise RuntimeError("Observation buffer is closed")
+
+                device_buffer = self._buffers.setdefault(device_id, _DeviceBuffer())
+                overflows = device_buffer.groups and device_buffer.size + 1 + group_size > self.max_bytes
+
+            if overflows:
+                self.flush(device_id)
+
+            with self._lock:
+                device_buffer = self._buffers.setdefault(device_id, _DeviceBuffer())
+                if not device_buffer.groups:
+                    device_buffer.first_added_at = time.monotonic()
+                    device_buffer.size = group_size
+                    self._linger_condition.notify()
+                else:
+                    device_buffer.size += 1 + group_size
+                device_buffer.groups.append(group)
+
+                is_full = len(device_buffer.groups) >= self.max_groups or device_buffer.size >= self.max_bytes
+
+            if is_full:
+                self.flush(device_id)
+
+    def flush(self, device_id=None):
+        """Sends the buffered measurement groups
+
+        :param device_id: The id of the device whose groups will be sent.
+                          If no value is provided, the groups of all the devices are sent
+        :return: None
+        """
+        if device_id is None:
+            with self._lock:
+                device_ids = [device_id for device_id, device_buffer in self._buffers.items() if device_buffer.groups]
+            for device_id in device_ids:
+                self.flush(device_id)
+            return
+
+        with self._lock:
+            device_buffer = self._buffers.get(device_id)
+        if device_buffer is None:
+            return
+
+        # Sending holding the device lock keeps the order of the payloads of each device
+        with device_buffer.send_lock:
+            with self._lock:
+                groups = device_buffer.groups
+                device_buffer.groups = []
+                device_buffer.size = 0
+                device_buffer.first_added_at = None
+
+            if groups:
+                self._send(device_id, groups)
+
+    def _send(self, device_id, groups):
+        """Auxiliary method to send a list of measurement groups as a single payload
+
+        :param device_id: The id of the device in which the measurements were obtained
+        :param groups: The list of UL encoded measurement groups
+        :return: None
+        """
+        payload = '#'.join(groups)
+        result = self.iot_client.send_observation_payload(device_id, payload, protocol=self.protocol,
+                                                          timeout=self.timeout)
+
+        if 'error' in result:
+            if self.on_error:
+                self.on_error(device_id, payload, result)
+            else:
+                logging.error(f"Failed to send {len(groups)} measurement groups of device '{device_id}': "
+                              f"{result['error']}")
+            return
+
+        with self._lock:
+            self.sent_payloads += 1
+            self.sent_groups += len(groups)
+
+    def _linger_loop(self):
+        """Auxiliary method run by a background thread to send the groups which have waited for too long
+
+        :return: None
+        """
+        while True:
+            with self._lock:
+                if self._closed:
+                    return
+
+                now = time.monotonic()
+                pending = [(device_buffer.first_added_at + self.max_linger, device_id)
+                           for device_id, device_buffer in self._buffers.items() if device_buffer.groups]
+                due_device_ids = [device_id for deadline, device_id in pending if deadline <= now]
+
+                if not due_device_ids:
+                    next_deadline = min(deadline for deadline, _ in pending) if pending else None
+                    self._linger_condition.wait(None if next_deadline is None else next_deadline - now)
+                    continue
+
+            for device_id in due_device_ids:
+                try:
+                    self.flush(device_id)
+                except Exception as e:
+                    logging.error(f"Failed to send the measurement groups of device '{device_id}': {e}")
+
+    @property
+    def pending_groups(self):
+        with self._lock:
+            return sum(len(device_buffer.groups) for device_buffer in self._buffers.values())
+
+    def close(self):
+        """Stops the background thread and sends all the remaining measurement groups
+
+        :return: None
+        """
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._linger_condition.notify()
+
+        if self._linger_thread is not None:
+            self._linger_thread.join()
+
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
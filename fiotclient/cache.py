@@ -0,0 +1,98 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLCache(object):
+
+    def __init__(self, maxsize=1024, ttl=5.0):
+        """Bounded least recently used cache whose entries expire after a fixed time
+
+        The cache is safe to be shared among threads and among several clients.
+
+        :param maxsize: The maximum number of entries. The least recently used entry is evicted when it is exceeded
+        :param ttl: The time in seconds after which an entry expires
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Get the value stored for a key, if present and not expired
+
+        :param key: The key of the entry
+        :return: The stored value or None if there is no valid entry for the key
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        """Store a value for a key, evicting the least recently used entry if the cache is full
+
+        :param key: The key of the entry
+        :param value: The value to be stored
+        :return: None
+        """
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key):
+        """Remove the entry of a key, if present
+
+        :param key: The key of the entry
+        :return: None
+        """
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        """Remove all the entries
+
+        :return: None
+        """
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Get the usage statistics of the cache
+
+        :return: A dict with the number of hits, misses, evictions and expirations, along with the current size
+        """
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'size': len(self._entries),
+                'maxsize': self.maxsize
+            }
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,60 @@
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class JsonCodec(object):
+    """JSON codec based on the standard library, used when no faster library is installed"""
+
+    name = 'json'
+
+    def dumps(self, obj, compact=True):
+        """Serialize an object to be sent on a request body
+
+        :param obj: The object to be serialized
+        :param compact: If the output should have no whitespace. Otherwise, it is indented
+        :return: The serialized object, as str or bytes
+        """
+        if compact:
+            return json.dumps(obj, separators=(',', ':'))
+        return json.dumps(obj, indent=4)
+
+    def loads(self, data):
+        """Deserialize a response body
+
+        :param data: The body to be deserialized, as str or UTF-8 encoded bytes
+        :return: The deserialized object
+        :raises ValueError: If the body isn't valid JSON
+        """
+        return json.loads(data)
+
+
+class OrjsonCodec(JsonCodec):
+    """JSON codec based on orjson, which serializes to and parses from bytes directly"""
+
+    name = 'orjson'
+
+    def __init__(self):
+        if orjson is None:
+            raise ImportError("orjson is not installed. Install it with 'pip install orjson'")
+
+    def dumps(self, obj, compact=True):
+        if compact:
+            return orjson.dumps(obj)
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2)
+
+    def loads(self, data):
+        return orjson.loads(data)
+
+
+def default_codec():
+    """Get the fastest JSON codec available
+
+    :return: An OrjsonCodec if orjson is installed, or a JsonCodec otherwise
+    """
+    if orjson is not None:
+        return OrjsonCodec()
+    return JsonCodec()
@@ -0,0 +1,273 @@
+import logging
+import queue
+import threading
+import time
+import zlib
+
+from . import ul
+from .config import FiwareConfig
+from .mqtt import _create_mqtt_client
+
+_STOP = object()
+
+
+class CommandDispatcher(object):
+
+    def __init__(self, host, port=1883, api_key='', client_id='', keepalive=60, qos=0, workers=4,
+                 max_pending=10000, reconnect_min_delay=1, reconnect_max_delay=120):
+        """Receives the commands sent by the FIWARE platform to devices over MQTT, and dispatches them
+        to the registered handlers
+
+        A single connection to the broker subscribes to the command topic of every device of the api key
+        ('/{api_key}/+/cmd'), so that any number of devices are served by the same connection. The commands are
+        executed by a pool of worker threads, where the commands of each device are always executed in order
+        by the same worker. The result returned by the handler is acknowledged to the platform on the
+        '/{api_key}/{device_id}/cmdexe' topic.
+
+        Handlers are called with the device id, the command name and the list of the command parameters,
+        and return the result of the command. The handler registered for the device and the command is used
+        first, then the handler of the command for any device, the handler of the device for any command
+        and the handler of any command.
+
+        :param host: The address of the MQTT broker
+        :param port: The port of the MQTT broker
+        :param api_key: The api key of the devices whose commands are received
+        :param client_id: The client id to be used on the connection. If empty, a random one is used
+        :param keepalive: The maximum period in seconds between communications with the broker
+        :param qos: The quality of service level of the subscription and of the acknowledgements
+        :param workers: The number of worker threads executing the commands
+        :param max_pending: The maximum number of commands waiting on each worker.
+                            Commands received while the worker is full are dropped
+        :param reconnect_min_delay: The initial delay in seconds before trying to reconnect
+        :param reconnect_max_delay: The maximum delay in seconds between reconnection attempts
+        """
+        self.host = host
+        self.port = port
+        self.api_key = api_key
+        self.keepalive = keepalive
+        self.qos = qos
+        self.topic = f'/{api_key}/+/cmd'
+
+        self._handlers = {}
+
+        self._client = _create_mqtt_client(client_id)
+        self._client.reconnect_delay_set(min_delay=reconnect_min_delay, max_delay=reconnect_max_delay)
+        self._client.on_connect = self._on_connect
+        self._client.on_disconnect = self._on_disconnect
+        self._client.on_subscribe = self._on_subscribe
+        self._client.on_message = self._on_message
+
+        self._lock = threading.Lock()
+        self._connected = threading.Event()
+        self._started = False
+        self._closed = False
+
+        self._stats = dict.fromkeys(('received', 'executed', 'acknowledged', 'failed', 'unhandled', 'dropped'), 0)
+        self._stats_lock = threading.Lock()
+
+        self._queues = [queue.Queue(max_pending) for _ in range(workers)]
+        self._workers = [threading.Thread(target=self._worker_loop, args=(commands,), name=f'CommandDispatcher-{i}',
+                                          daemon=True)
+                         for i, commands in enumerate(self._queues)]
+
+    @classmethod
+    def from_config(cls, fiware_config: FiwareConfig, **kwargs):
+        """Creates a dispatcher of the commands sent through the MQTT broker of the given configuration
+        to the devices of its api key
+
+        :param fiware_config: The FiwareConfig object from which to load the broker settings and the api key
+        :param kwargs: Additional options to be passed to the dispatcher constructor
+        """
+        kwargs.setdefault('api_key', fiware_config.api_key)
+        kwargs.setdefault('keepalive', fiware_config.mqtt_keepalive)
+        kwargs.setdefault('qos', fiware_config.mqtt_qos)
+        return cls(fiware_config.mqtt_broker_host, port=fiware_config.mqtt_broker_port or 1883, **kwargs)
+
+    def add_handler(self, handler, command=None, device_id=None):
+        """Registers the handler of a command
+
+        :param handler: The function called with the device id, the command name and the list of parameters,
+                        which returns the result of the command
+        :param command: The name of the command. If no value is provided, the handler receives any command
+        :param device_id: The id of the device. If no value is provided, the handler receives the commands
+                          of any device
+        :return: None
+        """
+        self._handlers[(device_id, command)] = handler
+
+    def handler(self, command=None, device_id=None):
+        """Decorator registering a function as the handler of a command
+
+        :param command: The name of the command. If no value is provided, the handler receives any command
+        :param device_id: The id of the device. If no value is provided, the handler receives the commands
+                          of any device
+        """
+        def register(handler):
+            self.add_handler(handler, command=command, device_id=device_id)
+            return handler
+        return register
+
+    def _find_handler(self, device_id, command):
+        handlers = self._handlers
+        return handlers.get((device_id, command)) or handlers.get((None, command)) or \
+            handlers.get((device_id, None)) or handlers.get((None, None))
+
+    def _on_connect(self, client, userdata, flags, reason_code, *args):
+        if reason_code == 0:
+            logging.info(f"Connected to MQTT broker {self.host}:{self.port}, subscribing to {self.topic}")
+            # Subscriptions are renewed on every connection, as the broker may not keep them
+            client.subscribe(self.topic, qos=self.qos)
+        else:
+            logging.error(f"Connection to MQTT broker {self.host}:{self.port} refused: {reason_code}")
+
+    def _on_subscribe(self, client, userdata, mid, *args):
+        self._connected.set()
+
+    def _on_disconnect(self, client, userdata, *args):
+        self._connected.clear()
+        if not self._closed:
+            logging.warning(f"Disconnected from MQTT broker {self.host}:{self.port}, reconnecting")
+
+    def _on_message(self, client, userdata, message):
+        levels = message.topic.split('/')
+        if len(levels) != 4:
+            return
+
+        try:
+            commands = ul.decode_commands(message.payload.decode('utf-8'))
+        except (UnicodeDecodeError, ValueError) as e:
+            logging.error(f"Invalid command on topic {message.topic}: {e}")
+            return
+
+        for device_id, command, params in commands:
+            self._count('received')
+            # The commands of each device are always executed by the same worker, keeping their order
+            commands_queue = self._queues[zlib.crc32(device_id.encode('utf-8')) % len(self._queues)]
+            try:
+                commands_queue.put_nowait((device_id, command, params))
+            except queue.Full:
+                self._count('dropped')
+                logging.error(f"Too many pending commands, command '{command}' of device '{device_id}' dropped")
+
+    def _worker_loop(self, commands_queue):
+        """Auxiliary method run by the worker threads to execute the commands
+
+        :param commands_queue: The queue of the commands of the worker
+        :return: None
+        """
+        while True:
+            item = commands_queue.get()
+            if item is _STOP:
+                return
+            self._execute(*item)
+
+    def _execute(self, device_id, command, params):
+        """Auxiliary method to execute a command with its handler and acknowledge its result
+
+        :param device_id: The id of the device which received the command
+        :param command: The name of the command
+        :param params: The list of the command parameters
+        :return: None
+        """
+        handler = self._find_handler(device_id, command)
+        if handler is None:
+            self._count('unhandled')
+            logging.warning(f"No handler for command '{command}' of device '{device_id}'")
+            return
+
+        try:
+            result = handler(device_id, command, params)
+            self._count('executed')
+        except Exception as e:
+            self._count('failed')
+            logging.error(f"Command '{command}' of device '{device_id}' failed: {e}")
+            result = f'ERROR: {e}'
+
+        try:
+            payload = ul.encode_command_result(device_id, command, '' if result is None else result)
+        except ValueError as e:
+            self._count('failed')
+            logging.error(f"Result of command '{command}' of device '{device_id}' can't be acknowledged: {e}")
+            return
+
+        info = self._client.publish(f'/{self.api_key}/{device_id}/cmdexe', payload, qos=self.qos)
+        if info.rc == 0:
+            self._count('acknowledged')
+        else:
+            logging.error(f"Failed to acknowledge command '{command}' of device '{device_id}': {info.rc}")
+
+    def _count(self, name):
+        with self._stats_lock:
+            self._stats[name] += 1
+
+    def start(self, timeout=None):
+        """Starts the worker threads and the connection to the broker, if not started yet
+
+        :param timeout: The maximum time in seconds to wait for the connection and the subscription.
+                        If None, does not wait
+        :return: True if the dispatcher is subscribed to the commands on the broker
+        """
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("Command dispatcher is closed")
+            if not self._started:
+                for worker in self._workers:
+                    worker.start()
+                self._client.connect_async(self.host, int(self.port), keepalive=self.keepalive)
+                self._client.loop_start()
+                self._started = True
+
+        if timeout is None:
+            return self.connected
+        return self._connected.wait(timeout)
+
+    @property
+    def connected(self):
+        """If the dispatcher is connected to the broker and subscribed to the commands"""
+        return self._connected.is_set()
+
+    def stats(self):
+        """Returns the counters of the dispatcher
+
+        :return: A dict with the number of 'received', 'executed', 'acknowledged', 'failed', 'unhandled'
+                 and 'dropped' commands, and the number of commands waiting for a worker ('pending')
+        """
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats['pending'] = sum(commands_queue.qsize() for commands_queue in self._queues)
+        return stats
+
+    def close(self, timeout=5):
+        """Stops receiving commands, waits for the workers to execute the pending ones
+        and disconnects from the broker
+
+        :param timeout: The maximum time in seconds to wait for the workers
+        :return: None
+        """
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            if not self._started:
+                return
+
+        self._client.unsubscribe(self.topic)
+        deadline = time.monotonic() + timeout
+        for commands_queue in self._queues:
+            try:
+                commands_queue.put(_STOP, timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Full:
+                pass
+        for worker in self._workers:
+            worker.join(max(0.0, deadline - time.monotonic()))
+            if worker.is_alive():
+                logging.warning(f"Closing command dispatcher with pending commands on {worker.name}")
+
+        self._client.disconnect()
+        self._client.loop_stop()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,196 @@
+import asyncio
+import collections
+import threading
+import time
+
+
+class AdaptiveLimiter(object):
+
+    def __init__(self, initial_limit=10, min_limit=1, max_limit=200, backoff_ratio=0.9, latency_tolerance=2.0,
+                 baseline_drift=0.001, overload_statuses=(429, 503)):
+        """Limits the number of simultaneous requests to a component, adapting the limit to its observed capacity
+        with an AIMD rule (additive increase, multiplicative decrease)
+
+        The limit grows by about one on each round trip in which the requests are answered with a stable latency,
+        as long as the current limit is being used. It is multiplied by the backoff ratio when a request
+        times out, is rejected as overloaded or its latency exceeds the tolerated multiple of the baseline
+        (the lowest latency observed recently). Simultaneous failures decrease the limit only once per round trip.
+
+        The limiter can be used by threads, which block waiting for a free slot,
+        and by asyncio tasks, which wait without blocking their event loop.
+
+        :param initial_limit: The limit of simultaneous requests when no request was observed yet
+        :param min_limit: The minimum limit
+        :param max_limit: The maximum limit
+        :param backoff_ratio: The factor applied to the limit when the component is overloaded
+        :param latency_tolerance: The multiple of the baseline latency above which the component is overloaded
+        :param baseline_drift: The rate at which the baseline latency rises on each request,
+                               so that it follows permanent changes of the latency of the component
+        :param overload_statuses: The response status codes meaning the component is overloaded,
+                                  besides connection errors and timeouts (status code 0)
+        """
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.backoff_ratio = backoff_ratio
+        self.latency_tolerance = latency_tolerance
+        self.baseline_drift = baseline_drift
+        self.overload_statuses = frozenset(overload_statuses)
+
+        self._lock = threading.Lock()
+        self._condition = threading.Condition(self._lock)
+        self._async_waiters = collections.deque()
+
+        self._limit = float(min(max(initial_limit, min_limit), max_limit))
+        self._in_flight = 0
+        self._baseline = None
+        self._last_decrease = 0.0
+
+    @property
+    def limit(self):
+        """The current maximum number of simultaneous requests"""
+        return int(self._limit)
+
+    @property
+    def in_flight(self):
+        """The number of requests currently being executed"""
+        return self._in_flight
+
+    def _try_acquire(self):
+        """Auxiliary method to take a free slot, if any. Must be called holding the limiter lock
+
+        :return: True if a slot was taken
+        """
+        if self._in_flight < int(self._limit):
+            self._in_flight += 1
+            return True
+        return False
+
+    def acquire(self):
+        """Wait for a free slot to execute a request, blocking the calling thread
+
+        :return: None
+        """
+        with self._condition:
+            while not self._try_acquire():
+                self._condition.wait()
+
+    async def acquire_async(self):
+        """Wait for a free slot to execute a request without blocking the event loop
+
+        :return: None
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            with self._lock:
+                if self._try_acquire():
+                    return
+                waiter = loop.create_future()
+                self._async_waiters.append((loop, waiter))
+
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                with self._lock:
+                    if (loop, waiter) in self._async_waiters:
+                        self._async_waiters.remove((loop, waiter))
+                    else:
+                        # The task was already woken up, so the slot freed for it is passed on to another waiter
+                        self._wake_waiters()
+                raise
+
+    def release(self, latency, status_code):
+        """Free the slot of a finished request, adapting the limit to its outcome
+
+        :param latency: The time in seconds taken by the request
+        :param status_code: The status code of the response, 0 if the connection failed or timed out,
+                            or None if the request was not sent
+        :return: None
+        """
+        with self._lock:
+            self._in_flight -= 1
+            if status_code is not None:
+                self._update_limit(latency, status_code)
+            self._wake_waiters()
+
+    def _update_limit(self, latency, status_code):
+        """Auxiliary method to apply the AIMD rule to the outcome of a request.
+        Must be called holding the limiter lock
+
+        :param latency: The time in seconds taken by the request
+        :param status_code: The status code of the response, or 0 if the connection failed or timed out
+        :return: None
+        """
+        overloaded = status_code == 0 or status_code in self.overload_statuses
+        if not overloaded:
+            if self._baseline is None or latency < self._baseline:
+                self._baseline = latency
+            else:
+                self._baseline *= 1 + self.baseline_drift
+            overloaded = latency > self._baseline * self.latency_tolerance
+
+        if overloaded:
+            now = time.monotonic()
+            if now - self._last_decrease >= (self._baseline or 0.0):
+                self._limit = max(self.min_limit, self._limit * self.backoff_ratio)
+                self._last_decrease = now
+        elif self._in_flight + 1 >= self._limit / 2:
+            self._limit = min(self.max_limit, self._limit + 1 / self._limit)
+
+    def _wake_waiters(self):
+        """Auxiliary method to wake up the requests waiting for the free slots.
+        Must be called holding the limiter lock
+
+        :return: None
+        """
+        free_slots = int(self._limit) - self._in_flight
+        while free_slots > 0 and self._async_waiters:
+            loop, waiter = self._async_waiters.popleft()
+            loop.call_soon_threadsafe(_set_waiter_result, waiter)
+            free_slots -= 1
+        if free_slots > 0:
+            self._condition.notify(free_slots)
+
+
+def _set_waiter_result(waiter):
+    """Auxiliary function to wake up an asyncio task waiting for a slot, unless it was cancelled meanwhile
+
+    :param waiter: The future on which the task waits
+    :return: None
+    """
+    if not waiter.done():
+        waiter.set_result(None)
+
+
+class ConcurrencyLimiterRegistry(object):
+
+    def __init__(self, **limiter_options):
+        """Keeps an AdaptiveLimiter for each FIWARE component, created on first use.
+        It should be shared among the clients calling the same components, so that their requests are limited together
+
+        :param limiter_options: The options of the AdaptiveLimiter created for each component
+        """
+        self.limiter_options = limiter_options
+
+        self._lock = threading.Lock()
+        self._limiters = {}
+
+    def get(self, component):
+        """Get the concurrency limiter of a component
+
+        :param component: The name of the component (e.g. 'orion')
+        :return: The AdaptiveLimiter of the component
+        """
+        with self._lock:
+            limiter = self._limiters.get(component)
+            if limiter is None:
+                limiter = self._limiters[component] = AdaptiveLimiter(**self.limiter_options)
+            return limiter
+
+    def limits(self):
+        """Get the current limit of simultaneous requests to each component
+
+        :return: A dict of component names to their current limit
+        """
+        with self._lock:
+            limiters = dict(self._limiters)
+        return {component: limiter.limit for component, limiter in limiters.items()}
@@ -19,6 +19,10 @@ class FiwareConfig:
 
         self.mqtt_broker_host = config_json.get('mqttBroker', {}).get('host', '')
         self.mqtt_broker_port = config_json.get('mqttBroker', {}).get('port', '')
+        self.mqtt_client_id = config_json.get('mqttBroker', {}).get('clientId', '')
+        self.mqtt_keepalive = config_json.get('mqttBroker', {}).get('keepalive', 60)
+        self.mqtt_qos = config_json.get('mqttBroker', {}).get('qos', 0)
+        self.mqtt_max_inflight = config_json.get('mqttBroker', {}).get('maxInflight', 100)
 
         self.sth_host = config_json.get('sthComet', {}).get('host', '')
         self.sth_port = config_json.get('sthComet', {}).get('port', '')
@@ -30,6 +34,15 @@ class FiwareConfig:
         self.perseo_host = config_json.get('perseo', {}).get('host', '')
         self.perseo_port = config_json.get('perseo', {}).get('port', '')
 
+        self.http_pool_connections = config_json.get('http', {}).get('poolConnections', 10)
+        self.http_pool_maxsize = config_json.get('http', {}).get('poolMaxsize', 10)
+        self.http_keep_alive = config_json.get('http', {}).get('keepAlive', True)
+        self.http_idle_timeout = config_json.get('http', {}).get('idleTimeout', None)
+        self.http_compact_json = config_json.get('http', {}).get('compactJson', True)
+
+        self.log_body_max_length = config_json.get('logging', {}).get('bodyMaxLength', None)
+        self.log_body_sample_rate = config_json.get('logging', {}).get('bodySampleRate', 1.0)
+
         if config_json.get('iota', {}).get('aaa', ''):
             self.token = config_json.get('user', {}).get('token', '')
             self.token_show = self.token[1:5] + "*" * 70 + self.token[-5:]
@@ -1,28 +1,38 @@
+import functools
 import json
 import logging
 
-from . import BaseClient
+from . import BaseClient, utils
 from .config import FiwareConfig
+from .exceptions import FiwareRequestError
+from .template import SchemaTemplate, as_template
+
+BATCH_ACTION_TYPES = ('append', 'appendStrict', 'update', 'replace', 'delete')
 
 
 class FiwareContextClient(BaseClient):
 
-    def __init__(self, fiware_config: FiwareConfig):
+    def __init__(self, fiware_config: FiwareConfig, **kwargs):
         """Client for doing context management operations on FIWARE platform
 
         :param fiware_config: The FiwareConfig object from which to load the default configuration
+        :param kwargs: Additional options to be passed to BaseClient (e.g. a shared transport)
         """
-        super(FiwareContextClient, self).__init__(fiware_config)
+        super(FiwareContextClient, self).__init__(fiware_config, **kwargs)
 
         self.cb_url = f"http://{self.fiware_config.cb_host}:{self.fiware_config.cb_port}"
         self.perseo_url = f"http://{self.fiware_config.perseo_host}:{self.fiware_config.perseo_port}"
         self.cygnus_notification_url = f"http://{self.fiware_config.cygnus_notification_host}:{self.fiware_config.cygnus_port}"
         self.sth_url = f"http://{self.fiware_config.sth_host}:{self.fiware_config.sth_port}"
 
+        self._register_component('orion', self.cb_url)
+        self._register_component('perseo', self.perseo_url)
+        self._register_component('sth', self.sth_url)
+
     def create_entity(self, entity_schema, entity_type, entity_id):
         """Creates a new NGSI entity with the given structure in the currently selected service
 
-        :param entity_schema: JSON string representing entity schema
+        :param entity_schema: JSON string representing entity schema, or its SchemaTemplate
         :param entity_type: The type of the entity to be created
         :param entity_id: The id to the entity to be created
 
@@ -31,12 +41,11 @@ class FiwareContextClient(BaseClient):
         url = f"{self.cb_url}/v2/entities"
         additional_headers = {'Content-Type': 'application/json'}
 
-        entity_schema = entity_schema.replace('[ENTITY_TYPE]', str(entity_type))
-        entity_schema = entity_schema.replace('[ENTITY_ID]', str(entity_id))
-
-        payload = json.loads(entity_schema)
+        payload = as_template(entity_schema).render(entity_type=entity_type, entity_id=entity_id)
 
-        return self._send_request(url, 'POST', payload=payload, additional_headers=additional_headers)
+        return self._invalidating_request([('entity', str(entity_type), str(entity_id))], url, 'POST',
+                                          payload=payload, additional_headers=additional_headers,
+                                          operation='create_entity')
 
     def create_entity_from_file(self, entity_file_path, entity_type, entity_id):
         """Creates a new NGSI entity loading its structure from a given file
@@ -48,12 +57,9 @@ class FiwareContextClient(BaseClient):
         :return: Information of the registered entity
         """
         logging.debug(f"Reading file '{entity_file_path}'")
-        with open(entity_file_path) as json_entity_file:
-            payload = json.load(json_entity_file)
+        entity_template = SchemaTemplate.from_file(entity_file_path)
 
-        entity_schema_json_str = json.dumps(payload)
-
-        return self.create_entity(entity_schema_json_str, entity_type, entity_id)
+        return self.create_entity(entity_template, entity_type, entity_id)
 
     def update_entity(self, entity_id, entity_schema):
         """Updates an entity with the given id for the new structure in the currently selected service
@@ -77,7 +83,8 @@ class FiwareContextClient(BaseClient):
         params = {'type': entity_type}
         url = f"{self.cb_url}/v2/entities/{entity_id}"
 
-        return self._send_request(url, 'DELETE', params=params)
+        return self._invalidating_request([('entity', str(entity_type), str(entity_id))], url, 'DELETE',
+                                          params=params, operation='remove_entity')
 
     def get_entity_by_id(self, entity_id, entity_type):
         """Get entity information given its entity id
@@ -90,7 +97,8 @@ class FiwareContextClient(BaseClient):
         params = {'type': entity_type}
         url = f"{self.cb_url}/v2/entities/{entity_id}"
 
-        return self._send_request(url, 'GET', params=params)
+        return self._cached_request(('entity', str(entity_type), str(entity_id)), url, 'GET', params=params,
+                                    operation='get_entity_by_id')
 
     def get_entities_by_type(self, entity_type):
         """Get entities created with a given entity type
@@ -102,13 +110,48 @@ class FiwareContextClient(BaseClient):
 
         url = f"{self.cb_url}/v2/entities"
 
-        return self._send_request(url, 'GET', params=params)
+        return self._send_request(url, 'GET', params=params, operation='get_entities_by_type')
 
     def get_entities(self, entity_type=None, id_pattern=None, q=None, limit=None, offset=None, options=None):
         """Get all created entities
 
         :return: A list with the information of all the created entities
         """
+        params = self._entities_params(entity_type, id_pattern, q, limit, offset, options)
+
+        url = f"{self.cb_url}/v2/entities"
+
+        return self._send_request(url, 'GET', params=params, operation='get_entities')
+
+    def stream_entities(self, entity_type=None, id_pattern=None, q=None, limit=1000, offset=None, options=None,
+                        chunk_size=65536, timeout=30):
+        """Get a page of entities, decoding them one at a time as the response is received,
+        so that memory usage doesn't grow with the size of the page
+
+        :param entity_type: The type of the entities to be listed
+        :param id_pattern: A regular expression the ids of the entities must match
+        :param q: A query expression the entities must match
+        :param limit: The maximum number of entities on the page (Orion accepts up to 1000)
+        :param offset: The number of entities to skip
+        :param options: Additional options of the query (e.g. 'keyValues')
+        :param chunk_size: The number of bytes read from the connection at a time
+        :param timeout: The timeout for the connection and for each read from it
+        :return: A generator of the entities
+        :raises FiwareRequestError: If the entities can't be listed
+        """
+        params = self._entities_params(entity_type, id_pattern, q, limit, offset, options)
+
+        url = f"{self.cb_url}/v2/entities"
+
+        return self._stream_request(url, params=params, timeout=timeout, chunk_size=chunk_size,
+                                    operation='stream_entities')
+
+    @staticmethod
+    def _entities_params(entity_type, id_pattern, q, limit, offset, options):
+        """Auxiliary method to build the query parameters of an entities listing
+
+        :return: A dict with the query parameters
+        """
         params = {}
 
         if entity_type:
@@ -124,9 +167,176 @@ class FiwareContextClient(BaseClient):
         if options:
             params['options'] = options
 
-        url = f"{self.cb_url}/v2/entities"
+        return params
+
+    def iter_entities(self, entity_type=None, id_pattern=None, q=None, options=None, page_size=1000, prefetch=True,
+                      max_concurrency=1):
+        """Iterate over all the entities matching the given filters, requesting them page by page
+
+        :param entity_type: The type of the entities to be listed
+        :param id_pattern: A regular expression the ids of the entities must match
+        :param q: A query expression the entities must match
+        :param options: Additional options of the query (e.g. 'keyValues')
+        :param page_size: The number of entities requested on each page (Orion accepts up to 1000)
+        :param prefetch: If the next page should be requested while the current one is consumed
+        :param max_concurrency: The maximum number of pages requested at the same time.
+                                If greater than one, the pages are requested in parallel once the total is known
+        :return: A generator of the entities
+        """
+        fetch_page = functools.partial(self._get_entities_page, entity_type=entity_type, id_pattern=id_pattern, q=q,
+                                       options=options)
+        return utils.iter_pages(fetch_page, page_size, prefetch=prefetch, max_workers=max_concurrency)
+
+    def _get_entities_page(self, offset, limit, entity_type=None, id_pattern=None, q=None, options=None):
+        """Auxiliary method to request a page of entities along with the total number of entities
+
+        :param offset: The number of entities to skip
+        :param limit: The maximum number of entities on the page
+        :return: A tuple with the list of entities of the page and the total number of entities
+        """
+        options = f'{options},count' if options else 'count'
+        response = self.get_entities(entity_type=entity_type, id_pattern=id_pattern, q=q, limit=limit,
+                                     offset=offset, options=options)
+        return self._parse_entities_page(response)
+
+    @staticmethod
+    def _parse_entities_page(response):
+        """Auxiliary method to get the entities and the total count from the response of a page request
+
+        :param response: The response of the page request
+        :return: A tuple with the list of entities of the page and the total number of entities
+        """
+        if response.get('status_code') != 200:
+            raise FiwareRequestError(f"Failed to list entities: {response.get('response')}", response)
+
+        total = response['headers'].get('Fiware-Total-Count')
+        return response['response'], int(total) if total is not None else None
+
+    def create_entities(self, entities, max_entities=1000, max_bytes=1000000, max_concurrency=4):
+        """Creates several NGSI entities in the currently selected service using batch operations.
+        The creation of an entity that already exists fails
+
+        :param entities: An iterable of dicts representing the entities to be created
+        :param max_entities: The maximum number of entities sent on each request
+        :param max_bytes: The maximum size in bytes of the entities sent on each request
+        :param max_concurrency: The maximum number of requests executed at the same time
+        :return: A list with the response of each request, along with the entities sent on it
+        """
+        return self.batch_update(entities, 'appendStrict', max_entities=max_entities, max_bytes=max_bytes,
+                                 max_concurrency=max_concurrency)
+
+    def upsert_entities(self, entities, max_entities=1000, max_bytes=1000000, max_concurrency=4):
+        """Creates several NGSI entities or updates their attributes if they already exist, using batch operations
+
+        :param entities: An iterable of dicts representing the entities to be created or updated
+        :param max_entities: The maximum number of entities sent on each request
+        :param max_bytes: The maximum size in bytes of the entities sent on each request
+        :param max_concurrency: The maximum number of requests executed at the same time
+        :return: A list with the response of each request, along with the entities sent on it
+        """
+        return self.batch_update(entities, 'append', max_entities=max_entities, max_bytes=max_bytes,
+                                 max_concurrency=max_concurrency)
+
+    def update_entities(self, entities, max_entities=1000, max_bytes=1000000, max_concurrency=4):
+        """Updates the attributes of several existing NGSI entities using batch operations
+
+        :param entities: An iterable of dicts with the id, type and the attributes to be updated of each entity
+        :param max_entities: The maximum number of entities sent on each request
+        :param max_bytes: The maximum size in bytes of the entities sent on each request
+        :param max_concurrency: The maximum number of requests executed at the same time
+        :return: A list with the response of each request, along with the entities sent on it
+        """
+        return self.batch_update(entities, 'update', max_entities=max_entities, max_bytes=max_bytes,
+                                 max_concurrency=max_concurrency)
+
+    def delete_entities(self, entities, max_entities=1000, max_bytes=1000000, max_concurrency=4):
+        """Removes several NGSI entities using batch operations
+
+        :param entities: An iterable of dicts with the id and type of each entity to be removed.
+                         Any other attribute is ignored, so the whole entity is removed
+        :param max_entities: The maximum number of entities sent on each request
+        :param max_bytes: The maximum size in bytes of the entities sent on each request
+        :param max_concurrency: The maximum number of requests executed at the same time
+        :return: A list with the response of each request, along with the entities sent on it
+        """
+        entities = ({'id': entity['id'], 'type': entity['type']} for entity in entities)
+        return self.batch_update(entities, 'delete', max_entities=max_entities, max_bytes=max_bytes,
+                                 max_concurrency=max_concurrency)
+
+    def batch_update(self, entities, action_type, max_entities=1000, max_bytes=1000000, max_concurrency=4):
+        """Applies an NGSI v2 batch operation (POST /v2/op/update) over several entities.
+        The entities are split into requests limited by number of entities and payload size,
+        which are sent concurrently
+
+        :param entities: An iterable of dicts representing the entities of the operation
+        :param action_type: The action type of the operation.
+                            Accepted values are 'append', 'appendStrict', 'update', 'replace' and 'delete'
+        :param max_entities: The maximum number of entities sent on each request
+        :param max_bytes: The maximum size in bytes of the entities sent on each request
+        :param max_concurrency: The maximum number of requests executed at the same time
+        :return: A list with the response of each request, along with the entities sent on it,
+                 so that the failed chunks can be retried
+        """
+        if action_type not in BATCH_ACTION_TYPES:
+            error_msg = f"Unknown batch action type '{action_type}'"
+            logging.error(error_msg)
+            return {'error': error_msg}
+
+        batches = self._split_entity_batches(entities, action_type, max_entities, max_bytes)
+        # Repeating an 'appendStrict' fails for the entities created by the first attempt
+        send_batch = functools.partial(self._send_entity_batch, idempotent=action_type != 'appendStrict')
+        return list(utils.bounded_map(send_batch, batches, max_concurrency))
+
+    @staticmethod
+    def _split_entity_batches(entities, action_type, max_entities, max_bytes):
+        """Auxiliary method to serialize the entities of a batch operation and split them into request payloads
+
+        :param entities: An iterable of dicts representing the entities of the operation
+        :param action_type: The action type of the operation
+        :param max_entities: The maximum number of entities on each payload
+        :param max_bytes: The maximum size in bytes of each payload
+        :return: A generator of (entities, payload string) tuples
+        """
+        payload_prefix = '{"actionType": "%s", "entities": [' % action_type
+        payload_suffix = ']}'
+        max_entities_bytes = max_bytes - len(payload_prefix) - len(payload_suffix)
+
+        serialized_entities = ((entity, json.dumps(entity, separators=(',', ':'))) for entity in entities)
+
+        for batch in utils.split_batches(serialized_entities, max_entities, max_entities_bytes,
+                                         size=lambda serialized_entity: len(serialized_entity[1]) + 1):
+            batch_entities = [entity for entity, _ in batch]
+            payload = payload_prefix + ','.join(serialized for _, serialized in batch) + payload_suffix
+            yield batch_entities, payload
+
+    @staticmethod
+    def _entities_cache_keys(entities):
+        """Auxiliary method to get the cache keys of the entities of a batch operation
+
+        :param entities: The list of entity dicts
+        :return: A list with the values identifying each entity in the cache
+        """
+        return [('entity', str(entity.get('type')), str(entity.get('id'))) for entity in entities]
+
+    def _send_entity_batch(self, batch, idempotent=None):
+        """Auxiliary method to send a single request of a batch operation
+
+        :param batch: A (entities, payload string) tuple
+        :param idempotent: If the request can be safely repeated by the retry policy
+        :return: The response of the request, along with the entities sent on it
+        """
+        entities, payload = batch
+
+        url = f"{self.cb_url}/v2/op/update"
+        additional_headers = {'Content-Type': 'application/json'}
+
+        response = self._send_request(url, 'POST', payload=payload, additional_headers=additional_headers,
+                                      operation='batch_update', idempotent=idempotent)
+        response['entities'] = entities
 
-        return self._send_request(url, 'GET', params=params)
+        self._invalidate_cache(self._entities_cache_keys(entities))
+
+        return response
 
     def subscribe_attributes_change(self, entity_id, entity_type, attributes, notification_url, duration, throttling):
         """Create a new subscription on given attributes of the entity with the specified id and type
@@ -163,7 +373,8 @@ class FiwareContextClient(BaseClient):
             "throttling": str(throttling)
         }
 
-        return self._send_request(url, 'POST', payload=payload, additional_headers=additional_headers)
+        return self._send_request(url, 'POST', payload=payload, additional_headers=additional_headers,
+                                  operation='subscribe_attributes_change')
 
     def subscribe_attribute_change_with_rule(self, attribute, attribute_type, condition, action='post', notification_url=None):
         """Register a new rule to be evaluated on attribute values change and a action to be taken when rule evaluated to true
@@ -208,7 +419,8 @@ class FiwareContextClient(BaseClient):
             logging.error(error_msg)
             return {'error': error_msg}
 
-        return self._send_request(url, 'POST', payload=payload, additional_headers=additional_headers)
+        return self._send_request(url, 'POST', payload=payload, additional_headers=additional_headers,
+                                  operation='subscribe_attribute_change_with_rule')
 
     def subscribe_cygnus(self, entity_id, attributes):
         """Create a new subscription on attributes to send changes on its values to sinks configured on Cygnus
@@ -241,16 +453,51 @@ class FiwareContextClient(BaseClient):
         :return: The historical data on the specified attribute of the given entity
         """
         params = {'lastN': items_number}
+        url, additional_headers = self._historical_data_request(entity_type, entity_id, attribute)
+
+        return self._send_request(url, 'GET', params=params, additional_headers=additional_headers,
+                                  operation='get_historical_data')
+
+    def stream_historical_data(self, entity_type, entity_id, attribute, items_number=10, chunk_size=65536,
+                               timeout=30):
+        """Get historical data from a specific attribute of an entity, decoding the values one at a time
+        as the response is received, so that memory usage doesn't grow with the number of entries
 
-        url = f"http://{self.sth_url}/STH/v1/contextEntities/type/{entity_type}/id/{entity_id}/attributes/{attribute}"
+        :param entity_type: The type of the entity to get historical data
+        :param entity_id: The id of the entity to get historical data
+        :param attribute: The attribute of the entity to get historical data
+        :param items_number: The number of last entries to be queried.
+                             If no value is provided, the default value (10 entries) will be used
+        :param chunk_size: The number of bytes read from the connection at a time
+        :param timeout: The timeout for the connection and for each read from it
+        :return: A generator of the historical values (dicts with 'recvTime' and 'attrValue')
+        :raises FiwareRequestError: If the historical data can't be queried
+        """
+        params = {'lastN': items_number}
+        url, additional_headers = self._historical_data_request(entity_type, entity_id, attribute)
+
+        return self._stream_request(url, path=('contextResponses', 0, 'contextElement', 'attributes', 0, 'values'),
+                                    params=params, additional_headers=additional_headers, timeout=timeout,
+                                    chunk_size=chunk_size, operation='stream_historical_data')
+
+    def _historical_data_request(self, entity_type, entity_id, attribute):
+        """Auxiliary method to build the url and the headers of a historical data query
+
+        :param entity_type: The type of the entity to get historical data
+        :param entity_id: The id of the entity to get historical data
+        :param attribute: The attribute of the entity to get historical data
+        :return: A tuple with the url and the additional headers of the query
+        """
+        url = f"{self.sth_url}/STH/v1/contextEntities/type/{entity_type}/id/{entity_id}/attributes/{attribute}"
 
+        tenant = self._tenant()
         additional_headers = {
             'Accept': 'application/json',
-            'Fiware-Service': str(self.fiware_config.service).lower(),
-            'Fiware-ServicePath': str(self.fiware_config.service_path).lower()
+            'Fiware-Service': str(tenant.service).lower(),
+            'Fiware-ServicePath': str(tenant.service_path).lower()
         }
 
-        return self._send_request(url, 'GET', params=params, additional_headers=additional_headers)
+        return url, additional_headers
 
     def unsubscribe(self, subscription_id):
         """Remove a subscription with the given subscription id
@@ -270,7 +517,8 @@ class FiwareContextClient(BaseClient):
             "subscriptionId": str(subscription_id)
         }
 
-        return self._send_request(url, 'POST', payload=payload, additional_headers=additional_headers)
+        return self._send_request(url, 'POST', payload=payload, additional_headers=additional_headers,
+                                  operation='unsubscribe')
 
     def get_subscription_by_id(self, subscription_id):
         """Get subscription information given its subscription id
@@ -281,7 +529,7 @@ class FiwareContextClient(BaseClient):
         """
         url = f"{self.cb_url}/v2/subscriptions/{subscription_id}"
 
-        return self._send_request(url, 'GET')
+        return self._send_request(url, 'GET', operation='get_subscription_by_id')
 
     def list_subscriptions(self):
         """Get all subscriptions
@@ -290,4 +538,4 @@ class FiwareContextClient(BaseClient):
         """
         url = f"{self.cb_url}/v2/subscriptions"
 
-        return self._send_request(url, 'GET')
+        return self._send_request(url, 'GET', operation='list_subscriptions')
@@ -0,0 +1,1577 @@
+import argparse
+import json
+import logging
+import re
+import socket
+import socketserver
+import struct
+import threading
+import uuid
+from collections import Counter, deque
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+
+
+_COMPACT_SEPARATORS = (',', ':')
+
+_TYPE_NAMES = ((bool, 'Boolean'), ((int, float), 'Number'), (str, 'Text'), ((dict, list), 'StructuredValue'))
+
+_Q_STATEMENT = re.compile(r'^\s*([^=!<>~\s]+)\s*(==|!=|>=|<=|>|<|~=)\s*(.*?)\s*$')
+
+# MQTT control packet types
+_MQTT_CONNECT, _MQTT_CONNACK, _MQTT_PUBLISH, _MQTT_PUBACK, _MQTT_PUBREC, _MQTT_PUBREL, _MQTT_PUBCOMP = range(1, 8)
+_MQTT_SUBSCRIBE, _MQTT_SUBACK, _MQTT_UNSUBSCRIBE, _MQTT_UNSUBACK, _MQTT_PINGREQ, _MQTT_PINGRESP = range(8, 14)
+_MQTT_DISCONNECT = 14
+
+
+class _HttpError(Exception):
+
+    def __init__(self, status_code, body):
+        """Error answered to a request to the emulator
+
+        :param status_code: The status code of the response
+        :param body: The dict sent as the body of the response
+        """
+        super().__init__(body)
+        self.status_code = status_code
+        self.body = body
+
+
+def _not_found(description):
+    return _HttpError(404, {'error': 'NotFound', 'description': description})
+
+
+def _bad_request(description):
+    return _HttpError(400, {'error': 'BadRequest', 'description': description})
+
+
+def _iot_error(status_code, name, message):
+    return _HttpError(status_code, {'name': name, 'message': message})
+
+
+class _Request(object):
+
+    __slots__ = ('method', 'args', 'query', 'headers', 'body')
+
+    def __init__(self, method, args, query, headers, body):
+        """Request received by the emulator
+
+        :param method: The http method of the request
+        :param args: The tuple of values captured from the path
+        :param query: A dict with the last value of each query parameter
+        :param headers: The http headers of the request
+        :param body: The raw body of the request
+        """
+        self.method = method
+        self.args = args
+        self.query = query
+        self.headers = headers
+        self.body = body
+
+    def json(self):
+        """Decode the body of the request
+
+        :return: The decoded body
+        :raises _HttpError: If the body is not valid JSON
+        """
+        try:
+            return json.loads(self.body)
+        except ValueError:
+            raise _HttpError(400, {'error': 'ParseError', 'description': 'Errors found in incoming JSON buffer'})
+
+    def options(self):
+        """Get the values of the 'options' query parameter
+
+        :return: A set with the options of the request
+        """
+        options = self.query.get('options')
+        return set(options.split(',')) if options else set()
+
+    def int_param(self, name, default):
+        """Get the value of an integer query parameter
+
+        :param name: The name of the parameter
+        :param default: The value returned when the parameter is missing
+        :return: The value of the parameter
+        :raises _HttpError: If the value is not an integer
+        """
+        value = self.query.get(name)
+        if value is None or value == '':
+            return default
+        try:
+            return int(value)
+        except ValueError:
+            raise _bad_request(f"Invalid value for URI param /{name}/")
+
+
+class _TenantState(object):
+
+    def __init__(self, service, service_path):
+        """Resources stored on a FIWARE service and service path
+
+        :param service: The name of the service, in lowercase
+        :param service_path: The service path of the service
+        """
+        self.service = service
+        self.service_path = service_path
+        self.entities = {}
+        self.entity_types = {}
+        self.subscriptions = {}
+        self.groups = []
+        self.devices = {}
+        self.device_entities = {}
+        self.commands = {}
+        self.rules = {}
+
+
+def _attribute_type(value):
+    """Auxiliary function to get the NGSI type given by Orion to an attribute value without explicit type
+
+    :param value: The value of the attribute
+    :return: The name of the type
+    """
+    for python_types, type_name in _TYPE_NAMES:
+        if isinstance(value, python_types):
+            return type_name
+    return 'None'
+
+
+def _normalize_attribute(value, key_values=False):
+    """Auxiliary function to build the stored representation of an attribute
+
+    :param value: The attribute as sent on the request
+    :param key_values: If the attribute was sent as a plain value (keyValues option)
+    :return: A dict with the type, the value and the metadata of the attribute
+    """
+    if key_values or not isinstance(value, dict):
+        return {'type': _attribute_type(value), 'value': value, 'metadata': {}}
+
+    attribute_value = value.get('value')
+    return {
+        'type': value.get('type') or _attribute_type(attribute_value),
+        'value': attribute_value,
+        'metadata': value.get('metadata', {})
+    }
+
+
+def _normalize_attributes(data, key_values=False):
+    """Auxiliary function to build the stored representation of the attributes of an entity
+
+    :param data: The entity or the attributes as sent on the request
+    :param key_values: If the attributes were sent as plain values (keyValues option)
+    :return: A dict of attribute names to attributes
+    """
+    return {name: _normalize_attribute(value, key_values) for name, value in data.items()
+            if name not in ('id', 'type')}
+
+
+def _q_value(value):
+    """Auxiliary function to convert a value of a query expression to the type of the attribute values
+
+    :param value: The value as written on the expression
+    :return: The string without quotes, or the number, boolean or null represented by it
+    """
+    if len(value) > 1 and value[0] == value[-1] and value[0] in '\'"':
+        return value[1:-1]
+    try:
+        return json.loads(value)
+    except ValueError:
+        return value
+
+
+def _q_compare(attribute_value, operator, value):
+    """Auxiliary function to evaluate a binary statement of a query expression
+
+    :param attribute_value: The value of the attribute of the entity
+    :param operator: The operator of the statement
+    :param value: The value on the right side of the statement
+    :return: True if the attribute value satisfies the statement
+    """
+    if operator == '~=':
+        return isinstance(attribute_value, str) and re.search(value, attribute_value) is not None
+
+    if operator in ('==', '!='):
+        if '..' in value:
+            low, high = (_q_value(bound) for bound in value.split('..', 1))
+            try:
+                matches = low <= attribute_value <= high
+            except TypeError:
+                matches = False
+        else:
+            matches = attribute_value in [_q_value(item) for item in value.split(',')]
+        return matches if operator == '==' else not matches
+
+    try:
+        return {'>': attribute_value.__gt__, '<': attribute_value.__lt__,
+                '>=': attribute_value.__ge__, '<=': attribute_value.__le__}[operator](_q_value(value)) is True
+    except TypeError:
+        return False
+
+
+def _matches_q(entity, q):
+    """Auxiliary function to check an entity against a simple query language expression,
+    with statements separated by ';' (unary 'attr' and '!attr', and '==', '!=', '>', '<', '>=', '<=', '~=')
+
+    :param entity: The stored entity
+    :param q: The query expression
+    :return: True if the entity satisfies all the statements
+    """
+    for statement in q.split(';'):
+        statement = statement.strip()
+        if not statement:
+            continue
+
+        match = _Q_STATEMENT.match(statement)
+        if match is None:
+            negated = statement.startswith('!')
+            if (statement.lstrip('!') in entity) == negated:
+                return False
+            continue
+
+        name, operator, value = match.groups()
+        attribute = entity.get(name)
+        if not isinstance(attribute, dict):
+            return False
+        if not _q_compare(attribute['value'], operator, value):
+            return False
+    return True
+
+
+def _render_entity(entity, options=(), attrs=None):
+    """Auxiliary function to build the representation of an entity returned by the API
+
+    :param entity: The stored entity
+    :param options: The options of the request (e.g. 'keyValues')
+    :param attrs: The list of attributes to be included, or None to include all of them
+    :return: The dict representing the entity
+    """
+    if attrs is None and 'keyValues' not in options:
+        return entity
+
+    rendered = {'id': entity['id'], 'type': entity['type']}
+    for name, attribute in entity.items():
+        if name in ('id', 'type') or (attrs is not None and name not in attrs):
+            continue
+        rendered[name] = attribute['value'] if 'keyValues' in options else attribute
+    return rendered
+
+
+def _timestamp():
+    """Auxiliary function to get the current time in the ISO 8601 format used by the FIWARE components
+
+    :return: The formatted current time, in UTC
+    """
+    return datetime.now(timezone.utc).isoformat(timespec='milliseconds').replace('+00:00', 'Z')
+
+
+def _parse_ul_measures(payload):
+    """Auxiliary function to split a UL payload into its measurement groups as the IoT Agent does,
+    keeping the raw strings of the keys and values, which the agent stores verbatim.
+    A group with an odd number of fields starts with the timestamp of its measures
+
+    :param payload: The UL payload string
+    :return: A list of (timestamp, measures) tuples, where timestamp is None if the group has no timestamp
+    :raises ValueError: If a group has a key without a value
+    """
+    groups = []
+    for group in payload.strip().split('#'):
+        if not group:
+            continue
+
+        fields = group.split('|')
+        timestamp = None
+        if len(fields) % 2:
+            if len(fields) == 1:
+                raise ValueError(f"Measure without value in group '{group}'")
+            timestamp = fields.pop(0)
+        groups.append((timestamp, dict(zip(fields[::2], fields[1::2]))))
+    return groups
+
+
+class _EmulatorServer(ThreadingHTTPServer):
+
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 128
+
+
+class _EmulatorRequestHandler(BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def _dispatch(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+
+        status_code, content, headers = self.server.emulator.handle(self.command, self.path, self.headers, body)
+
+        self.send_response_only(status_code)
+        for name, value in headers:
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        if content:
+            self.wfile.write(content)
+
+    do_GET = do_POST = do_PUT = do_PATCH = do_DELETE = _dispatch
+
+    def log_message(self, format, *args):
+        logging.debug(f"Emulator: {format % args}")
+
+
+class FiwareEmulator(object):
+
+    _STATIC_ROUTES = {
+        ('GET', '/version'): '_get_version',
+        ('POST', '/v2/entities'): '_create_entity',
+        ('GET', '/v2/entities'): '_list_entities',
+        ('POST', '/v2/op/update'): '_batch_update',
+        ('POST', '/v2/subscriptions'): '_create_subscription',
+        ('GET', '/v2/subscriptions'): '_list_subscriptions',
+        ('POST', '/v1/subscribeContext'): '_subscribe_context',
+        ('POST', '/v1/unsubscribeContext'): '_unsubscribe_context',
+        ('POST', '/v1/updateContext'): '_send_commands',
+        ('GET', '/iot/about'): '_get_about',
+        ('POST', '/iot/services'): '_create_groups',
+        ('GET', '/iot/services'): '_list_groups',
+        ('DELETE', '/iot/services'): '_remove_group',
+        ('POST', '/iot/devices'): '_create_devices',
+        ('GET', '/iot/devices'): '_list_devices',
+        ('POST', '/iot/d'): '_receive_measures',
+        ('POST', '/rules'): '_create_rule',
+        ('GET', '/rules'): '_list_rules',
+    }
+
+    _PATTERN_ROUTES = [
+        (re.compile(r'/v2/entities/([^/]+)'), {'GET': '_get_entity', 'DELETE': '_remove_entity'}),
+        (re.compile(r'/v2/entities/([^/]+)/attrs'), {'POST': '_append_attributes', 'PATCH': '_update_attributes',
+                                                     'PUT': '_replace_attributes'}),
+        (re.compile(r'/v2/subscriptions/([^/]+)'), {'GET': '_get_subscription', 'DELETE': '_remove_subscription'}),
+        (re.compile(r'/iot/devices/([^/]+)'), {'GET': '_get_device', 'PUT': '_update_device',
+                                              'DELETE': '_remove_device'}),
+        (re.compile(r'/STH/v1/contextEntities/type/([^/]+)/id/([^/]+)/attributes/([^/]+)'),
+         {'GET': '_get_history'}),
+        (re.compile(r'/rules/([^/]+)'), {'DELETE': '_remove_rule'}),
+    ]
+
+    def __init__(self, host='127.0.0.1', port=0, history_size=100):
+        """In-memory stand-in for a FIWARE stack, to be used as the target of tests and benchmarks
+        without any external service
+
+        A single HTTP server answers the requests of every component:
+
+        - Orion Context Broker: the NGSI v2 entities API (including a subset of the simple query language),
+          batch updates and subscriptions, and the NGSI v1 subscribeContext and unsubscribeContext operations.
+          Subscriptions are stored, but notifications are not sent
+        - IoT Agent UL north API: service groups, devices (which create their entity on registration)
+          and commands sent through NGSI v1 updateContext
+        - IoT Agent UL south API: measures sent to /iot/d, which update the entity of the device,
+          and commands polled with getCmd. When an MqttBrokerEmulator is attached, also the MQTT transport:
+          measures and command results published by the devices, and commands pushed to MQTT devices
+        - STH-Comet: lastN (and hLimit/hOffset) queries of the raw history of every attribute written
+          to the context broker, as if all the changes were notified to it
+        - Perseo: rules creation, listing and removal
+
+        Resources are kept apart by Fiware-Service and Fiware-ServicePath, as on the real components.
+
+        :param host: The address in which the server listens
+        :param port: The port in which the server listens. If no value is provided, a free port is chosen
+        :param history_size: The maximum number of values kept on the history of each attribute.
+                             If 0, no history is kept
+        """
+        self.host = host
+        self.history_size = history_size
+        self.mqtt_broker = None
+
+        self._requested_port = port
+        self._server = None
+        self._thread = None
+
+        self._lock = threading.Lock()
+        self._tenants = {}
+        self._device_tenants = {}
+        self._history = {}
+        self._requests = Counter()
+
+    @property
+    def port(self):
+        """The port in which the server listens, once started"""
+        return self._server.server_address[1] if self._server is not None else self._requested_port
+
+    @property
+    def url(self):
+        """The base url of the server"""
+        return f"http://{self.host}:{self.port}"
+
+    def start(self):
+        """Start the server on a background thread
+
+        :return: The emulator itself
+        """
+        if self._server is None:
+            self._server = _EmulatorServer((self.host, self._requested_port), _EmulatorRequestHandler)
+            self._server.emulator = self
+            self._thread = threading.Thread(target=self._server.serve_forever, name='FiwareEmulator', daemon=True)
+            self._thread.start()
+            logging.info(f"FIWARE emulator listening on {self.url}")
+        return self
+
+    def stop(self):
+        """Stop the server, keeping the stored resources
+
+        :return: None
+        """
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._thread.join()
+            self._server = None
+            self._thread = None
+
+    def reset(self):
+        """Remove all the stored resources and the request counters
+
+        :return: None
+        """
+        with self._lock:
+            self._tenants.clear()
+            self._device_tenants.clear()
+            self._history.clear()
+            self._requests.clear()
+
+    def stats(self):
+        """Get the number of requests answered by the emulator for each operation
+
+        :return: A dict of operation names (e.g. 'create_entity') to the number of requests
+        """
+        with self._lock:
+            return dict(self._requests)
+
+    def config_dict(self, base_config=None):
+        """Build a client configuration pointing every component to the emulator
+
+        :param base_config: The configuration dict from which the other settings (e.g. service) are taken
+        :return: A new configuration dict, to be used with from_config_dict
+        """
+        config = dict(base_config or {})
+        config['contextBroker'] = {**config.get('contextBroker', {}), 'host': self.host, 'port': self.port}
+        config['iota'] = {**config.get('iota', {}), 'host': self.host, 'northPort': self.port,
+                          'protocolPort': self.port}
+        config['sthComet'] = {**config.get('sthComet', {}), 'host': self.host, 'port': self.port}
+        config['perseo'] = {**config.get('perseo', {}), 'host': self.host, 'port': self.port}
+        if self.mqtt_broker is not None:
+            config['mqttBroker'] = {**config.get('mqttBroker', {}), 'host': self.mqtt_broker.host,
+                                    'port': self.mqtt_broker.port}
+        return config
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def handle(self, method, target, headers, body):
+        """Answer a request made to any of the emulated components
+
+        :param method: The http method of the request
+        :param target: The path and query string of the request
+        :param headers: The http headers of the request
+        :param body: The raw body of the request
+        :return: A tuple with the status code, the raw body and a list of (name, value) headers of the response
+        """
+        split_target = urlsplit(target)
+        path = split_target.path.rstrip('/') or '/'
+        query = {key: values[-1] for key, values in parse_qs(split_target.query, keep_blank_values=True).items()}
+
+        handler_name, args = self._route(method, path)
+        if handler_name is None:
+            status_code, data, response_headers = args, '{"error":"BadRequest","description":"service not found"}', ()
+        else:
+            request = _Request(method, args, query, headers, body)
+            with self._lock:
+                self._requests[handler_name[1:]] += 1
+                try:
+                    status_code, data, response_headers = getattr(self, handler_name)(request)
+                except _HttpError as e:
+                    status_code, data, response_headers = e.status_code, e.body, ()
+
+                if data is None:
+                    return status_code, b'', list(response_headers)
+                if isinstance(data, str):
+                    return status_code, data.encode('utf-8'), [('Content-Type', 'text/plain'), *response_headers]
+
+                # The body is encoded holding the lock, as it references the stored resources
+                data = json.dumps(data, separators=_COMPACT_SEPARATORS)
+
+        return status_code, data.encode('utf-8'), [('Content-Type', 'application/json'), *response_headers]
+
+    def _route(self, method, path):
+        """Auxiliary method to find the method handling a request
+
+        :param method: The http method of the request
+        :param path: The path of the request
+        :return: A tuple with the name of the handler and the values captured from the path,
+                 or with None and the status code of the error if no handler was found
+        """
+        handler_name = self._STATIC_ROUTES.get((method, path))
+        if handler_name is not None:
+            return handler_name, ()
+
+        found_path = any(route_path == path for _, route_path in self._STATIC_ROUTES)
+        for pattern, handlers in self._PATTERN_ROUTES:
+            match = pattern.fullmatch(path)
+            if match is not None:
+                if method in handlers:
+                    return handlers[method], tuple(unquote(value) for value in match.groups())
+                found_path = True
+
+        return None, 405 if found_path else 404
+
+    def _tenant(self, request, create=True):
+        """Auxiliary method to get the resources of the service and service path of a request
+
+        :param request: The received request
+        :param create: If the tenant should be created when it doesn't exist yet
+        :return: The _TenantState, or None if it doesn't exist and should not be created
+        """
+        service = (request.headers.get('Fiware-Service') or '').lower()
+        service_path = request.headers.get('Fiware-ServicePath') or '/'
+        tenant = self._tenants.get((service, service_path))
+        if tenant is None and create:
+            tenant = self._tenants[(service, service_path)] = _TenantState(service, service_path)
+        return tenant
+
+    def _query_tenants(self, request):
+        """Auxiliary method to get the resources matched by the service and service paths of a query,
+        where a service path may end with '/#' to include its children
+
+        :param request: The received request
+        :return: A list of _TenantState
+        """
+        service = (request.headers.get('Fiware-Service') or '').lower()
+        service_paths = [path.strip() for path in (request.headers.get('Fiware-ServicePath') or '/#').split(',')]
+
+        tenants = []
+        for (tenant_service, tenant_path), tenant in self._tenants.items():
+            if tenant_service != service:
+                continue
+            for service_path in service_paths:
+                if service_path.endswith('/#'):
+                    prefix = service_path[:-2]
+                    if not prefix or tenant_path == prefix or tenant_path.startswith(prefix + '/'):
+                        tenants.append(tenant)
+                        break
+                elif tenant_path == service_path:
+                    tenants.append(tenant)
+                    break
+        return tenants
+
+    # Context broker
+
+    def _find_entity(self, tenant, entity_id, entity_type=None):
+        """Auxiliary method to get a stored entity
+
+        :param tenant: The _TenantState in which the entity is stored
+        :param entity_id: The id of the entity
+        :param entity_type: The type of the entity. If no value is provided, the id must be unique
+        :return: The stored entity, or None if it doesn't exist
+        :raises _HttpError: If no type is provided and several entities have the id
+        """
+        if entity_type:
+            return tenant.entities.get((entity_id, entity_type))
+
+        types = tenant.entity_types.get(entity_id)
+        if not types:
+            return None
+        if len(types) > 1:
+            raise _HttpError(409, {'error': 'TooManyResults',
+                                   'description': 'More than one matching entity. Please refine your query'})
+        return tenant.entities[(entity_id, types[0])]
+
+    def _get_entity_or_error(self, request):
+        """Auxiliary method to get the entity addressed by the path of a request
+
+        :param request: The received request
+        :return: A tuple with the _TenantState and the stored entity
+        :raises _HttpError: If the entity doesn't exist
+        """
+        tenant = self._tenant(request)
+        entity = self._find_entity(tenant, request.args[0], request.query.get('type'))
+        if entity is None:
+            raise _not_found('The requested entity has not been found. Check type and id')
+        return tenant, entity
+
+    def _add_entity(self, tenant, entity_id, entity_type, attributes):
+        """Auxiliary method to store a new entity
+
+        :param tenant: The _TenantState in which the entity is stored
+        :param entity_id: The id of the entity
+        :param entity_type: The type of the entity
+        :param attributes: A dict of attribute names to normalized attributes
+        :return: The stored entity
+        """
+        entity = {'id': entity_id, 'type': entity_type}
+        tenant.entities[(entity_id, entity_type)] = entity
+        tenant.entity_types.setdefault(entity_id, []).append(entity_type)
+        self._set_attributes(tenant, entity, attributes)
+        return entity
+
+    def _delete_entity(self, tenant, entity):
+        """Auxiliary method to remove a stored entity
+
+        :param tenant: The _TenantState in which the entity is stored
+        :param entity: The stored entity
+        :return: None
+        """
+        del tenant.entities[(entity['id'], entity['type'])]
+        types = tenant.entity_types[entity['id']]
+        types.remove(entity['type'])
+        if not types:
+            del tenant.entity_types[entity['id']]
+
+    def _set_attributes(self, tenant, entity, attributes):
+        """Auxiliary method to write attributes of an entity, adding their values to the history
+
+        :param tenant: The _TenantState in which the entity is stored
+        :param entity: The stored entity
+        :param attributes: A dict of attribute names to normalized attributes
+        :return: None
+        """
+        entity.update(attributes)
+        if not self.history_size or not attributes:
+            return
+
+        received_at = _timestamp()
+        history_prefix = (tenant.service, tenant.service_path.lower(), entity['type'], entity['id'])
+        for name, attribute in attributes.items():
+            history = self._history.get((*history_prefix, name))
+            if history is None:
+                history = self._history[(*history_prefix, name)] = deque(maxlen=self.history_size)
+            history.append({'recvTime': received_at, 'attrType': attribute['type'], 'attrValue': attribute['value']})
+
+    def _apply_update(self, tenant, action_type, entity_id, entity_type, attributes):
+        """Auxiliary method to apply an update action to an entity, as on the batch update operation
+
+        :param tenant: The _TenantState in which the entity is stored
+        :param action_type: The action ('append', 'appendStrict', 'update', 'replace' or 'delete')
+        :param entity_id: The id of the entity
+        :param entity_type: The type of the entity, or None if not provided
+        :param attributes: A dict of attribute names to normalized attributes
+        :return: None
+        :raises _HttpError: If the action can't be applied to the entity
+        """
+        entity = self._find_entity(tenant, entity_id, entity_type)
+
+        if entity is None:
+            if action_type not in ('append', 'appendStrict'):
+                raise _not_found('The requested entity has not been found. Check type and id')
+            self._add_entity(tenant, entity_id, entity_type or 'Thing', attributes)
+            return
+
+        if action_type == 'appendStrict':
+            raise _HttpError(422, {'error': 'Unprocessable', 'description': f'Already Exists: {entity_id}'})
+
+        if action_type == 'update':
+            if any(name not in entity for name in attributes):
+                raise _not_found('The entity does not have such attribute')
+        elif action_type == 'replace':
+            for name in [name for name in entity if name not in ('id', 'type')]:
+                del entity[name]
+        elif action_type == 'delete':
+            if not attributes:
+                self._delete_entity(tenant, entity)
+                return
+            if any(name not in entity for name in attributes):
+                raise _not_found('The entity does not have such attribute')
+            for name in attributes:
+                del entity[name]
+            return
+
+        self._set_attributes(tenant, entity, attributes)
+
+    def _get_version(self, request):
+        return 200, {'orion': {'version': '3.0.0', 'release_date': 'emulated'}}, ()
+
+    def _create_entity(self, request):
+        data = request.json()
+        if not isinstance(data, dict) or not isinstance(data.get('id'), str) or not data['id']:
+            raise _bad_request('entity id is missing')
+
+        tenant = self._tenant(request)
+        options = request.options()
+        entity_type = data.get('type') or 'Thing'
+        attributes = _normalize_attributes(data, 'keyValues' in options)
+
+        entity = self._find_entity(tenant, data['id'], entity_type)
+        if entity is not None:
+            if 'upsert' not in options:
+                raise _HttpError(422, {'error': 'Unprocessable', 'description': 'Already Exists'})
+            self._set_attributes(tenant, entity, attributes)
+            return 204, None, ()
+
+        self._add_entity(tenant, data['id'], entity_type, attributes)
+        return 201, None, [('Location', f"/v2/entities/{data['id']}?type={entity_type}")]
+
+    def _list_entities(self, request):
+        limit = request.int_param('limit', 20)
+        offset = request.int_param('offset', 0)
+        if not 0 < limit <= 1000:
+            raise _bad_request('Bad pagination limit: /1000/ maximum')
+
+        entity_types = set(request.query['type'].split(',')) if request.query.get('type') else None
+        entity_ids = set(request.query['id'].split(',')) if request.query.get('id') else None
+        id_pattern = re.compile(request.query['idPattern']) if request.query.get('idPattern') else None
+        q = request.query.get('q')
+
+        entities = []
+        for tenant in self._query_tenants(request):
+            for entity in tenant.entities.values():
+                if entity_types is not None and entity['type'] not in entity_types:
+                    continue
+                if entity_ids is not None and entity['id'] not in entity_ids:
+                    continue
+                if id_pattern is not None and id_pattern.search(entity['id']) is None:
+                    continue
+                if q and not _matches_q(entity, q):
+                    continue
+                entities.append(entity)
+
+        options = request.options()
+        attrs = set(request.query['attrs'].split(',')) if request.query.get('attrs') else None
+        page = [_render_entity(entity, options, attrs) for entity in entities[offset:offset + limit]]
+
+        headers = [('Fiware-Total-Count', str(len(entities)))] if 'count' in options else ()
+        return 200, page, headers
+
+    def _get_entity(self, request):
+        _, entity = self._get_entity_or_error(request)
+        attrs = set(request.query['attrs'].split(',')) if request.query.get('attrs') else None
+        return 200, _render_entity(entity, request.options(), attrs), ()
+
+    def _remove_entity(self, request):
+        tenant, entity = self._get_entity_or_error(request)
+        self._delete_entity(tenant, entity)
+        return 204, None, ()
+
+    def _append_attributes(self, request):
+        tenant, entity = self._get_entity_or_error(request)
+        options = request.options()
+        attributes = _normalize_attributes(request.json(), 'keyValues' in options)
+
+        if 'append' in options and any(name in entity for name in attributes):
+            raise _HttpError(422, {'error': 'Unprocessable', 'description': 'one or more attributes already exist'})
+
+        self._set_attributes(tenant, entity, attributes)
+        return 204, None, ()
+
+    def _update_attributes(self, request):
+        tenant, entity = self._get_entity_or_error(request)
+        attributes = _normalize_attributes(request.json(), 'keyValues' in request.options())
+
+        if any(name not in entity for name in attributes):
+            raise _not_found('The entity does not have such attribute')
+
+        self._set_attributes(tenant, entity, attributes)
+        return 204, None, ()
+
+    def _replace_attributes(self, request):
+        tenant, entity = self._get_entity_or_error(request)
+        self._apply_update(tenant, 'replace', entity['id'], entity['type'],
+                           _normalize_attributes(request.json(), 'keyValues' in request.options()))
+        return 204, None, ()
+
+    def _batch_update(self, request):
+        data = request.json()
+        action_type = data.get('actionType') if isinstance(data, dict) else None
+        if action_type not in ('append', 'appendStrict', 'update', 'replace', 'delete'):
+            raise _bad_request(f"invalid update action type: '{action_type}'")
+
+        tenant = self._tenant(request)
+        key_values = 'keyValues' in request.options()
+
+        # Like Orion, every entity is processed and the first error is reported
+        error = None
+        for entity_data in data.get('entities', []):
+            try:
+                if not isinstance(entity_data, dict) or not entity_data.get('id'):
+                    raise _bad_request('entity id is missing')
+                self._apply_update(tenant, action_type, entity_data['id'], entity_data.get('type'),
+                                   _normalize_attributes(entity_data, key_values))
+            except _HttpError as e:
+                error = error or e
+
+        if error is not None:
+            raise error
+        return 204, None, ()
+
+    def _store_subscription(self, tenant, subscription):
+        """Auxiliary method to store a new subscription
+
+        :param tenant: The _TenantState in which the subscription is stored
+        :param subscription: The dict representing the subscription, without id
+        :return: The id of the subscription
+        """
+        subscription_id = uuid.uuid4().hex[:24]
+        tenant.subscriptions[subscription_id] = {'id': subscription_id, 'status': 'active', **subscription}
+        return subscription_id
+
+    def _create_subscription(self, request):
+        data = request.json()
+        if not isinstance(data, dict) or 'subject' not in data or 'notification' not in data:
+            raise _bad_request('no subject or notification for subscription')
+
+        subscription_id = self._store_subscription(self._tenant(request), data)
+        return 201, None, [('Location', f'/v2/subscriptions/{subscription_id}')]
+
+    def _list_subscriptions(self, request):
+        limit = request.int_param('limit', 20)
+        offset = request.int_param('offset', 0)
+
+        subscriptions = [subscription for tenant in self._query_tenants(request)
+                         for subscription in tenant.subscriptions.values()]
+
+        headers = [('Fiware-Total-Count', str(len(subscriptions)))] if 'count' in request.options() else ()
+        return 200, subscriptions[offset:offset + limit], headers
+
+    def _find_subscription(self, request):
+        """Auxiliary method to get the tenant storing the subscription addressed by a request
+
+        :param request: The received request
+        :return: The _TenantState in which the subscription is stored
+        :raises _HttpError: If the subscription doesn't exist
+        """
+        for tenant in self._query_tenants(request):
+            if request.args[0] in tenant.subscriptions:
+                return tenant
+        raise _not_found('The requested subscription has not been found. Check id')
+
+    def _get_subscription(self, request):
+        return 200, self._find_subscription(request).subscriptions[request.args[0]], ()
+
+    def _remove_subscription(self, request):
+        del self._find_subscription(request).subscriptions[request.args[0]]
+        return 204, None, ()
+
+    def _subscribe_context(self, request):
+        data = request.json()
+        entities = [{'idPattern' if str(entity.get('isPattern')).lower() == 'true' else 'id': entity.get('id'),
+                     'type': entity.get('type')} for entity in data.get('entities', [])]
+        throttling = str(data.get('throttling', '0'))
+        condition_attributes = [value for condition in data.get('notifyConditions', [])
+                                for value in condition.get('condValues', [])]
+
+        subscription = {
+            'subject': {'entities': entities, 'condition': {'attrs': condition_attributes}},
+            'notification': {'attrs': data.get('attributes', []), 'http': {'url': data.get('reference')},
+                             'attrsFormat': 'legacy'},
+            'throttling': int(throttling) if throttling.isdigit() else 0
+        }
+        subscription_id = self._store_subscription(self._tenant(request), subscription)
+
+        response = {'subscriptionId': subscription_id, 'duration': data.get('duration')}
+        if data.get('throttling') is not None:
+            response['throttling'] = data['throttling']
+        return 200, {'subscribeResponse': response}, ()
+
+    def _unsubscribe_context(self, request):
+        subscription_id = str(request.json().get('subscriptionId'))
+        for tenant in self._query_tenants(request):
+            if subscription_id in tenant.subscriptions:
+                del tenant.subscriptions[subscription_id]
+                return 200, {'subscriptionId': subscription_id, 'statusCode': {'code': '200', 'reasonPhrase': 'OK'}}, ()
+
+        return 200, {'subscriptionId': subscription_id,
+                     'statusCode': {'code': '404', 'reasonPhrase': 'No context element found',
+                                    'details': f'subscriptionId: /{subscription_id}/'}}, ()
+
+    # IoT Agent
+
+    def _get_about(self, request):
+        return 200, {'libVersion': '2.0.0', 'port': str(self.port), 'baseRoot': '/', 'version': 'emulated'}, ()
+
+    def _create_groups(self, request):
+        data = request.json()
+        groups = data.get('services') if isinstance(data, dict) else None
+        if not groups or any('apikey' not in group or 'resource' not in group for group in groups):
+            raise _iot_error(400, 'MANDATORY_PARAMS_NOT_FOUND_IN_REQUEST',
+                             'Some of the mandatory params weren\'t found in the request: ["apikey","resource"]')
+
+        tenant = self._tenant(request)
+        for group in groups:
+            if any((stored['apikey'], stored['resource']) == (group['apikey'], group['resource'])
+                   for stored in tenant.groups):
+                raise _iot_error(409, 'DUPLICATE_GROUP',
+                                 f"A device configuration already exists for resource {group['resource']} "
+                                 f"and API Key {group['apikey']}")
+
+        for group in groups:
+            tenant.groups.append({**group, 'service': tenant.service, 'subservice': tenant.service_path})
+        return 201, None, ()
+
+    def _list_groups(self, request):
+        tenant = self._tenant(request, create=False)
+        groups = tenant.groups if tenant is not None else []
+        return 200, {'count': len(groups), 'services': groups}, ()
+
+    def _remove_group(self, request):
+        tenant = self._tenant(request, create=False)
+        resource, api_key = request.query.get('resource'), request.query.get('apikey', '')
+
+        group = None
+        if tenant is not None:
+            group = next((group for group in tenant.groups
+                          if group['resource'] == resource and group['apikey'] == api_key), None)
+        if group is None:
+            raise _iot_error(404, 'DEVICE_GROUP_NOT_FOUND', 'Couldn\'t find device group')
+
+        tenant.groups.remove(group)
+        if request.query.get('device') == 'true':
+            for device in [device for device in tenant.devices.values() if device.get('apikey', api_key) == api_key]:
+                self._delete_device(tenant, device)
+        return 204, None, ()
+
+    def _add_device(self, tenant, device_data, protocol, group=None):
+        """Auxiliary method to store a new device, creating or updating its entity on the context broker
+
+        :param tenant: The _TenantState in which the device is stored
+        :param device_data: The device as sent on the request
+        :param protocol: The protocol of the device
+        :param group: The service group from which the default values of the device are taken, if any
+        :return: The stored device
+        """
+        group = group or {}
+        device = dict(device_data)
+        device_id = device['device_id']
+        device.setdefault('service', tenant.service)
+        device.setdefault('service_path', tenant.service_path)
+        device.setdefault('entity_type', group.get('entity_type') or 'Thing')
+        device.setdefault('entity_name', f"{device['entity_type']}:{device_id}")
+        device.setdefault('protocol', protocol)
+        device.setdefault('explicitAttrs', False)
+        device['attributes'] = list(device.get('attributes', group.get('attributes', [])))
+        device['lazy'] = list(device.get('lazy', group.get('lazy', [])))
+        device['static_attributes'] = list(device.get('static_attributes', group.get('static_attributes', [])))
+        device['commands'] = [{**command, 'object_id': command.get('object_id', command['name'])}
+                              for command in device.get('commands', group.get('commands', []))]
+        if group.get('apikey') is not None:
+            device.setdefault('apikey', group['apikey'])
+
+        tenant.devices[device_id] = device
+        tenant.device_entities[device['entity_name']] = device_id
+        self._device_tenants.setdefault(device_id, []).append(tenant)
+
+        attributes = {attribute['name']: {'type': attribute.get('type', 'Text'), 'value': ' ', 'metadata': {}}
+                      for attribute in device['attributes']}
+        for attribute in device['static_attributes']:
+            attributes[attribute['name']] = _normalize_attribute(attribute)
+        for command in device['commands']:
+            attributes[f"{command['name']}_info"] = {'type': 'commandResult', 'value': ' ', 'metadata': {}}
+            attributes[f"{command['name']}_status"] = {'type': 'commandStatus', 'value': 'UNKNOWN', 'metadata': {}}
+        self._apply_update(tenant, 'append', device['entity_name'], device['entity_type'], attributes)
+
+        return device
+
+    def _delete_device(self, tenant, device):
+        """Auxiliary method to remove a stored device, keeping its entity on the context broker
+
+        :param tenant: The _TenantState in which the device is stored
+        :param device: The stored device
+        :return: None
+        """
+        device_id = device['device_id']
+        del tenant.devices[device_id]
+        tenant.device_entities.pop(device['entity_name'], None)
+        tenant.commands.pop(device_id, None)
+
+        tenants = self._device_tenants[device_id]
+        tenants.remove(tenant)
+        if not tenants:
+            del self._device_tenants[device_id]
+
+    def _create_devices(self, request):
+        data = request.json()
+        devices = data.get('devices') if isinstance(data, dict) else None
+        if not devices or any(not device.get('device_id') for device in devices):
+            raise _iot_error(400, 'MANDATORY_PARAMS_NOT_FOUND_IN_REQUEST',
+                             'Some of the mandatory params weren\'t found in the request: ["device_id"]')
+
+        tenant = self._tenant(request)
+        devices_ids = [device['device_id'] for device in devices]
+
+        # The devices of a request are registered all together or not at all
+        for device_id in devices_ids:
+            if device_id in tenant.devices or devices_ids.count(device_id) > 1:
+                raise _iot_error(409, 'DUPLICATE_DEVICE_ID',
+                                 f'A device with the same pair (Service, DeviceId) was found: {device_id}')
+
+        protocol = request.query.get('protocol', 'IoTA-UL')
+        for device in devices:
+            self._add_device(tenant, device, protocol)
+        return 201, None, ()
+
+    def _list_devices(self, request):
+        tenant = self._tenant(request, create=False)
+        devices = list(tenant.devices.values()) if tenant is not None else []
+
+        limit = request.int_param('limit', 20)
+        offset = request.int_param('offset', 0)
+        return 200, {'count': len(devices), 'devices': devices[offset:offset + limit]}, ()
+
+    def _get_device_or_error(self, request):
+        """Auxiliary method to get the device addressed by the path of a request
+
+        :param request: The received request
+        :return: A tuple with the _TenantState and the stored device
+        :raises _HttpError: If the device doesn't exist
+        """
+        tenant = self._tenant(request, create=False)
+        device = tenant.devices.get(request.args[0]) if tenant is not None else None
+        if device is None:
+            raise _iot_error(404, 'DEVICE_NOT_FOUND', f'No device was found with id:{request.args[0]}')
+        return tenant, device
+
+    def _get_device(self, request):
+        return 200, self._get_device_or_error(request)[1], ()
+
+    def _update_device(self, request):
+        tenant, device = self._get_device_or_error(request)
+        data = request.json()
+        if not isinstance(data, dict):
+            raise _iot_error(400, 'WRONG_SYNTAX', 'Wrong syntax in request: device must be an object')
+
+        tenant.device_entities.pop(device['entity_name'], None)
+        device.update({key: value for key, value in data.items() if key != 'device_id'})
+        tenant.device_entities[device['entity_name']] = device['device_id']
+        return 204, None, ()
+
+    def _remove_device(self, request):
+        tenant, device = self._get_device_or_error(request)
+        self._delete_device(tenant, device)
+        return 204, None, ()
+
+    def _find_device_for_measures(self, device_id, api_key):
+        """Auxiliary method to find the device sending measures, provisioning it if it is not registered
+        but a service group exists for its API key
+
+        :param device_id: The id of the device
+        :param api_key: The API key sent along with the measures
+        :return: A tuple with the _TenantState and the stored device
+        :raises _HttpError: If the device is not registered and there is no group for the API key
+        """
+        for tenant in self._device_tenants.get(device_id, ()):
+            device = tenant.devices[device_id]
+            device_api_key = device.get('apikey')
+            if device_api_key is None:
+                group_api_keys = [group['apikey'] for group in tenant.groups]
+                if not group_api_keys or api_key in group_api_keys:
+                    return tenant, device
+            elif device_api_key == api_key:
+                return tenant, device
+
+        for tenant in self._tenants.values():
+            for group in tenant.groups:
+                if group['apikey'] == api_key and group['resource'] == '/iot/d':
+                    return tenant, self._add_device(tenant, {'device_id': device_id}, 'IoTA-UL', group)
+
+        raise _iot_error(404, 'DEVICE_GROUP_NOT_FOUND', 'Couldn\'t find device group')
+
+    def _update_device_entity(self, tenant, device, attributes):
+        """Auxiliary method to write attributes of the entity of a device, creating the entity if it doesn't exist
+
+        :param tenant: The _TenantState in which the device is stored
+        :param device: The stored device
+        :param attributes: A dict of attribute names to normalized attributes
+        :return: None
+        """
+        entity = self._find_entity(tenant, device['entity_name'], device['entity_type'])
+        if entity is None:
+            self._add_entity(tenant, device['entity_name'], device['entity_type'], attributes)
+        else:
+            self._set_attributes(tenant, entity, attributes)
+
+    def _apply_measures(self, tenant, device, payload):
+        """Auxiliary method to write the measures of a UL payload to the entity of a device
+
+        :param tenant: The _TenantState in which the device is stored
+        :param device: The stored device
+        :param payload: The UL payload string
+        :return: None
+        :raises _HttpError: If the payload can't be parsed
+        """
+        try:
+            groups = _parse_ul_measures(payload)
+        except ValueError as e:
+            raise _iot_error(400, 'UNSUPPORTED_TYPE', f'Parse error parsing incoming message: {e}')
+
+        attributes_by_object_id = {attribute.get('object_id', attribute['name']): attribute
+                                   for attribute in device['attributes']}
+        for timestamp, measures in groups:
+            attributes = {}
+            for object_id, value in measures.items():
+                attribute = attributes_by_object_id.get(object_id, {'name': object_id, 'type': 'Text'})
+                attributes[attribute['name']] = {'type': attribute.get('type', 'Text'), 'value': value,
+                                                 'metadata': {}}
+            if timestamp is not None:
+                attributes['TimeInstant'] = {'type': 'DateTime', 'value': timestamp, 'metadata': {}}
+
+            self._update_device_entity(tenant, device, attributes)
+
+    def _apply_command_result(self, tenant, device, payload):
+        """Auxiliary method to write the results of commands executed by a device ('device_id@command|result')
+
+        :param tenant: The _TenantState in which the device is stored
+        :param device: The stored device
+        :param payload: The UL command execution payload
+        :return: None
+        """
+        for result in payload.strip().split('#'):
+            target, _, value = result.partition('|')
+            command_name = target.partition('@')[2] or target
+            self._update_device_entity(tenant, device, {
+                f'{command_name}_status': {'type': 'commandStatus', 'value': 'OK', 'metadata': {}},
+                f'{command_name}_info': {'type': 'commandResult', 'value': value, 'metadata': {}}
+            })
+
+    def _receive_measures(self, request):
+        device_id = request.query.get('i')
+        if not device_id:
+            raise _iot_error(400, 'MANDATORY_PARAMS_NOT_FOUND_IN_REQUEST',
+                             'Some of the mandatory params weren\'t found in the request: ["i","k"]')
+
+        tenant, device = self._find_device_for_measures(device_id, request.query.get('k', ''))
+        self._apply_measures(tenant, device, request.body.decode('utf-8'))
+
+        if request.query.get('getCmd') in ('1', 'true'):
+            commands = tenant.commands.pop(device_id, [])
+            for name, _ in commands:
+                self._update_device_entity(tenant, device, {
+                    f'{name}_status': {'type': 'commandStatus', 'value': 'DELIVERED', 'metadata': {}}})
+            return 200, '#'.join(f'{device_id}@{name}|{value}' for name, value in commands), ()
+
+        return 200, '', ()
+
+    def handle_mqtt(self, topic, payload):
+        """Process a message published by a device on the MQTT transport of the IoT Agent UL:
+        measures on '/{api_key}/{device_id}/attrs' (or '.../attrs/{attribute}' for a single one)
+        and command results on '/{api_key}/{device_id}/cmdexe'. Other topics are ignored
+
+        :param topic: The topic of the message
+        :param payload: The payload of the message, as bytes
+        :return: True if the message was processed, False if it was ignored
+        """
+        levels = topic.split('/')
+        if len(levels) not in (4, 5) or levels[0] != '' or levels[3] not in ('attrs', 'cmdexe'):
+            return False
+
+        api_key, device_id, kind = levels[1], levels[2], levels[3]
+        payload = payload.decode('utf-8')
+        if len(levels) == 5:
+            if kind != 'attrs':
+                return False
+            payload = f'{levels[4]}|{payload}'
+
+        with self._lock:
+            self._requests['mqtt_' + kind] += 1
+            try:
+                tenant, device = self._find_device_for_measures(device_id, api_key)
+                if kind == 'attrs':
+                    self._apply_measures(tenant, device, payload)
+                else:
+                    self._apply_command_result(tenant, device, payload)
+            except _HttpError as e:
+                logging.error(f"Emulator: MQTT message on topic {topic} rejected: {e.body}")
+                return False
+        return True
+
+    def _send_commands(self, request):
+        data = request.json()
+        tenant = self._tenant(request)
+
+        context_responses = []
+        for element in data.get('contextElements', []):
+            device_id = tenant.device_entities.get(element.get('id'))
+            if device_id is None:
+                raise _HttpError(404, {'errorCode': {'code': '404', 'reasonPhrase': 'No context element found'}})
+
+            device = tenant.devices[device_id]
+            commands_names = {command['name'] for command in device['commands']}
+
+            for attribute in element.get('attributes', []):
+                if attribute.get('name') not in commands_names:
+                    continue
+
+                name, value = attribute['name'], attribute.get('value', '')
+                if device.get('transport') == 'MQTT' and self.mqtt_broker is not None:
+                    # Commands of MQTT devices are pushed to them, instead of waiting to be polled
+                    api_key = device.get('apikey', tenant.groups[0]['apikey'] if tenant.groups else '')
+                    self.mqtt_broker.publish(f'/{api_key}/{device_id}/cmd',
+                                             f'{device_id}@{name}|{value}'.encode('utf-8'))
+                else:
+                    tenant.commands.setdefault(device_id, []).append((name, value))
+                self._update_device_entity(tenant, device, {
+                    f'{name}_status': {'type': 'commandStatus', 'value': 'PENDING', 'metadata': {}}})
+
+            context_responses.append({
+                'contextElement': {
+                    'attributes': [{'name': attribute.get('name'), 'type': attribute.get('type'), 'value': ''}
+                                   for attribute in element.get('attributes', [])],
+                    'id': element.get('id'),
+                    'isPattern': 'false',
+                    'type': element.get('type')
+                },
+                'statusCode': {'code': '200', 'reasonPhrase': 'OK'}
+            })
+
+        return 200, {'contextResponses': context_responses}, ()
+
+    # STH-Comet
+
+    def _get_history(self, request):
+        entity_type, entity_id, attribute = request.args
+        last_n = request.int_param('lastN', None)
+        h_limit = request.int_param('hLimit', None)
+        if last_n is None and h_limit is None:
+            raise _HttpError(400, {'statusCode': 400, 'error': 'Bad Request',
+                                   'message': "A 'lastN' or 'hLimit' and 'hOffset' query param is mandatory"})
+
+        service = (request.headers.get('Fiware-Service') or '').lower()
+        service_path = (request.headers.get('Fiware-ServicePath') or '/').lower()
+        values = list(self._history.get((service, service_path, entity_type, entity_id, attribute), ()))
+
+        if last_n is not None:
+            values = values[-last_n:] if last_n > 0 else values
+        else:
+            h_offset = request.int_param('hOffset', 0)
+            values = values[h_offset:h_offset + h_limit]
+
+        return 200, {'contextResponses': [{
+            'contextElement': {
+                'attributes': [{'name': attribute, 'values': values}],
+                'id': entity_id,
+                'isPattern': False,
+                'type': entity_type
+            },
+            'statusCode': {'code': '200', 'reasonPhrase': 'OK'}
+        }]}, ()
+
+    # Perseo
+
+    def _create_rule(self, request):
+        data = request.json()
+        if not isinstance(data, dict) or not data.get('name'):
+            raise _HttpError(400, {'error': 'missing name', 'data': None})
+
+        tenant = self._tenant(request)
+        if data['name'] in tenant.rules:
+            raise _HttpError(400, {'error': 'duplicated rule', 'data': None})
+
+        tenant.rules[data['name']] = data
+        return 200, {'error': None, 'data': data}, ()
+
+    def _list_rules(self, request):
+        tenant = self._tenant(request, create=False)
+        rules = list(tenant.rules.values()) if tenant is not None else []
+        return 200, {'error': None, 'data': rules, 'count': len(rules)}, ()
+
+    def _remove_rule(self, request):
+        tenant = self._tenant(request, create=False)
+        if tenant is None or tenant.rules.pop(request.args[0], None) is None:
+            raise _HttpError(404, {'error': 'rule not found', 'data': None})
+        return 204, None, ()
+
+
+def _mqtt_packet(packet_type, flags, body):
+    """Auxiliary function to build an MQTT control packet
+
+    :param packet_type: The type of the packet
+    :param flags: The flags of the fixed header
+    :param body: The variable header and the payload of the packet
+    :return: The encoded packet
+    """
+    header = bytearray([packet_type << 4 | flags])
+    length = len(body)
+    while True:
+        length, digit = divmod(length, 128)
+        header.append(digit | 0x80 if length else digit)
+        if not length:
+            break
+    return bytes(header) + body
+
+
+def _mqtt_string(data, offset):
+    """Auxiliary function to read a length-prefixed UTF-8 string of an MQTT packet
+
+    :param data: The body of the packet
+    :param offset: The position of the string
+    :return: A tuple with the string and the position after it
+    """
+    length, = struct.unpack_from('!H', data, offset)
+    return data[offset + 2:offset + 2 + length].decode('utf-8'), offset + 2 + length
+
+
+def _topic_matches(topic_filter, topic):
+    """Auxiliary function to check a topic against a subscription filter with '+' and '#' wildcards
+
+    :param topic_filter: The topic filter of the subscription
+    :param topic: The topic of the message
+    :return: True if the topic matches the filter
+    """
+    filter_levels = topic_filter.split('/')
+    topic_levels = topic.split('/')
+    for index, level in enumerate(filter_levels):
+        if level == '#':
+            return True
+        if index >= len(topic_levels) or (level != '+' and level != topic_levels[index]):
+            return False
+    return len(filter_levels) == len(topic_levels)
+
+
+class _MqttBrokerServer(socketserver.ThreadingTCPServer):
+
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 128
+
+
+class _MqttConnectionHandler(socketserver.StreamRequestHandler):
+
+    def setup(self):
+        super().setup()
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.write_lock = threading.Lock()
+        self.subscriptions = set()
+
+    def send(self, packet):
+        with self.write_lock:
+            self.connection.sendall(packet)
+
+    def _read_packet(self):
+        header = self.rfile.read(1)
+        if not header:
+            return None, None, None
+
+        length, multiplier = 0, 1
+        while True:
+            digit = self.rfile.read(1)
+            if not digit:
+                return None, None, None
+            length += (digit[0] & 0x7F) * multiplier
+            if not digit[0] & 0x80:
+                break
+            multiplier *= 128
+
+        body = self.rfile.read(length) if length else b''
+        return header[0] >> 4, header[0] & 0x0F, body
+
+    def handle(self):
+        broker = self.server.broker
+        broker._add_connection(self)
+        try:
+            while True:
+                packet_type, flags, body = self._read_packet()
+                if packet_type is None or packet_type == _MQTT_DISCONNECT:
+                    break
+                broker._process_packet(self, packet_type, flags, body)
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            broker._remove_connection(self)
+
+
+class MqttBrokerEmulator(object):
+
+    def __init__(self, host='127.0.0.1', port=0, fiware_emulator=None):
+        """Minimal in-process MQTT 3.1.1 broker, to be used as the target of tests and benchmarks
+        without an external broker
+
+        It accepts connections without authentication and routes the published messages to the matching
+        subscriptions (with '+' and '#' wildcards), always delivering them with QoS 0.
+        Retained messages and will messages are not supported.
+
+        :param host: The address in which the broker listens
+        :param port: The port in which the broker listens. If no value is provided, a free port is chosen
+        :param fiware_emulator: The FiwareEmulator which receives the messages published by the devices
+                                and pushes commands to them through this broker, if any
+        """
+        self.host = host
+        self.fiware_emulator = fiware_emulator
+        if fiware_emulator is not None:
+            fiware_emulator.mqtt_broker = self
+
+        self._requested_port = port
+        self._server = None
+        self._thread = None
+
+        self._lock = threading.Lock()
+        self._connections = set()
+        self._published = 0
+        self._delivered = 0
+
+    @property
+    def port(self):
+        """The port in which the broker listens, once started"""
+        return self._server.server_address[1] if self._server is not None else self._requested_port
+
+    def start(self):
+        """Start the broker on a background thread
+
+        :return: The broker itself
+        """
+        if self._server is None:
+            self._server = _MqttBrokerServer((self.host, self._requested_port), _MqttConnectionHandler)
+            self._server.broker = self
+            self._thread = threading.Thread(target=self._server.serve_forever, name='MqttBrokerEmulator',
+                                            daemon=True)
+            self._thread.start()
+            logging.info(f"MQTT broker emulator listening on {self.host}:{self.port}")
+        return self
+
+    def stop(self):
+        """Stop the broker, closing the connections of the clients
+
+        :return: None
+        """
+        if self._server is not None:
+            self._server.shutdown()
+            with self._lock:
+                connections = list(self._connections)
+            for connection in connections:
+                try:
+                    connection.connection.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+            self._server.server_close()
+            self._thread.join()
+            self._server = None
+            self._thread = None
+
+    def stats(self):
+        """Get the counters of the messages handled by the broker
+
+        :return: A dict with the number of 'published' messages, of messages 'delivered' to subscribers
+                 and of open 'connections'
+        """
+        with self._lock:
+            return {'published': self._published, 'delivered': self._delivered,
+                    'connections': len(self._connections)}
+
+    def publish(self, topic, payload):
+        """Deliver a message to the clients subscribed to its topic
+
+        :param topic: The topic of the message
+        :param payload: The payload of the message, as bytes
+        :return: The number of clients to which the message was delivered
+        """
+        with self._lock:
+            subscribers = [connection for connection in self._connections
+                           if any(_topic_matches(topic_filter, topic) for topic_filter in connection.subscriptions)]
+            self._delivered += len(subscribers)
+
+        if subscribers:
+            topic_bytes = topic.encode('utf-8')
+            packet = _mqtt_packet(_MQTT_PUBLISH, 0, struct.pack('!H', len(topic_bytes)) + topic_bytes + payload)
+            for connection in subscribers:
+                try:
+                    connection.send(packet)
+                except OSError:
+                    pass
+        return len(subscribers)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def _add_connection(self, connection):
+        with self._lock:
+            self._connections.add(connection)
+
+    def _remove_connection(self, connection):
+        with self._lock:
+            self._connections.discard(connection)
+
+    def _process_packet(self, connection, packet_type, flags, body):
+        """Auxiliary method to answer a packet sent by a client
+
+        :param connection: The _MqttConnectionHandler of the client
+        :param packet_type: The type of the packet
+        :param flags: The flags of the fixed header of the packet
+        :param body: The variable header and the payload of the packet
+        :return: None
+        """
+        if packet_type == _MQTT_CONNECT:
+            connection.send(_mqtt_packet(_MQTT_CONNACK, 0, b'\x00\x00'))
+
+        elif packet_type == _MQTT_PUBLISH:
+            topic, offset = _mqtt_string(body, 0)
+            qos = (flags >> 1) & 0x03
+            if qos:
+                packet_id = body[offset:offset + 2]
+                offset += 2
+                # QoS 2 is completed right away, as the message is delivered only once anyway
+                connection.send(_mqtt_packet(_MQTT_PUBACK if qos == 1 else _MQTT_PUBREC, 0, packet_id))
+
+            with self._lock:
+                self._published += 1
+            payload = body[offset:]
+            if self.fiware_emulator is not None:
+                self.fiware_emulator.handle_mqtt(topic, payload)
+            self.publish(topic, payload)
+
+        elif packet_type == _MQTT_PUBREL:
+            connection.send(_mqtt_packet(_MQTT_PUBCOMP, 0, body[:2]))
+
+        elif packet_type == _MQTT_SUBSCRIBE:
+            offset, granted = 2, bytearray()
+            with self._lock:
+                while offset < len(body):
+                    topic_filter, offset = _mqtt_string(body, offset)
+                    offset += 1
+                    connection.subscriptions.add(topic_filter)
+                    granted.append(0)
+            connection.send(_mqtt_packet(_MQTT_SUBACK, 0, body[:2] + bytes(granted)))
+
+        elif packet_type == _MQTT_UNSUBSCRIBE:
+            offset = 2
+            with self._lock:
+                while offset < len(body):
+                    topic_filter, offset = _mqtt_string(body, offset)
+                    connection.subscriptions.discard(topic_filter)
+            connection.send(_mqtt_packet(_MQTT_UNSUBACK, 0, body[:2]))
+
+        elif packet_type == _MQTT_PINGREQ:
+            connection.send(_mqtt_packet(_MQTT_PINGRESP, 0, b''))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run an in-memory FIWARE stack emulator "
+                                                 "(Orion, IoT Agent UL, STH-Comet and Perseo subset)")
+    parser.add_argument('--host', default='127.0.0.1', help="The address in which the servers listen")
+    parser.add_argument('--port', type=int, default=1026, help="The port in which the HTTP server listens")
+    parser.add_argument('--mqtt-port', type=int, default=None,
+                        help="The port in which the MQTT broker listens. If not provided, no broker is started")
+    parser.add_argument('--history-size', type=int, default=100,
+                        help="The maximum number of values kept on the history of each attribute")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    emulator = FiwareEmulator(args.host, args.port, history_size=args.history_size)
+    broker = MqttBrokerEmulator(args.host, args.mqtt_port, fiware_emulator=emulator) \
+        if args.mqtt_port is not None else None
+
+    emulator.start()
+    if broker is not None:
+        broker.start()
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        if broker is not None:
+            broker.stop()
+        emulator.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,22 @@
+class FiwareRequestError(Exception):
+
+    def __init__(self, message, response=None):
+        """Raised when a request to a FIWARE API fails in an operation that can't return the error as a response
+
+        :param message: The description of the error
+        :param response: The response of the failed request, if any
+        """
+        super(FiwareRequestError, self).__init__(message)
+        self.response = response
+
+
+class MqttPublishError(Exception):
+
+    def __init__(self, message, rc=None):
+        """Raised when a message is refused by the MQTT client and will never be delivered to the broker
+
+        :param message: The description of the error
+        :param rc: The paho error code of the publication
+        """
+        super(MqttPublishError, self).__init__(message)
+        self.rc = rc
@@ -0,0 +1,445 @@
+import logging
+import multiprocessing
+import os
+import pickle
+import signal
+import struct
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+from . import ul, utils
+from .config import FiwareConfig
+from .iot import FiwareIotClient
+
+# Each record on the queue of a shard is made of a header with the length of the record, the CRC32 of its data,
+# the length of the device id and the kind of the data, followed by the device id and the data.
+# Records are aligned to 16 bytes, and a wrap record fills the end of the ring when the next record does not fit
+_RECORD_HEADER = struct.Struct('<IIHH4x')
+_ALIGNMENT = 16
+
+_KIND_PAYLOAD = 0
+_KIND_MEASUREMENTS = 1
+_KIND_WRAP = 2
+
+# Counters at the start of the shared memory of a shard, each one written by a single process
+_HEAD, _TAIL, _WAITING, _CLOSING, _PROCESSED, _FAILED = range(6)
+_COUNTERS_SIZE = 64
+
+
+def _align(size):
+    return (size + _ALIGNMENT - 1) & ~(_ALIGNMENT - 1)
+
+
+class _ShardQueue(object):
+
+    def __init__(self, memory, wakeup):
+        """Single-producer single-consumer ring of observation records on shared memory.
+        The producer copies each record once into the ring, and the consumer reads it from there
+
+        :param memory: The SharedMemory holding the counters and the ring
+        :param wakeup: The multiprocessing Event set by the producer when the consumer is waiting for records
+        """
+        self.memory = memory
+        self.wakeup = wakeup
+        self.counters = memory.buf[:_COUNTERS_SIZE].cast('Q')
+        self.ring = memory.buf[_COUNTERS_SIZE:]
+        self.capacity = len(self.ring)
+
+    def put(self, device_id, kind, data, timeout=None, is_alive=None):
+        """Copies a record into the ring, waiting for free space if it is full
+
+        :param device_id: The encoded id of the device
+        :param kind: The kind of the data
+        :param data: The encoded data
+        :param timeout: The maximum time in seconds to wait for free space. If None, waits indefinitely
+        :param is_alive: A function telling if the consumer is still running, checked while waiting
+        :return: True if the record was added, False if the timeout expired or the consumer stopped
+        """
+        length = _RECORD_HEADER.size + len(device_id) + len(data)
+        size = _align(length)
+        if size > self.capacity // 2:
+            raise ValueError(f"Observation of {length} bytes does not fit on the gateway queue")
+
+        counters = self.counters
+        deadline = None
+        while True:
+            head = counters[_HEAD]
+            offset = head % self.capacity
+            contiguous = self.capacity - offset
+            needed = size if size <= contiguous else contiguous + size
+            if self.capacity - (head - counters[_TAIL]) >= needed:
+                break
+
+            if deadline is None:
+                deadline = float('inf') if timeout is None else time.monotonic() + timeout
+            if time.monotonic() >= deadline or (is_alive is not None and not is_alive()):
+                return False
+            time.sleep(0.0005)
+
+        if size > contiguous:
+            _RECORD_HEADER.pack_into(self.ring, offset, contiguous, 0, 0, _KIND_WRAP)
+            head += contiguous
+            offset = 0
+
+        data_start = offset + _RECORD_HEADER.size
+        self.ring[data_start:data_start + len(device_id)] = device_id
+        self.ring[data_start + len(device_id):offset + length] = data
+        _RECORD_HEADER.pack_into(self.ring, offset, length, zlib.crc32(data, zlib.crc32(device_id)), len(device_id),
+                                 kind)
+
+        # The head is only moved once the record is written, so the consumer never sees a partial record
+        counters[_HEAD] = head + size
+        if counters[_WAITING]:
+            self.wakeup.set()
+        return True
+
+    def get_batch(self, max_records, wait=0.05):
+        """Reads the available records, waiting for the producer if there are none
+
+        :param max_records: The maximum number of records read
+        :param wait: The maximum time in seconds to wait for the producer
+        :return: A list of (device_id, kind, data) tuples, empty if no record was available
+        """
+        counters = self.counters
+        if counters[_TAIL] == counters[_HEAD]:
+            counters[_WAITING] = 1
+            if counters[_TAIL] == counters[_HEAD]:
+                self.wakeup.wait(wait)
+            self.wakeup.clear()
+            counters[_WAITING] = 0
+
+        records = []
+        tail = counters[_TAIL]
+        head = counters[_HEAD]
+        while tail < head and len(records) < max_records:
+            offset = tail % self.capacity
+            length, checksum, device_id_length, kind = _RECORD_HEADER.unpack_from(self.ring, offset)
+            if offset + length > self.capacity:
+                break
+            if kind == _KIND_WRAP:
+                tail += length
+                continue
+
+            data_start = offset + _RECORD_HEADER.size + device_id_length
+            device_id = bytes(self.ring[offset + _RECORD_HEADER.size:data_start])
+            data = bytes(self.ring[data_start:offset + length])
+            if zlib.crc32(data, zlib.crc32(device_id)) != checksum:
+                # The writes of the producer are not visible yet, the record is read again on the next batch
+                break
+
+            records.append((device_id.decode('utf-8'), kind, data))
+            tail += _align(length)
+
+        counters[_TAIL] = tail
+        return records
+
+    def release(self):
+        self.counters.release()
+        self.ring.release()
+
+
+def _run_worker(shard, fiware_config, memory, wakeup, protocol, max_batch, max_bytes, timeout):
+    """Main function of a worker process, which sends the observations of the devices of a shard
+    with its own IoT client
+
+    :return: None
+    """
+    # Interruptions are handled by the gateway, which closes the workers after they send the queued observations
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    queue = _ShardQueue(memory, wakeup)
+    iot_client = FiwareIotClient(fiware_config)
+    counters = queue.counters
+    try:
+        while True:
+            closing = counters[_CLOSING]
+            records = queue.get_batch(max_batch)
+            if not records:
+                if closing and counters[_TAIL] == counters[_HEAD]:
+                    break
+                continue
+
+            joined_records = _join_records(records, max_bytes)
+            # The records which could not be encoded are left out of the payloads
+            counters[_FAILED] += len(records) - sum(groups for payloads in joined_records.values()
+                                                    for _, groups in payloads)
+            for device_id, payloads in joined_records.items():
+                for payload, groups in payloads:
+                    result = iot_client.send_observation_payload(device_id, payload, protocol=protocol,
+                                                                 timeout=timeout)
+                    if 'error' in result:
+                        counters[_FAILED] += groups
+                    else:
+                        counters[_PROCESSED] += groups
+    except Exception as e:
+        logging.error(f"Gateway worker {shard} stopped: {e}")
+    finally:
+        iot_client.close()
+        queue.release()
+
+
+def _join_records(records, max_bytes):
+    """Auxiliary function to decode a batch of records and join the observations of each device
+    as multi-group UL payloads, keeping their order. Measurements which can't be encoded as UL are logged and skipped
+
+    :param records: A list of (device_id, kind, data) tuples
+    :param max_bytes: The maximum size in bytes of each payload
+    :return: An ordered dict of device ids to lists of (payload, number of records) tuples
+    """
+    payloads = OrderedDict()
+    for device_id, kind, data in records:
+        if kind == _KIND_MEASUREMENTS:
+            try:
+                payload = ul.encode_measurements(pickle.loads(data))
+            except ValueError as e:
+                logging.error(f"Invalid observation of device '{device_id}' dropped: {e}")
+                continue
+        else:
+            payload = data.decode('utf-8')
+
+        device_payloads = payloads.setdefault(device_id, [])
+        if device_payloads and len(device_payloads[-1][0]) + 1 + len(payload) <= max_bytes:
+            last_payload, groups = device_payloads[-1]
+            device_payloads[-1] = (f'{last_payload}#{payload}', groups + 1)
+        else:
+            device_payloads.append((payload, 1))
+    return payloads
+
+
+class _Shard(object):
+
+    def __init__(self, index, queue, process):
+        """A worker process of the gateway along with its queue
+
+        :param index: The index of the shard
+        :param queue: The _ShardQueue feeding the worker
+        :param process: The worker process
+        """
+        self.index = index
+        self.queue = queue
+        self.process = process
+        self.lock = threading.Lock()
+        self.enqueued = 0
+        self.dropped = 0
+        self.final_counters = None
+        self.last_processed = 0
+        self.last_stats_at = time.monotonic()
+
+
+class ObservationGateway(object):
+
+    def __init__(self, fiware_config: FiwareConfig, workers=None, protocol='MQTT', queue_size=4 * 1024 * 1024,
+                 max_batch=100, max_bytes=4096, timeout=10, start_method=None):
+        """Gateway sending observations through a pool of worker processes, so that the encoding and the sending
+        of the observations are spread across several CPU cores
+
+        Devices are sharded by a hash of their id, so the observations of each device are always sent in order
+        by the same worker. Each worker has its own IoT client, with its own MQTT connection or HTTP transport,
+        and receives the observations through a ring on shared memory. The observations queued on a worker
+        are joined as multi-group UL payloads of each device.
+
+        :param fiware_config: The FiwareConfig object from which the workers create their IoT clients
+        :param workers: The number of worker processes. If no value is provided, the number of CPU cores is used
+        :param protocol: The transport protocol to be used to send measurements.
+                         Currently accepted values are 'MQTT' and 'HTTP'
+        :param queue_size: The size in bytes of the queue of each worker
+        :param max_batch: The maximum number of queued observations read by a worker at once
+        :param max_bytes: The maximum size in bytes of each payload sent by the workers
+        :param timeout: The timeout for each observation send request
+        :param start_method: The multiprocessing start method of the workers (e.g. 'spawn').
+                             If no value is provided, the default method of the platform is used
+        :raises ImportError: If shared memory is not available (Python older than 3.8)
+        """
+        try:
+            from multiprocessing import shared_memory
+        except ImportError:
+            raise ImportError("ObservationGateway requires multiprocessing.shared_memory, available on Python 3.8+")
+
+        self.fiware_config = fiware_config
+        self.protocol = protocol
+        self.workers = workers or os.cpu_count() or 1
+
+        self._closed = False
+        self._started_at = time.monotonic()
+        self._shards = []
+
+        context = multiprocessing.get_context(start_method)
+        queue_size = _align(queue_size)
+        try:
+            for index in range(self.workers):
+                memory = shared_memory.SharedMemory(create=True, size=_COUNTERS_SIZE + queue_size)
+                queue = _ShardQueue(memory, context.Event())
+                process = context.Process(target=_run_worker, name=f'ObservationGateway-{index}', daemon=True,
+                                          args=(index, fiware_config, memory, queue.wakeup, protocol, max_batch,
+                                                max_bytes, timeout))
+                self._shards.append(_Shard(index, queue, process))
+                process.start()
+        except Exception:
+            self.close(timeout=0)
+            raise
+
+    @classmethod
+    def from_config_file(cls, config_file_path, **kwargs):
+        """Gateway sending observations through a pool of worker processes
+
+        :param config_file_path: The file in which load the default configuration
+        :param kwargs: Additional options to be passed to the gateway constructor
+        """
+        return cls(utils.read_config_file(config_file_path), **kwargs)
+
+    @classmethod
+    def from_config_dict(cls, config_dict: dict, **kwargs):
+        """Gateway sending observations through a pool of worker processes
+
+        :param config_dict: The config dict from which to load the default configuration
+        :param kwargs: Additional options to be passed to the gateway constructor
+        """
+        return cls(utils.parse_config_dict(config_dict), **kwargs)
+
+    def shard_for(self, device_id):
+        """Returns the shard whose worker sends the observations of a device
+
+        :param device_id: The id of the device
+        :return: The index of the shard
+        """
+        return zlib.crc32(str(device_id).encode('utf-8')) % self.workers
+
+    def send(self, device_id, measurements, timeout=None):
+        """Queues a measurement group or a list of measurement groups from a device on the worker of its shard
+
+        :param device_id: The id of the device in which the measurements were obtained
+        :param measurements: A measurement group (a dict where keys are device attributes and values are measurements
+                             for each attribute) or a list of measurement groups obtained in the device
+        :param timeout: The maximum time in seconds to wait when the queue of the worker is full.
+                        If no value is provided, waits indefinitely
+        :return: True if the observation was queued, False if it was dropped
+        """
+        return self._put(device_id, _KIND_MEASUREMENTS, pickle.dumps(measurements, pickle.HIGHEST_PROTOCOL),
+                         timeout)
+
+    def send_payload(self, device_id, payload, timeout=None):
+        """Queues an already encoded UL payload from a device on the worker of its shard
+
+        :param device_id: The id of the device in which the measurements were obtained
+        :param payload: The UL payload string, with measurement groups separated by '#'
+        :param timeout: The maximum time in seconds to wait when the queue of the worker is full.
+                        If no value is provided, waits indefinitely
+        :return: True if the observation was queued, False if it was dropped
+        """
+        return self._put(device_id, _KIND_PAYLOAD, payload.encode('utf-8'), timeout)
+
+    def _put(self, device_id, kind, data, timeout):
+        """Auxiliary method to queue an observation on the worker of the shard of its device
+
+        :return: True if the observation was queued, False if it was dropped
+        """
+        if self._closed:
+            raise RuntimeError("Observation gateway is closed")
+
+        device_id = str(device_id).encode('utf-8')
+        shard = self._shards[zlib.crc32(device_id) % self.workers]
+        with shard.lock:
+            if shard.queue.put(device_id, kind, data, timeout=timeout, is_alive=shard.process.is_alive):
+                shard.enqueued += 1
+                return True
+
+            shard.dropped += 1
+        logging.error(f"Queue of gateway worker {shard.index} is full, observation of device "
+                      f"'{device_id.decode('utf-8')}' dropped")
+        return False
+
+    @staticmethod
+    def _sent(shard):
+        """Auxiliary method to read the number of observations processed and failed by the worker of a shard
+
+        :param shard: The _Shard
+        :return: A (processed, failed) tuple
+        """
+        if shard.final_counters is not None:
+            return shard.final_counters
+        return shard.queue.counters[_PROCESSED], shard.queue.counters[_FAILED]
+
+    def flush(self, timeout=None):
+        """Waits until the workers have sent all the queued observations
+
+        :param timeout: The maximum time in seconds to wait. If no value is provided, waits indefinitely
+        :return: True if all the observations were sent, False if the timeout expired before
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for shard in self._shards:
+            while sum(self._sent(shard)) < shard.enqueued:
+                if shard.final_counters is not None or not shard.process.is_alive() or \
+                        (deadline is not None and time.monotonic() >= deadline):
+                    return False
+                time.sleep(0.001)
+        return True
+
+    def stats(self):
+        """Returns the metrics of each shard. The throughput is measured since the previous call
+
+        :return: A list with a dict for each shard with its 'shard' index, the 'pid' of its worker and if it is
+                 'alive', the number of 'enqueued', 'dropped', 'processed' and 'failed' observations,
+                 the number of observations waiting on its queue ('backlog') and the 'throughput'
+                 in observations per second
+        """
+        now = time.monotonic()
+        shard_stats = []
+        for shard in self._shards:
+            processed, failed = self._sent(shard)
+            elapsed = now - shard.last_stats_at
+
+            shard_stats.append({
+                'shard': shard.index,
+                'pid': shard.process.pid,
+                'alive': shard.process.is_alive(),
+                'enqueued': shard.enqueued,
+                'dropped': shard.dropped,
+                'processed': processed,
+                'failed': failed,
+                'backlog': shard.enqueued - processed - failed,
+                'throughput': round((processed + failed - shard.last_processed) / elapsed, 1) if elapsed else 0.0
+            })
+            shard.last_processed = processed + failed
+            shard.last_stats_at = now
+        return shard_stats
+
+    def close(self, timeout=10):
+        """Stops the workers once they have sent the queued observations, and releases the shared memory.
+        Workers which do not finish on time are terminated
+
+        :param timeout: The maximum time in seconds to wait for the workers
+        :return: None
+        """
+        if self._closed:
+            return
+        self._closed = True
+
+        for shard in self._shards:
+            shard.queue.counters[_CLOSING] = 1
+            shard.queue.wakeup.set()
+
+        deadline = time.monotonic() + timeout
+        for shard in self._shards:
+            if shard.process.pid is None:
+                continue
+            shard.process.join(max(0.0, deadline - time.monotonic()))
+            if shard.process.is_alive():
+                logging.warning(f"Terminating gateway worker {shard.index} with "
+                                f"{shard.enqueued - sum(self._sent(shard))} queued observations")
+                shard.process.terminate()
+                shard.process.join()
+
+        for shard in self._shards:
+            shard.final_counters = self._sent(shard)
+            memory = shard.queue.memory
+            shard.queue.release()
+            memory.close()
+            memory.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
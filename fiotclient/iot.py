@@ -1,20 +1,32 @@
-import json
+import functools
 import logging
+import threading
+import time
 
-import paho.mqtt.publish as publish
-
-from . import BaseClient
+from . import BaseClient, ul, utils
 from .config import FiwareConfig
+from .exceptions import FiwareRequestError, MqttPublishError
+from .metrics import RequestMetrics
+from .mqtt import MqttPublisher
+from .template import SchemaTemplate, as_template
 
 
 class FiwareIotClient(BaseClient):
 
-    def __init__(self, fiware_config: FiwareConfig):
+    def __init__(self, fiware_config: FiwareConfig, mqtt_publisher: MqttPublisher = None, **kwargs):
         """Client for doing IoT management operations on FIWARE platform
 
         :param fiware_config: The FiwareConfig object from which to load the default configuration
+        :param mqtt_publisher: The MqttPublisher used to send observations over MQTT.
+                               It can be shared among clients. If no publisher is provided, a new one is created
+                               from the configuration on the first MQTT observation and closed along with the client
+        :param kwargs: Additional options to be passed to BaseClient (e.g. a shared transport)
         """
-        super(FiwareIotClient, self).__init__(fiware_config)
+        super(FiwareIotClient, self).__init__(fiware_config, **kwargs)
+
+        self._owns_mqtt_publisher = mqtt_publisher is None
+        self._mqtt_publisher = mqtt_publisher
+        self._mqtt_publisher_lock = threading.Lock()
 
         self.api_key = self.fiware_config.api_key
 
@@ -23,6 +35,32 @@ class FiwareIotClient(BaseClient):
         self.iota_protocol_url = f"http://{self.fiware_config.iota_host}:{self.fiware_config.iota_protocol_port}"
         self.mqtt_broker_url = f"{self.fiware_config.mqtt_broker_host}:{self.fiware_config.mqtt_broker_port}"
 
+        self._register_component('orion', self.cb_url)
+        self._register_component('iota-north', self.iota_north_url)
+        self._register_component('iota-south', self.iota_protocol_url)
+
+    @property
+    def mqtt_publisher(self):
+        """The MqttPublisher used to send observations over MQTT, created on first use if none was provided
+
+        :return: The MqttPublisher of the client
+        """
+        with self._mqtt_publisher_lock:
+            if self._mqtt_publisher is None:
+                self._mqtt_publisher = MqttPublisher.from_config(self.fiware_config)
+            return self._mqtt_publisher
+
+    def close(self):
+        """Releases the resources held by the client.
+        The transport and the MQTT publisher are only closed if they were created by the client itself
+
+        :return: None
+        """
+        if self._owns_mqtt_publisher and self._mqtt_publisher is not None:
+            self._mqtt_publisher.close()
+
+        super(FiwareIotClient, self).close()
+
     @staticmethod
     def generate_api_key():
         """Generate a random api key to be used on service creation
@@ -84,7 +122,8 @@ class FiwareIotClient(BaseClient):
             ]
         }
 
-        return self._send_request(url, 'POST', payload=payload, additional_headers=additional_headers)
+        return self._send_request(url, 'POST', payload=payload, additional_headers=additional_headers,
+                                  operation='create_service')
 
     def remove_service(self, service, service_path, api_key="", remove_devices=False):
         """Remove a subservice into a service.
@@ -115,7 +154,8 @@ class FiwareIotClient(BaseClient):
             'Fiware-ServicePath': service_path
         }
 
-        return self._send_request(url, 'DELETE', params=params, additional_headers=additional_headers)
+        return self._send_request(url, 'DELETE', params=params, additional_headers=additional_headers,
+                                  operation='remove_service')
 
     def list_services(self):
         """Get all registered services
@@ -136,7 +176,7 @@ class FiwareIotClient(BaseClient):
     def register_device(self, device_schema, device_id, entity_id, endpoint='', protocol='IoTA-UL'):
         """Register a new device with the given structure in the currently selected service
 
-        :param device_schema: JSON string representing device schema
+        :param device_schema: JSON string representing device schema, or its SchemaTemplate
         :param device_id: The id to the device to be created
         :param entity_id: The id to the NGSI entity created representing the device
         :param endpoint: The endpoint of the device to which actions will be sent on format IP:PORT
@@ -148,19 +188,10 @@ class FiwareIotClient(BaseClient):
         url = f"{self.iota_north_url}/iot/devices"
         additional_headers = {'Content-Type': 'application/json'}
 
-        device_schema = device_schema.replace('[DEVICE_ID]', str(device_id)) \
-            .replace('[ENTITY_ID]', str(entity_id))
+        payload = self._render_device_schema(as_template(device_schema), device_id, entity_id, endpoint)
 
-        if endpoint and '"endpoint"' in device_schema:
-            endpoint_split = endpoint.split(':')
-            device_ip = endpoint_split[0]
-            device_port = endpoint_split[1]
-            device_schema = device_schema.replace('[DEVICE_IP]', str(device_ip)) \
-                                         .replace('[PORT]', str(device_port))
-
-        payload = json.loads(device_schema)
-
-        return self._send_request(url, 'POST', params=params, payload=payload, additional_headers=additional_headers)
+        return self._invalidating_request([('device', str(device_id))], url, 'POST', params=params, payload=payload,
+                                          additional_headers=additional_headers, operation='register_device')
 
     def register_device_from_file(self, device_file_path, device_id, entity_id, endpoint='', protocol='IoTA-UL'):
         """Register a new device loading its structure from a given file
@@ -174,11 +205,123 @@ class FiwareIotClient(BaseClient):
         :return: Information of the registered device
         """
         logging.debug(f"Reading file '{device_file_path}'")
-        with open(device_file_path) as json_device_file:
-            payload = json.load(json_device_file)
+        device_template = SchemaTemplate.from_file(device_file_path)
+
+        return self.register_device(device_template, device_id, entity_id, endpoint=endpoint, protocol=protocol)
+
+    def register_devices(self, devices, device_schema, protocol='IoTA-UL', max_devices=100, max_concurrency=4,
+                         isolate_failures=True):
+        """Register several devices sharing the same structure in the currently selected service.
+        The schema is parsed only once and the devices are sent in batches on the 'devices' array of each request
+
+        :param devices: An iterable of (device_id, entity_id) or (device_id, entity_id, endpoint) tuples,
+                        where endpoint is on format IP:PORT
+        :param device_schema: JSON string representing device schema, or its SchemaTemplate
+        :param protocol: The protocol to be used on the devices.
+                         If no value is provided the default protocol (IoTA-UL) will be used
+        :param max_devices: The maximum number of devices sent on each request
+        :param max_concurrency: The maximum number of requests executed at the same time
+        :param isolate_failures: If the devices of a failed request should be registered one by one,
+                                 so that only the devices which actually failed are reported
+        :return: A dict with the list of the registered device ids and a dict of the failed device ids
+                 to the response of their registration request
+        """
+        device_template = as_template(device_schema)
+
+        rendered_devices = (self._render_device(device_template, *device) for device in devices)
+        batches = utils.split_batches(rendered_devices, max_devices)
+
+        register_batch = functools.partial(self._register_device_batch, protocol=protocol,
+                                           isolate_failures=isolate_failures)
+        results = utils.bounded_map(register_batch, batches, max_concurrency)
+
+        return self._summarize_device_registration(results)
+
+    @staticmethod
+    def _render_device(device_template, device_id, entity_id, endpoint=''):
+        """Auxiliary method to render a single device from a device schema template
+
+        :param device_template: The SchemaTemplate of the device schema
+        :param device_id: The id to the device to be created
+        :param entity_id: The id to the NGSI entity created representing the device
+        :param endpoint: The endpoint of the device to which actions will be sent on format IP:PORT
+        :return: A new dict representing the device
+        """
+        return FiwareIotClient._render_device_schema(device_template, device_id, entity_id, endpoint)['devices'][0]
+
+    @staticmethod
+    def _render_device_schema(device_template, device_id, entity_id, endpoint=''):
+        """Auxiliary method to fill the placeholders of a device schema template
+
+        :param device_template: The SchemaTemplate of the device schema
+        :param device_id: The id to the device to be created
+        :param entity_id: The id to the NGSI entity created representing the device
+        :param endpoint: The endpoint of the device to which actions will be sent on format IP:PORT.
+                         The [DEVICE_IP] and [PORT] placeholders are only filled if the schema has an 'endpoint'
+        :return: A new dict with the 'devices' array of the schema
+        """
+        if endpoint and 'endpoint' in device_template.keys:
+            device_ip, device_port = endpoint.split(':')[:2]
+            return device_template.render(device_id=device_id, entity_id=entity_id, device_ip=device_ip,
+                                          port=device_port)
+        return device_template.render(device_id=device_id, entity_id=entity_id)
+
+    def _register_device_batch(self, batch, protocol, isolate_failures):
+        """Auxiliary method to register a batch of rendered devices in a single request
+
+        :param batch: The list of device dicts to be registered
+        :param protocol: The protocol to be used on the devices
+        :param isolate_failures: If the devices should be registered one by one when the batch request fails
+        :return: A list of (device_id, response) tuples
+        """
+        response = self._post_devices(batch, protocol)
+
+        if len(batch) > 1 and isolate_failures and not 200 <= response.get('status_code', 0) < 300:
+            return [(device['device_id'], self._post_devices([device], protocol)) for device in batch]
+
+        return [(device['device_id'], response) for device in batch]
+
+    def _post_devices(self, devices, protocol):
+        """Auxiliary method to send a device registration request
+
+        :param devices: The list of device dicts to be registered
+        :param protocol: The protocol to be used on the devices
+        :return: The response of the registration request
+        """
+        params = {'protocol': protocol}
+        url = f"{self.iota_north_url}/iot/devices"
+        additional_headers = {'Content-Type': 'application/json'}
+
+        payload = {'devices': devices}
+        devices_cache_keys = [('device', str(device['device_id'])) for device in devices]
+
+        return self._invalidating_request(devices_cache_keys, url, 'POST', params=params, payload=payload,
+                                          additional_headers=additional_headers, operation='register_devices')
 
-        device_schema_json_str = json.dumps(payload)
-        return self.register_device(device_schema_json_str, device_id, entity_id, endpoint=endpoint, protocol=protocol)
+    @staticmethod
+    def _summarize_device_registration(batch_results):
+        """Auxiliary method to gather the results of the registration requests of several devices
+
+        :param batch_results: An iterable of lists of (device_id, response) tuples
+        :return: A dict with the list of the registered device ids and a dict of the failed device ids
+                 to the response of their registration request
+        """
+        registered = []
+        failed = {}
+        for batch_result in batch_results:
+            for device_id, response in batch_result:
+                if 200 <= response.get('status_code', 0) < 300:
+                    registered.append(device_id)
+                else:
+                    failed[device_id] = response
+
+        if failed:
+            logging.error(f"Failed to register {len(failed)} devices")
+
+        return {
+            'registered': registered,
+            'failed': failed
+        }
 
     def update_device(self, device_schema, device_id, entity_id, endpoint='', protocol='IoTA-UL'):
         """Updates a registered device with the given structure in the currently selected service
@@ -203,7 +346,8 @@ class FiwareIotClient(BaseClient):
         url = f"{self.iota_north_url}/iot/devices/{device_id}"
         additional_headers = {'Content-Type': 'application/json'}
 
-        return self._send_request(url, 'DELETE', additional_headers=additional_headers)
+        return self._invalidating_request([('device', str(device_id))], url, 'DELETE',
+                                          additional_headers=additional_headers, operation='remove_device')
 
     def get_device_by_id(self, device_id):
         """Get device information given its device id
@@ -215,7 +359,8 @@ class FiwareIotClient(BaseClient):
         url = f"{self.iota_north_url}/iot/devices/{device_id}"
         additional_headers = {'Content-Type': 'application/json'}
 
-        return self._send_request(url, 'GET', additional_headers=additional_headers)
+        return self._cached_request(('device', str(device_id)), url, 'GET', additional_headers=additional_headers,
+                                    operation='get_device_by_id')
 
     def list_devices(self, limit=None, offset=None):
         """List the devices registered in the currently selected service
@@ -231,7 +376,42 @@ class FiwareIotClient(BaseClient):
         url = f"{self.iota_north_url}/iot/devices"
         additional_headers = {'Content-Type': 'application/json'}
 
-        return self._send_request(url, 'GET', params=params, additional_headers=additional_headers)
+        return self._send_request(url, 'GET', params=params, additional_headers=additional_headers,
+                                  operation='list_devices')
+
+    def iter_devices(self, page_size=100, prefetch=True, max_concurrency=1):
+        """Iterate over all the devices registered in the currently selected service, requesting them page by page
+
+        :param page_size: The number of devices requested on each page
+        :param prefetch: If the next page should be requested while the current one is consumed
+        :param max_concurrency: The maximum number of pages requested at the same time.
+                                If greater than one, the pages are requested in parallel once the total is known
+        :return: A generator of the devices
+        """
+        return utils.iter_pages(self._get_devices_page, page_size, prefetch=prefetch, max_workers=max_concurrency)
+
+    def _get_devices_page(self, offset, limit):
+        """Auxiliary method to request a page of devices along with the total number of devices
+
+        :param offset: The number of devices to skip
+        :param limit: The maximum number of devices on the page
+        :return: A tuple with the list of devices of the page and the total number of devices
+        """
+        response = self.list_devices(limit=limit, offset=offset)
+        return self._parse_devices_page(response)
+
+    @staticmethod
+    def _parse_devices_page(response):
+        """Auxiliary method to get the devices and the total count from the response of a page request
+
+        :param response: The response of the page request
+        :return: A tuple with the list of devices of the page and the total number of devices
+        """
+        if response.get('status_code') != 200:
+            raise FiwareRequestError(f"Failed to list devices: {response.get('response')}", response)
+
+        data = response['response']
+        return data.get('devices', []), data.get('count')
 
     @staticmethod
     def _join_group_measurements(group_measurements):
@@ -241,7 +421,7 @@ class FiwareIotClient(BaseClient):
                                    names and the values are the measurements values for each attribute
         :return: A string representing the measurement group
         """
-        return '|'.join(['%s|%s' % (str(key), str(value)) for (key, value) in group_measurements.items()])
+        return ul.encode_group(group_measurements)
 
     @staticmethod
     def _create_ul_payload_from_measurements(measurements):
@@ -252,20 +432,7 @@ class FiwareIotClient(BaseClient):
                              for each attribute) or a list of measurement groups obtained in the device
         :return: A string containing the UL payload
         """
-        if isinstance(measurements, list):
-            # multiple measurement groups list
-            groups_payload = []
-            for measurement_group in measurements:
-                group_payload = FiwareIotClient._join_group_measurements(measurement_group)
-                groups_payload.append(group_payload)
-
-            payload = '#'.join(groups_payload)
-
-        else:
-            # single measurement group dict
-            payload = FiwareIotClient._join_group_measurements(measurements)
-
-        return payload
+        return ul.encode_measurements(measurements)
 
     def send_observation(self, device_id, measurements, protocol='MQTT', timeout=10):
         """Sends a measurement group or a list of measurement groups from a device to the FIWARE platform
@@ -276,22 +443,45 @@ class FiwareIotClient(BaseClient):
         :param protocol: The transport protocol to be used to send measurements.
                          Currently accepted values are 'MQTT' and 'HTTP'.
                          If no value is provided the default value (MQTT) will be used
-        :param timeout: The timeout for the observation send request
+        :param timeout: The timeout for the observation send request.
+                        Over MQTT, the maximum time to wait for the broker connection and for a free in-flight slot
         :return: The summary of the sent measurements
+        :raises ValueError: If an attribute name or a value contains a UL separator ('|' or '#')
         """
         payload = self._create_ul_payload_from_measurements(measurements)
 
+        return self.send_observation_payload(device_id, payload, protocol=protocol, timeout=timeout)
+
+    def send_observation_payload(self, device_id, payload, protocol='MQTT', timeout=10):
+        """Sends an already encoded UL payload with one or more measurement groups from a device
+        to the FIWARE platform
+
+        :param device_id: The id of the device in which the measurements were obtained
+        :param payload: The UL payload string, with measurement groups separated by '#'
+        :param protocol: The transport protocol to be used to send measurements.
+                         Currently accepted values are 'MQTT' and 'HTTP'.
+                         If no value is provided the default value (MQTT) will be used
+        :param timeout: The timeout for the observation send request.
+                        Over MQTT, the maximum time to wait for the broker connection and for a free in-flight slot
+        :return: The summary of the sent measurements
+        """
         if protocol == 'MQTT':
             logging.debug("Transport protocol: MQTT")
             topic = f"/{self.api_key}/{device_id}/attrs"
 
-            logging.info(f"Publishing to {self.mqtt_broker_url} on topic {topic}")
-            logging.debug(f"Payload: {payload}")
+            logging.info("Publishing to %s on topic %s", self.mqtt_broker_url, topic)
+            logging.debug("Payload: %s", payload)
+
+            started_at = time.perf_counter()
+            try:
+                self.mqtt_publisher.publish(topic, payload, timeout=timeout)
+            except (TimeoutError, MqttPublishError) as e:
+                logging.error(f"Error: {e}")
+                return {'error': str(e)}
+
+            if self.metrics is not None:
+                self._record_publish('send_observation', payload, started_at)
 
-            publish.single(topic, payload=payload,
-                           hostname=self.fiware_config.mqtt_broker_host,
-                           port=self.fiware_config.mqtt_broker_port,
-                           keepalive=timeout)
             return {'result': 'OK'}
 
         elif protocol == 'HTTP':
@@ -305,15 +495,71 @@ class FiwareIotClient(BaseClient):
             url = f"{self.iota_protocol_url}/iot/d"
             additional_headers = {'Content-Type': 'text/plain'}
 
-            self._send_request(url, 'POST', params=params, payload=payload, additional_headers=additional_headers,
-                               timeout=timeout)
-            return {'result': 'OK'}
+            response = self._send_request(url, 'POST', params=params, payload=payload,
+                                          additional_headers=additional_headers, timeout=timeout,
+                                          operation='send_observation')
+            return self._summarize_observation(device_id, response)
 
         else:
             logging.error(f"Unknown transport protocol '{protocol}'")
             error_msg = "Unknown transport protocol. Accepted values are 'MQTT' and 'HTTP'"
             return {'error': error_msg}
 
+    @staticmethod
+    def _summarize_observation(device_id, response):
+        """Auxiliary method to create the summary of an observation sent to the IoT Agent over HTTP
+
+        :param device_id: The id of the device in which the measurements were obtained
+        :param response: The response of the observation request
+        :return: The summary of the sent measurements, with an 'error' if the observation was not accepted
+        """
+        if 'error' in response:
+            return response
+
+        status_code = response.get('status_code', 0)
+        if not 200 <= status_code < 300:
+            error_msg = f"Failed to send observation of device '{device_id}': {status_code} {response.get('response')}"
+            logging.error(error_msg)
+            return {'error': error_msg, 'status_code': status_code}
+
+        return {'result': 'OK'}
+
+    def _record_publish(self, operation, payload, started_at):
+        """Auxiliary method to send the measurements of an MQTT publication to the metrics collector
+
+        :param operation: The client operation which made the publication
+        :param payload: The published payload
+        :param started_at: The performance counter value when the publication started
+        :return: None
+        """
+        self._record_metrics(RequestMetrics(operation, 'mqtt', 'MQTT', bytes_sent=len(payload.encode('utf-8')),
+                                            network_time=time.perf_counter() - started_at))
+
+    def send_observation_columns(self, device_id, columns, rows=None, protocol='MQTT', float_format=None,
+                                 max_bytes=4096, max_groups=None, timeout=10):
+        """Sends columnar measurements from a device to the FIWARE platform, where each row is a measurement group.
+        The rows are encoded in bulk and sent as multi-group UL payloads limited in size
+
+        :param device_id: The id of the device in which the measurements were obtained
+        :param columns: A dict of attribute names to NumPy arrays or sequences with the values of each attribute
+        :param rows: The number of rows to be sent. If no value is provided, the length of the columns is used
+        :param protocol: The transport protocol to be used to send measurements.
+                         Currently accepted values are 'MQTT' and 'HTTP'.
+                         If no value is provided the default value (MQTT) will be used
+        :param float_format: The %-style format applied to float values (e.g. '%.2f').
+                             If no value is provided, the shortest representation of each float is used
+        :param max_bytes: The maximum size in bytes of each payload
+        :param max_groups: The maximum number of measurement groups on each payload
+        :param timeout: The timeout for each observation send request
+        :return: A list with the summary of each sent payload
+        :raises ValueError: If an attribute name or a value contains a UL separator ('|' or '#')
+        """
+        payloads = ul.encode_columns(columns, rows=rows, float_format=float_format, max_bytes=max_bytes,
+                                     max_groups=max_groups)
+
+        return [self.send_observation_payload(device_id, payload, protocol=protocol, timeout=timeout)
+                for payload in payloads]
+
     def get_polling_commands(self, device_id, measurements):
         """Get a list of polling commands of the device with the given id when sending a measurement group
         or a list of measurement groups to the FIWARE platform from a device with POST request
@@ -333,7 +579,8 @@ class FiwareIotClient(BaseClient):
         payload = self._create_ul_payload_from_measurements(measurements)
         additional_headers = {'Content-Type': 'text/plain'}
 
-        return self._send_request(url, 'POST', params=params, payload=payload, additional_headers=additional_headers)
+        return self._send_request(url, 'POST', params=params, payload=payload, additional_headers=additional_headers,
+                                  operation='get_polling_commands')
 
     def send_command(self, entity_id, device_id, command, params=None):
         """Sends a command from the FIWARE platform to a specific device
@@ -383,4 +630,5 @@ class FiwareIotClient(BaseClient):
             "updateAction": "UPDATE"
         }
 
-        return self._send_request(url, 'POST', payload=payload, additional_headers=additional_headers)
+        return self._send_request(url, 'POST', payload=payload, additional_headers=additional_headers,
+                                  operation='send_command')
@@ -0,0 +1,199 @@
+import bisect
+import threading
+
+# Upper bounds in seconds of the latency histogram buckets
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+PHASES = ('serialize', 'network', 'parse', 'total')
+
+
+class RequestMetrics(object):
+
+    __slots__ = ('operation', 'component', 'method', 'status_code', 'bytes_sent', 'bytes_received',
+                 'serialize_time', 'network_time', 'parse_time')
+
+    def __init__(self, operation, component, method, status_code=None, bytes_sent=0, bytes_received=0,
+                 serialize_time=0.0, network_time=0.0, parse_time=0.0):
+        """Measurements of a single call made by a client
+
+        :param operation: The client operation which made the call (e.g. 'create_entity')
+        :param component: The FIWARE component called (e.g. 'orion', 'iota-north', 'iota-south', 'sth', 'perseo')
+        :param method: The HTTP method of the call, or the transport name for non HTTP calls (e.g. 'MQTT')
+        :param status_code: The status code of the response. 0 on connection errors, None for non HTTP calls
+        :param bytes_sent: The size in bytes of the sent body
+        :param bytes_received: The size in bytes of the received body
+        :param serialize_time: The time in seconds spent building the request
+        :param network_time: The time in seconds spent waiting for the response
+        :param parse_time: The time in seconds spent building the response.
+                           Bodies decoded lazily, on first access, are not accounted
+        """
+        self.operation = operation
+        self.component = component
+        self.method = method
+        self.status_code = status_code
+        self.bytes_sent = bytes_sent
+        self.bytes_received = bytes_received
+        self.serialize_time = serialize_time
+        self.network_time = network_time
+        self.parse_time = parse_time
+
+    @property
+    def total_time(self):
+        return self.serialize_time + self.network_time + self.parse_time
+
+
+class MetricsCollector(object):
+    """Base class of the hooks receiving the measurements of every call made by a client"""
+
+    def record(self, request_metrics: RequestMetrics):
+        """Receives the measurements of a call
+
+        :param request_metrics: The RequestMetrics of the call
+        :return: None
+        """
+        raise NotImplementedError
+
+
+class Histogram(object):
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        """Cumulative histogram of observed values with fixed bucket bounds
+
+        :param buckets: The sorted upper bounds of the buckets. An extra bucket holds the values above the last bound
+        """
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q):
+        """Estimate a quantile of the observed values, interpolating linearly inside its bucket
+
+        :param q: The quantile, between 0 and 1
+        :return: The estimated value, or None if no value was observed
+        """
+        if not self.count:
+            return None
+
+        rank = q * self.count
+        accumulated = 0
+        for index, bucket_count in enumerate(self.counts):
+            if bucket_count and accumulated + bucket_count >= rank:
+                lower = self.buckets[index - 1] if index > 0 else 0.0
+                upper = self.buckets[index] if index < len(self.buckets) else self.max
+                return min(lower + (upper - lower) * (rank - accumulated) / bucket_count, self.max)
+            accumulated += bucket_count
+
+        return self.max
+
+
+class InMemoryMetrics(MetricsCollector):
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        """Collector keeping latency histograms per phase and counters of calls and bytes
+        for each operation and component, which can be exported on Prometheus text format
+
+        :param buckets: The upper bounds in seconds of the latency histogram buckets
+        """
+        self.buckets = buckets
+
+        self._lock = threading.Lock()
+        self._latencies = {}
+        self._calls = {}
+        self._bytes = {}
+
+    def record(self, request_metrics: RequestMetrics):
+        key = (request_metrics.operation, request_metrics.component)
+        phase_times = (request_metrics.serialize_time, request_metrics.network_time, request_metrics.parse_time,
+                       request_metrics.total_time)
+
+        with self._lock:
+            histograms = self._latencies.get(key)
+            if histograms is None:
+                histograms = self._latencies[key] = {phase: Histogram(self.buckets) for phase in PHASES}
+            for phase, phase_time in zip(PHASES, phase_times):
+                histograms[phase].observe(phase_time)
+
+            calls_key = key + (request_metrics.status_code,)
+            self._calls[calls_key] = self._calls.get(calls_key, 0) + 1
+
+            sent, received = self._bytes.get(key, (0, 0))
+            self._bytes[key] = (sent + request_metrics.bytes_sent, received + request_metrics.bytes_received)
+
+    def summary(self):
+        """Summarize the recorded calls of each operation and component
+
+        :return: A dict of (operation, component) to the number of calls, the calls per status code,
+                 the bytes sent and received, and the mean, p50, p99 and maximum latency in seconds of each phase
+        """
+        with self._lock:
+            summary = {}
+            for key, histograms in self._latencies.items():
+                sent, received = self._bytes[key]
+                summary[key] = {
+                    'count': histograms['total'].count,
+                    'status_codes': {calls_key[2]: calls for calls_key, calls in self._calls.items()
+                                     if calls_key[:2] == key},
+                    'bytes_sent': sent,
+                    'bytes_received': received,
+                    'latency': {phase: {'mean': histogram.sum / histogram.count,
+                                        'p50': histogram.quantile(0.5),
+                                        'p99': histogram.quantile(0.99),
+                                        'max': histogram.max}
+                                for phase, histogram in histograms.items()}
+                }
+            return summary
+
+    def reset(self):
+        """Discard all the recorded measurements
+
+        :return: None
+        """
+        with self._lock:
+            self._latencies.clear()
+            self._calls.clear()
+            self._bytes.clear()
+
+    def to_prometheus(self, prefix='fiotclient'):
+        """Export the recorded measurements on Prometheus text exposition format
+
+        :param prefix: The prefix of the metric names
+        :return: A string with the exported metrics
+        """
+        lines = [f'# HELP {prefix}_request_duration_seconds Latency of the calls to FIWARE components per phase',
+                 f'# TYPE {prefix}_request_duration_seconds histogram']
+
+        with self._lock:
+            for (operation, component), histograms in sorted(self._latencies.items()):
+                for phase, histogram in histograms.items():
+                    labels = f'operation="{operation}",component="{component}",phase="{phase}"'
+                    accumulated = 0
+                    for bound, bucket_count in zip(histogram.buckets + ('+Inf',), histogram.counts):
+                        accumulated += bucket_count
+                        lines.append(f'{prefix}_request_duration_seconds_bucket{{{labels},le="{bound}"}} '
+                                     f'{accumulated}')
+                    lines.append(f'{prefix}_request_duration_seconds_sum{{{labels}}} {histogram.sum}')
+                    lines.append(f'{prefix}_request_duration_seconds_count{{{labels}}} {histogram.count}')
+
+            lines += [f'# HELP {prefix}_requests_total Calls to FIWARE components per status code',
+                      f'# TYPE {prefix}_requests_total counter']
+            for (operation, component, status_code), calls in sorted(self._calls.items(), key=str):
+                status = '' if status_code is None else status_code
+                lines.append(f'{prefix}_requests_total{{operation="{operation}",component="{component}",'
+                             f'status="{status}"}} {calls}')
+
+            lines += [f'# HELP {prefix}_request_bytes_total Bytes sent to and received from FIWARE components',
+                      f'# TYPE {prefix}_request_bytes_total counter']
+            for (operation, component), (sent, received) in sorted(self._bytes.items()):
+                labels = f'operation="{operation}",component="{component}"'
+                lines.append(f'{prefix}_request_bytes_total{{{labels},direction="sent"}} {sent}')
+                lines.append(f'{prefix}_request_bytes_total{{{labels},direction="received"}} {received}')
+
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,181 @@
+import logging
+import threading
+import time
+
+import paho.mqtt.client as mqtt
+
+from .config import FiwareConfig
+from .exceptions import MqttPublishError
+
+
+def _create_mqtt_client(client_id):
+    """Auxiliary method to create a paho client on both 1.x and 2.x versions of the library
+
+    :param client_id: The client id to be used on the connection
+    :return: The created paho client
+    """
+    if hasattr(mqtt, 'CallbackAPIVersion'):
+        return mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, client_id=client_id)
+    return mqtt.Client(client_id=client_id)
+
+
+class MqttPublisher(object):
+
+    def __init__(self, host, port=1883, client_id='', keepalive=60, qos=0, max_inflight=100,
+                 reconnect_min_delay=1, reconnect_max_delay=120):
+        """Long-lived MQTT connection used to publish messages to the broker
+
+        The connection is opened on the first publication and kept by a background network loop,
+        which reconnects automatically when the connection to the broker is lost.
+
+        :param host: The address of the MQTT broker
+        :param port: The port of the MQTT broker
+        :param client_id: The client id to be used on the connection. If empty, a random one is used
+        :param keepalive: The maximum period in seconds between communications with the broker
+        :param qos: The default quality of service level of the published messages
+        :param max_inflight: The maximum number of messages published and not yet delivered to the broker
+                             (written to the socket for QoS 0, acknowledged for QoS 1 and 2).
+                             Publications wait for a free slot when this limit is reached
+        :param reconnect_min_delay: The initial delay in seconds before trying to reconnect
+        :param reconnect_max_delay: The maximum delay in seconds between reconnection attempts
+        """
+        self.host = host
+        self.port = port
+        self.keepalive = keepalive
+        self.qos = qos
+        self.max_inflight = max_inflight
+
+        self._client = _create_mqtt_client(client_id)
+        self._client.max_inflight_messages_set(max_inflight)
+        self._client.reconnect_delay_set(min_delay=reconnect_min_delay, max_delay=reconnect_max_delay)
+        self._client.on_connect = self._on_connect
+        self._client.on_disconnect = self._on_disconnect
+        self._client.on_publish = self._on_publish
+
+        self._lock = threading.Lock()
+        self._connected = threading.Event()
+        self._inflight = threading.Semaphore(max_inflight)
+        self._started = False
+        self._closed = False
+
+    @classmethod
+    def from_config(cls, fiware_config: FiwareConfig):
+        """Creates a publisher to the MQTT broker of the given configuration
+
+        :param fiware_config: The FiwareConfig object from which to load the broker settings
+        """
+        return cls(fiware_config.mqtt_broker_host, port=fiware_config.mqtt_broker_port or 1883,
+                   client_id=fiware_config.mqtt_client_id,
+                   keepalive=fiware_config.mqtt_keepalive,
+                   qos=fiware_config.mqtt_qos,
+                   max_inflight=fiware_config.mqtt_max_inflight)
+
+    def _on_connect(self, client, userdata, flags, reason_code, *args):
+        if reason_code == 0:
+            logging.info(f"Connected to MQTT broker {self.host}:{self.port}")
+            self._connected.set()
+        else:
+            logging.error(f"Connection to MQTT broker {self.host}:{self.port} refused: {reason_code}")
+
+    def _on_disconnect(self, client, userdata, *args):
+        self._connected.clear()
+        if not self._closed:
+            logging.warning(f"Disconnected from MQTT broker {self.host}:{self.port}, reconnecting")
+
+    def _on_publish(self, client, userdata, mid, *args):
+        self._inflight.release()
+
+    def start(self):
+        """Starts the background network loop and the connection to the broker, if not started yet
+
+        :return: None
+        """
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("Publisher is closed")
+            if not self._started:
+                self._client.connect_async(self.host, int(self.port), keepalive=self.keepalive)
+                self._client.loop_start()
+                self._started = True
+
+    def publish(self, topic, payload, qos=None, retain=False, timeout=None):
+        """Publishes a message to the broker without waiting for its delivery
+
+        :param topic: The topic in which the message will be published
+        :param payload: The payload of the message
+        :param qos: The quality of service level of the message.
+                    If no value is provided, the default level of the publisher will be used
+        :param retain: If the message should be retained by the broker
+        :param timeout: The maximum time in seconds to wait for the connection and for a free in-flight slot.
+                        If no value is provided, waits indefinitely
+        :return: The paho MQTTMessageInfo of the publication
+        :raises TimeoutError: If the connection or a free in-flight slot are not available before the timeout
+        :raises MqttPublishError: If the message is refused and will never be delivered to the broker
+        """
+        qos = self.qos if qos is None else qos
+
+        self.start()
+
+        if not self._connected.wait(timeout):
+            raise TimeoutError(f"Not connected to MQTT broker {self.host}:{self.port}")
+
+        if not self._inflight.acquire(timeout=timeout):
+            raise TimeoutError(f"Too many in-flight messages to MQTT broker {self.host}:{self.port}")
+
+        info = self._client.publish(topic, payload=payload, qos=qos, retain=retain)
+
+        # Messages refused by paho will never be notified as published, so their slot is released now.
+        # QoS 1 and 2 messages published while disconnected are kept by paho and sent again on reconnection
+        if info.rc != mqtt.MQTT_ERR_SUCCESS and (qos == 0 or info.rc != mqtt.MQTT_ERR_NO_CONN):
+            self._inflight.release()
+            raise MqttPublishError(f"Failed to publish on topic {topic}: {mqtt.error_string(info.rc)}", info.rc)
+
+        return info
+
+    @property
+    def connected(self):
+        return self._connected.is_set()
+
+    def flush(self, timeout=None):
+        """Waits until all the published messages are delivered to the broker
+
+        :param timeout: The maximum time in seconds to wait. If no value is provided, waits indefinitely
+        :return: True if all the messages were delivered, False if the timeout expired before
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        acquired = 0
+        try:
+            while acquired < self.max_inflight:
+                remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+                if not self._inflight.acquire(timeout=remaining):
+                    return False
+                acquired += 1
+            return True
+        finally:
+            for _ in range(acquired):
+                self._inflight.release()
+
+    def close(self, timeout=5):
+        """Waits for the delivery of the pending messages, disconnects from the broker
+        and stops the background network loop
+
+        :param timeout: The maximum time in seconds to wait for the pending messages
+        :return: None
+        """
+        with self._lock:
+            if self._closed:
+                return
+            if self._started and self.connected and not self.flush(timeout):
+                logging.warning(f"Closing connection to MQTT broker {self.host}:{self.port} "
+                                f"with undelivered messages")
+
+            self._closed = True
+            if self._started:
+                self._client.disconnect()
+                self._client.loop_stop()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
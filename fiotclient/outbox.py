@@ -0,0 +1,556 @@
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+from collections import deque
+
+from . import ul
+from .iot import FiwareIotClient
+
+# Each record is stored as its length, the CRC32 of its body and the body itself, which holds the length
+# of the device id, the device id and the UL payload. A zero length marks the end of the records of a segment
+_RECORD_HEADER = struct.Struct('<II')
+_DEVICE_ID_LENGTH = struct.Struct('<H')
+_CURSOR = struct.Struct('<QQ')
+
+_SEGMENT_SUFFIX = '.seg'
+_CURSOR_FILE_NAME = 'cursor'
+
+OVERFLOW_POLICIES = ('drop_oldest', 'drop_newest')
+
+
+class _Segment(object):
+
+    def __init__(self, path, segment_id, size):
+        """Memory-mapped file of the journal, pre-allocated to its full size
+
+        :param path: The path of the segment file
+        :param segment_id: The sequence number of the segment
+        :param size: The size in bytes of the segment
+        """
+        self.path = path
+        self.segment_id = segment_id
+
+        with open(path, 'a+b') as segment_file:
+            if os.fstat(segment_file.fileno()).st_size < size:
+                segment_file.truncate(size)
+            self.map = mmap.mmap(segment_file.fileno(), 0)
+        self.size = len(self.map)
+        self.end = 0
+
+    def recover(self):
+        """Finds the end of the valid records of the segment, discarding a record only partially written
+
+        :return: The number of valid records
+        """
+        records = 0
+        offset = 0
+        while True:
+            record = self.read(offset)
+            if record is None:
+                break
+            offset = record[2]
+            records += 1
+
+        self.end = offset
+        if any(self.map[offset:offset + _RECORD_HEADER.size]):
+            logging.warning(f"Discarding a partially written record at offset {offset} of outbox segment {self.path}")
+            self.map[offset:] = bytes(self.size - offset)
+        return records
+
+    def read(self, offset):
+        """Reads the record found at a given offset
+
+        :param offset: The offset of the record
+        :return: A (device_id, payload, next_offset) tuple, or None if there is no valid record
+        """
+        if offset + _RECORD_HEADER.size > self.size:
+            return None
+
+        length, checksum = _RECORD_HEADER.unpack_from(self.map, offset)
+        body_start = offset + _RECORD_HEADER.size
+        if length == 0 or body_start + length > self.size:
+            return None
+
+        body = self.map[body_start:body_start + length]
+        if zlib.crc32(body) != checksum:
+            return None
+
+        device_id_length, = _DEVICE_ID_LENGTH.unpack_from(body)
+        device_id_end = _DEVICE_ID_LENGTH.size + device_id_length
+        return (body[_DEVICE_ID_LENGTH.size:device_id_end].decode('utf-8'), body[device_id_end:].decode('utf-8'),
+                body_start + length)
+
+    def append(self, record):
+        """Writes a record after the last one, if it fits in the segment
+
+        :param record: The encoded record
+        :return: True if the record was written, False if the segment is full
+        """
+        if self.end + len(record) > self.size:
+            return False
+        self.map[self.end:self.end + len(record)] = record
+        self.end += len(record)
+        return True
+
+    def count(self, offset):
+        """Counts the records written from a given offset
+
+        :param offset: The offset of the first record
+        :return: The number of records
+        """
+        records = 0
+        while offset < self.end:
+            record = self.read(offset)
+            if record is None:
+                break
+            offset = record[2]
+            records += 1
+        return records
+
+    def close(self, sync=False):
+        if sync:
+            self.map.flush()
+        self.map.close()
+
+    def remove(self):
+        self.map.close()
+        os.remove(self.path)
+
+
+def _encode_record(device_id, payload):
+    """Auxiliary function to encode a journal record
+
+    :param device_id: The id of the device in which the measurements were obtained
+    :param payload: The UL payload
+    :return: The bytes of the record
+    """
+    device_id = device_id.encode('utf-8')
+    body = _DEVICE_ID_LENGTH.pack(len(device_id)) + device_id + payload.encode('utf-8')
+    return _RECORD_HEADER.pack(len(body), zlib.crc32(body)) + body
+
+
+def _is_permanent_error(result):
+    """Auxiliary method to check if an observation was refused by the IoT Agent and would be refused again
+
+    :param result: The result of sending the observation
+    :return: True for client errors other than 429, False for connection errors, server errors and rate limits
+    """
+    status_code = result.get('status_code', 0)
+    return 400 <= status_code < 500 and status_code != 429
+
+
+class ObservationOutbox(object):
+
+    def __init__(self, iot_client: FiwareIotClient, directory, protocol='MQTT', segment_size=1024 * 1024,
+                 max_segments=64, overflow='drop_oldest', max_batch=100, max_bytes=4096, timeout=10,
+                 retry_min_delay=0.5, retry_max_delay=30, sync=False, rate_window=10):
+        """Durable store-and-forward outbox of observations, which keeps the measurements while the MQTT broker
+        or the IoT Agent are unreachable and sends them once they recover
+
+        Observations are first appended to a journal on disk, made of memory-mapped segment files, and a background
+        thread drains the journal in order and in batches. The position of the last delivered observation is only
+        stored after the whole batch was sent (and, over MQTT, acknowledged by the broker), so every observation
+        is sent at least once: after a failure or a crash, some observations may be sent again.
+        Observations refused by the IoT Agent with a client error (other than 429) are logged and skipped,
+        so that they don't block the observations of the other devices.
+        On start, the journal left on the directory is recovered and the pending observations are sent.
+
+        The directory must not be used by several outboxes at the same time.
+
+        :param iot_client: The FiwareIotClient used to send the observations
+        :param directory: The directory where the journal is stored. It is created if it does not exist
+        :param protocol: The transport protocol to be used to send measurements.
+                         Currently accepted values are 'MQTT' and 'HTTP'
+        :param segment_size: The size in bytes of each segment file
+        :param max_segments: The maximum number of segment files, which bounds the size of the journal
+        :param overflow: What to do when the journal is full: 'drop_oldest' discards the oldest segment
+                         of pending observations, 'drop_newest' refuses the new observations
+        :param max_batch: The maximum number of observations read from the journal on each batch
+        :param max_bytes: The maximum size in bytes of each payload. Observations of the same device on a batch
+                          are joined as multi-group payloads up to this size
+        :param timeout: The timeout for each observation send request
+        :param retry_min_delay: The initial delay in seconds before sending again a batch which failed
+        :param retry_max_delay: The maximum delay in seconds between attempts to send a failed batch
+        :param sync: If the segment files should be flushed to disk after every write.
+                     Without it, the observations survive a crash of the process but not of the whole system
+        :param rate_window: The period in seconds over which the drain rate is computed
+        """
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy '{overflow}'. Accepted values are {OVERFLOW_POLICIES}")
+        if max_segments < 2:
+            raise ValueError("The outbox needs at least 2 segments")
+
+        self.iot_client = iot_client
+        self.directory = directory
+        self.protocol = protocol
+        self.segment_size = segment_size
+        self.max_segments = max_segments
+        self.overflow = overflow
+        self.max_batch = max_batch
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        self.retry_min_delay = retry_min_delay
+        self.retry_max_delay = retry_max_delay
+        self.sync = sync
+        self.rate_window = rate_window
+
+        self.appended = 0
+        self.drained = 0
+        self.dropped = 0
+        self.rejected = 0
+        self.failed_batches = 0
+
+        self._segments = deque()
+        self._cursor_segment_id = 0
+        self._cursor_offset = 0
+        self._backlog = 0
+        self._generation = 0
+        self._drains = deque()
+
+        self._lock = threading.Lock()
+        self._condition = threading.Condition(self._lock)
+        self._closed = False
+
+        os.makedirs(directory, exist_ok=True)
+        self._recover()
+
+        self._drain_thread = threading.Thread(target=self._drain_loop, name='ObservationOutbox', daemon=True)
+        self._drain_thread.start()
+
+    def _segment_path(self, segment_id):
+        return os.path.join(self.directory, f'{segment_id:016d}{_SEGMENT_SUFFIX}')
+
+    def _recover(self):
+        """Auxiliary method to open the journal left on the directory and find the pending observations
+
+        :return: None
+        """
+        cursor_path = os.path.join(self.directory, _CURSOR_FILE_NAME)
+        if os.path.exists(cursor_path):
+            with open(cursor_path, 'rb') as cursor_file:
+                data = cursor_file.read()
+            if len(data) == _CURSOR.size:
+                self._cursor_segment_id, self._cursor_offset = _CURSOR.unpack(data)
+
+        segment_ids = sorted(int(name[:-len(_SEGMENT_SUFFIX)]) for name in os.listdir(self.directory)
+                             if name.endswith(_SEGMENT_SUFFIX))
+        for segment_id in segment_ids:
+            segment = _Segment(self._segment_path(segment_id), segment_id, self.segment_size)
+            if segment_id < self._cursor_segment_id:
+                segment.remove()
+                continue
+
+            records = segment.recover()
+            if segment_id == self._cursor_segment_id:
+                self._cursor_offset = min(self._cursor_offset, segment.end)
+                records = segment.count(self._cursor_offset)
+            self._backlog += records
+            self._segments.append(segment)
+
+        if not self._segments:
+            segment_id = max([self._cursor_segment_id] + [segment_id + 1 for segment_id in segment_ids])
+            self._segments.append(_Segment(self._segment_path(segment_id), segment_id, self.segment_size))
+
+        if self._segments[0].segment_id != self._cursor_segment_id or not self._segments[0].end:
+            self._cursor_segment_id, self._cursor_offset = self._segments[0].segment_id, 0
+
+        if self._backlog:
+            logging.info(f"Recovered {self._backlog} pending observations from outbox {self.directory}")
+
+    def add(self, device_id, measurements):
+        """Adds a measurement group or a list of measurement groups from a device to the outbox
+
+        :param device_id: The id of the device in which the measurements were obtained
+        :param measurements: A measurement group (a dict where keys are device attributes and values are measurements
+                             for each attribute) or a list of measurement groups obtained in the device
+        :return: True if the observation was stored, False if it was refused because the outbox is full
+        :raises ValueError: If an attribute name or a value contains a UL separator ('|' or '#')
+        """
+        return self.add_payload(device_id, ul.encode_measurements(measurements))
+
+    def add_payload(self, device_id, payload):
+        """Adds an already encoded UL payload with one or more measurement groups from a device to the outbox
+
+        :param device_id: The id of the device in which the measurements were obtained
+        :param payload: The UL payload string, with measurement groups separated by '#'
+        :return: True if the observation was stored, False if it was refused because the outbox is full
+        """
+        record = _encode_record(str(device_id), payload)
+        if len(record) + _RECORD_HEADER.size > self.segment_size:
+            raise ValueError(f"Observation of {len(record)} bytes does not fit on a segment of the outbox")
+
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("Observation outbox is closed")
+
+            segment = self._segments[-1]
+            if not segment.append(record):
+                if len(self._segments) >= self.max_segments and not self._drop_oldest_segment():
+                    logging.error(f"Outbox {self.directory} is full, observation of device '{device_id}' dropped")
+                    self.dropped += 1
+                    return False
+
+                if self.sync:
+                    segment.map.flush()
+                segment = _Segment(self._segment_path(segment.segment_id + 1), segment.segment_id + 1,
+                                   self.segment_size)
+                self._segments.append(segment)
+                segment.append(record)
+
+            if self.sync:
+                segment.map.flush()
+
+            self.appended += 1
+            self._backlog += 1
+            self._condition.notify_all()
+        return True
+
+    def _drop_oldest_segment(self):
+        """Auxiliary method to make room on a full journal by discarding its oldest segment, if allowed
+
+        :return: True if a segment was discarded
+        """
+        if self.overflow != 'drop_oldest':
+            return False
+
+        segment = self._segments.popleft()
+        offset = self._cursor_offset if segment.segment_id == self._cursor_segment_id else 0
+        dropped = segment.count(offset)
+        segment.remove()
+
+        logging.error(f"Outbox {self.directory} is full, {dropped} pending observations dropped")
+        self.dropped += dropped
+        self._backlog -= dropped
+        self._generation += 1
+        self._cursor_segment_id, self._cursor_offset = self._segments[0].segment_id, 0
+        self._store_cursor()
+        return True
+
+    def _read_batch(self):
+        """Auxiliary method to read the next batch of pending observations, holding the lock
+
+        :return: A list of (device_id, payload) tuples and the position after the last one
+        """
+        batch = []
+        segment_index = 0
+        offset = self._cursor_offset
+        while len(batch) < self.max_batch and segment_index < len(self._segments):
+            segment = self._segments[segment_index]
+            if offset >= segment.end:
+                if segment_index == len(self._segments) - 1:
+                    break
+                segment_index += 1
+                offset = 0
+                continue
+
+            device_id, payload, offset = segment.read(offset)
+            batch.append((device_id, payload))
+
+        return batch, (self._segments[segment_index].segment_id, offset)
+
+    def _commit(self, position, records, generation, rejected=0):
+        """Auxiliary method to store the position of the last delivered observation,
+        removing the segments which were completely delivered
+
+        :param position: The (segment_id, offset) position after the last delivered observation
+        :param records: The number of observations sent, including the rejected ones
+        :param generation: The generation of the journal when the observations were read.
+                           If segments were dropped since, the position is not stored
+        :param rejected: The number of observations refused by the IoT Agent
+        :return: None
+        """
+        with self._lock:
+            if generation != self._generation:
+                return
+
+            self._cursor_segment_id, self._cursor_offset = position
+            while self._segments[0].segment_id < self._cursor_segment_id:
+                self._segments.popleft().remove()
+            self._store_cursor()
+
+            self.drained += records - rejected
+            self.rejected += rejected
+            self._backlog -= records
+            self._drains.append((time.monotonic(), records))
+            self._condition.notify_all()
+
+    def _store_cursor(self):
+        """Auxiliary method to atomically replace the file with the position of the last delivered observation
+
+        :return: None
+        """
+        cursor_path = os.path.join(self.directory, _CURSOR_FILE_NAME)
+        with open(cursor_path + '.tmp', 'wb') as cursor_file:
+            cursor_file.write(_CURSOR.pack(self._cursor_segment_id, self._cursor_offset))
+            if self.sync:
+                cursor_file.flush()
+                os.fsync(cursor_file.fileno())
+        os.replace(cursor_path + '.tmp', cursor_path)
+
+    def _drain_loop(self):
+        """Auxiliary method run by a background thread to send the pending observations
+
+        :return: None
+        """
+        backoff = 0
+        retry_at = 0
+        retried_batch = None
+        delivered = {}
+        while True:
+            with self._lock:
+                while not self._closed:
+                    if self._backlog == 0:
+                        self._condition.wait()
+                        continue
+                    # New observations wake the thread up, but don't cut the backoff of a failed batch short
+                    remaining = retry_at - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+                if self._closed:
+                    return
+
+                # A failed batch is sent again with the same observations, even if new ones were added since,
+                # so that the payloads delivered on the failed attempt are the same and are not sent again
+                if retried_batch is not None and retried_batch[0] == self._generation:
+                    generation, batch, position = retried_batch
+                else:
+                    generation = self._generation
+                    batch, position = self._read_batch()
+                    delivered = {}
+
+            try:
+                sent = self._send_batch(batch, delivered)
+            except Exception as e:
+                logging.error(f"Failed to send the observations of outbox {self.directory}: {e}")
+                sent = False
+
+            if sent:
+                self._commit(position, len(batch), generation, sum(delivered.values()))
+                retried_batch = None
+                backoff = 0
+            else:
+                self.failed_batches += 1
+                retried_batch = (generation, batch, position)
+                backoff = min(self.retry_max_delay, max(self.retry_min_delay, backoff * 2))
+                retry_at = time.monotonic() + backoff
+
+    def _send_batch(self, batch, delivered):
+        """Auxiliary method to send a batch of observations, joining the payloads of each device
+
+        Observations refused by the IoT Agent with a client error (e.g. an unknown device) would be refused again,
+        so they are logged and counted as rejected instead of blocking the observations of the other devices.
+
+        :param batch: A list of (device_id, payload) tuples
+        :param delivered: A dict of the payloads of the batch already delivered to the number of their rejected
+                          observations, updated on each delivery
+        :return: True if all the observations were sent
+        """
+        payloads = {}
+        for device_id, payload in batch:
+            device_payloads = payloads.setdefault(device_id, [])
+            if device_payloads and len(device_payloads[-1][0]) + 1 + len(payload) <= self.max_bytes:
+                device_payloads[-1] = (f'{device_payloads[-1][0]}#{payload}', device_payloads[-1][1] + 1)
+            else:
+                device_payloads.append((payload, 1))
+
+        for device_id, device_payloads in payloads.items():
+            for index, (payload, records) in enumerate(device_payloads):
+                if (device_id, index) in delivered:
+                    continue
+
+                result = self.iot_client.send_observation_payload(device_id, payload, protocol=self.protocol,
+                                                                  timeout=self.timeout)
+                if 'error' not in result:
+                    delivered[(device_id, index)] = 0
+                elif _is_permanent_error(result):
+                    logging.error(f"Outbox {self.directory} dropped {records} observations of device "
+                                  f"'{device_id}' refused by the IoT Agent: {result['error']}")
+                    delivered[(device_id, index)] = records
+                else:
+                    logging.warning(f"Outbox {self.directory} could not send the observations of device "
+                                    f"'{device_id}', retrying later: {result['error']}")
+                    return False
+
+        # Over MQTT, the publications are only delivered once the broker has received them
+        if self.protocol == 'MQTT' and not self.iot_client.mqtt_publisher.flush(self.timeout):
+            logging.warning(f"Outbox {self.directory} could not deliver the observations to the MQTT broker, "
+                            f"retrying later")
+            delivered.clear()
+            return False
+
+        return True
+
+    def flush(self, timeout=None):
+        """Waits until all the pending observations are delivered
+
+        :param timeout: The maximum time in seconds to wait. If no value is provided, waits indefinitely
+        :return: True if all the observations were delivered, False if the timeout expired before
+        """
+        with self._lock:
+            return self._condition.wait_for(lambda: self._backlog == 0 or self._closed, timeout) \
+                and self._backlog == 0
+
+    @property
+    def pending(self):
+        """The number of observations waiting to be delivered"""
+        with self._lock:
+            return self._backlog
+
+    def stats(self):
+        """Returns the metrics of the outbox
+
+        :return: A dict with the number of pending observations ('backlog') and their size on the journal
+                 ('backlog_bytes'), the number of 'segments', the number of 'appended', 'drained', 'dropped'
+                 and 'rejected' (refused by the IoT Agent) observations, the number of 'failed_batches'
+                 and the 'drain_rate' in observations per second
+        """
+        with self._lock:
+            now = time.monotonic()
+            while self._drains and self._drains[0][0] < now - self.rate_window:
+                self._drains.popleft()
+
+            backlog_bytes = sum(segment.end for segment in self._segments) - self._cursor_offset
+            return {
+                'backlog': self._backlog,
+                'backlog_bytes': backlog_bytes,
+                'segments': len(self._segments),
+                'appended': self.appended,
+                'drained': self.drained,
+                'dropped': self.dropped,
+                'rejected': self.rejected,
+                'failed_batches': self.failed_batches,
+                'drain_rate': sum(records for _, records in self._drains) / self.rate_window
+            }
+
+    def close(self, timeout=5):
+        """Waits for the delivery of the pending observations, stops the background thread and closes the journal.
+        Observations not delivered are kept on the journal and sent when an outbox is opened again on the directory
+
+        :param timeout: The maximum time in seconds to wait for the pending observations
+        :return: None
+        """
+        if self._closed:
+            return
+        if timeout and not self.flush(timeout):
+            logging.warning(f"Closing outbox {self.directory} with {self.pending} pending observations")
+
+        with self._lock:
+            self._closed = True
+            self._condition.notify_all()
+        self._drain_thread.join()
+
+        with self._lock:
+            for segment in self._segments:
+                segment.close(sync=True)
+            self._segments.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
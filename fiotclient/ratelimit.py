@@ -0,0 +1,141 @@
+import asyncio
+import threading
+import time
+
+
+class TokenBucket(object):
+
+    def __init__(self, rate, capacity=None):
+        """Allows a sustained rate of requests with bursts up to the capacity of the bucket
+
+        Tokens are reserved in advance: a caller takes its tokens even if the bucket is empty
+        and waits only the time needed to refill them, so that waiting callers are served in order
+        without polling the bucket.
+
+        :param rate: The number of tokens added to the bucket per second
+        :param capacity: The maximum number of tokens in the bucket. If None, the bucket holds one second of tokens
+        """
+        if rate <= 0:
+            raise ValueError("The rate of a token bucket must be positive")
+
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(rate, 1))
+
+        self._lock = threading.Lock()
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+
+    @property
+    def tokens(self):
+        """The number of tokens currently available, negative if tokens were reserved in advance"""
+        with self._lock:
+            return min(self.capacity, self._tokens + (time.monotonic() - self._updated_at) * self.rate)
+
+    def reserve(self, tokens=1):
+        """Take tokens from the bucket, even if they are not available yet
+
+        :param tokens: The number of tokens to be taken
+        :return: The time in seconds to wait until the tokens are available
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate) - tokens
+            self._updated_at = now
+            return max(0.0, -self._tokens / self.rate)
+
+    def refund(self, tokens=1):
+        """Return tokens reserved by a caller which gave up waiting for them
+
+        :param tokens: The number of tokens to be returned
+        :return: None
+        """
+        with self._lock:
+            self._tokens = min(self.capacity, self._tokens + tokens)
+
+
+class RateLimiter(object):
+
+    def __init__(self, component_rates=None, service_rates=None, default_service_rate=None):
+        """Limits the rate of the requests made by clients per FIWARE component and per service,
+        making callers wait for their turn instead of being throttled by the platform.
+        It can be shared among clients, threads and asyncio tasks
+
+        Each rate is given as requests per second, or as a (requests per second, burst size) tuple.
+
+        :param component_rates: A dict of component names ('orion', 'iota-north', 'iota-south', 'sth', 'perseo')
+                                to the rate of the requests to that component
+        :param service_rates: A dict of the rates of the requests to a service. The keys are either a service name,
+                              limiting all its service paths together, or a (service, service path) tuple
+        :param default_service_rate: The rate of the requests to each service not listed in service_rates, if any
+        """
+        self._lock = threading.Lock()
+        self._component_buckets = {component: self._bucket(rate) for component, rate in (component_rates or {}).items()}
+        self._service_buckets = {key: self._bucket(rate) for key, rate in (service_rates or {}).items()}
+        self.default_service_rate = default_service_rate
+
+    @staticmethod
+    def _bucket(rate):
+        """Auxiliary method to create the token bucket of a rate
+
+        :param rate: The requests per second, or a (requests per second, burst size) tuple
+        :return: The TokenBucket
+        """
+        if isinstance(rate, tuple):
+            return TokenBucket(*rate)
+        return TokenBucket(rate)
+
+    def buckets_for(self, component, service, service_path):
+        """Get the token buckets limiting a request
+
+        :param component: The name of the component called by the request
+        :param service: The Fiware-Service of the request
+        :param service_path: The Fiware-ServicePath of the request
+        :return: A list with the token buckets from which the request must take a token
+        """
+        buckets = []
+        with self._lock:
+            if component in self._component_buckets:
+                buckets.append(self._component_buckets[component])
+
+            path_key = (service, service_path)
+            if path_key in self._service_buckets:
+                buckets.append(self._service_buckets[path_key])
+
+            if service not in self._service_buckets and self.default_service_rate is not None:
+                self._service_buckets[service] = self._bucket(self.default_service_rate)
+            if service in self._service_buckets:
+                buckets.append(self._service_buckets[service])
+
+        return buckets
+
+    def acquire(self, component, service, service_path):
+        """Wait until a request is allowed by every rate limiting it, blocking the calling thread
+
+        :param component: The name of the component called by the request
+        :param service: The Fiware-Service of the request
+        :param service_path: The Fiware-ServicePath of the request
+        :return: The time in seconds the caller waited
+        """
+        delay = max([bucket.reserve() for bucket in self.buckets_for(component, service, service_path)], default=0.0)
+        if delay > 0:
+            time.sleep(delay)
+        return delay
+
+    async def acquire_async(self, component, service, service_path):
+        """Wait until a request is allowed by every rate limiting it, without blocking the event loop
+
+        :param component: The name of the component called by the request
+        :param service: The Fiware-Service of the request
+        :param service_path: The Fiware-ServicePath of the request
+        :return: The time in seconds the caller waited
+        """
+        buckets = self.buckets_for(component, service, service_path)
+        delay = max([bucket.reserve() for bucket in buckets], default=0.0)
+        if delay > 0:
+            try:
+                await asyncio.sleep(delay)
+            except asyncio.CancelledError:
+                for bucket in buckets:
+                    bucket.refund()
+                raise
+        return delay
@@ -0,0 +1,215 @@
+import random
+import threading
+import time
+
+IDEMPOTENT_METHODS = ('GET', 'PUT', 'DELETE', 'HEAD', 'OPTIONS')
+
+
+class RetryPolicy(object):
+
+    def __init__(self, max_attempts=3, backoff_base=0.5, backoff_max=30.0, jitter=True,
+                 retry_statuses=(429, 502, 503, 504), rejected_statuses=(429, 503), retry_non_idempotent=False,
+                 respect_retry_after=True):
+        """Rules to decide if a failed request is sent again and how long to wait before each new attempt
+
+        Requests which may not be safely repeated (POSTs, unless declared idempotent) are only retried
+        when the server explicitly rejected them without processing (rejected_statuses),
+        so that a retry never duplicates data.
+
+        :param max_attempts: The maximum number of attempts of each request, including the first one
+        :param backoff_base: The delay in seconds before the second attempt. It doubles on each new attempt
+        :param backoff_max: The maximum delay in seconds between attempts
+        :param jitter: If the delays should be randomized between zero and the exponential delay ("full jitter"),
+                       so that many clients failing at the same time don't retry in lockstep
+        :param retry_statuses: The response status codes of idempotent requests which are retried.
+                               Connection errors (status code 0) are always retried for idempotent requests
+        :param rejected_statuses: The response status codes meaning the request was not processed,
+                                  for which non idempotent requests are also retried
+        :param retry_non_idempotent: If non idempotent requests should be retried as idempotent ones
+        :param respect_retry_after: If the Retry-After header of the response should be used as delay, when present
+        """
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.jitter = jitter
+        self.retry_statuses = frozenset(retry_statuses)
+        self.rejected_statuses = frozenset(rejected_statuses)
+        self.retry_non_idempotent = retry_non_idempotent
+        self.respect_retry_after = respect_retry_after
+
+    def is_retryable(self, method, status_code, idempotent=None):
+        """Check if a request should be sent again after getting a given status code
+
+        :param method: The method of the request
+        :param status_code: The status code of the response, or 0 if the connection failed
+        :param idempotent: If the request can be safely repeated. If None, it is deduced from the method
+        :return: True if the request should be retried
+        """
+        if idempotent is None:
+            idempotent = method in IDEMPOTENT_METHODS
+
+        if status_code in self.rejected_statuses:
+            return True
+        if not idempotent and not self.retry_non_idempotent:
+            return False
+        return status_code == 0 or status_code in self.retry_statuses
+
+    def delay(self, attempt, retry_after=None):
+        """Compute the delay before the next attempt of a request
+
+        :param attempt: The number of the attempt which failed, starting at 1
+        :param retry_after: The value of the Retry-After header of the failed response, if any
+        :return: The delay in seconds
+        """
+        if self.respect_retry_after and retry_after is not None:
+            try:
+                return min(max(float(retry_after), 0.0), self.backoff_max)
+            except ValueError:
+                # HTTP dates are not supported, the exponential backoff is used instead
+                pass
+
+        delay = min(self.backoff_max, self.backoff_base * 2 ** (attempt - 1))
+        return random.uniform(0, delay) if self.jitter else delay
+
+
+class CircuitBreaker(object):
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, failure_threshold=5, recovery_timeout=30.0, half_open_max_calls=1,
+                 failure_statuses=(500, 502, 503, 504)):
+        """Stops sending requests to a component after consecutive failures, so that calls fail fast
+        while the component is down instead of waiting for their timeout
+
+        After the recovery timeout, a limited number of trial requests are let through.
+        The circuit closes again if they succeed, and opens for another recovery timeout if they fail.
+
+        :param failure_threshold: The number of consecutive failures which opens the circuit
+        :param recovery_timeout: The time in seconds the circuit stays open before trial requests are allowed
+        :param half_open_max_calls: The maximum number of simultaneous trial requests
+        :param failure_statuses: The response status codes counted as failures, besides connection errors
+        """
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.half_open_max_calls = half_open_max_calls
+        self.failure_statuses = frozenset(failure_statuses)
+
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = None
+        self._half_open_calls = 0
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.recovery_timeout:
+                return self.HALF_OPEN
+            return self._state
+
+    def allow(self):
+        """Check if a request can be sent, reserving a trial slot if the circuit is half open
+
+        :return: True if the request can be sent
+        """
+        with self._lock:
+            if self._state == self.OPEN:
+                if time.monotonic() - self._opened_at < self.recovery_timeout:
+                    return False
+                self._state = self.HALF_OPEN
+                self._half_open_calls = 0
+
+            if self._state == self.HALF_OPEN:
+                if self._half_open_calls >= self.half_open_max_calls:
+                    return False
+                self._half_open_calls += 1
+
+            return True
+
+    def record(self, status_code):
+        """Record the outcome of a request allowed by the breaker
+
+        :param status_code: The status code of the response, or 0 if the connection failed
+        :return: None
+        """
+        failed = status_code == 0 or status_code in self.failure_statuses
+
+        with self._lock:
+            if self._state == self.HALF_OPEN:
+                self._half_open_calls -= 1
+                if failed:
+                    self._open()
+                else:
+                    self._state = self.CLOSED
+                    self._failures = 0
+            elif failed:
+                self._failures += 1
+                if self._failures >= self.failure_threshold:
+                    self._open()
+            else:
+                self._failures = 0
+
+    def release(self):
+        """Give back the trial slot of a request allowed by the breaker which ended without an outcome
+        (e.g. it was not sent)
+
+        :return: None
+        """
+        with self._lock:
+            if self._state == self.HALF_OPEN and self._half_open_calls > 0:
+                self._half_open_calls -= 1
+
+    def _open(self):
+        """Auxiliary method to open the circuit. Must be called holding the breaker lock
+
+        :return: None
+        """
+        self._state = self.OPEN
+        self._opened_at = time.monotonic()
+        self._failures = 0
+
+
+class CircuitBreakerRegistry(object):
+
+    def __init__(self, failure_threshold=5, recovery_timeout=30.0, half_open_max_calls=1,
+                 failure_statuses=(500, 502, 503, 504)):
+        """Keeps a CircuitBreaker for each FIWARE component, created on first use.
+        It can be shared among clients, so that all of them stop calling a component which is down
+
+        :param failure_threshold: The number of consecutive failures which opens the circuit of a component
+        :param recovery_timeout: The time in seconds a circuit stays open before trial requests are allowed
+        :param half_open_max_calls: The maximum number of simultaneous trial requests to a component
+        :param failure_statuses: The response status codes counted as failures, besides connection errors
+        """
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.half_open_max_calls = half_open_max_calls
+        self.failure_statuses = failure_statuses
+
+        self._lock = threading.Lock()
+        self._breakers = {}
+
+    def get(self, component):
+        """Get the circuit breaker of a component
+
+        :param component: The name of the component (e.g. 'orion')
+        :return: The CircuitBreaker of the component
+        """
+        with self._lock:
+            breaker = self._breakers.get(component)
+            if breaker is None:
+                breaker = self._breakers[component] = CircuitBreaker(
+                    failure_threshold=self.failure_threshold, recovery_timeout=self.recovery_timeout,
+                    half_open_max_calls=self.half_open_max_calls, failure_statuses=self.failure_statuses)
+            return breaker
+
+    def states(self):
+        """Get the state of the circuit of each component
+
+        :return: A dict of component names to their circuit state ('closed', 'open' or 'half-open')
+        """
+        with self._lock:
+            breakers = dict(self._breakers)
+        return {component: breaker.state for component, breaker in breakers.items()}
@@ -0,0 +1,73 @@
+import logging
+from collections.abc import MutableMapping
+
+
+class Response(MutableMapping):
+
+    def __init__(self, status_code, headers, content, codec):
+        """Result of a request to FIWARE APIs, which behaves as a dict with the 'status_code', 'headers' and
+        'response' keys. The body is only decoded when the 'response' key is first accessed,
+        so callers which only check the status code never pay for parsing it
+
+        :param status_code: The status code of the response
+        :param headers: The http headers of the response
+        :param content: The raw body of the response
+        :param codec: The JsonCodec used to decode the body
+        """
+        self._data = {
+            'status_code': status_code,
+            'headers': headers
+        }
+        self._content = content
+        self._codec = codec
+
+    def _decode(self):
+        """Auxiliary method to decode the body into the 'response' key, if not decoded yet
+
+        :return: None
+        """
+        # The content is read before checking the decoded body, and dropped after setting it, so that
+        # a response shared among threads (e.g. cached) is never seen without both
+        content = self._content
+        if 'response' in self._data:
+            return
+
+        if not content:
+            self._data['response'] = {}
+        else:
+            try:
+                self._data['response'] = self._codec.loads(content)
+            except ValueError as e:
+                logging.error(f"Error: {e}")
+                self._data['response'] = {}
+        self._content = None
+
+    def __getitem__(self, key):
+        if key == 'response':
+            self._decode()
+        return self._data[key]
+
+    def __setitem__(self, key, value):
+        if key == 'response':
+            self._content = None
+        self._data[key] = value
+
+    def __delitem__(self, key):
+        if key == 'response':
+            self._decode()
+        del self._data[key]
+
+    def __contains__(self, key):
+        return key in self._data or (key == 'response' and self._content is not None)
+
+    def __iter__(self):
+        self._decode()
+        return iter(self._data)
+
+    def __len__(self):
+        self._decode()
+        return len(self._data)
+
+    def __repr__(self):
+        self._decode()
+        return repr(self._data)
@@ -0,0 +1,129 @@
+import asyncio
+import threading
+
+
+class _Call(object):
+
+    __slots__ = ('event', 'result', 'error')
+
+    def __init__(self):
+        """Call in flight on a thread, whose outcome is shared with the threads making the same call"""
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight(object):
+
+    def __init__(self):
+        """Coalesces identical calls made at the same time: while a call with a given key is in flight,
+        other calls with the same key wait for it and share its result instead of being executed.
+        It can be used by threads and by asyncio tasks, and shared among clients
+
+        Results are shared among the coalesced callers, so they must not be modified.
+        """
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._async_calls = {}
+        self._executed = 0
+        self._coalesced = 0
+
+    @property
+    def coalesced(self):
+        """The number of calls which shared the result of another call instead of being executed"""
+        return self._coalesced
+
+    def stats(self):
+        """Get the counters of the calls made through the single-flight layer
+
+        :return: A dict with the number of 'executed' and 'coalesced' calls
+        """
+        with self._lock:
+            return {'executed': self._executed, 'coalesced': self._coalesced}
+
+    def do(self, key, function):
+        """Execute a call, unless an identical one is already in flight on another thread
+
+        :param key: The hashable key identifying identical calls
+        :param function: The function executing the call
+        :return: The result of the call, shared with the identical calls
+        :raises Exception: The exception raised by the call, if any
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self._executed += 1
+            else:
+                self._coalesced += 1
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = function()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+
+    async def do_async(self, key, coroutine_function):
+        """Execute a call without blocking the event loop, unless an identical one is already in flight
+        on another task of the same loop. If the task executing the call is cancelled,
+        one of the tasks waiting for it executes the call instead
+
+        :param key: The hashable key identifying identical calls
+        :param coroutine_function: The coroutine function executing the call
+        :return: The result of the call, shared with the identical calls
+        :raises Exception: The exception raised by the call, if any
+        """
+        loop = asyncio.get_running_loop()
+        call_key = (loop, key)
+
+        while True:
+            with self._lock:
+                future = self._async_calls.get(call_key)
+                leader = future is None
+                if leader:
+                    future = self._async_calls[call_key] = loop.create_future()
+                    self._executed += 1
+                else:
+                    self._coalesced += 1
+
+            if leader:
+                break
+
+            try:
+                # The shared future is shielded, so that cancelling a waiting task doesn't cancel the call
+                result, error = await asyncio.shield(future)
+            except asyncio.CancelledError:
+                if future.cancelled():
+                    # The task executing the call was cancelled, so the call is executed again
+                    continue
+                raise
+            if error is not None:
+                raise error
+            return result
+
+        try:
+            result = await coroutine_function()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_result((None, e))
+            raise
+        else:
+            future.set_result((result, None))
+            return result
+        finally:
+            with self._lock:
+                del self._async_calls[call_key]
@@ -0,0 +1,230 @@
+import codecs
+import json
+import re
+
+_STRUCTURAL = re.compile(r'[\[\]{}",:]')
+_STRING_SPECIAL = re.compile(r'["\\]')
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+_SCALAR_END = re.compile(r'[ \t\n\r]*[,\]]')
+
+
+class _Container(object):
+
+    __slots__ = ('is_array', 'key', 'child_key')
+
+    def __init__(self, is_array, key):
+        """Object or array enclosing the selected array
+
+        :param is_array: If the container is an array
+        :param key: The key (or index) of the container in its parent
+        """
+        self.is_array = is_array
+        self.key = key
+        self.child_key = 0 if is_array else None
+
+
+class JsonArrayStream(object):
+
+    def __init__(self, path=()):
+        """Incremental parser of a JSON document that extracts the items of one of its arrays as soon as
+        they are complete, keeping in memory only the item being read
+
+        The document is scanned for its structure until the selected array is found.
+        Then each item is decoded on its own and discarded from the buffer.
+
+        :param path: The keys and indexes leading to the array in the document
+                     (e.g. ('contextResponses', 0, 'values')). An empty path selects a top-level array
+        """
+        self.path = tuple(path)
+
+        self._text_decoder = codecs.getincrementaldecoder('utf-8')()
+        self._json_decoder = json.JSONDecoder()
+
+        self._text = ''
+        self._position = 0
+        self._stack = []
+        self._expect_key = False
+        self._in_string = False
+        self._string_start = None
+        self._reading_key = False
+
+        self._in_array = False
+        self._expect_separator = False
+        self._done = False
+
+    def feed(self, chunk):
+        """Parse the next chunk of the document
+
+        :param chunk: The next bytes of the document
+        :return: A list with the items of the array completed on this chunk
+        """
+        if self._done:
+            return []
+
+        # Only the text after the parsed position (or an incomplete key) is kept for the next chunk
+        keep_from = self._position
+        if self._in_string and self._reading_key:
+            keep_from = min(keep_from, self._string_start)
+            self._string_start -= keep_from
+
+        self._text = self._text[keep_from:] + self._text_decoder.decode(chunk)
+        self._position -= keep_from
+
+        if not self._in_array:
+            self._find_array()
+
+        items = []
+        if self._in_array:
+            self._read_items(items, final=False)
+        return items
+
+    def _find_array(self):
+        """Auxiliary method to scan the structure of the document until the selected array is opened
+
+        :return: None
+        """
+        text = self._text
+        position = self._position
+        stack = self._stack
+
+        while True:
+            if self._in_string:
+                match = _STRING_SPECIAL.search(text, position)
+                if match is None:
+                    position = len(text)
+                    break
+                if text[match.start()] == '\\':
+                    if match.end() >= len(text):
+                        # The escaped character is on the next chunk
+                        position = match.start()
+                        break
+                    position = match.end() + 1
+                    continue
+
+                position = match.end()
+                self._in_string = False
+                if self._reading_key:
+                    stack[-1].child_key = json.loads(text[self._string_start:position])
+                    self._reading_key = False
+                continue
+
+            match = _STRUCTURAL.search(text, position)
+            if match is None:
+                position = len(text)
+                break
+
+            char = text[match.start()]
+            position = match.end()
+
+            if char == '"':
+                self._in_string = True
+                self._string_start = match.start()
+                self._reading_key = self._expect_key
+            elif char == '{' or char == '[':
+                stack.append(_Container(char == '[', stack[-1].child_key if stack else None))
+                if char == '[' and self._is_target_path():
+                    self._in_array = True
+                    break
+                self._expect_key = char == '{'
+            elif char == '}' or char == ']':
+                if not stack:
+                    raise ValueError("Invalid JSON document: unbalanced brackets")
+                stack.pop()
+                self._expect_key = False
+                if not stack:
+                    # The whole document was scanned without finding the array
+                    self._done = True
+                    break
+            elif char == ',':
+                if stack[-1].is_array:
+                    stack[-1].child_key += 1
+                else:
+                    self._expect_key = True
+            else:
+                self._expect_key = False
+
+        self._position = position
+
+    def _is_target_path(self):
+        """Auxiliary method to check if the innermost container is the array selected by the path
+
+        :return: True if the path of the innermost container is the selected one
+        """
+        if len(self._stack) != len(self.path) + 1:
+            return False
+        return tuple(container.key for container in self._stack[1:]) == self.path
+
+    def _read_items(self, items, final):
+        """Auxiliary method to decode the complete items of the selected array
+
+        :param items: The list to which the decoded items are added
+        :param final: If there are no more chunks, so that an item at the end of the text is complete
+        :return: None
+        """
+        text = self._text
+        position = self._position
+
+        while True:
+            position = _WHITESPACE.match(text, position).end()
+            if position >= len(text):
+                break
+
+            char = text[position]
+            if self._expect_separator or char == ']':
+                if char == ']':
+                    self._done = True
+                    position += 1
+                    break
+                if char != ',':
+                    raise ValueError(f"Invalid JSON document: expecting ',' or ']' at '{text[position:position + 20]}'")
+                self._expect_separator = False
+                position += 1
+                continue
+
+            try:
+                item, end = self._json_decoder.raw_decode(text, position)
+            except json.JSONDecodeError:
+                # The item continues on the next chunk
+                break
+
+            if not final and char not in '{["' and not _SCALAR_END.match(text, end):
+                # A number or literal may continue on the next chunk
+                break
+
+            items.append(item)
+            position = end
+            self._expect_separator = True
+
+        self._position = position
+
+    def close(self):
+        """Parse the end of the document, checking that the selected array was complete
+
+        :return: A list with the last items of the array
+        :raises ValueError: If the document ended inside the selected array
+        """
+        items = []
+        if self._in_array and not self._done:
+            self._text = self._text[self._position:] + self._text_decoder.decode(b'', final=True)
+            self._position = 0
+            self._read_items(items, final=True)
+        if self._stack and not self._done:
+            raise ValueError("Incomplete JSON document")
+        return items
+
+    @property
+    def found(self):
+        return self._in_array
+
+
+def iter_json_array(chunks, path=()):
+    """Iterate over the items of an array of a JSON document read in chunks, decoding one item at a time
+
+    :param chunks: An iterable of the bytes chunks of the document
+    :param path: The keys and indexes leading to the array in the document. An empty path selects a top-level array
+    :return: A generator of the decoded items. Nothing is generated if the document has no array on the path
+    """
+    stream = JsonArrayStream(path)
+    for chunk in chunks:
+        yield from stream.feed(chunk)
+    yield from stream.close()
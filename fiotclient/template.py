@@ -0,0 +1,153 @@
+import functools
+import json
+import operator
+import re
+
+PLACEHOLDERS = ('DEVICE_ID', 'ENTITY_ID', 'ENTITY_TYPE', 'DEVICE_IP', 'PORT')
+
+
+class SchemaTemplate(object):
+
+    def __init__(self, schema, placeholders=PLACEHOLDERS):
+        """Device or entity schema with placeholders (e.g. '[DEVICE_ID]'), parsed once and compiled into
+        a renderer which fills the placeholders of a new copy of the structure on each call
+
+        Placeholders may be found in any string of the schema, keys included, possibly along with other text.
+        As the values are written into the parsed structure instead of the JSON text, they never need escaping.
+
+        :param schema: The JSON string of the schema, or the already parsed schema
+        :param placeholders: The names of the placeholders, which are written between brackets on the schema
+        """
+        if isinstance(schema, (str, bytes)):
+            schema = json.loads(schema)
+
+        self.schema = schema
+        self._pattern = re.compile(r'\[(' + '|'.join(re.escape(name) for name in placeholders) + r')\]')
+        self._defaults = {}
+        self._keys = set()
+        self._render = self._compile(schema)
+        self._keys = frozenset(self._keys)
+
+    @classmethod
+    def from_file(cls, schema_file_path, placeholders=PLACEHOLDERS):
+        """Load a schema template from a file
+
+        :param schema_file_path: The path to the description file of the device or entity
+        :param placeholders: The names of the placeholders, which are written between brackets on the schema
+        :return: The SchemaTemplate
+        """
+        with open(schema_file_path) as schema_file:
+            return cls(json.load(schema_file), placeholders=placeholders)
+
+    @property
+    def placeholders(self):
+        """The names of the placeholders found on the schema"""
+        return frozenset(self._defaults)
+
+    @property
+    def keys(self):
+        """The keys of all the objects of the schema, at any level"""
+        return self._keys
+
+    def render(self, **values):
+        """Create a new payload from the schema, filling its placeholders.
+        Placeholders without a value are kept as they are
+
+        :param values: The values of the placeholders, given by their name in any case (e.g. device_id='LED_001')
+        :return: A new structure, which can be modified without affecting the template or other payloads
+        """
+        filled_values = self._defaults.copy()
+        for name, value in values.items():
+            filled_values[name.upper()] = str(value)
+        return self._render(filled_values)
+
+    def _compile(self, node):
+        """Auxiliary method to compile a node of the schema into a function building a new copy of it,
+        so that the placeholders are found once and a payload is rendered without searching the schema again
+
+        :param node: The node of the parsed schema
+        :return: A function receiving the dict of placeholder values and returning the rendered node
+        """
+        if isinstance(node, dict):
+            self._keys.update(node)
+            # Items without placeholders nor nested structures are shared by the rendered payloads
+            constant_items = {}
+            rendered_items = []
+            for key, value in node.items():
+                render_key = self._compile_string(key)
+                render_value = self._compile(value)
+                if isinstance(render_key, str) and isinstance(render_value, _Constant):
+                    constant_items[render_key] = render_value.value
+                else:
+                    rendered_items.append((render_key, render_value))
+
+            def render_dict(values):
+                rendered = constant_items.copy()
+                for render_key, render_value in rendered_items:
+                    rendered[render_key if isinstance(render_key, str) else render_key(values)] = render_value(values)
+                return rendered
+            return render_dict
+
+        if isinstance(node, list):
+            render_items = [self._compile(item) for item in node]
+            if all(isinstance(render_item, _Constant) for render_item in render_items):
+                return lambda values: list(node)
+            return lambda values: [render_item(values) for render_item in render_items]
+
+        if isinstance(node, str):
+            render_string = self._compile_string(node)
+            return _Constant(node) if isinstance(render_string, str) else render_string
+
+        # Numbers, booleans and null are immutable, so they are shared by the rendered payloads
+        return _Constant(node)
+
+    def _compile_string(self, text):
+        """Auxiliary method to compile a string of the schema, which may contain placeholders
+
+        :param text: The string of the schema
+        :return: The string itself if it has no placeholders, or a function receiving the dict of placeholder values
+                 and returning the filled string
+        """
+        parts = self._pattern.split(text)
+        if len(parts) == 1:
+            return text
+
+        # The parts alternate between literal text and placeholder names
+        for name in parts[1::2]:
+            self._defaults[name] = f'[{name}]'
+        if parts == ['', parts[1], '']:
+            return operator.itemgetter(parts[1])
+        return lambda values: ''.join([values[part] if index % 2 else part for index, part in enumerate(parts)])
+
+
+class _Constant(object):
+
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        """Renderer of an immutable node of a schema, which is shared by all the rendered payloads
+
+        :param value: The node
+        """
+        self.value = value
+
+    def __call__(self, values):
+        return self.value
+
+
+@functools.lru_cache(maxsize=64)
+def _parse_template(schema):
+    return SchemaTemplate(schema)
+
+
+def as_template(schema):
+    """Get the template of a schema, so that a JSON string passed again and again is only parsed once
+
+    :param schema: A SchemaTemplate, the JSON string of a schema or the already parsed schema
+    :return: The SchemaTemplate
+    """
+    if isinstance(schema, SchemaTemplate):
+        return schema
+    if isinstance(schema, (str, bytes)):
+        return _parse_template(schema)
+    return SchemaTemplate(schema)
@@ -0,0 +1,65 @@
+import contextvars
+
+_tenant_overrides = contextvars.ContextVar('fiotclient_tenant_overrides', default=None)
+
+
+class Tenant(object):
+
+    __slots__ = ('service', 'service_path', 'headers', '_token_headers')
+
+    def __init__(self, service, service_path):
+        """A FIWARE service and service path, with the default headers of the requests made on them
+
+        :param service: The name of the service
+        :param service_path: The service path of the service
+        """
+        self.service = service
+        self.service_path = service_path
+        self.headers = {'Fiware-Service': service, 'Fiware-ServicePath': service_path}
+        self._token_headers = (None, None)
+
+    def default_headers(self, token):
+        """Get the default headers of a request on the tenant, built once for each authentication token
+
+        :param token: The authentication token sent on the request
+        :return: The dict of default headers. It is shared, so it must not be modified
+        """
+        # The token and its headers are kept together, so that threads never see them mismatched
+        cached_token, headers = self._token_headers
+        if headers is None or cached_token != token:
+            headers = {'X-Auth-Token': token, **self.headers}
+            self._token_headers = (token, headers)
+        return headers
+
+    def __repr__(self):
+        return f"Tenant({self.service!r}, {self.service_path!r})"
+
+
+def get_override(owner):
+    """Get the tenant selected for an object in the current thread or asyncio task, if any
+
+    :param owner: The object (e.g. a client) for which the tenant was selected
+    :return: The selected Tenant, or None if no tenant was selected for the object
+    """
+    overrides = _tenant_overrides.get()
+    return overrides.get(owner) if overrides else None
+
+
+def set_override(owner, tenant):
+    """Select the tenant of an object in the current thread or asyncio task, and in the tasks it creates
+
+    :param owner: The object (e.g. a client) for which the tenant is selected
+    :param tenant: The Tenant to be selected
+    :return: The contextvars token to be passed to reset_override
+    """
+    overrides = _tenant_overrides.get()
+    return _tenant_overrides.set({**overrides, owner: tenant} if overrides else {owner: tenant})
+
+
+def reset_override(reset_token):
+    """Restore the tenants selected before a call to set_override
+
+    :param reset_token: The contextvars token returned by set_override
+    :return: None
+    """
+    _tenant_overrides.reset(reset_token)
@@ -0,0 +1,157 @@
+import logging
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from .config import FiwareConfig
+
+
+class HttpTransport(object):
+
+    def __init__(self, pool_connections=10, pool_maxsize=10, keep_alive=True, idle_timeout=None, pool_block=False):
+        """Pooled HTTP transport used by the clients to reuse connections to FIWARE components
+
+        A single transport can be shared by several clients (e.g. a FiwareContextClient and a FiwareIotClient
+        targeting the same hosts), so that all of them draw connections from the same pool.
+
+        :param pool_connections: The number of per host connection pools to keep
+        :param pool_maxsize: The maximum number of connections kept alive in the pool of each host
+        :param keep_alive: If connections should be kept open between requests.
+                           If False, every request asks the server to close the connection
+        :param idle_timeout: Time in seconds after which the idle connections of a host are closed.
+                             If no value is provided, idle connections are kept until the transport is closed
+        :param pool_block: If requests should wait for a free connection when the pool of a host is exhausted
+                           instead of opening an extra, non pooled, connection
+        """
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.keep_alive = keep_alive
+        self.idle_timeout = idle_timeout
+        self.pool_block = pool_block
+
+        self._lock = threading.Lock()
+        self._session = None
+        self._closed = False
+        self._last_used = {}
+        self._in_flight = {}
+
+    @classmethod
+    def from_config(cls, fiware_config: FiwareConfig):
+        """Creates a transport with the pool settings of the given configuration
+
+        :param fiware_config: The FiwareConfig object from which to load the pool settings
+        """
+        return cls(pool_connections=fiware_config.http_pool_connections,
+                   pool_maxsize=fiware_config.http_pool_maxsize,
+                   keep_alive=fiware_config.http_keep_alive,
+                   idle_timeout=fiware_config.http_idle_timeout)
+
+    def _build_session(self):
+        """Auxiliary method to create the pooled session used to execute the requests
+
+        :return: The created session
+        """
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=self.pool_connections, pool_maxsize=self.pool_maxsize,
+                              pool_block=self.pool_block)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+
+        if not self.keep_alive:
+            session.headers['Connection'] = 'close'
+
+        return session
+
+    def _evict_idle_hosts(self, now):
+        """Auxiliary method to close the pooled connections of the hosts without activity for longer
+        than the configured idle timeout. Must be called holding the transport lock
+
+        :param now: The current monotonic time
+        :return: None
+        """
+        idle_hosts = [host for host, last_used in self._last_used.items()
+                      if now - last_used > self.idle_timeout and not self._in_flight.get(host)]
+
+        for host in idle_hosts:
+            del self._last_used[host]
+            for adapter in self._session.adapters.values():
+                pools = adapter.poolmanager.pools
+                for pool_key in list(pools.keys()):
+                    if (pool_key.key_scheme, pool_key.key_host, pool_key.key_port) == host:
+                        # Removing the pool from the manager closes its connections
+                        del pools[pool_key]
+            logging.debug(f"Closed idle connections to {host[0]}://{host[1]}:{host[2]}")
+
+    @staticmethod
+    def _host_key(url):
+        """Auxiliary method to get the key identifying the connection pool used for an url
+
+        :param url: The url to be requested
+        :return: A (scheme, host, port) tuple
+        """
+        split_url = urlsplit(url)
+        scheme = split_url.scheme.lower()
+        port = split_url.port or (443 if scheme == 'https' else 80)
+        return scheme, (split_url.hostname or '').lower(), port
+
+    def request(self, method, url, params=None, data=None, headers=None, timeout=30, stream=False):
+        """Executes a request using a pooled connection
+
+        :param method: The method to be used on the request
+        :param url: The url to be called on the request
+        :param params: The query parameters to be sent on the request
+        :param data: The body to be sent on the request
+        :param headers: The http headers to be used in the request
+        :param timeout: The request's timeout
+        :param stream: If the response body should be read lazily
+        :return: The requests.Response of the request execution
+        """
+        host = self._host_key(url)
+
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("Transport is closed")
+
+            if self._session is None:
+                self._session = self._build_session()
+
+            now = time.monotonic()
+            if self.idle_timeout is not None:
+                self._evict_idle_hosts(now)
+
+            self._last_used[host] = now
+            self._in_flight[host] = self._in_flight.get(host, 0) + 1
+            session = self._session
+
+        try:
+            return session.request(method, url, params=params, data=data, headers=headers, timeout=timeout,
+                                   stream=stream)
+        finally:
+            with self._lock:
+                self._in_flight[host] -= 1
+                self._last_used[host] = time.monotonic()
+
+    def close(self):
+        """Closes all the pooled connections. The transport can't be used after being closed
+
+        :return: None
+        """
+        with self._lock:
+            self._closed = True
+            if self._session is not None:
+                self._session.close()
+                self._session = None
+            self._last_used.clear()
+
+    @property
+    def closed(self):
+        return self._closed
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
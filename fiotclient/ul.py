@@ -0,0 +1,189 @@
+from itertools import chain
+
+from . import utils
+
+def format_value(value):
+    """Format a key or a value as a UL string
+
+    UltraLight 2.0 has no escape mechanism and the IoT Agent stores the values verbatim,
+    so a value containing one of the UL separators ('|' and '#') can't be sent without being split.
+
+    :param value: The value to be formatted
+    :return: The UL representation of the value
+    :raises ValueError: If the value contains a UL separator
+    """
+    value_str = str(value)
+    if '|' in value_str or '#' in value_str:
+        raise ValueError(f"UL values can't contain the separators '|' and '#': '{value_str}'")
+    return value_str
+
+
+def encode_group(group_measurements):
+    """Create a UL string from a measurements group dict
+
+    :param group_measurements: A dict representing a group of measurements, where the keys are the attribute
+                               names and the values are the measurements values for each attribute
+    :return: A string representing the measurement group
+    :raises ValueError: If a key or a value contains a UL separator
+    """
+    return '|'.join([f'{format_value(key)}|{format_value(value)}' for (key, value) in group_measurements.items()])
+
+
+def encode_measurements(measurements):
+    """Create a UL payload from a measurement group or a list of measurement groups
+
+    :param measurements: A measurement group (a dict where keys are device attributes and values are measurements
+                         for each attribute) or a list of measurement groups
+    :return: A string containing the UL payload
+    :raises ValueError: If a key or a value contains a UL separator
+    """
+    if isinstance(measurements, list):
+        return '#'.join([encode_group(measurement_group) for measurement_group in measurements])
+    return encode_group(measurements)
+
+
+def decode_measurements(payload):
+    """Parse a UL payload into its measurement groups.
+    A group with an odd number of fields starts with the timestamp of its measurements
+
+    :param payload: A string containing the UL payload
+    :return: A list of (timestamp, measurements) tuples, where timestamp is None if the group has no timestamp
+             and measurements is a dict of attribute names to string values
+    :raises ValueError: If a group has a key without a value
+    """
+    groups = []
+    for group in payload.strip().split('#'):
+        if not group:
+            continue
+
+        fields = group.split('|')
+        timestamp = None
+        if len(fields) % 2:
+            if len(fields) == 1:
+                raise ValueError(f"Measurement without value in UL group '{group}'")
+            timestamp = fields.pop(0)
+
+        groups.append((timestamp, {fields[index]: fields[index + 1] for index in range(0, len(fields), 2)}))
+    return groups
+
+
+def decode_commands(payload):
+    """Parse a UL command payload ('device_id@command|param|...'), which may hold several commands separated by '#'
+
+    :param payload: A string containing the UL command payload
+    :return: A list of (device_id, command, params) tuples, where params is a list of string values
+    :raises ValueError: If a command has no device id
+    """
+    commands = []
+    for command in payload.strip().split('#'):
+        if not command:
+            continue
+
+        fields = command.split('|')
+        device_id, separator, name = fields[0].partition('@')
+        if not separator:
+            raise ValueError(f"Command without device id in UL payload '{command}'")
+        commands.append((device_id, name, fields[1:]))
+    return commands
+
+
+def encode_command_result(device_id, command, result):
+    """Create the UL payload acknowledging the execution of a command
+
+    :param device_id: The id of the device which executed the command
+    :param command: The name of the executed command
+    :param result: The result of the command
+    :return: A string containing the UL command execution payload
+    :raises ValueError: If the result contains a UL separator
+    """
+    return f'{device_id}@{command}|{format_value(result)}'
+
+
+def _format_column(column, float_format):
+    """Auxiliary method to format all the values of a column as UL strings
+
+    :param column: A NumPy array or a sequence with the values of an attribute
+    :param float_format: The %-style format applied to float values, or None to use their shortest representation
+    :return: A list with the formatted values, where missing (None) values are kept as None
+    """
+    dtype = getattr(column, 'dtype', None)
+    if dtype is not None:
+        if dtype.kind in 'biu':
+            return column.astype(str).tolist()
+        if dtype.kind == 'f':
+            if float_format:
+                import numpy
+                return numpy.char.mod(float_format, column).tolist()
+            return column.astype(str).tolist()
+        column = column.tolist()
+
+    if float_format:
+        return [None if value is None else
+                float_format % value if isinstance(value, float) else format_value(value) for value in column]
+    return [None if value is None else format_value(value) for value in column]
+
+
+def _encode_rows(columns, start, stop, float_format):
+    """Auxiliary method to create the UL measurement groups of a range of rows
+
+    :param columns: A dict of attribute names to columns of values
+    :param start: The index of the first row of the range
+    :param stop: The index after the last row of the range
+    :param float_format: The %-style format applied to float values
+    :return: A list with the UL string of each row
+    """
+    attribute_columns = []
+    has_missing_values = False
+    for name, column in columns.items():
+        prefix = format_value(name) + '|'
+        values = _format_column(column[start:stop], float_format)
+        if None in values:
+            has_missing_values = True
+            attribute_columns.append([None if value is None else prefix + value for value in values])
+        else:
+            attribute_columns.append([prefix + value for value in values])
+
+    if has_missing_values:
+        groups = ('|'.join([attribute for attribute in row if attribute is not None])
+                  for row in zip(*attribute_columns))
+        return [group for group in groups if group]
+    return list(map('|'.join, zip(*attribute_columns)))
+
+
+def encode_columns(columns, rows=None, float_format=None, max_bytes=None, max_groups=None, block_size=10000):
+    """Create UL payloads from columnar measurements, where each row is a measurement group
+
+    The values are formatted a whole column at a time, which is much faster than creating a dict per row,
+    and the resulting groups are joined into multi-group payloads limited by size and number of groups.
+    Missing (None) values are left out of their group, and rows without any value are skipped.
+
+    :param columns: A dict of attribute names to NumPy arrays or sequences with the values of each attribute
+    :param rows: The number of rows to be encoded. If no value is provided, the length of the columns is used
+    :param float_format: The %-style format applied to float values (e.g. '%.2f').
+                         If no value is provided, the shortest representation of each float is used
+    :param max_bytes: The maximum size in bytes of each payload. A group bigger than this limit is sent alone.
+                      If no value is provided, payloads are only limited by the number of groups
+    :param max_groups: The maximum number of measurement groups on each payload.
+                       If neither this value nor max_bytes are provided, a single payload is created
+    :param block_size: The number of rows formatted at a time, which bounds the memory used
+    :return: A generator of UL payload strings
+    :raises ValueError: If the columns don't have the expected length, or an attribute name or a value
+                        contains a UL separator
+    """
+    lengths = {len(column) for column in columns.values()}
+    if rows is None:
+        if len(lengths) > 1:
+            raise ValueError("All columns must have the same length")
+        rows = lengths.pop() if lengths else 0
+    elif any(length < rows for length in lengths):
+        raise ValueError(f"All columns must have at least {rows} rows")
+
+    groups = chain.from_iterable(_encode_rows(columns, start, min(start + block_size, rows), float_format)
+                                 for start in range(0, rows, block_size))
+
+    def group_size(group):
+        return (len(group) if group.isascii() else len(group.encode('utf-8'))) + 1
+
+    for batch in utils.split_batches(groups, max_groups or float('inf'),
+                                     max_bytes=None if max_bytes is None else max_bytes + 1, size=group_size):
+        yield '#'.join(batch)
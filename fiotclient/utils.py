@@ -1,4 +1,7 @@
+import contextvars
 import json
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
 from .config import FiwareConfig
 
@@ -33,3 +36,104 @@ def parse_config_json(config_json_str: str) -> FiwareConfig:
 
 def parse_config_dict(config_dict: dict) -> FiwareConfig:
     return FiwareConfig(config_dict)
+
+
+def split_batches(items, max_items, max_bytes=None, size=len):
+    """Split items into consecutive batches limited both by the number of items and by their accumulated size
+
+    :param items: The iterable of items to be split
+    :param max_items: The maximum number of items in each batch
+    :param max_bytes: The maximum accumulated size of the items in each batch.
+                      An item bigger than this limit is placed alone in its own batch.
+                      If no value is provided, batches are only limited by the number of items
+    :param size: The function used to compute the size of each item
+    :return: A generator of lists of items
+    """
+    batch = []
+    batch_size = 0
+    for item in items:
+        item_size = size(item) if max_bytes is not None else 0
+        if batch and (len(batch) >= max_items or (max_bytes is not None and batch_size + item_size > max_bytes)):
+            yield batch
+            batch = []
+            batch_size = 0
+        batch.append(item)
+        batch_size += item_size
+
+    if batch:
+        yield batch
+
+
+def _submit(executor, function, *args):
+    """Auxiliary function to run a function on an executor within a copy of the caller context,
+    so that context variables (e.g. the selected tenant) are kept on the worker threads
+
+    :param executor: The executor running the function
+    :param function: The function to be run
+    :param args: The arguments of the function
+    :return: The future of the result
+    """
+    return executor.submit(contextvars.copy_context().run, function, *args)
+
+
+def bounded_map(function, items, max_workers):
+    """Apply a function to each item using a pool of threads, keeping at most max_workers calls in flight
+
+    :param function: The function to be applied to each item
+    :param items: The iterable of items. It is consumed lazily, as calls complete
+    :param max_workers: The maximum number of concurrent calls
+    :return: A generator of the results, in the same order as the items
+    """
+    if max_workers <= 1:
+        for item in items:
+            yield function(item)
+        return
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = deque()
+        for item in items:
+            if len(pending) >= max_workers:
+                yield pending.popleft().result()
+            pending.append(_submit(executor, function, item))
+
+        while pending:
+            yield pending.popleft().result()
+
+
+def iter_pages(fetch_page, page_size, prefetch=True, max_workers=1):
+    """Iterate over the items of a paginated resource, fetching the pages on demand
+
+    :param fetch_page: A function receiving an offset and a limit and returning a tuple with the list of items
+                       of the page and the total number of items (or None if the total is unknown)
+    :param page_size: The number of items requested on each page
+    :param prefetch: If the next page should be fetched while the items of the current one are consumed
+    :param max_workers: The maximum number of pages fetched at the same time once the total is known
+    :return: A generator of the items
+    """
+    items, total = fetch_page(0, page_size)
+
+    if total is not None and max_workers > 1:
+        yield from items
+        offsets = range(page_size, total, page_size)
+        for page_items, _ in bounded_map(lambda offset: fetch_page(offset, page_size), offsets, max_workers):
+            yield from page_items
+        return
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        offset = 0
+        while True:
+            next_offset = offset + page_size
+            has_more = bool(items) and (len(items) == page_size if total is None else next_offset < total)
+
+            next_page = None
+            if has_more and prefetch:
+                next_page = _submit(executor, fetch_page, next_offset, page_size)
+
+            yield from items
+
+            if not has_more:
+                return
+
+            items, page_total = next_page.result() if next_page else fetch_page(next_offset, page_size)
+            total = page_total if page_total is not None else total
+            offset = next_offset
@@ -30,12 +30,15 @@ setup(
         'Intended Audience :: Developers',
         'Topic :: Software Development :: Libraries',
         'License :: OSI Approved :: MIT License',
-        'Programming Language :: Python :: 3.6',
         'Programming Language :: Python :: 3.7',
     ],
     keywords='fiware api iot things context development',
     py_modules=["fiotclient"],
     install_requires=['requests', 'paho-mqtt'],
+    extras_require={
+        'async': ['aiohttp'],
+        'fast': ['orjson'],
+    },
     test_suite='tests',
-    python_requires='>=3.6, <4',
+    python_requires='>=3.7, <4',
 )
@@ -1,9 +1,30 @@
+import json
+import os
 import unittest
 from os.path import dirname, realpath, join
 
 from fiotclient.context import FiwareContextClient
+from fiotclient.emulator import FiwareEmulator
 from fiotclient.iot import FiwareIotClient
 
+_emulator = None
+
+
+def _stack_config():
+    """Get the configuration of the FIWARE stack used by the tests: the one on config.json when the
+    FIOT_LIVE_TESTS environment variable is set, or an in-process emulator started on first use otherwise"""
+    global _emulator
+
+    with open(join(TestCommonMethods.files_dir_path, 'config.json')) as config_file:
+        config = json.load(config_file)
+
+    if os.environ.get('FIOT_LIVE_TESTS'):
+        return config
+
+    if _emulator is None:
+        _emulator = FiwareEmulator().start()
+    return _emulator.config_dict(config)
+
 
 class TestCommonMethods(unittest.TestCase):
 
@@ -11,8 +32,8 @@ class TestCommonMethods(unittest.TestCase):
 
     def __init__(self, method_name):
         super().__init__(methodName=method_name)
-        self.context_client = FiwareContextClient.from_config_file(TestCommonMethods._build_file_path('config.json'))
-        self.iot_client = FiwareIotClient.from_config_file(TestCommonMethods._build_file_path('config.json'))
+        self.context_client = FiwareContextClient.from_config_dict(_stack_config())
+        self.iot_client = FiwareIotClient.from_config_dict(_stack_config())
 
     def setUp(self):
         self._remove_all_entities()
@@ -29,7 +50,7 @@ class TestCommonMethods(unittest.TestCase):
 
     @staticmethod
     def _remove_all_entities():
-        context_client = FiwareContextClient.from_config_file(TestCommonMethods._build_file_path('config.json'))
+        context_client = FiwareContextClient.from_config_dict(_stack_config())
         response = context_client.get_entities()
         data = response['response']
 
@@ -38,8 +59,8 @@ class TestCommonMethods(unittest.TestCase):
 
     @staticmethod
     def _remove_all_devices():
-        iot_client = FiwareIotClient.from_config_file(TestCommonMethods._build_file_path('config.json'))
-        context_client = FiwareContextClient.from_config_file(TestCommonMethods._build_file_path('config.json'))
+        iot_client = FiwareIotClient.from_config_dict(_stack_config())
+        context_client = FiwareContextClient.from_config_dict(_stack_config())
 
         response = iot_client.list_devices()
         data = response['response']
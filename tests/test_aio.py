@@ -0,0 +1,136 @@
+import json
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from fiotclient.aio import AsyncFiwareContextClient, AsyncFiwareIotClient, AsyncHttpTransport, aiter_pages
+
+
+class _RecordingHandler(BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+    requests = []
+
+    def _reply(self):
+        length = int(self.headers.get('Content-Length', 0))
+        body = self.rfile.read(length).decode()
+        self.requests.append((self.command, self.path, dict(self.headers), body))
+
+        status = 201 if self.command == 'POST' else 200
+        response = json.dumps([{'id': 'ROOM_001', 'type': 'Room'}]).encode() if self.command == 'GET' else b''
+
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(response)))
+        self.end_headers()
+        self.wfile.write(response)
+
+    do_GET = do_POST = do_DELETE = _reply
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestAsyncClients(unittest.IsolatedAsyncioTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), _RecordingHandler)
+        cls.server.daemon_threads = True
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+        port = cls.server.server_address[1]
+        cls.config = {
+            'fiwareService': 'Test',
+            'fiwareServicePath': '/testService',
+            'contextBroker': {'host': '127.0.0.1', 'port': port},
+            'iota': {'host': '127.0.0.1', 'northPort': port, 'protocolPort': port, 'apiKey': 'key'}
+        }
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        _RecordingHandler.requests.clear()
+
+    async def test_create_and_get_entities(self):
+        async with AsyncFiwareContextClient.from_config_dict(self.config) as context_client:
+            response = await context_client.create_entity('{"id": "[ENTITY_ID]", "type": "[ENTITY_TYPE]"}',
+                                                          'Room', 'ROOM_001')
+            self.assertEqual(response['status_code'], 201)
+
+            response = await context_client.get_entities(entity_type='Room')
+            self.assertEqual(response['status_code'], 200)
+            self.assertEqual(response['response'][0]['id'], 'ROOM_001')
+
+        method, path, headers, body = _RecordingHandler.requests[0]
+        self.assertEqual((method, path), ('POST', '/v2/entities'))
+        self.assertEqual(headers['Fiware-Service'], 'Test')
+        self.assertEqual(json.loads(body), {'id': 'ROOM_001', 'type': 'Room'})
+
+    async def test_send_observation_http(self):
+        async with AsyncFiwareIotClient.from_config_dict(self.config) as iot_client:
+            response = await iot_client.send_observation('DEVICE_001', {'t': 23, 'h': 40}, protocol='HTTP')
+            self.assertEqual(response, {'result': 'OK'})
+
+        method, path, headers, body = _RecordingHandler.requests[0]
+        self.assertEqual((method, path), ('POST', '/iot/d?k=key&i=DEVICE_001'))
+        self.assertEqual(body, 't|23|h|40')
+
+    async def test_shared_transport(self):
+        async with AsyncHttpTransport() as transport:
+            context_client = AsyncFiwareContextClient.from_config_dict(self.config, transport=transport)
+            iot_client = AsyncFiwareIotClient.from_config_dict(self.config, transport=transport)
+
+            await context_client.remove_entity('Room', 'ROOM_001')
+            await iot_client.remove_device('DEVICE_001')
+            await context_client.close()
+            self.assertFalse(transport.closed)
+
+        self.assertTrue(transport.closed)
+        self.assertEqual([request[0] for request in _RecordingHandler.requests], ['DELETE', 'DELETE'])
+
+    async def test_batch_update(self):
+        entities = [{'id': f'ROOM_{i:03}', 'type': 'Room'} for i in range(5)]
+
+        async with AsyncFiwareContextClient.from_config_dict(self.config) as context_client:
+            results = await context_client.create_entities(entities, max_entities=2, max_concurrency=2)
+
+        self.assertEqual([len(result['entities']) for result in results], [2, 2, 1])
+        self.assertEqual(len(_RecordingHandler.requests), 3)
+
+        method, path, headers, body = _RecordingHandler.requests[0]
+        self.assertEqual((method, path), ('POST', '/v2/op/update'))
+        self.assertEqual(json.loads(body)['actionType'], 'appendStrict')
+
+    async def test_register_devices(self):
+        device_schema = '{"devices": [{"device_id": "[DEVICE_ID]", "entity_name": "[ENTITY_ID]"}]}'
+        devices = [(f'DEVICE_{i:03}', f'ENTITY_{i:03}') for i in range(5)]
+
+        async with AsyncFiwareIotClient.from_config_dict(self.config) as iot_client:
+            result = await iot_client.register_devices(devices, device_schema, max_devices=3)
+
+        self.assertEqual(result['registered'], [device_id for device_id, _ in devices])
+        self.assertEqual(len(_RecordingHandler.requests), 2)
+
+        sent_devices = []
+        for method, path, headers, body in _RecordingHandler.requests:
+            self.assertEqual(path, '/iot/devices?protocol=IoTA-UL')
+            sent_devices += json.loads(body)['devices']
+        self.assertIn({'device_id': 'DEVICE_000', 'entity_name': 'ENTITY_000'}, sent_devices)
+
+    async def test_aiter_pages(self):
+        items = list(range(23))
+
+        async def fetch_page(offset, limit):
+            return items[offset:offset + limit], len(items)
+
+        self.assertEqual([item async for item in aiter_pages(fetch_page, 5)], items)
+        self.assertEqual([item async for item in aiter_pages(fetch_page, 5, max_concurrency=3)], items)
+
+    async def test_connection_error(self):
+        config = dict(self.config, contextBroker={'host': '127.0.0.1', 'port': 1})
+        async with AsyncFiwareContextClient.from_config_dict(config) as context_client:
+            response = await context_client.list_subscriptions()
+        self.assertEqual(response['status_code'], 0)
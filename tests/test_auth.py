@@ -0,0 +1,188 @@
+import asyncio
+import json
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from fiotclient.aio import AsyncFiwareContextClient
+from fiotclient.auth import TokenManager, _parse_expiration
+from fiotclient.context import FiwareContextClient
+
+
+class _KeystoneHandler(BaseHTTPRequestHandler):
+    """Issues tokens on the tokens API and only accepts the last issued token on the other requests"""
+
+    protocol_version = 'HTTP/1.1'
+
+    def _send(self, status, body):
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        credentials = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        if credentials['auth']['passwordCredentials'] != {'username': 'user', 'password': 'secret'}:
+            self._send(401, b'{}')
+            return
+
+        time.sleep(0.05)
+        with self.server.lock:
+            self.server.issued += 1
+            self.server.valid_token = f'token-{self.server.issued}'
+            token = {'id': self.server.valid_token, 'expires': '2099-01-01T00:00:00.000Z'}
+        self._send(200, json.dumps({'access': {'token': token}}).encode('utf-8'))
+
+    def do_GET(self):
+        with self.server.lock:
+            self.server.received_tokens.append(self.headers.get('X-Auth-Token'))
+            valid = self.headers.get('X-Auth-Token') == self.server.valid_token
+        self._send(200 if valid else 401, b'[]' if valid else b'{"error": "Unauthorized"}')
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _TokenSource(object):
+
+    def __init__(self, lifetime, delay=0.0, fail=False):
+        self.lifetime = lifetime
+        self.delay = delay
+        self.fail = fail
+        self.calls = 0
+
+    def __call__(self):
+        time.sleep(self.delay)
+        self.calls += 1
+        if self.fail:
+            raise ValueError("Authentication system unavailable")
+        return f'token-{self.calls}', time.time() + self.lifetime
+
+
+class TestTokenManager(unittest.TestCase):
+
+    def test_parse_expiration(self):
+        self.assertEqual(_parse_expiration('2015-07-01T12:00:00Z'), 1435752000)
+        self.assertEqual(_parse_expiration('2015-07-01T12:00:00.000Z'), 1435752000)
+        self.assertIsNone(_parse_expiration(None))
+        with self.assertLogs(level='ERROR'):
+            self.assertIsNone(_parse_expiration('tomorrow'))
+
+    def test_single_refresh(self):
+        source = _TokenSource(lifetime=3600, delay=0.05)
+        token_manager = TokenManager(source)
+
+        with ThreadPoolExecutor(max_workers=10) as executor:
+            tokens = set(executor.map(lambda _: token_manager.get_token(), range(10)))
+
+        self.assertEqual(tokens, {'token-1'})
+        self.assertEqual(source.calls, 1)
+
+    def test_proactive_refresh(self):
+        source = _TokenSource(lifetime=5)
+        token_manager = TokenManager(source, refresh_margin=10)
+        self.assertEqual(token_manager.get_token(), 'token-1')
+
+        # The token is close to expiry: it is still returned while a new one is requested in the background
+        self.assertEqual(token_manager.get_token(), 'token-1')
+        time.sleep(0.05)
+        self.assertEqual(token_manager.token, 'token-2')
+
+    def test_failed_refresh(self):
+        source = _TokenSource(lifetime=5, fail=True)
+        token_manager = TokenManager(source)
+        with self.assertRaises(ValueError):
+            token_manager.get_token()
+
+        source.fail = False
+        token_manager.get_token()
+
+        # A failed background refresh keeps the current token
+        token_manager.refresh_margin = 10
+        source.fail = True
+        with self.assertLogs(level='ERROR'):
+            self.assertEqual(token_manager.get_token(), 'token-2')
+            time.sleep(0.05)
+        self.assertEqual(token_manager.get_token(), 'token-2')
+
+    def test_invalidate(self):
+        source = _TokenSource(lifetime=3600)
+        token_manager = TokenManager(source)
+        token_manager.get_token()
+
+        token_manager.invalidate('token-1')
+        self.assertEqual(token_manager.get_token(), 'token-2')
+        token_manager.invalidate('token-1')
+        self.assertEqual(token_manager.get_token(), 'token-2')
+
+    def test_async_refresh(self):
+        source = _TokenSource(lifetime=3600, delay=0.05)
+        token_manager = TokenManager(source)
+
+        async def get_tokens():
+            return await asyncio.gather(*(token_manager.get_token_async() for _ in range(5)))
+
+        self.assertEqual(asyncio.run(get_tokens()), ['token-1'] * 5)
+        self.assertEqual(source.calls, 1)
+
+
+class TestClientAuthentication(unittest.TestCase):
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), _KeystoneHandler)
+        self.server.daemon_threads = True
+        self.server.lock = threading.Lock()
+        self.server.issued = 0
+        self.server.valid_token = None
+        self.server.received_tokens = []
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+        port = self.server.server_address[1]
+        self.tokens_url = f'http://127.0.0.1:{port}/v2.0/tokens'
+        self.config = {'contextBroker': {'host': '127.0.0.1', 'port': port}}
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_renew_on_unauthorized(self):
+        with FiwareContextClient.from_config_dict(self.config) as context_client:
+            token, expires_at = context_client.authenticate('user', 'secret', tokens_url=self.tokens_url)
+            self.assertEqual((token, expires_at), ('token-1', 4070908800))
+            self.assertEqual(context_client.get_entities()['status_code'], 200)
+
+            # The token is revoked by the platform
+            self.server.valid_token = 'token-revoked'
+            with ThreadPoolExecutor(max_workers=8) as executor:
+                responses = list(executor.map(lambda _: context_client.get_entities(), range(8)))
+
+        self.assertEqual([response['status_code'] for response in responses], [200] * 8)
+        self.assertEqual(self.server.issued, 2)
+        self.assertEqual(self.server.received_tokens[0], 'token-1')
+        self.assertEqual(self.server.received_tokens[-1], 'token-2')
+
+    def test_rejected_credentials(self):
+        with FiwareContextClient.from_config_dict(self.config) as context_client:
+            with self.assertRaises(Exception):
+                context_client.authenticate('user', 'wrong', tokens_url=self.tokens_url)
+
+            with self.assertLogs(level='ERROR'):
+                response = context_client.get_entities()
+        self.assertIn('Authentication failed', response['error'])
+
+    def test_async_authentication(self):
+        async def get_entities():
+            async with AsyncFiwareContextClient.from_config_dict(self.config) as context_client:
+                await context_client.authenticate('user', 'secret', tokens_url=self.tokens_url)
+                self.server.valid_token = 'token-revoked'
+                return await context_client.get_entities()
+
+        self.assertEqual(asyncio.run(get_entities())['status_code'], 200)
+        self.assertEqual(self.server.received_tokens, ['token-1', 'token-2'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from fiotclient.buffer import ObservationBuffer
+from fiotclient.iot import FiwareIotClient
+
+
+class _UlHandler(BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+    payloads = []
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        self.payloads.append(self.rfile.read(length).decode())
+        self.send_response(200)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestObservationBuffer(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), _UlHandler)
+        cls.server.daemon_threads = True
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+        config = {'iota': {'host': '127.0.0.1', 'protocolPort': cls.server.server_address[1], 'apiKey': 'key'}}
+        cls.iot_client = FiwareIotClient.from_config_dict(config)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.iot_client.close()
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        _UlHandler.payloads.clear()
+
+    def test_flush_on_max_groups(self):
+        with ObservationBuffer(self.iot_client, protocol='HTTP', max_groups=3, max_linger=None) as buffer:
+            for i in range(7):
+                buffer.add('DEVICE_001', {'t': i})
+            self.assertEqual(_UlHandler.payloads, ['t|0#t|1#t|2', 't|3#t|4#t|5'])
+            self.assertEqual(buffer.pending_groups, 1)
+
+        self.assertEqual(_UlHandler.payloads[-1], 't|6')
+        self.assertEqual(buffer.sent_groups, 7)
+
+    def test_flush_on_max_bytes(self):
+        with ObservationBuffer(self.iot_client, protocol='HTTP', max_bytes=10, max_linger=None) as buffer:
+            buffer.add('DEVICE_001', [{'t': 10}, {'t': 11}, {'t': 12}])
+
+        self.assertEqual(_UlHandler.payloads, ['t|10#t|11', 't|12'])
+
+    def test_flush_on_linger(self):
+        with ObservationBuffer(self.iot_client, protocol='HTTP', max_linger=0.05) as buffer:
+            buffer.add('DEVICE_001', {'t': 1})
+            buffer.add('DEVICE_002', {'h': 2})
+
+            deadline = time.monotonic() + 2
+            while len(_UlHandler.payloads) < 2 and time.monotonic() < deadline:
+                time.sleep(0.01)
+
+            self.assertEqual(sorted(_UlHandler.payloads), ['h|2', 't|1'])
+            self.assertEqual(buffer.pending_groups, 0)
+
+    def test_concurrent_add(self):
+        with ObservationBuffer(self.iot_client, protocol='HTTP', max_groups=5, max_linger=None) as buffer:
+            threads = [threading.Thread(target=lambda: [buffer.add('DEVICE_001', {'t': 1}) for _ in range(20)])
+                       for _ in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(sum(payload.count('#') + 1 for payload in _UlHandler.payloads), 80)
+
+    def test_closed_buffer(self):
+        buffer = ObservationBuffer(self.iot_client, protocol='HTTP')
+        buffer.close()
+        self.assertRaises(RuntimeError, buffer.add, 'DEVICE_001', {'t': 1})
@@ -0,0 +1,114 @@
+import json
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from fiotclient.cache import TTLCache
+from fiotclient.context import FiwareContextClient
+from fiotclient.iot import FiwareIotClient
+
+
+class _EntityHandler(BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+    requests = []
+
+    def _reply(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self.requests.append((self.command, self.path))
+
+        body = json.dumps({'id': 'ROOM_001', 'type': 'Room'}).encode() if self.command == 'GET' else b''
+        self.send_response(200 if self.command == 'GET' else 204)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_GET = do_POST = do_DELETE = _reply
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestTTLCache(unittest.TestCase):
+
+    def test_lru_eviction(self):
+        cache = TTLCache(maxsize=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        self.assertEqual(cache.get('a'), 1)
+        cache.set('c', 3)
+
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(cache.get('c'), 3)
+        self.assertEqual(cache.stats()['evictions'], 1)
+
+    def test_expiration(self):
+        cache = TTLCache(ttl=0.05)
+        cache.set('a', 1)
+        self.assertEqual(cache.get('a'), 1)
+        time.sleep(0.1)
+        self.assertIsNone(cache.get('a'))
+
+        stats = cache.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['expirations'], stats['size']), (1, 1, 1, 0))
+
+
+class TestClientCache(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), _EntityHandler)
+        cls.server.daemon_threads = True
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+        port = cls.server.server_address[1]
+        cls.config = {
+            'fiwareService': 'Test',
+            'fiwareServicePath': '/testService',
+            'contextBroker': {'host': '127.0.0.1', 'port': port},
+            'iota': {'host': '127.0.0.1', 'northPort': port}
+        }
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        _EntityHandler.requests.clear()
+
+    def test_entity_lookup_cached(self):
+        cache = TTLCache()
+        with FiwareContextClient.from_config_dict(self.config, cache=cache) as context_client:
+            for _ in range(3):
+                response = context_client.get_entity_by_id('ROOM_001', 'Room')
+                self.assertEqual(response['response']['id'], 'ROOM_001')
+            self.assertEqual(len(_EntityHandler.requests), 1)
+
+            context_client.remove_entity('Room', 'ROOM_001')
+            context_client.get_entity_by_id('ROOM_001', 'Room')
+            self.assertEqual(len(_EntityHandler.requests), 3)
+
+            context_client.create_entities([{'id': 'ROOM_001', 'type': 'Room'}])
+            context_client.get_entity_by_id('ROOM_001', 'Room')
+            self.assertEqual(len(_EntityHandler.requests), 5)
+
+        self.assertEqual(cache.stats()['hits'], 2)
+
+    def test_cache_keyed_by_service(self):
+        with FiwareContextClient.from_config_dict(self.config, cache=TTLCache()) as context_client:
+            context_client.get_entity_by_id('ROOM_001', 'Room')
+            context_client.set_service('Other', '/')
+            context_client.get_entity_by_id('ROOM_001', 'Room')
+        self.assertEqual(len(_EntityHandler.requests), 2)
+
+    def test_device_lookup_cached(self):
+        with FiwareIotClient.from_config_dict(self.config, cache=TTLCache()) as iot_client:
+            iot_client.get_device_by_id('DEVICE_001')
+            iot_client.get_device_by_id('DEVICE_001')
+            iot_client.remove_device('DEVICE_001')
+            iot_client.get_device_by_id('DEVICE_001')
+
+        self.assertEqual([method for method, _ in _EntityHandler.requests], ['GET', 'DELETE', 'GET'])
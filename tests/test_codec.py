@@ -0,0 +1,66 @@
+import unittest
+
+from fiotclient import codec
+from fiotclient.codec import JsonCodec, OrjsonCodec
+from fiotclient.response import Response
+
+
+class _CountingCodec(JsonCodec):
+
+    def __init__(self):
+        self.decoded = 0
+
+    def loads(self, data):
+        self.decoded += 1
+        return super(_CountingCodec, self).loads(data)
+
+
+class TestCodecs(unittest.TestCase):
+
+    def test_json_codec(self):
+        json_codec = JsonCodec()
+        self.assertEqual(json_codec.dumps({'id': 'ROOM_001', 'values': [1, 2]}), '{"id":"ROOM_001","values":[1,2]}')
+        self.assertIn('\n    "id"', json_codec.dumps({'id': 'ROOM_001'}, compact=False))
+        self.assertEqual(json_codec.loads('{"temperatura": "25ºC"}'.encode('utf-8')), {'temperatura': '25ºC'})
+
+    @unittest.skipIf(codec.orjson is None, "orjson is not installed")
+    def test_orjson_codec(self):
+        orjson_codec = OrjsonCodec()
+        self.assertEqual(orjson_codec.dumps({'id': 'ROOM_001', 'values': [1, 2]}), b'{"id":"ROOM_001","values":[1,2]}')
+        self.assertEqual(orjson_codec.loads(b'{"temperatura": "25\xc2\xbaC"}'), {'temperatura': '25ºC'})
+        self.assertIsInstance(codec.default_codec(), OrjsonCodec)
+
+
+class TestResponse(unittest.TestCase):
+
+    def test_lazy_decoding(self):
+        counting_codec = _CountingCodec()
+        response = Response(200, {'Fiware-Total-Count': '1'}, b'[{"id": "ROOM_001"}]', counting_codec)
+
+        self.assertEqual(response['status_code'], 200)
+        self.assertEqual(response.get('headers'), {'Fiware-Total-Count': '1'})
+        self.assertIn('response', response)
+        self.assertEqual(counting_codec.decoded, 0)
+
+        self.assertEqual(response['response'], [{'id': 'ROOM_001'}])
+        self.assertEqual(response['response'][0]['id'], 'ROOM_001')
+        self.assertEqual(counting_codec.decoded, 1)
+
+    def test_mapping_behaviour(self):
+        response = Response(201, {}, b'', JsonCodec())
+        response['api_key'] = 'abc'
+
+        self.assertEqual(response, {'status_code': 201, 'headers': {}, 'response': {}, 'api_key': 'abc'})
+        self.assertEqual(dict(response)['api_key'], 'abc')
+
+        response['response'] = {'replaced': True}
+        self.assertEqual(response['response'], {'replaced': True})
+
+    def test_invalid_body(self):
+        with self.assertLogs(level='ERROR'):
+            response = Response(500, {}, b'<html>Internal error</html>', JsonCodec())
+            self.assertEqual(response['response'], {})
+
+
+if __name__ == '__main__':
+    unittest.main()
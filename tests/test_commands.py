@@ -0,0 +1,102 @@
+import json
+import threading
+import time
+import unittest
+
+from fiotclient.commands import CommandDispatcher
+from fiotclient.context import FiwareContextClient
+from fiotclient.emulator import FiwareEmulator, MqttBrokerEmulator
+from fiotclient.iot import FiwareIotClient
+from fiotclient.utils import parse_config_dict
+
+LED_SCHEMA = json.dumps({'devices': [{
+    'device_id': '[DEVICE_ID]',
+    'entity_name': '[ENTITY_ID]',
+    'entity_type': 'thing',
+    'transport': 'MQTT',
+    'apikey': 'key',
+    'commands': [{'name': 'switch', 'type': 'command'}, {'name': 'blink', 'type': 'command'}]
+}]})
+
+
+class TestCommandDispatcher(unittest.TestCase):
+
+    def setUp(self):
+        self.emulator = FiwareEmulator().start()
+        self.broker = MqttBrokerEmulator(fiware_emulator=self.emulator).start()
+        config = self.emulator.config_dict({'fiwareService': 'smartcity', 'fiwareServicePath': '/',
+                                            'iota': {'apiKey': 'key'}})
+        self.context_client = FiwareContextClient.from_config_dict(config)
+        self.iot_client = FiwareIotClient.from_config_dict(config)
+        self.iot_client.register_devices([(f'LED_{i}', f'TEST_LED_{i}') for i in range(20)], LED_SCHEMA)
+
+        self.dispatcher = CommandDispatcher.from_config(parse_config_dict(config), workers=4)
+
+    def tearDown(self):
+        self.dispatcher.close()
+        self.context_client.close()
+        self.iot_client.close()
+        self.broker.stop()
+        self.emulator.stop()
+
+    def _wait_for_attribute(self, entity_id, name, value):
+        deadline = time.monotonic() + 5
+        while time.monotonic() < deadline:
+            entity = self.context_client.get_entity_by_id(entity_id, 'thing')['response']
+            if entity.get(name, {}).get('value') == value:
+                return entity
+            time.sleep(0.01)
+        self.fail(f"Attribute {name} of {entity_id} was not set to {value}")
+
+    def test_dispatch_and_acknowledge(self):
+        received = []
+        lock = threading.Lock()
+
+        @self.dispatcher.handler('switch')
+        def switch(device_id, command, params):
+            with lock:
+                received.append((device_id, params))
+            return f'switched {params[0]}'
+
+        self.assertTrue(self.dispatcher.start(timeout=5))
+
+        for i in range(20):
+            self.iot_client.send_command(f'TEST_LED_{i}', f'LED_{i}', 'switch', {'state': 'ON'})
+
+        for i in range(20):
+            entity = self._wait_for_attribute(f'TEST_LED_{i}', 'switch_status', 'OK')
+            self.assertEqual(entity['switch_info']['value'], 'switched ON')
+
+        self.assertEqual(sorted(received), sorted((f'LED_{i}', ['ON']) for i in range(20)))
+        stats = self.dispatcher.stats()
+        self.assertEqual((stats['received'], stats['executed'], stats['acknowledged']), (20, 20, 20))
+
+    def test_handler_lookup_and_failures(self):
+        self.dispatcher.add_handler(lambda device_id, command, params: 'led 0', device_id='LED_0')
+        self.dispatcher.add_handler(lambda device_id, command, params: 1 / 0, command='blink', device_id='LED_1')
+
+        self.assertTrue(self.dispatcher.start(timeout=5))
+
+        self.iot_client.send_command('TEST_LED_0', 'LED_0', 'blink', {'times': 3})
+        self._wait_for_attribute('TEST_LED_0', 'blink_info', 'led 0')
+
+        with self.assertLogs(level='ERROR'):
+            self.iot_client.send_command('TEST_LED_1', 'LED_1', 'blink', {'times': 3})
+            entity = self._wait_for_attribute('TEST_LED_1', 'blink_status', 'OK')
+        self.assertEqual(entity['blink_info']['value'], 'ERROR: division by zero')
+
+        # Commands without handler are not acknowledged
+        with self.assertLogs(level='WARNING'):
+            self.iot_client.send_command('TEST_LED_2', 'LED_2', 'switch', {'state': 'ON'})
+            deadline = time.monotonic() + 5
+            while self.dispatcher.stats()['unhandled'] == 0 and time.monotonic() < deadline:
+                time.sleep(0.01)
+
+        stats = self.dispatcher.stats()
+        self.assertEqual((stats['failed'], stats['unhandled'], stats['acknowledged']), (1, 1, 2))
+        entity = self.context_client.get_entity_by_id('TEST_LED_2', 'thing')['response']
+        self.assertEqual(entity['switch_status']['value'], 'PENDING')
+
+
+if __name__ == '__main__':
+    unittest.main()
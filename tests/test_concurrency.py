@@ -0,0 +1,173 @@
+import asyncio
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from fiotclient.concurrency import AdaptiveLimiter, ConcurrencyLimiterRegistry
+from fiotclient.context import FiwareContextClient
+
+
+class _SlowHandler(BaseHTTPRequestHandler):
+    """Replies after a short delay with the status code of the server, keeping track of the simultaneous requests"""
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        with self.server.lock:
+            self.server.in_flight += 1
+            self.server.max_in_flight = max(self.server.max_in_flight, self.server.in_flight)
+        time.sleep(0.02)
+        with self.server.lock:
+            self.server.in_flight -= 1
+
+        body = b'{"id": "ROOM_001", "type": "Room"}'
+        self.send_response(self.server.status)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestAdaptiveLimiter(unittest.TestCase):
+
+    def test_additive_increase(self):
+        limiter = AdaptiveLimiter(initial_limit=4, max_limit=6)
+        for _ in range(100):
+            for _ in range(limiter.limit):
+                limiter.acquire()
+            for _ in range(limiter.in_flight):
+                limiter.release(0.01, 200)
+
+        self.assertEqual(limiter.limit, 6)
+        self.assertEqual(limiter.in_flight, 0)
+
+    def test_no_increase_when_unused(self):
+        limiter = AdaptiveLimiter(initial_limit=10)
+        for _ in range(100):
+            limiter.acquire()
+            limiter.release(0.01, 200)
+        self.assertEqual(limiter.limit, 10)
+
+    def test_multiplicative_decrease(self):
+        limiter = AdaptiveLimiter(initial_limit=20, min_limit=5, backoff_ratio=0.5)
+        limiter.acquire()
+        limiter.release(1.0, 200)
+
+        for status_code in (503, 0, 429):
+            limiter.acquire()
+            limiter.acquire()
+            limiter.release(1.0, status_code)
+            limiter.release(1.0, status_code)
+        # Failures within the same round trip only decrease the limit once
+        self.assertEqual(limiter.limit, 10)
+
+        limiter.acquire()
+        limiter.release(0.01, 200)
+        limiter.acquire()
+        time.sleep(0.02)
+        limiter.release(0.5, 200)
+        self.assertEqual(limiter.limit, 5)
+
+        limiter.acquire()
+        time.sleep(0.02)
+        limiter.release(1.0, 503)
+        self.assertEqual(limiter.limit, 5)
+
+    def test_blocks_threads(self):
+        limiter = AdaptiveLimiter(initial_limit=2, max_limit=2)
+        lock = threading.Lock()
+        counters = {'in_flight': 0, 'max_in_flight': 0}
+
+        def task(_):
+            limiter.acquire()
+            with lock:
+                counters['in_flight'] += 1
+                counters['max_in_flight'] = max(counters['max_in_flight'], counters['in_flight'])
+            time.sleep(0.01)
+            with lock:
+                counters['in_flight'] -= 1
+            limiter.release(0.01, 200)
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            list(executor.map(task, range(40)))
+
+        self.assertEqual(counters['max_in_flight'], 2)
+        self.assertEqual(limiter.in_flight, 0)
+
+
+class TestAsyncAdaptiveLimiter(unittest.IsolatedAsyncioTestCase):
+
+    async def test_waits_without_blocking(self):
+        limiter = AdaptiveLimiter(initial_limit=1, max_limit=1)
+        limiter.acquire()
+
+        waiting = asyncio.ensure_future(limiter.acquire_async())
+        await asyncio.sleep(0.01)
+        self.assertFalse(waiting.done())
+
+        # A slot freed by another thread wakes up the waiting task
+        threading.Thread(target=limiter.release, args=(0.01, 200)).start()
+        await asyncio.wait_for(waiting, 1)
+        self.assertEqual(limiter.in_flight, 1)
+
+    async def test_cancelled_waiter(self):
+        limiter = AdaptiveLimiter(initial_limit=1, max_limit=1)
+        await limiter.acquire_async()
+
+        cancelled = asyncio.ensure_future(limiter.acquire_async())
+        waiting = asyncio.ensure_future(limiter.acquire_async())
+        await asyncio.sleep(0.01)
+        cancelled.cancel()
+
+        limiter.release(0.01, 200)
+        await asyncio.wait_for(waiting, 1)
+        self.assertEqual(limiter.in_flight, 1)
+
+
+class TestClientConcurrency(unittest.TestCase):
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), _SlowHandler)
+        self.server.daemon_threads = True
+        self.server.lock = threading.Lock()
+        self.server.in_flight = self.server.max_in_flight = 0
+        self.server.status = 200
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+        self.config = {'contextBroker': {'host': '127.0.0.1', 'port': self.server.server_address[1]}}
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_shared_limit(self):
+        concurrency = ConcurrencyLimiterRegistry(initial_limit=3, max_limit=3)
+        clients = [FiwareContextClient.from_config_dict(self.config, concurrency=concurrency) for _ in range(2)]
+
+        def task(index):
+            return clients[index % 2].get_entities_by_type('Room')['status_code']
+
+        with ThreadPoolExecutor(max_workers=12) as executor:
+            self.assertEqual(set(executor.map(task, range(36))), {200})
+        for client in clients:
+            client.close()
+
+        self.assertLessEqual(self.server.max_in_flight, 3)
+        self.assertIn(concurrency.limits()['orion'], (1, 2, 3))
+
+    def test_backoff_on_overload(self):
+        self.server.status = 503
+        concurrency = ConcurrencyLimiterRegistry(initial_limit=16, backoff_ratio=0.5)
+        with FiwareContextClient.from_config_dict(self.config, concurrency=concurrency) as context_client:
+            for _ in range(3):
+                self.assertEqual(context_client.get_entities_by_type('Room')['status_code'], 503)
+
+        self.assertEqual(concurrency.limits(), {'orion': 2})
+
+
+if __name__ == '__main__':
+    unittest.main()
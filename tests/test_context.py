@@ -113,6 +113,16 @@ class TestContextMethods(TestCommonMethods):
             self.assertIn(entity['id'], entities_ids)
             self.assertEqual(entity['type'], 'Room')
 
+    def test_iter_entities(self):
+        entities = [{'id': f'ROOM_{i:03}', 'type': 'Room'} for i in range(25)]
+        self.context_client.create_entities(entities)
+
+        entities_ids = [entity['id'] for entity in self.context_client.iter_entities(entity_type='Room', page_size=10)]
+        self.assertEqual(sorted(entities_ids), [entity['id'] for entity in entities])
+
+        entities_ids = [entity['id'] for entity in self.context_client.iter_entities(page_size=7, max_concurrency=3)]
+        self.assertEqual(len(entities_ids), 25)
+
     def test_get_nonexistent_entity(self):
         response = self.context_client.get_entity_by_id('NON_EXIST', 'NonexistentType')
         self.assertEqual(response['status_code'], 404)
@@ -181,6 +191,52 @@ class TestContextMethods(TestCommonMethods):
             self.assertIn(entity['id'], cars_entities_ids)
             self.assertEqual(entity['type'], 'Car')
 
+    def test_create_entities(self):
+        entities = [{'id': f'ROOM_{i:03}', 'type': 'Room', 'temperature': {'value': i, 'type': 'Float'}}
+                    for i in range(1, 6)]
+
+        results = self.context_client.create_entities(entities, max_entities=2)
+        self.assertEqual(len(results), 3)
+        for result in results:
+            self.assertEqual(result['status_code'], 204)
+        self.assertEqual([entity['id'] for entity in results[2]['entities']], ['ROOM_005'])
+
+        response = self.context_client.get_entities(entity_type='Room')
+        self.assertEqual(len(response['response']), 5)
+
+        results = self.context_client.create_entities(entities[:1])
+        self.assertNotEqual(results[0]['status_code'], 204)
+
+    def test_upsert_entities(self):
+        self.context_client.create_entity_from_file(self._build_file_path('ROOM.json'), 'Room', 'ROOM_001')
+
+        entities = [{'id': 'ROOM_001', 'type': 'Room', 'temperature': {'value': 30, 'type': 'Float'}},
+                    {'id': 'ROOM_002', 'type': 'Room', 'temperature': {'value': 31, 'type': 'Float'}}]
+
+        results = self.context_client.upsert_entities(entities)
+        self.assertEqual(len(results), 1)
+        self.assertEqual(results[0]['status_code'], 204)
+
+        response = self.context_client.get_entity_by_id('ROOM_001', 'Room')
+        self.assertEqual(response['response']['temperature']['value'], 30)
+        self.assertEqual(response['response']['pressure']['value'], 720)
+
+    def test_delete_entities(self):
+        entities_ids = ['ROOM_001', 'ROOM_002', 'ROOM_003']
+        for entity_id in entities_ids:
+            self.context_client.create_entity_from_file(self._build_file_path('ROOM.json'), 'Room', entity_id)
+
+        entities = self.context_client.get_entities(entity_type='Room')['response']
+        results = self.context_client.delete_entities(entities, max_bytes=100)
+        self.assertEqual(len(results), 3)
+
+        response = self.context_client.get_entities(entity_type='Room')
+        self.assertEqual(len(response['response']), 0)
+
+    def test_batch_update_unknown_action(self):
+        response = self.context_client.batch_update([], 'unknown')
+        self.assertIn('error', response)
+
     def test_update_entity(self):
         pass  # TODO Implement
 
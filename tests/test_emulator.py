@@ -0,0 +1,211 @@
+import json
+import queue
+import threading
+import time
+import unittest
+import urllib.request
+
+from fiotclient.context import FiwareContextClient
+from fiotclient.emulator import FiwareEmulator, MqttBrokerEmulator
+from fiotclient.iot import FiwareIotClient
+from fiotclient.mqtt import _create_mqtt_client
+
+LED_SCHEMA = json.dumps({'devices': [{
+    'device_id': '[DEVICE_ID]',
+    'entity_name': '[ENTITY_ID]',
+    'entity_type': 'thing',
+    'attributes': [{'object_id': 't', 'name': 'temperature', 'type': 'Number'}],
+    'commands': [{'name': 'switch', 'type': 'command'}]
+}]})
+
+
+class TestFiwareEmulator(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.emulator = FiwareEmulator().start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.emulator.stop()
+
+    def setUp(self):
+        self.emulator.reset()
+        config = self.emulator.config_dict({'fiwareService': 'smartcity', 'fiwareServicePath': '/rooms'})
+        self.context_client = FiwareContextClient.from_config_dict(config)
+        self.iot_client = FiwareIotClient.from_config_dict(config)
+
+    def tearDown(self):
+        self.context_client.close()
+        self.iot_client.close()
+
+    def test_query_entities(self):
+        entities = [{'id': f'ROOM_{i:03}', 'type': 'Room', 'temperature': {'value': i, 'type': 'Number'},
+                     'floor': {'value': f'F{i % 2}', 'type': 'Text'}} for i in range(10)]
+        self.context_client.create_entities(entities)
+
+        response = self.context_client.get_entities(q='temperature>=5;floor==F1', options='keyValues,count')
+        self.assertEqual(response['status_code'], 200)
+        self.assertEqual([entity['id'] for entity in response['response']], ['ROOM_005', 'ROOM_007', 'ROOM_009'])
+        self.assertEqual(response['response'][0]['temperature'], 5)
+        self.assertEqual(response['headers']['Fiware-Total-Count'], '3')
+
+        response = self.context_client.get_entities(id_pattern='ROOM_00[12]', limit=1, offset=1)
+        self.assertEqual([entity['id'] for entity in response['response']], ['ROOM_002'])
+
+        with self.context_client.tenant('smartcity', '/parkings'):
+            self.assertEqual(self.context_client.get_entities()['response'], [])
+
+        response = self.context_client.get_entities(limit=5000)
+        self.assertEqual(response['status_code'], 400)
+
+    def test_measures_and_history(self):
+        self.iot_client.register_devices([('SENSOR_001', 'TEST_SENSOR')], LED_SCHEMA)
+        for value in range(5):
+            self.iot_client.send_observation('SENSOR_001', {'t': value, 'h': 40}, protocol='HTTP')
+
+        entity = self.context_client.get_entity_by_id('TEST_SENSOR', 'thing')['response']
+        self.assertEqual(entity['temperature'], {'type': 'Number', 'value': '4', 'metadata': {}})
+        self.assertEqual(entity['h']['value'], '40')
+
+        response = self.context_client.get_historical_data('thing', 'TEST_SENSOR', 'temperature', items_number=3)
+        values = response['response']['contextResponses'][0]['contextElement']['attributes'][0]['values']
+        self.assertEqual([value['attrValue'] for value in values], ['2', '3', '4'])
+
+        values = list(self.context_client.stream_historical_data('thing', 'TEST_SENSOR', 'h', items_number=10))
+        self.assertEqual(len(values), 5)
+
+        # Like the IoT Agent, the emulator stores the UL values verbatim
+        self.iot_client.send_observation('SENSOR_001', {'h': '50%'}, protocol='HTTP')
+        self.assertEqual(self.context_client.get_entity_by_id('TEST_SENSOR', 'thing')['response']['h']['value'], '50%')
+        self.iot_client.send_observation_payload('SENSOR_001', 'h|50%25', protocol='HTTP')
+        self.assertEqual(self.context_client.get_entity_by_id('TEST_SENSOR', 'thing')['response']['h']['value'],
+                         '50%25')
+
+    def test_polling_commands(self):
+        self.iot_client.register_devices([('LED_001', 'TEST_LED')], LED_SCHEMA)
+
+        response = self.iot_client.send_command('TEST_LED', 'LED_001', 'switch', {'state': 'ON'})
+        self.assertEqual(response['status_code'], 200)
+
+        url = f"{self.emulator.url}/iot/d?k=&i=LED_001&getCmd=1"
+        request = urllib.request.Request(url, data=b't|21', headers={'Fiware-Service': 'smartcity',
+                                                                      'Fiware-ServicePath': '/rooms'})
+        with urllib.request.urlopen(request) as response:
+            self.assertEqual(response.read(), b'LED_001@switch|ON')
+
+        entity = self.context_client.get_entity_by_id('TEST_LED', 'thing')['response']
+        self.assertEqual(entity['switch_status']['value'], 'DELIVERED')
+
+        response = self.iot_client.send_command('UNKNOWN_LED', 'LED_002', 'switch')
+        self.assertEqual(response['status_code'], 404)
+
+    def test_provisioning_from_service_group(self):
+        response = self.iot_client.create_service('smartcity', '/rooms', api_key='rooms-key')
+        self.assertEqual(response['status_code'], 201)
+        self.iot_client.set_api_key('rooms-key')
+
+        self.iot_client.send_observation('SENSOR_002', [{'t': 21}, {'t': 22}], protocol='HTTP')
+
+        device = self.iot_client.get_device_by_id('SENSOR_002')['response']
+        self.assertEqual(device['entity_name'], 'Thing:SENSOR_002')
+        entity = self.context_client.get_entity_by_id('Thing:SENSOR_002', 'Thing')['response']
+        self.assertEqual(entity['t']['value'], '22')
+
+        self.iot_client.set_api_key('unknown-key')
+        response = self.iot_client.get_polling_commands('SENSOR_003', {'t': 21})
+        self.assertEqual(response['status_code'], 404)
+
+    def test_subscriptions(self):
+        response = self.context_client.subscribe_attributes_change('ROOM_001', 'Room', ['temperature'],
+                                                                   'http://localhost:1028/notify', 'P1M', 5)
+        subscription_id = response['response']['subscribeResponse']['subscriptionId']
+
+        response = self.context_client.get_subscription_by_id(subscription_id)
+        self.assertEqual(response['response']['notification']['http']['url'], 'http://localhost:1028/notify')
+        self.assertEqual(len(self.context_client.list_subscriptions()['response']), 1)
+
+        response = self.context_client.unsubscribe(subscription_id)
+        self.assertEqual(response['response']['statusCode']['code'], '200')
+        self.assertEqual(self.context_client.get_subscription_by_id(subscription_id)['status_code'], 404)
+
+    def test_errors(self):
+        response = self.context_client.get_entity_by_id('ROOM_001', 'Room')
+        self.assertEqual(response['status_code'], 404)
+        self.assertEqual(response['response']['error'], 'NotFound')
+
+        response = self.context_client.batch_update([{'id': 'ROOM_001', 'type': 'Room'}], 'update')
+        self.assertEqual(response[0]['status_code'], 404)
+
+        status_code, _, _ = self.emulator.handle('PATCH', '/v2/op/update', {}, b'')
+        self.assertEqual(status_code, 405)
+        status_code, _, _ = self.emulator.handle('GET', '/unknown', {}, b'')
+        self.assertEqual(status_code, 404)
+
+        self.assertEqual(self.emulator.stats()['get_entity'], 1)
+
+
+class TestMqttBrokerEmulator(unittest.TestCase):
+
+    def setUp(self):
+        self.emulator = FiwareEmulator().start()
+        self.broker = MqttBrokerEmulator(fiware_emulator=self.emulator).start()
+        config = self.emulator.config_dict({'fiwareService': 'smartcity', 'fiwareServicePath': '/',
+                                            'iota': {'apiKey': 'key'}})
+        self.context_client = FiwareContextClient.from_config_dict(config)
+        self.iot_client = FiwareIotClient.from_config_dict(config)
+
+        schema = json.loads(LED_SCHEMA)
+        schema['devices'][0].update({'transport': 'MQTT', 'apikey': 'key'})
+        self.iot_client.register_devices([('LED_001', 'TEST_LED')], json.dumps(schema))
+
+    def tearDown(self):
+        self.context_client.close()
+        self.iot_client.close()
+        self.broker.stop()
+        self.emulator.stop()
+
+    def _wait_for_attribute(self, name, value):
+        deadline = time.monotonic() + 5
+        while time.monotonic() < deadline:
+            entity = self.context_client.get_entity_by_id('TEST_LED', 'thing')['response']
+            if entity.get(name, {}).get('value') == value:
+                return
+            time.sleep(0.01)
+        self.fail(f"Attribute {name} was not set to {value}")
+
+    def test_observations(self):
+        for value in range(10):
+            self.iot_client.send_observation('LED_001', {'t': value})
+        self.assertTrue(self.iot_client.mqtt_publisher.flush(5))
+
+        self._wait_for_attribute('temperature', '9')
+        self.assertEqual(self.broker.stats()['published'], 10)
+
+    def test_commands(self):
+        messages = queue.Queue()
+        subscribed = threading.Event()
+        device = _create_mqtt_client('LED_001')
+        device.on_message = lambda client, userdata, message: messages.put((message.topic, message.payload))
+        device.on_subscribe = lambda *args: subscribed.set()
+        device.connect('127.0.0.1', self.broker.port)
+        device.subscribe('/+/LED_001/cmd')
+        device.loop_start()
+        try:
+            self.assertTrue(subscribed.wait(5))
+
+            self.iot_client.send_command('TEST_LED', 'LED_001', 'switch', {'state': 'ON'})
+            self.assertEqual(messages.get(timeout=5), ('/key/LED_001/cmd', b'LED_001@switch|ON'))
+            self._wait_for_attribute('switch_status', 'PENDING')
+
+            device.publish('/key/LED_001/cmdexe', 'LED_001@switch|switched')
+            self._wait_for_attribute('switch_status', 'OK')
+            entity = self.context_client.get_entity_by_id('TEST_LED', 'thing')['response']
+            self.assertEqual(entity['switch_info']['value'], 'switched')
+        finally:
+            device.loop_stop()
+            device.disconnect()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+import json
+import pickle
+import time
+import unittest
+
+from fiotclient.context import FiwareContextClient
+from fiotclient.emulator import FiwareEmulator, MqttBrokerEmulator
+from fiotclient.gateway import ObservationGateway, _join_records, _KIND_MEASUREMENTS, _KIND_PAYLOAD
+from fiotclient.iot import FiwareIotClient
+
+SENSOR_SCHEMA = json.dumps({'devices': [{
+    'device_id': '[DEVICE_ID]',
+    'entity_name': '[ENTITY_ID]',
+    'entity_type': 'thing',
+    'transport': 'MQTT',
+    'attributes': [{'object_id': 't', 'name': 'temperature', 'type': 'Number'}]
+}]})
+
+
+class TestObservationGateway(unittest.TestCase):
+
+    def setUp(self):
+        self.emulator = FiwareEmulator().start()
+        self.broker = MqttBrokerEmulator(fiware_emulator=self.emulator).start()
+        self.config = self.emulator.config_dict({'fiwareService': 'smartcity', 'fiwareServicePath': '/',
+                                                 'iota': {'apiKey': 'key'}})
+        self.context_client = FiwareContextClient.from_config_dict(self.config)
+
+        with FiwareIotClient.from_config_dict(self.config) as iot_client:
+            iot_client.register_devices([(f'SENSOR_{i}', f'TEST_SENSOR_{i}') for i in range(8)], SENSOR_SCHEMA)
+
+    def tearDown(self):
+        self.context_client.close()
+        self.broker.stop()
+        self.emulator.stop()
+
+    def _temperature(self, entity_id):
+        return self.context_client.get_entity_by_id(entity_id, 'thing')['response']['temperature']['value']
+
+    def test_join_records(self):
+        records = [('SENSOR_1', _KIND_PAYLOAD, b't|1'), ('SENSOR_2', _KIND_PAYLOAD, b't|2'),
+                   ('SENSOR_1', _KIND_PAYLOAD, b't|3'), ('SENSOR_1', _KIND_MEASUREMENTS, pickle.dumps({'t': 4}))]
+        self.assertEqual(_join_records(records, max_bytes=7), {'SENSOR_1': [('t|1#t|3', 2), ('t|4', 1)],
+                                                              'SENSOR_2': [('t|2', 1)]})
+
+        # Measurements which can't be encoded as UL are skipped
+        with self.assertLogs(level='ERROR'):
+            joined = _join_records([('SENSOR_1', _KIND_MEASUREMENTS, pickle.dumps({'s': 'a|b'}))] + records, 7)
+        self.assertEqual(joined['SENSOR_1'], [('t|1#t|3', 2), ('t|4', 1)])
+
+    def test_http_observations(self):
+        with ObservationGateway.from_config_dict(self.config, workers=2, protocol='HTTP') as gateway:
+            self.assertEqual({gateway.shard_for(f'SENSOR_{i}') for i in range(8)}, {0, 1})
+
+            for value in range(5):
+                for i in range(8):
+                    self.assertTrue(gateway.send(f'SENSOR_{i}', {'t': value * 10 + i}))
+            self.assertTrue(gateway.send_payload('SENSOR_0', 't|100'))
+            self.assertTrue(gateway.flush(10))
+
+            stats = gateway.stats()
+            self.assertEqual([shard['shard'] for shard in stats], [0, 1])
+            self.assertTrue(all(shard['alive'] and shard['backlog'] == 0 for shard in stats))
+            self.assertEqual(sum(shard['processed'] for shard in stats), 41)
+            self.assertEqual(sum(shard['failed'] for shard in stats), 0)
+
+        # The observations of each device are sent in order
+        self.assertEqual(self._temperature('TEST_SENSOR_0'), '100')
+        self.assertEqual(self._temperature('TEST_SENSOR_7'), '47')
+
+        with self.assertRaises(RuntimeError):
+            gateway.send('SENSOR_0', {'t': 0})
+
+    def test_mqtt_observations_on_close(self):
+        gateway = ObservationGateway.from_config_dict(self.config, workers=2, queue_size=4096)
+        for value in range(200):
+            self.assertTrue(gateway.send(f'SENSOR_{value % 8}', {'t': value}))
+
+        # Closing waits for the workers to send the queued observations
+        gateway.close()
+        self.assertEqual(sum(shard['processed'] for shard in gateway.stats()), 200)
+
+        deadline = time.monotonic() + 5
+        while self._temperature('TEST_SENSOR_7') != '199' and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(self._temperature('TEST_SENSOR_7'), '199')
+
+
+if __name__ == '__main__':
+    unittest.main()
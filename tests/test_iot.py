@@ -101,6 +101,25 @@ class TestIotMethods(TestCommonMethods):
         }
         self._assert_device_entity_data(data, expected_entity_data)
 
+    def test_register_devices(self):
+        with open(self._build_file_path('LED.json')) as device_file:
+            device_schema = device_file.read()
+
+        devices = [(f'LED_{i:03}', f'TEST_LED_{i:03}') for i in range(1, 6)]
+        result = self.iot_client.register_devices(devices, device_schema, max_devices=2)
+        self.assertEqual(result['registered'], [device_id for device_id, _ in devices])
+        self.assertEqual(result['failed'], {})
+
+        response = self.iot_client.get_device_by_id('LED_003')
+        self.assertEqual(response['status_code'], 200)
+        self.assertEqual(response['response']['entity_name'], 'TEST_LED_003')
+        self.assertEqual(response['response']['static_attributes'][0]['value'], 'LED_003')
+
+        devices = [('LED_005', 'TEST_LED_005'), ('LED_006', 'TEST_LED_006')]
+        result = self.iot_client.register_devices(devices, device_schema)
+        self.assertEqual(result['registered'], ['LED_006'])
+        self.assertEqual(list(result['failed'].keys()), ['LED_005'])
+
     def test_update_device(self):
         pass  # TODO Implement
 
@@ -120,6 +139,16 @@ class TestIotMethods(TestCommonMethods):
     def test_list_devices(self):
         pass  # TODO Implement
 
+    def test_iter_devices(self):
+        with open(self._build_file_path('LED.json')) as device_file:
+            device_schema = device_file.read()
+
+        devices = [(f'LED_{i:03}', f'TEST_LED_{i:03}') for i in range(12)]
+        self.iot_client.register_devices(devices, device_schema)
+
+        devices_ids = [device['device_id'] for device in self.iot_client.iter_devices(page_size=5)]
+        self.assertEqual(sorted(devices_ids), [device_id for device_id, _ in devices])
+
     def test_send_observation(self):
         pass  # TODO Implement
 
@@ -186,10 +215,15 @@ class TestIotMethods(TestCommonMethods):
         pass  # TODO Implement
 
     def test_join_group_measurements(self):
-        pass  # TODO Implement
+        payload = FiwareIotClient._join_group_measurements({'t': 23.5, 'h': 40, 's': 'ON'})
+        self.assertEqual(payload, 't|23.5|h|40|s|ON')
 
     def test_create_ul_payload_from_measurements(self):
-        pass  # TODO Implement
+        payload = FiwareIotClient._create_ul_payload_from_measurements({'t': 23.5})
+        self.assertEqual(payload, 't|23.5')
+
+        payload = FiwareIotClient._create_ul_payload_from_measurements([{'t': 23.5}, {'t': 24, 'h': 40}])
+        self.assertEqual(payload, 't|23.5#t|24|h|40')
 
     def test_create_service(self):
         pass  # TODO Implement
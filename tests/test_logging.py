@@ -0,0 +1,97 @@
+import logging
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from fiotclient.context import FiwareContextClient
+
+
+class _EchoHandler(BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+    bodies = []
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self.bodies.append(body)
+
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestRequestLogging(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), _EchoHandler)
+        cls.server.daemon_threads = True
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+        cls.port = cls.server.server_address[1]
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        _EchoHandler.bodies.clear()
+
+    def _config(self, http=None, logging_options=None):
+        return {
+            'contextBroker': {'host': '127.0.0.1', 'port': self.port},
+            'http': http or {},
+            'logging': logging_options or {}
+        }
+
+    def _subscribe(self, context_client):
+        return context_client.subscribe_attributes_change('ROOM_001', 'Room', ['temperature'],
+                                                          'http://localhost/notify', 'P1M', 5)
+
+    def test_compact_payload(self):
+        with FiwareContextClient.from_config_dict(self._config()) as context_client:
+            response = self._subscribe(context_client)
+        self.assertNotIn(b' ', _EchoHandler.bodies[0])
+        self.assertEqual(response['response']['reference'], 'http://localhost/notify')
+
+        with FiwareContextClient.from_config_dict(self._config(http={'compactJson': False})) as context_client:
+            self._subscribe(context_client)
+        self.assertIn(b'\n    ', _EchoHandler.bodies[1])
+
+    def test_truncated_bodies(self):
+        config = self._config(logging_options={'bodyMaxLength': 10})
+        with FiwareContextClient.from_config_dict(config) as context_client, \
+                self.assertLogs(level=logging.INFO) as logs:
+            self._subscribe(context_client)
+
+        body_length = len(_EchoHandler.bodies[0])
+        payload_logs = [line for line in logs.output if 'Request payload' in line]
+        self.assertEqual(payload_logs, [f'INFO:root:Request payload: {_EchoHandler.bodies[0][:10].decode()}... '
+                                        f'({body_length} characters)'])
+
+    def test_sampled_out_bodies(self):
+        config = self._config(logging_options={'bodySampleRate': 0})
+        with FiwareContextClient.from_config_dict(config) as context_client, \
+                self.assertLogs(level=logging.INFO) as logs:
+            self._subscribe(context_client)
+
+        self.assertFalse([line for line in logs.output if 'temperature' in line])
+        self.assertTrue([line for line in logs.output if line.startswith('INFO:root:Response 200')])
+
+    def test_nothing_logged_when_disabled(self):
+        with FiwareContextClient.from_config_dict(self._config()) as context_client, \
+                self.assertLogs(level=logging.DEBUG) as logs:
+            logging.root.setLevel(logging.WARNING)
+            self._subscribe(context_client)
+            logging.warning("Done")
+
+        self.assertEqual(logs.output, ['WARNING:root:Done'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,129 @@
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from fiotclient.context import FiwareContextClient
+from fiotclient.iot import FiwareIotClient
+from fiotclient.metrics import Histogram, InMemoryMetrics, MetricsCollector, RequestMetrics
+
+
+class _JsonHandler(BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+
+    def _reply(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+
+        body = b'{"id": "ROOM_001", "type": "Room"}' if self.command == 'GET' else b''
+        self.send_response(200 if self.command == 'GET' else 201)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_GET = do_POST = _reply
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _FailingCollector(MetricsCollector):
+
+    def record(self, request_metrics):
+        raise ValueError("Collector failure")
+
+
+class TestHistogram(unittest.TestCase):
+
+    def test_quantile(self):
+        histogram = Histogram(buckets=(1.0, 2.0, 4.0))
+        self.assertIsNone(histogram.quantile(0.5))
+
+        for value in (0.5, 1.5, 1.5, 3.0):
+            histogram.observe(value)
+
+        self.assertEqual((histogram.count, histogram.sum, histogram.max), (4, 6.5, 3.0))
+        self.assertEqual(histogram.counts, [1, 2, 1, 0])
+        self.assertAlmostEqual(histogram.quantile(0.5), 1.5)
+        self.assertAlmostEqual(histogram.quantile(1.0), 3.0)
+
+
+class TestInMemoryMetrics(unittest.TestCase):
+
+    def test_summary_and_prometheus(self):
+        metrics = InMemoryMetrics(buckets=(0.01, 0.1))
+        metrics.record(RequestMetrics('create_entity', 'orion', 'POST', 201, bytes_sent=100, network_time=0.005))
+        metrics.record(RequestMetrics('create_entity', 'orion', 'POST', 422, bytes_sent=50, bytes_received=80,
+                                      serialize_time=0.001, network_time=0.05))
+
+        summary = metrics.summary()[('create_entity', 'orion')]
+        self.assertEqual(summary['count'], 2)
+        self.assertEqual(summary['status_codes'], {201: 1, 422: 1})
+        self.assertEqual((summary['bytes_sent'], summary['bytes_received']), (150, 80))
+        self.assertAlmostEqual(summary['latency']['network']['max'], 0.05)
+
+        text = metrics.to_prometheus()
+        labels = 'operation="create_entity",component="orion"'
+        self.assertIn(f'fiotclient_request_duration_seconds_bucket{{{labels},phase="network",le="0.01"}} 1', text)
+        self.assertIn(f'fiotclient_request_duration_seconds_bucket{{{labels},phase="network",le="+Inf"}} 2', text)
+        self.assertIn(f'fiotclient_request_duration_seconds_count{{{labels},phase="total"}} 2', text)
+        self.assertIn(f'fiotclient_requests_total{{{labels},status="422"}} 1', text)
+        self.assertIn(f'fiotclient_request_bytes_total{{{labels},direction="sent"}} 150', text)
+
+        metrics.reset()
+        self.assertEqual(metrics.summary(), {})
+
+
+class TestClientMetrics(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), _JsonHandler)
+        cls.server.daemon_threads = True
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+        port = cls.server.server_address[1]
+        cls.config = {
+            'contextBroker': {'host': '127.0.0.1', 'port': port},
+            'iota': {'host': 'localhost', 'northPort': port}
+        }
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def test_operations_and_components(self):
+        metrics = InMemoryMetrics()
+        with FiwareContextClient.from_config_dict(self.config, metrics=metrics) as context_client:
+            context_client.create_entity('{"id": "[ENTITY_ID]", "type": "[ENTITY_TYPE]"}', 'Room', 'ROOM_001')
+            context_client.get_entity_by_id('ROOM_001', 'Room')
+        with FiwareIotClient.from_config_dict(self.config, metrics=metrics) as iot_client:
+            iot_client.get_device_by_id('DEVICE_001')
+
+        summary = metrics.summary()
+        self.assertEqual(set(summary), {('create_entity', 'orion'), ('get_entity_by_id', 'orion'),
+                                        ('get_device_by_id', 'iota-north')})
+
+        create_summary = summary[('create_entity', 'orion')]
+        self.assertEqual(create_summary['status_codes'], {201: 1})
+        self.assertEqual(create_summary['bytes_sent'], len('{"id":"ROOM_001","type":"Room"}'))
+        self.assertEqual(summary[('get_entity_by_id', 'orion')]['bytes_received'], 34)
+        self.assertGreater(create_summary['latency']['network']['mean'], 0)
+
+    def test_connection_error_recorded(self):
+        metrics = InMemoryMetrics()
+        config = {'contextBroker': {'host': '127.0.0.1', 'port': 1}}
+        with FiwareContextClient.from_config_dict(config, metrics=metrics) as context_client:
+            response = context_client.list_subscriptions()
+
+        self.assertEqual(response['status_code'], 0)
+        self.assertEqual(metrics.summary()[('list_subscriptions', 'orion')]['status_codes'], {0: 1})
+
+    def test_failing_collector_ignored(self):
+        with FiwareContextClient.from_config_dict(self.config, metrics=_FailingCollector()) as context_client:
+            response = context_client.get_entity_by_id('ROOM_001', 'Room')
+        self.assertEqual(response['status_code'], 200)
+
+
+if __name__ == '__main__':
+    unittest.main()
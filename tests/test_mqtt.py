@@ -0,0 +1,81 @@
+import socket
+import threading
+import unittest
+
+from fiotclient.exceptions import MqttPublishError
+from fiotclient.iot import FiwareIotClient
+from fiotclient.mqtt import MqttPublisher
+
+
+def _silent_broker():
+    """Starts a broker which accepts the connection and never acknowledges the published messages
+
+    :return: The listening socket of the broker
+    """
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    sock.listen(1)
+
+    def serve():
+        try:
+            connection, _ = sock.accept()
+        except OSError:
+            return
+        with connection:
+            connection.recv(1024)
+            connection.sendall(b'\x20\x02\x00\x00')
+            while connection.recv(1024):
+                pass
+
+    threading.Thread(target=serve, daemon=True).start()
+    return sock
+
+
+class TestMqttPublisher(unittest.TestCase):
+
+    unreachable_config = {
+        'iota': {'apiKey': 'key'},
+        'mqttBroker': {'host': '127.0.0.1', 'port': 1}
+    }
+
+    def test_publish_timeout_without_broker(self):
+        with MqttPublisher('127.0.0.1', port=1, reconnect_max_delay=1) as publisher:
+            self.assertRaises(TimeoutError, publisher.publish, '/key/DEVICE_001/attrs', 't|23', timeout=0.2)
+            self.assertFalse(publisher.connected)
+
+    def test_closed_publisher(self):
+        publisher = MqttPublisher('127.0.0.1', port=1)
+        publisher.close()
+        self.assertRaises(RuntimeError, publisher.publish, '/key/DEVICE_001/attrs', 't|23')
+
+    def test_send_observation_without_broker(self):
+        with FiwareIotClient.from_config_dict(self.unreachable_config) as iot_client:
+            response = iot_client.send_observation('DEVICE_001', {'t': 23}, timeout=0.2)
+            self.assertIn('error', response)
+            publisher = iot_client.mqtt_publisher
+            self.assertIs(iot_client.mqtt_publisher, publisher)
+
+    def test_shared_publisher_not_closed(self):
+        with MqttPublisher('127.0.0.1', port=1) as publisher:
+            with FiwareIotClient.from_config_dict(self.unreachable_config, mqtt_publisher=publisher) as iot_client:
+                self.assertIs(iot_client.mqtt_publisher, publisher)
+            publisher.start()
+
+    def test_refused_publication(self):
+        broker = _silent_broker()
+        self.addCleanup(broker.close)
+        publisher = MqttPublisher('127.0.0.1', port=broker.getsockname()[1], qos=1)
+        # Paho refuses the messages exceeding its queue, which are never sent to the broker
+        publisher._client.max_queued_messages_set(1)
+        config = {'iota': {'apiKey': 'key'}}
+        try:
+            with FiwareIotClient.from_config_dict(config, mqtt_publisher=publisher) as iot_client:
+                self.assertEqual(iot_client.send_observation('DEVICE_001', {'t': 23}, timeout=5), {'result': 'OK'})
+
+                self.assertRaises(MqttPublishError, publisher.publish, '/key/DEVICE_001/attrs', 't|24')
+                with self.assertLogs(level='ERROR'):
+                    response = iot_client.send_observation('DEVICE_001', {'t': 25})
+                self.assertIn('error', response)
+        finally:
+            with self.assertLogs(level='WARNING'):
+                publisher.close(timeout=0.1)
@@ -0,0 +1,211 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from fiotclient.iot import FiwareIotClient
+from fiotclient.outbox import ObservationOutbox
+
+
+class _UlHandler(BaseHTTPRequestHandler):
+    """Accepts the UL observations only while the IoT Agent is available,
+    replying first with the scripted status codes of each device"""
+
+    protocol_version = 'HTTP/1.1'
+    available = True
+    payloads = []
+    request_times = []
+    statuses = {}
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        payload = self.rfile.read(length).decode()
+        self.request_times.append(time.monotonic())
+        device_statuses = self.statuses.get(parse_qs(urlparse(self.path).query)['i'][0])
+        status = device_statuses.pop(0) if device_statuses else 200 if self.available else 503
+        if status == 200:
+            self.payloads.append(payload)
+        self.send_response(status)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestObservationOutbox(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), _UlHandler)
+        cls.server.daemon_threads = True
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+        config = {'iota': {'host': '127.0.0.1', 'protocolPort': cls.server.server_address[1], 'apiKey': 'key'}}
+        cls.iot_client = FiwareIotClient.from_config_dict(config)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.iot_client.close()
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        _UlHandler.available = True
+        _UlHandler.payloads.clear()
+        _UlHandler.request_times.clear()
+        _UlHandler.statuses.clear()
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def _outbox(self, **kwargs):
+        return ObservationOutbox(self.iot_client, self.directory.name, protocol='HTTP', retry_min_delay=0.01,
+                                 retry_max_delay=0.05, **kwargs)
+
+    def test_failed_http_observation(self):
+        _UlHandler.available = False
+        with self.assertLogs(level='ERROR'):
+            result = self.iot_client.send_observation('DEVICE_001', {'t': 21}, protocol='HTTP')
+        self.assertEqual(result['status_code'], 503)
+        self.assertIn('error', result)
+
+    def test_store_and_forward(self):
+        _UlHandler.available = False
+        with self._outbox() as outbox:
+            with self.assertLogs(level='WARNING'):
+                for i in range(5):
+                    outbox.add('DEVICE_001', {'t': i})
+                outbox.add('DEVICE_002', [{'t': 10}, {'t': 11}])
+                self.assertFalse(outbox.flush(0.1))
+
+            stats = outbox.stats()
+            self.assertEqual(stats['backlog'], 6)
+            self.assertGreater(stats['backlog_bytes'], 0)
+            self.assertGreater(stats['failed_batches'], 0)
+
+            _UlHandler.available = True
+            self.assertTrue(outbox.flush(5))
+
+            stats = outbox.stats()
+            self.assertEqual((stats['backlog'], stats['backlog_bytes'], stats['drained']), (0, 0, 6))
+            self.assertGreater(stats['drain_rate'], 0)
+
+        self.assertEqual(sorted(_UlHandler.payloads), ['t|0#t|1#t|2#t|3#t|4', 't|10#t|11'])
+
+    def test_retry_backoff(self):
+        _UlHandler.available = False
+        outbox = ObservationOutbox(self.iot_client, self.directory.name, protocol='HTTP', retry_min_delay=0.05,
+                                   retry_max_delay=1)
+        with self.assertLogs(level='WARNING'):
+            # Observations keep arriving while the batch is failing, without shortening the backoff
+            deadline = time.monotonic() + 0.8
+            while time.monotonic() < deadline:
+                outbox.add('DEVICE_001', {'t': 1})
+                time.sleep(0.01)
+            outbox.close(timeout=0)
+
+        gaps = [later - earlier for earlier, later in zip(_UlHandler.request_times, _UlHandler.request_times[1:])]
+        self.assertGreaterEqual(len(gaps), 3)
+        self.assertLessEqual(len(gaps), 5)
+        self.assertGreaterEqual(min(gaps), 0.05)
+        self.assertTrue(all(later > earlier * 1.5 for earlier, later in zip(gaps, gaps[1:])))
+
+    def test_retry_with_new_observations(self):
+        _UlHandler.available = False
+        outbox = self._outbox()
+        outbox.add('DEVICE_001', {'x': 1})
+        outbox.add('DEVICE_002', {'y': 1})
+        outbox.close(timeout=0)
+
+        # The observation added while the batch is failing is not joined to the payload already delivered
+        _UlHandler.available = True
+        _UlHandler.statuses['DEVICE_002'] = [503]
+        _UlHandler.request_times.clear()
+        with ObservationOutbox(self.iot_client, self.directory.name, protocol='HTTP', retry_min_delay=0.2) as outbox:
+            with self.assertLogs(level='WARNING'):
+                deadline = time.monotonic() + 5
+                while len(_UlHandler.request_times) < 2 and time.monotonic() < deadline:
+                    time.sleep(0.01)
+            outbox.add('DEVICE_001', {'x': 2})
+            self.assertTrue(outbox.flush(5))
+            self.assertEqual(outbox.stats()['drained'], 3)
+
+        self.assertEqual(sorted(_UlHandler.payloads), ['x|1', 'x|2', 'y|1'])
+
+    def test_rejected_observations(self):
+        _UlHandler.statuses['DEVICE_001'] = [404]
+        with self._outbox() as outbox:
+            with self.assertLogs(level='ERROR'):
+                outbox.add('DEVICE_001', {'t': 1})
+                outbox.add('DEVICE_002', {'t': 2})
+                self.assertTrue(outbox.flush(5))
+
+            stats = outbox.stats()
+            self.assertEqual((stats['backlog'], stats['drained'], stats['rejected']), (0, 1, 1))
+        self.assertEqual(_UlHandler.payloads, ['t|2'])
+
+    def test_crash_recovery(self):
+        _UlHandler.available = False
+        outbox = self._outbox()
+        for i in range(3):
+            outbox.add('DEVICE_001', {'t': i})
+        outbox.close(timeout=0)
+
+        # A record partially written when the process crashed is discarded
+        segment_path = os.path.join(self.directory.name, sorted(os.listdir(self.directory.name))[0])
+        with open(segment_path, 'r+b') as segment_file:
+            data = segment_file.read()
+            segment_file.seek(len(data.rstrip(b'\0')))
+            segment_file.write(b'\x20\x00\x00\x00\x01\x02\x03')
+
+        _UlHandler.available = True
+        with self.assertLogs(level='WARNING'):
+            outbox = self._outbox()
+        with outbox:
+            self.assertTrue(outbox.flush(5))
+            outbox.add('DEVICE_001', {'t': 3})
+            self.assertTrue(outbox.flush(5))
+
+        self.assertEqual(_UlHandler.payloads, ['t|0#t|1#t|2', 't|3'])
+
+        # Delivered observations are not sent again
+        with self._outbox() as outbox:
+            self.assertEqual(outbox.pending, 0)
+
+    def test_overflow(self):
+        _UlHandler.available = False
+        with self._outbox(segment_size=64, max_segments=2) as outbox:
+            with self.assertLogs(level='WARNING'):
+                for i in range(6):
+                    self.assertTrue(outbox.add('DEVICE_001', {'t': i}))
+
+            stats = outbox.stats()
+            self.assertEqual(stats['segments'], 2)
+            self.assertEqual(stats['backlog'] + stats['dropped'], 6)
+            self.assertGreater(stats['dropped'], 0)
+
+            _UlHandler.available = True
+            self.assertTrue(outbox.flush(5))
+
+        # The newest observations are kept and sent in order. The oldest ones were dropped,
+        # unless they were already being sent when the outbox overflowed
+        groups = '#'.join(_UlHandler.payloads).split('#')
+        self.assertEqual(groups[-stats['backlog']:], [f't|{i}' for i in range(6 - stats['backlog'], 6)])
+
+        _UlHandler.available = False
+        with self._outbox(segment_size=64, max_segments=2, overflow='drop_newest') as outbox:
+            with self.assertLogs(level='WARNING'):
+                results = [outbox.add('DEVICE_001', {'t': i}) for i in range(6)]
+            self.assertEqual(results.count(False), outbox.stats()['dropped'])
+            self.assertEqual(results[:2], [True, True])
+            self.assertFalse(results[-1])
+            outbox.close(timeout=0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,139 @@
+import asyncio
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from fiotclient.aio import AsyncFiwareContextClient
+from fiotclient.context import FiwareContextClient
+from fiotclient.ratelimit import RateLimiter, TokenBucket
+
+
+class _JsonHandler(BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        body = b'[]'
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestTokenBucket(unittest.TestCase):
+
+    def test_reservations(self):
+        bucket = TokenBucket(rate=10, capacity=2)
+        self.assertEqual(bucket.reserve(), 0.0)
+        self.assertEqual(bucket.reserve(), 0.0)
+        self.assertAlmostEqual(bucket.reserve(), 0.1, delta=0.01)
+        self.assertAlmostEqual(bucket.reserve(), 0.2, delta=0.01)
+
+        bucket.refund()
+        self.assertAlmostEqual(bucket.reserve(), 0.2, delta=0.01)
+        self.assertLess(bucket.tokens, 0)
+
+    def test_invalid_rate(self):
+        with self.assertRaises(ValueError):
+            TokenBucket(rate=0)
+
+
+class TestRateLimiter(unittest.TestCase):
+
+    def test_buckets(self):
+        limiter = RateLimiter(component_rates={'orion': 100},
+                              service_rates={'smartcity': 50, ('smartcity', '/rooms'): (10, 5)},
+                              default_service_rate=20)
+
+        self.assertEqual([bucket.rate for bucket in limiter.buckets_for('orion', 'smartcity', '/rooms')],
+                         [100, 10, 50])
+        self.assertEqual([bucket.rate for bucket in limiter.buckets_for('sth', 'smartcity', '/')], [50])
+        self.assertEqual([bucket.rate for bucket in limiter.buckets_for('sth', 'other', '/')], [20])
+        self.assertIs(limiter.buckets_for('sth', 'other', '/')[0], limiter.buckets_for('orion', 'other', '/a')[1])
+
+        self.assertEqual(RateLimiter().buckets_for('orion', 'smartcity', '/'), [])
+
+    def test_shared_across_threads(self):
+        limiter = RateLimiter(component_rates={'orion': (100, 1)})
+
+        started_at = time.monotonic()
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            list(executor.map(lambda _: limiter.acquire('orion', 'smartcity', '/'), range(20)))
+        self.assertGreaterEqual(time.monotonic() - started_at, 0.18)
+
+    def test_shared_across_tasks(self):
+        limiter = RateLimiter(service_rates={'smartcity': (100, 1)})
+
+        async def acquire_all():
+            ticks = 0
+
+            async def tick():
+                nonlocal ticks
+                while True:
+                    ticks += 1
+                    await asyncio.sleep(0.005)
+
+            ticker = asyncio.ensure_future(tick())
+            await asyncio.gather(*(limiter.acquire_async('orion', 'smartcity', '/') for _ in range(10)))
+            ticker.cancel()
+            return ticks
+
+        started_at = time.monotonic()
+        ticks = asyncio.run(acquire_all())
+        self.assertGreaterEqual(time.monotonic() - started_at, 0.08)
+        # The event loop kept running other tasks while the requests waited
+        self.assertGreater(ticks, 5)
+
+
+class TestClientRateLimit(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), _JsonHandler)
+        cls.server.daemon_threads = True
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+        cls.config = {'contextBroker': {'host': '127.0.0.1', 'port': cls.server.server_address[1]},
+                      'fiwareService': 'smartcity', 'fiwareServicePath': '/'}
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def test_service_rate(self):
+        rate_limiter = RateLimiter(service_rates={'smartcity': (20, 1)})
+        with FiwareContextClient.from_config_dict(self.config, rate_limiter=rate_limiter) as context_client:
+            started_at = time.monotonic()
+            for _ in range(5):
+                self.assertEqual(context_client.get_entities_by_type('Room')['status_code'], 200)
+            self.assertGreaterEqual(time.monotonic() - started_at, 0.18)
+
+            context_client.set_service('other', '/')
+            started_at = time.monotonic()
+            for _ in range(5):
+                context_client.get_entities_by_type('Room')
+            self.assertLess(time.monotonic() - started_at, 0.18)
+
+    def test_async_component_rate(self):
+        rate_limiter = RateLimiter(component_rates={'orion': (20, 1)})
+
+        async def get_entities():
+            async with AsyncFiwareContextClient.from_config_dict(self.config,
+                                                                 rate_limiter=rate_limiter) as context_client:
+                return await asyncio.gather(*(context_client.get_entities_by_type('Room') for _ in range(5)))
+
+        started_at = time.monotonic()
+        responses = asyncio.run(get_entities())
+        self.assertGreaterEqual(time.monotonic() - started_at, 0.18)
+        self.assertEqual([response['status_code'] for response in responses], [200] * 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
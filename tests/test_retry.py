@@ -0,0 +1,265 @@
+import asyncio
+import socket
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from fiotclient.aio import AsyncFiwareContextClient
+from fiotclient.context import FiwareContextClient
+from fiotclient.exceptions import FiwareRequestError
+from fiotclient.metrics import InMemoryMetrics
+from fiotclient.resilience import CircuitBreaker, CircuitBreakerRegistry, RetryPolicy
+
+
+class _ScriptedHandler(BaseHTTPRequestHandler):
+    """Replies with the next status code of the server script, and 200 once it is exhausted"""
+
+    protocol_version = 'HTTP/1.1'
+
+    def _reply(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+
+        with self.server.lock:
+            self.server.requests.append(self.command)
+            status = self.server.script.pop(0) if self.server.script else 200
+
+        body = b'{"id": "ROOM_001", "type": "Room"}' if status == 200 else b''
+        self.send_response(status)
+        if status == 429:
+            self.send_header('Retry-After', '0')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_GET = do_POST = _reply
+
+    def log_message(self, format, *args):
+        pass
+
+
+def _unused_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+class _SilentServer(object):
+    """Accepts connections and never answers, so that every request times out"""
+
+    def __init__(self):
+        self.sock = socket.socket()
+        self.sock.bind(('127.0.0.1', 0))
+        self.sock.listen(16)
+        self.port = self.sock.getsockname()[1]
+        self.connections = []
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def _accept(self):
+        while True:
+            try:
+                connection, _ = self.sock.accept()
+            except OSError:
+                return
+            self.connections.append(connection)
+
+    def close(self):
+        self.sock.close()
+        for connection in self.connections:
+            connection.close()
+
+
+class TestRetryPolicy(unittest.TestCase):
+
+    def test_idempotency(self):
+        policy = RetryPolicy()
+        self.assertTrue(policy.is_retryable('GET', 503))
+        self.assertTrue(policy.is_retryable('DELETE', 0))
+        self.assertFalse(policy.is_retryable('GET', 404))
+
+        self.assertTrue(policy.is_retryable('POST', 429))
+        self.assertTrue(policy.is_retryable('POST', 503))
+        self.assertFalse(policy.is_retryable('POST', 502))
+        self.assertFalse(policy.is_retryable('POST', 0))
+        self.assertTrue(policy.is_retryable('POST', 0, idempotent=True))
+        self.assertTrue(RetryPolicy(retry_non_idempotent=True).is_retryable('POST', 0))
+
+    def test_delay(self):
+        policy = RetryPolicy(backoff_base=0.5, backoff_max=3.0, jitter=False)
+        self.assertEqual([policy.delay(attempt) for attempt in range(1, 5)], [0.5, 1.0, 2.0, 3.0])
+        self.assertEqual(policy.delay(1, retry_after='2'), 2.0)
+        self.assertEqual(policy.delay(1, retry_after='120'), 3.0)
+        self.assertEqual(policy.delay(2, retry_after='Wed, 21 Oct 2015 07:28:00 GMT'), 1.0)
+
+        jittered = RetryPolicy(backoff_base=1.0)
+        self.assertTrue(all(0 <= jittered.delay(3) <= 4.0 for _ in range(100)))
+
+
+class TestCircuitBreaker(unittest.TestCase):
+
+    def test_open_and_recover(self):
+        breaker = CircuitBreaker(failure_threshold=2, recovery_timeout=0.05)
+        breaker.record(503)
+        breaker.record(200)
+        breaker.record(0)
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+        breaker.record(0)
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        self.assertFalse(breaker.allow())
+
+        time.sleep(0.06)
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())
+        breaker.record(503)
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+
+        time.sleep(0.06)
+        self.assertTrue(breaker.allow())
+        breaker.record(404)
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+        self.assertTrue(breaker.allow())
+
+
+class TestClientRetry(unittest.TestCase):
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), _ScriptedHandler)
+        self.server.daemon_threads = True
+        self.server.lock = threading.Lock()
+        self.server.requests = []
+        self.server.script = []
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+        self.config = {'contextBroker': {'host': '127.0.0.1', 'port': self.server.server_address[1]}}
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_retry_unavailable(self):
+        self.server.script = [503, 429]
+        policy = RetryPolicy(max_attempts=3, backoff_base=0.01)
+        with FiwareContextClient.from_config_dict(self.config, retry_policy=policy) as context_client:
+            response = context_client.get_entity_by_id('ROOM_001', 'Room')
+
+        self.assertEqual(response['status_code'], 200)
+        self.assertEqual(response['response']['id'], 'ROOM_001')
+        self.assertEqual(self.server.requests, ['GET', 'GET', 'GET'])
+
+    def test_max_attempts(self):
+        self.server.script = [503, 503, 503]
+        policy = RetryPolicy(max_attempts=2, backoff_base=0.01)
+        with FiwareContextClient.from_config_dict(self.config, retry_policy=policy) as context_client:
+            response = context_client.get_entity_by_id('ROOM_001', 'Room')
+
+        self.assertEqual(response['status_code'], 503)
+        self.assertEqual(len(self.server.requests), 2)
+
+    def test_non_idempotent_not_repeated(self):
+        self.server.script = [502, 502]
+        policy = RetryPolicy(max_attempts=3, backoff_base=0.01)
+        with FiwareContextClient.from_config_dict(self.config, retry_policy=policy) as context_client:
+            entity_schema = '{"id": "[ENTITY_ID]", "type": "[ENTITY_TYPE]"}'
+            response = context_client.create_entity(entity_schema, 'Room', 'ROOM_001')
+            self.assertEqual(response['status_code'], 502)
+            self.assertEqual(self.server.requests, ['POST'])
+
+            responses = context_client.batch_update([{'id': 'ROOM_001', 'type': 'Room'}], 'append')
+            self.assertEqual(responses[0]['status_code'], 200)
+            self.assertEqual(self.server.requests, ['POST', 'POST', 'POST'])
+
+    def test_circuit_open_fails_fast(self):
+        metrics = InMemoryMetrics()
+        breakers = CircuitBreakerRegistry(failure_threshold=2, recovery_timeout=60)
+        config = {'contextBroker': {'host': '127.0.0.1', 'port': _unused_port()}}
+        with FiwareContextClient.from_config_dict(config, circuit_breakers=breakers,
+                                                  metrics=metrics) as context_client:
+            for _ in range(5):
+                response = context_client.get_entity_by_id('ROOM_001', 'Room')
+                self.assertEqual(response['status_code'], 0)
+
+        self.assertIn('Circuit open', response['response'])
+        self.assertEqual(breakers.states(), {'orion': CircuitBreaker.OPEN})
+        self.assertEqual(metrics.summary()[('get_entity_by_id', 'orion')]['count'], 2)
+
+    def test_timeout(self):
+        server = _SilentServer()
+        self.addCleanup(server.close)
+        breakers = CircuitBreakerRegistry(failure_threshold=2, recovery_timeout=0.1)
+        policy = RetryPolicy(max_attempts=2, backoff_base=0.01)
+        config = {'contextBroker': {'host': '127.0.0.1', 'port': server.port}}
+        with FiwareContextClient.from_config_dict(config, retry_policy=policy,
+                                                  circuit_breakers=breakers) as context_client:
+            url = f'{context_client.cb_url}/v2/entities/ROOM_001'
+            with self.assertLogs(level='ERROR'):
+                response = context_client._send_request(url, 'GET', timeout=0.1)
+
+            # Timed out requests are retried and counted as failures by the circuit breaker
+            self.assertEqual(response['status_code'], 0)
+            self.assertIn('timed out', response['response'])
+            self.assertEqual(len(server.connections), 2)
+            self.assertEqual(breakers.states(), {'orion': CircuitBreaker.OPEN})
+
+            # A trial request timing out opens the circuit again, instead of keeping its half-open slot
+            time.sleep(0.15)
+            with self.assertLogs(level='ERROR'), self.assertRaises(FiwareRequestError) as error:
+                list(context_client.stream_entities(timeout=0.1))
+            self.assertEqual(error.exception.response['status_code'], 0)
+            self.assertEqual(breakers.states(), {'orion': CircuitBreaker.OPEN})
+
+            time.sleep(0.15)
+            with self.assertLogs(level='ERROR'):
+                context_client._send_request(url, 'GET', timeout=0.1)
+            self.assertEqual(breakers.states(), {'orion': CircuitBreaker.OPEN})
+            time.sleep(0.15)
+            self.assertTrue(breakers.get('orion').allow())
+
+
+class TestAsyncClientRetry(unittest.IsolatedAsyncioTestCase):
+
+    async def test_retry_unavailable(self):
+        server = ThreadingHTTPServer(('127.0.0.1', 0), _ScriptedHandler)
+        server.daemon_threads = True
+        server.lock = threading.Lock()
+        server.requests = []
+        server.script = [503]
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        try:
+            config = {'contextBroker': {'host': '127.0.0.1', 'port': server.server_address[1]}}
+            policy = RetryPolicy(backoff_base=0.01)
+            async with AsyncFiwareContextClient.from_config_dict(config, retry_policy=policy) as context_client:
+                response = await context_client.get_entity_by_id('ROOM_001', 'Room')
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        self.assertEqual(response['status_code'], 200)
+        self.assertEqual(server.requests, ['GET', 'GET'])
+
+    async def test_timeout(self):
+        server = _SilentServer()
+        self.addCleanup(server.close)
+        breakers = CircuitBreakerRegistry(failure_threshold=2, recovery_timeout=0.1)
+        policy = RetryPolicy(max_attempts=2, backoff_base=0.01)
+        config = {'contextBroker': {'host': '127.0.0.1', 'port': server.port}}
+        async with AsyncFiwareContextClient.from_config_dict(config, retry_policy=policy,
+                                                             circuit_breakers=breakers) as context_client:
+            url = f'{context_client.cb_url}/v2/entities/ROOM_001'
+            with self.assertLogs(level='ERROR'):
+                response = await context_client._send_request(url, 'GET', timeout=0.1)
+            self.assertEqual(response['status_code'], 0)
+            self.assertIn('timed out', response['response'])
+            self.assertEqual(len(server.connections), 2)
+            self.assertEqual(breakers.states(), {'orion': CircuitBreaker.OPEN})
+
+            await asyncio.sleep(0.15)
+            with self.assertLogs(level='ERROR'):
+                await context_client._send_request(url, 'GET', timeout=0.1)
+            self.assertEqual(breakers.states(), {'orion': CircuitBreaker.OPEN})
+            await asyncio.sleep(0.15)
+            self.assertTrue(breakers.get('orion').allow())
+
+
+if __name__ == '__main__':
+    unittest.main()
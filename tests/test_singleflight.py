@@ -0,0 +1,161 @@
+import asyncio
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from fiotclient.aio import AsyncFiwareContextClient
+from fiotclient.context import FiwareContextClient
+from fiotclient.singleflight import SingleFlight
+
+
+class _SlowHandler(BaseHTTPRequestHandler):
+    """Replies after a short delay, keeping track of the requests"""
+
+    protocol_version = 'HTTP/1.1'
+
+    def _reply(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        with self.server.lock:
+            self.server.requests.append((self.command, self.path, self.headers.get('Fiware-Service')))
+        time.sleep(0.05)
+
+        body = b'{"id": "ROOM_001", "type": "Room"}'
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_GET = do_POST = _reply
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestSingleFlight(unittest.TestCase):
+
+    def test_threads_share_result(self):
+        single_flight = SingleFlight()
+        executions = []
+
+        def call():
+            executions.append(1)
+            time.sleep(0.05)
+            return object()
+
+        with ThreadPoolExecutor(max_workers=10) as executor:
+            results = list(executor.map(lambda _: single_flight.do('key', call), range(10)))
+
+        self.assertEqual(len(executions), 1)
+        self.assertEqual(len(set(map(id, results))), 1)
+        self.assertEqual(single_flight.stats(), {'executed': 1, 'coalesced': 9})
+        self.assertEqual(single_flight.coalesced, 9)
+
+        single_flight.do('key', call)
+        self.assertEqual(len(executions), 2)
+
+    def test_threads_share_error(self):
+        single_flight = SingleFlight()
+
+        def call():
+            time.sleep(0.05)
+            raise ValueError("Failed call")
+
+        def task(_):
+            with self.assertRaises(ValueError):
+                single_flight.do('key', call)
+
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            list(executor.map(task, range(4)))
+        self.assertEqual(single_flight.stats()['executed'], 1)
+
+
+class TestAsyncSingleFlight(unittest.IsolatedAsyncioTestCase):
+
+    async def test_tasks_share_result(self):
+        single_flight = SingleFlight()
+        executions = []
+
+        async def call():
+            executions.append(1)
+            await asyncio.sleep(0.05)
+            return len(executions)
+
+        results = await asyncio.gather(*(single_flight.do_async('key', call) for _ in range(10)))
+        self.assertEqual(results, [1] * 10)
+        self.assertEqual(single_flight.stats(), {'executed': 1, 'coalesced': 9})
+
+    async def test_cancelled_leader(self):
+        single_flight = SingleFlight()
+
+        async def call():
+            await asyncio.sleep(0.05)
+            return 'result'
+
+        leader = asyncio.ensure_future(single_flight.do_async('key', call))
+        await asyncio.sleep(0)
+        waiter = asyncio.ensure_future(single_flight.do_async('key', call))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+
+        self.assertEqual(await waiter, 'result')
+        with self.assertRaises(asyncio.CancelledError):
+            await leader
+
+
+class TestClientSingleFlight(unittest.TestCase):
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), _SlowHandler)
+        self.server.daemon_threads = True
+        self.server.lock = threading.Lock()
+        self.server.requests = []
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+        self.config = {'contextBroker': {'host': '127.0.0.1', 'port': self.server.server_address[1]},
+                       'fiwareService': 'smartcity', 'fiwareServicePath': '/'}
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_identical_gets_coalesced(self):
+        single_flight = SingleFlight()
+        with FiwareContextClient.from_config_dict(self.config, single_flight=single_flight) as context_client:
+            def task(index):
+                with context_client.tenant(f'tenant_{index % 2}', '/'):
+                    return context_client.get_entity_by_id('ROOM_001', 'Room')['response']['id']
+
+            with ThreadPoolExecutor(max_workers=10) as executor:
+                self.assertEqual(set(executor.map(task, range(10))), {'ROOM_001'})
+
+        self.assertEqual(sorted(service for _, _, service in self.server.requests), ['tenant_0', 'tenant_1'])
+        self.assertEqual(single_flight.coalesced, 8)
+
+    def test_posts_not_coalesced(self):
+        single_flight = SingleFlight()
+        with FiwareContextClient.from_config_dict(self.config, single_flight=single_flight) as context_client:
+            with ThreadPoolExecutor(max_workers=4) as executor:
+                list(executor.map(lambda _: context_client.create_entities([{'id': 'ROOM_001', 'type': 'Room'}]),
+                                  range(4)))
+
+        self.assertEqual(len(self.server.requests), 4)
+        self.assertEqual(single_flight.stats(), {'executed': 0, 'coalesced': 0})
+
+    def test_async_identical_gets_coalesced(self):
+        single_flight = SingleFlight()
+
+        async def get_entities():
+            async with AsyncFiwareContextClient.from_config_dict(self.config,
+                                                                 single_flight=single_flight) as context_client:
+                return await asyncio.gather(*(context_client.get_entity_by_id('ROOM_001', 'Room') for _ in range(5)))
+
+        responses = asyncio.run(get_entities())
+        self.assertEqual([response['status_code'] for response in responses], [200] * 5)
+        self.assertEqual(len(self.server.requests), 1)
+        self.assertEqual(single_flight.coalesced, 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
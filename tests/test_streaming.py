@@ -0,0 +1,150 @@
+import json
+import random
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+from fiotclient.aio import AsyncFiwareContextClient
+from fiotclient.context import FiwareContextClient
+from fiotclient.exceptions import FiwareRequestError
+from fiotclient.streaming import JsonArrayStream, iter_json_array
+
+ENTITIES = [{'id': f'ROOM_{index:03d}', 'type': 'Room',
+             'name': {'type': 'Text', 'value': f'Sala "{index}" [bloco {index % 3}], ºC \\ {{}}'}}
+            for index in range(200)]
+
+HISTORY = {
+    'contextResponses': [{
+        'contextElement': {
+            'attributes': [{'name': 'temperature',
+                            'values': [{'recvTime': f'2024-01-01T00:00:{index:02d}.000Z', 'attrValue': str(index)}
+                                       for index in range(50)]}],
+            'id': 'ROOM_001',
+            'isPattern': False,
+            'type': 'Room'
+        },
+        'statusCode': {'code': '200', 'reasonPhrase': 'OK'}
+    }]
+}
+
+HISTORY_PATH = ('contextResponses', 0, 'contextElement', 'attributes', 0, 'values')
+
+
+def _split(data, parts):
+    cuts = sorted(random.sample(range(1, len(data)), min(parts, len(data) - 1)))
+    return [data[start:end] for start, end in zip([0] + cuts, cuts + [len(data)])]
+
+
+class _StreamingHandler(BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        path = urlsplit(self.path).path
+        if path == '/v2/entities':
+            status, body = 200, json.dumps(ENTITIES, ensure_ascii=False).encode('utf-8')
+        elif path.startswith('/STH/'):
+            status, body = 200, json.dumps(HISTORY, indent=2).encode('utf-8')
+        else:
+            status, body = 404, b'{"error": "NotFound", "description": "The requested entity has not been found"}'
+
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        for chunk in _split(body, 20):
+            self.wfile.write(b'%x\r\n%s\r\n' % (len(chunk), chunk))
+        self.wfile.write(b'0\r\n\r\n')
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestJsonArrayStream(unittest.TestCase):
+
+    def test_random_chunks(self):
+        data = json.dumps(HISTORY, ensure_ascii=False).encode('utf-8')
+        for _ in range(200):
+            values = list(iter_json_array(_split(data, random.randint(1, 60)), HISTORY_PATH))
+            self.assertEqual(values, HISTORY['contextResponses'][0]['contextElement']['attributes'][0]['values'])
+
+    def test_scalars_and_empty_arrays(self):
+        for document in (b'[1, 2.5e3 , "a,]", true, null, [], {}]', b' [ ] ', b'[-12]'):
+            for _ in range(50):
+                items = list(iter_json_array(_split(document, random.randint(1, len(document)))))
+                self.assertEqual(items, json.loads(document))
+
+    def test_items_released(self):
+        stream = JsonArrayStream()
+        self.assertEqual(stream.feed(b'[{"id": "A"}, {"id": '), [{'id': 'A'}])
+        self.assertEqual(stream.feed(b'"B"}, '), [{'id': 'B'}])
+        self.assertNotIn('A', stream._text)
+        self.assertEqual(stream.feed(b'{"id": "C"}]'), [{'id': 'C'}])
+        self.assertNotIn('B', stream._text)
+        self.assertEqual(stream.close(), [])
+
+    def test_missing_array(self):
+        self.assertEqual(list(iter_json_array([b'{"error": "BadRequest"}'], HISTORY_PATH)), [])
+
+    def test_incomplete_document(self):
+        with self.assertRaises(ValueError):
+            list(iter_json_array([b'[{"id": "A"}, {"id": ']))
+
+
+class TestStreamingClient(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), _StreamingHandler)
+        cls.server.daemon_threads = True
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+        port = cls.server.server_address[1]
+        cls.config = {
+            'contextBroker': {'host': '127.0.0.1', 'port': port},
+            'sthComet': {'host': '127.0.0.1', 'port': port}
+        }
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def test_stream_entities(self):
+        with FiwareContextClient.from_config_dict(self.config) as context_client:
+            self.assertEqual(list(context_client.stream_entities(entity_type='Room', chunk_size=256)), ENTITIES)
+
+    def test_stream_historical_data(self):
+        with FiwareContextClient.from_config_dict(self.config) as context_client:
+            values = list(context_client.stream_historical_data('Room', 'ROOM_001', 'temperature', items_number=50))
+        self.assertEqual([value['attrValue'] for value in values], [str(index) for index in range(50)])
+
+    def test_stream_error(self):
+        with FiwareContextClient.from_config_dict(self.config) as context_client:
+            context_client.cb_url += '/missing'
+            with self.assertRaises(FiwareRequestError) as context:
+                list(context_client.stream_entities())
+        self.assertEqual(context.exception.response['status_code'], 404)
+        self.assertEqual(context.exception.response['response']['error'], 'NotFound')
+
+
+class TestAsyncStreamingClient(unittest.IsolatedAsyncioTestCase):
+
+    async def test_stream_entities(self):
+        server = ThreadingHTTPServer(('127.0.0.1', 0), _StreamingHandler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        try:
+            config = {'contextBroker': {'host': '127.0.0.1', 'port': server.server_address[1]}}
+            async with AsyncFiwareContextClient.from_config_dict(config) as context_client:
+                entities = [entity async for entity in context_client.stream_entities(chunk_size=256)]
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        self.assertEqual(entities, ENTITIES)
+
+
+if __name__ == '__main__':
+    unittest.main()
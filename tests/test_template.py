@@ -0,0 +1,102 @@
+import json
+import os
+import tempfile
+import unittest
+
+from fiotclient.iot import FiwareIotClient
+from fiotclient.template import SchemaTemplate, as_template
+
+DEVICE_SCHEMA = json.dumps({'devices': [{
+    'device_id': '[DEVICE_ID]',
+    'entity_name': '[ENTITY_ID]',
+    'entity_type': 'thing',
+    'endpoint': 'http://[DEVICE_IP]:[PORT]',
+    'timezone': 'America/Santiago',
+    'attributes': [{'object_id': 't', 'name': 'temperature', 'type': 'Number'}],
+    'static_attributes': [{'name': '[DEVICE_ID]_location', 'type': 'geo:point', 'value': [1.5, 2.5]}]
+}]})
+
+
+class TestSchemaTemplate(unittest.TestCase):
+
+    def test_render(self):
+        template = SchemaTemplate(DEVICE_SCHEMA)
+        self.assertEqual(template.placeholders, {'DEVICE_ID', 'ENTITY_ID', 'DEVICE_IP', 'PORT'})
+
+        device = template.render(device_id='LED_001', entity_id='TEST_LED', device_ip='10.0.0.1', port=8080)
+        self.assertEqual(device['devices'][0]['device_id'], 'LED_001')
+        self.assertEqual(device['devices'][0]['entity_name'], 'TEST_LED')
+        self.assertEqual(device['devices'][0]['endpoint'], 'http://10.0.0.1:8080')
+        self.assertEqual(device['devices'][0]['static_attributes'][0]['name'], 'LED_001_location')
+
+        # The result matches the former textual replacement of the placeholders
+        expected = DEVICE_SCHEMA.replace('[DEVICE_ID]', 'LED_001').replace('[ENTITY_ID]', 'TEST_LED') \
+            .replace('[DEVICE_IP]', '10.0.0.1').replace('[PORT]', '8080')
+        self.assertEqual(device, json.loads(expected))
+
+    def test_escaping(self):
+        template = SchemaTemplate(DEVICE_SCHEMA)
+        device = template.render(device_id='LED "1"\\', entity_id='TEST\nLED')
+        self.assertEqual(device['devices'][0]['device_id'], 'LED "1"\\')
+        self.assertEqual(device['devices'][0]['entity_name'], 'TEST\nLED')
+
+    def test_unfilled_placeholders(self):
+        template = SchemaTemplate(DEVICE_SCHEMA)
+        device = template.render(device_id='LED_001')
+        self.assertEqual(device['devices'][0]['entity_name'], '[ENTITY_ID]')
+        self.assertEqual(device['devices'][0]['endpoint'], 'http://[DEVICE_IP]:[PORT]')
+
+        template = SchemaTemplate({'id': '[UNKNOWN]', 'name': '[DEVICE_ID'})
+        self.assertEqual(template.placeholders, set())
+        self.assertEqual(template.render(device_id='LED_001'), {'id': '[UNKNOWN]', 'name': '[DEVICE_ID'})
+
+    def test_independent_copies(self):
+        template = SchemaTemplate(DEVICE_SCHEMA)
+        first = template.render(device_id='LED_001', entity_id='TEST_LED_1')
+        second = template.render(device_id='LED_002', entity_id='TEST_LED_2')
+
+        first['devices'][0]['attributes'].append({'object_id': 'h'})
+        first['devices'][0]['static_attributes'][0]['value'][0] = 0
+        self.assertEqual(len(second['devices'][0]['attributes']), 1)
+        self.assertEqual(second['devices'][0]['static_attributes'][0]['value'], [1.5, 2.5])
+        self.assertEqual(template.schema, json.loads(DEVICE_SCHEMA))
+
+    def test_from_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            schema_file_path = os.path.join(directory, 'entity.json')
+            with open(schema_file_path, 'w') as schema_file:
+                json.dump({'id': '[ENTITY_ID]', 'type': '[ENTITY_TYPE]', 'temperature': {'value': 23.5}}, schema_file)
+
+            template = SchemaTemplate.from_file(schema_file_path)
+
+        self.assertEqual(template.render(entity_id='ROOM_001', entity_type='Room'),
+                         {'id': 'ROOM_001', 'type': 'Room', 'temperature': {'value': 23.5}})
+
+    def test_as_template(self):
+        template = SchemaTemplate(DEVICE_SCHEMA)
+        self.assertIs(as_template(template), template)
+        self.assertIs(as_template(DEVICE_SCHEMA), as_template(DEVICE_SCHEMA))
+
+        schema = json.loads(DEVICE_SCHEMA)
+        self.assertEqual(as_template(schema).render(device_id='LED_001'), template.render(device_id='LED_001'))
+
+    def test_deep_nesting(self):
+        schema = '{"id": "[ENTITY_ID]", "value": ' + '[' * 300 + '"[DEVICE_ID]"' + ']' * 300 + '}'
+        rendered = SchemaTemplate(schema).render(entity_id='ROOM_001', device_id='LED_001')
+        expected = schema.replace('[ENTITY_ID]', 'ROOM_001').replace('[DEVICE_ID]', 'LED_001')
+        self.assertEqual(rendered, json.loads(expected))
+
+    def test_endpoint_placeholders(self):
+        template = SchemaTemplate(DEVICE_SCHEMA)
+        self.assertIn('endpoint', template.keys)
+        device = FiwareIotClient._render_device(template, 'LED_001', 'TEST_LED', '10.0.0.1:8080')
+        self.assertEqual(device['endpoint'], 'http://10.0.0.1:8080')
+
+        # As on the textual replacement, the endpoint placeholders are only filled on schemas with an endpoint
+        template = SchemaTemplate({'devices': [{'device_id': '[DEVICE_ID]', 'ip': '[DEVICE_IP]'}]})
+        device = FiwareIotClient._render_device(template, 'LED_001', 'TEST_LED', '10.0.0.1:8080')
+        self.assertEqual(device, {'device_id': 'LED_001', 'ip': '[DEVICE_IP]'})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,122 @@
+import asyncio
+import json
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from fiotclient.aio import AsyncFiwareContextClient
+from fiotclient.cache import TTLCache
+from fiotclient.context import FiwareContextClient
+from fiotclient.tenant import Tenant
+
+
+class _TenantHandler(BaseHTTPRequestHandler):
+    """Replies with the tenant headers of the request, keeping track of them"""
+
+    protocol_version = 'HTTP/1.1'
+
+    def _reply(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+
+        tenant = [self.headers.get('Fiware-Service'), self.headers.get('Fiware-ServicePath')]
+        with self.server.lock:
+            self.server.tenants.append(tuple(tenant))
+
+        body = json.dumps(tenant).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_GET = do_POST = _reply
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestTenant(unittest.TestCase):
+
+    def test_default_headers(self):
+        tenant = Tenant('smartcity', '/rooms')
+        headers = tenant.default_headers('token-1')
+        self.assertEqual(headers, {'X-Auth-Token': 'token-1', 'Fiware-Service': 'smartcity',
+                                   'Fiware-ServicePath': '/rooms'})
+        self.assertIs(tenant.default_headers('token-1'), headers)
+        self.assertEqual(tenant.default_headers('token-2')['X-Auth-Token'], 'token-2')
+
+
+class TestClientTenants(unittest.TestCase):
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), _TenantHandler)
+        self.server.daemon_threads = True
+        self.server.lock = threading.Lock()
+        self.server.tenants = []
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+        self.config = {'contextBroker': {'host': '127.0.0.1', 'port': self.server.server_address[1]},
+                       'fiwareService': 'default', 'fiwareServicePath': '/'}
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_scoped_tenant(self):
+        with FiwareContextClient.from_config_dict(self.config) as context_client:
+            with context_client.tenant('smartcity', '/rooms'):
+                self.assertEqual(context_client.get_entities()['response'], ['smartcity', '/rooms'])
+                with context_client.tenant('smartcity', '/halls'):
+                    self.assertEqual(context_client.service_path, '/halls')
+                self.assertEqual(context_client.service_path, '/rooms')
+
+            self.assertEqual(context_client.get_entities()['response'], ['default', '/'])
+
+            context_client.set_service('other', '/')
+            self.assertEqual(context_client.get_entities()['response'], ['other', '/'])
+            self.assertEqual(context_client.fiware_config.service, 'default')
+
+    def test_concurrent_threads(self):
+        with FiwareContextClient.from_config_dict(self.config) as context_client:
+            def task(index):
+                service = f'tenant_{index % 5}'
+                with context_client.tenant(service, f'/{index}'):
+                    return context_client.get_entities()['response'] == [service, f'/{index}']
+
+            with ThreadPoolExecutor(max_workers=10) as executor:
+                self.assertTrue(all(executor.map(task, range(100))))
+
+    def test_batch_threads_keep_tenant(self):
+        entities = [{'id': f'ROOM_{index:03d}', 'type': 'Room'} for index in range(10)]
+        with FiwareContextClient.from_config_dict(self.config) as context_client:
+            with context_client.tenant('smartcity', '/rooms'):
+                responses = context_client.create_entities(entities, max_entities=2, max_concurrency=4)
+
+        self.assertEqual(len(responses), 5)
+        self.assertEqual(set(self.server.tenants), {('smartcity', '/rooms')})
+
+    def test_cache_keyed_by_tenant(self):
+        with FiwareContextClient.from_config_dict(self.config, cache=TTLCache()) as context_client:
+            with context_client.tenant('smartcity', '/rooms'):
+                context_client.get_entity_by_id('ROOM_001', 'Room')
+                context_client.get_entity_by_id('ROOM_001', 'Room')
+            response = context_client.get_entity_by_id('ROOM_001', 'Room')
+
+        self.assertEqual(response['response'], ['default', '/'])
+        self.assertEqual(self.server.tenants, [('smartcity', '/rooms'), ('default', '/')])
+
+    def test_async_tasks(self):
+        async def get_entities(context_client, index):
+            with context_client.tenant(f'tenant_{index}', '/'):
+                await asyncio.sleep(0.01 * (index % 3))
+                return (await context_client.get_entities())['response'] == [f'tenant_{index}', '/']
+
+        async def run_all():
+            async with AsyncFiwareContextClient.from_config_dict(self.config) as context_client:
+                return await asyncio.gather(*(get_entities(context_client, index) for index in range(20)))
+
+        self.assertTrue(all(asyncio.run(run_all())))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from fiotclient.context import FiwareContextClient
+from fiotclient.iot import FiwareIotClient
+from fiotclient.transport import HttpTransport
+
+
+class _EchoPortHandler(BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        body = str(self.client_address[1]).encode()
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestHttpTransport(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), _EchoPortHandler)
+        cls.server.daemon_threads = True
+        cls.url = f"http://127.0.0.1:{cls.server.server_address[1]}/"
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def test_connection_reused(self):
+        with HttpTransport() as transport:
+            ports = {transport.request('GET', self.url).text for _ in range(5)}
+        self.assertEqual(len(ports), 1)
+
+    def test_keep_alive_disabled(self):
+        with HttpTransport(keep_alive=False) as transport:
+            ports = {transport.request('GET', self.url).text for _ in range(3)}
+        self.assertEqual(len(ports), 3)
+
+    def test_idle_connections_evicted(self):
+        with HttpTransport(idle_timeout=0.05) as transport:
+            first_port = transport.request('GET', self.url).text
+            time.sleep(0.1)
+            second_port = transport.request('GET', self.url).text
+        self.assertNotEqual(first_port, second_port)
+
+    def test_closed_transport(self):
+        transport = HttpTransport()
+        transport.close()
+        self.assertTrue(transport.closed)
+        self.assertRaises(RuntimeError, transport.request, 'GET', self.url)
+
+    def test_shared_transport_lifecycle(self):
+        config = {'contextBroker': {'host': '127.0.0.1', 'port': self.server.server_address[1]}}
+
+        with HttpTransport() as transport:
+            context_client = FiwareContextClient.from_config_dict(config, transport=transport)
+            iot_client = FiwareIotClient.from_config_dict(config, transport=transport)
+            self.assertIs(context_client.transport, iot_client.transport)
+
+            context_client.close()
+            self.assertFalse(transport.closed)
+
+        with FiwareContextClient.from_config_dict(config) as context_client:
+            transport = context_client.transport
+        self.assertTrue(transport.closed)
@@ -0,0 +1,78 @@
+import unittest
+
+from fiotclient import ul
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class TestUlEncoding(unittest.TestCase):
+
+    def test_separators_rejected(self):
+        self.assertEqual(ul.format_value(23.5), '23.5')
+        self.assertRaises(ValueError, ul.format_value, 'a|b')
+        self.assertRaises(ValueError, ul.encode_group, {'msg': 'on#off'})
+        self.assertRaises(ValueError, ul.encode_measurements, [{'t': 1}, {'a|b': 2}])
+        self.assertRaises(ValueError, lambda: list(ul.encode_columns({'msg': ['on', 'on|off']})))
+        self.assertRaises(ValueError, ul.encode_command_result, 'LED_001', 'switch', 'ON|switched')
+
+    def test_values_sent_verbatim(self):
+        values = ['50%', '%7C', '100%25', 'a%23b']
+        payload = ul.encode_measurements([{'humidity': value} for value in values])
+        self.assertEqual(payload, 'humidity|50%#humidity|%7C#humidity|100%25#humidity|a%23b')
+        self.assertEqual(ul.decode_measurements(payload), [(None, {'humidity': value}) for value in values])
+        self.assertEqual(list(ul.encode_columns({'humidity': values})), [payload])
+
+    def test_decode_measurements(self):
+        groups = ul.decode_measurements('t|23.5|s|ON#2024-01-01T00:00:00Z|t|24')
+        self.assertEqual(groups, [(None, {'t': '23.5', 's': 'ON'}), ('2024-01-01T00:00:00Z', {'t': '24'})])
+        self.assertRaises(ValueError, ul.decode_measurements, 't')
+
+    def test_commands(self):
+        commands = ul.decode_commands('LED_001@switch|ON#LED_001@blink|3|50%#LED_001@reset')
+        self.assertEqual(commands, [('LED_001', 'switch', ['ON']), ('LED_001', 'blink', ['3', '50%']),
+                                    ('LED_001', 'reset', [])])
+        self.assertRaises(ValueError, ul.decode_commands, 'switch|ON')
+
+        self.assertEqual(ul.encode_command_result('LED_001', 'switch', 'switched 100%'),
+                         'LED_001@switch|switched 100%')
+
+    def test_columns_match_measurements(self):
+        rows = [{'t': 23.5, 'h': 40, 's': 'ON'}, {'t': 24.0, 'h': 41, 's': 'OFF'}, {'t': 1e-05, 'h': 0, 's': '50%'}]
+        columns = {key: [row[key] for row in rows] for key in rows[0]}
+
+        self.assertEqual(list(ul.encode_columns(columns)), [ul.encode_measurements(rows)])
+
+    def test_missing_values(self):
+        payloads = list(ul.encode_columns({'t': [1, None, 3], 'h': [None, None, 6]}))
+        self.assertEqual(payloads, ['t|1#t|3|h|6'])
+
+    def test_float_format(self):
+        payloads = list(ul.encode_columns({'t': [1.0, 2.345], 'n': [1, 2]}, float_format='%.2f'))
+        self.assertEqual(payloads, ['t|1.00|n|1#t|2.35|n|2'])
+
+    def test_chunking(self):
+        columns = {'t': list(range(10, 20))}
+
+        payloads = list(ul.encode_columns(columns, max_bytes=14))
+        self.assertEqual(payloads[0], 't|10#t|11#t|12')
+        self.assertTrue(all(len(payload) <= 14 for payload in payloads))
+        self.assertEqual('#'.join(payloads), ul.encode_measurements([{'t': value} for value in range(10, 20)]))
+
+        payloads = list(ul.encode_columns(columns, max_groups=4, block_size=3))
+        self.assertEqual([payload.count('#') + 1 for payload in payloads], [4, 4, 2])
+
+    def test_rows(self):
+        self.assertEqual(list(ul.encode_columns({'t': [1, 2, 3]}, rows=2)), ['t|1#t|2'])
+        self.assertRaises(ValueError, lambda: list(ul.encode_columns({'t': [1, 2, 3]}, rows=4)))
+        self.assertRaises(ValueError, lambda: list(ul.encode_columns({'t': [1, 2], 'h': [1]})))
+
+    @unittest.skipIf(numpy is None, "NumPy is not installed")
+    def test_numpy_columns(self):
+        columns = {'t': numpy.array([23.5, 24.0]), 'h': numpy.array([40, 41]), 'on': numpy.array([True, False])}
+
+        self.assertEqual(list(ul.encode_columns(columns)), ['t|23.5|h|40|on|True#t|24.0|h|41|on|False'])
+        self.assertEqual(list(ul.encode_columns(columns, float_format='%.1f', max_groups=1))[1],
+                         't|24.0|h|41|on|False')
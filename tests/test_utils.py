@@ -0,0 +1,64 @@
+import threading
+import time
+import unittest
+
+from fiotclient import utils
+
+
+class TestUtils(unittest.TestCase):
+
+    def test_merge_dicts(self):
+        self.assertEqual(utils.merge_dicts({'a': 1, 'b': 2}, {'b': 3}), {'a': 1, 'b': 3})
+
+    def test_split_batches_by_count(self):
+        batches = list(utils.split_batches(range(7), max_items=3, max_bytes=100, size=lambda item: 1))
+        self.assertEqual(batches, [[0, 1, 2], [3, 4, 5], [6]])
+
+    def test_split_batches_by_size(self):
+        batches = list(utils.split_batches(['aaaa', 'bb', 'cc', 'dddddddd', 'e'], max_items=10, max_bytes=6))
+        self.assertEqual(batches, [['aaaa', 'bb'], ['cc'], ['dddddddd'], ['e']])
+
+    def test_bounded_map(self):
+        in_flight = []
+        lock = threading.Lock()
+
+        def function(item):
+            with lock:
+                in_flight.append(item)
+                concurrent = len(in_flight)
+            time.sleep(0.01)
+            with lock:
+                in_flight.remove(item)
+            return item * 2, concurrent
+
+        results = list(utils.bounded_map(function, range(20), max_workers=3))
+        self.assertEqual([result for result, _ in results], [item * 2 for item in range(20)])
+        self.assertLessEqual(max(concurrent for _, concurrent in results), 3)
+
+    def test_iter_pages(self):
+        items = list(range(25))
+        requested_offsets = []
+
+        def fetch_page(offset, limit, total=None):
+            requested_offsets.append(offset)
+            return items[offset:offset + limit], total
+
+        for prefetch in (True, False):
+            requested_offsets.clear()
+            self.assertEqual(list(utils.iter_pages(fetch_page, 10, prefetch=prefetch)), items)
+            self.assertEqual(requested_offsets, [0, 10, 20])
+
+        requested_offsets.clear()
+        pages = utils.iter_pages(lambda offset, limit: fetch_page(offset, limit, total=25), 5, max_workers=3)
+        self.assertEqual(list(pages), items)
+        self.assertEqual(sorted(requested_offsets), [0, 5, 10, 15, 20])
+
+    def test_iter_pages_exact_multiple(self):
+        requested_offsets = []
+
+        def fetch_page(offset, limit):
+            requested_offsets.append(offset)
+            return list(range(20))[offset:offset + limit], 20
+
+        self.assertEqual(len(list(utils.iter_pages(fetch_page, 10))), 20)
+        self.assertEqual(requested_offsets, [0, 10])